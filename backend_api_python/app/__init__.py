@@ -74,6 +74,26 @@ def start_pending_order_worker():
         logger.error(f"Failed to start pending order worker: {e}")
 
 
+def prefetch_exchange_clients():
+    """Warm exchange clients and symbol metadata of running live strategies in the background.
+
+    To disable it, set LIVE_CLIENT_PREFETCH=false.
+    """
+    import os
+    import threading
+    if os.getenv('LIVE_CLIENT_PREFETCH', 'true').lower() != 'true':
+        return
+    try:
+        from app.services.live_trading.client_registry import get_exchange_client_registry
+        threading.Thread(
+            target=get_exchange_client_registry().prefetch_running_strategies,
+            name='ExchangeClientPrefetch',
+            daemon=True,
+        ).start()
+    except Exception as e:
+        logger.error(f"Failed to start exchange client prefetch: {e}")
+
+
 def restore_running_strategies():
     """
     Restore running strategies on startup.
@@ -232,6 +252,7 @@ def create_app(config_name='default'):
         start_pending_order_worker()
         start_portfolio_monitor()
         restore_running_strategies()
+        prefetch_exchange_clients()
     
     return app
 
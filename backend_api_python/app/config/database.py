@@ -95,6 +95,11 @@ class MetaCacheConfig(type):
             '1d': 300,
         }
 
+    @property
+    def STALE_TTL_RATIO(cls):
+        # 过期后仍可返回旧值（后台刷新）的时长，占 TTL 的比例；0 表示关闭
+        return float(os.getenv('CACHE_STALE_RATIO', '0.5'))
+
     @property
     def ANALYSIS_CACHE_TTL(cls):
         return 3600
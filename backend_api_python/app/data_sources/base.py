@@ -60,6 +60,26 @@ class BaseDataSource(ABC):
         Implementations may return a dict compatible with CCXT `fetch_ticker` shape (e.g. {'last': ...}).
         """
         raise NotImplementedError("get_ticker is not implemented for this data source")
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get latest tickers for several symbols, keyed by the symbols as passed in.
+
+        The default calls get_ticker() per symbol; sources with a batch endpoint override it.
+        Symbols that fail are left out of the result.
+        """
+        result = {}
+        for symbol in symbols:
+            try:
+                ticker = self.get_ticker(symbol)
+            except NotImplementedError:
+                raise
+            except Exception as e:
+                logger.warning(f"get_ticker failed for {symbol}: {e}")
+                continue
+            if ticker:
+                result[symbol] = ticker
+        return result
     
     def format_kline(
         self,
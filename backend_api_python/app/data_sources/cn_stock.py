@@ -164,6 +164,63 @@ class TencentDataMixin:
         # logger.info(f"聚合生成 {len(aggregated)} 条 4H 数据")
         return aggregated[-limit:] if len(aggregated) > limit else aggregated
 
+    # 单次行情请求最多包含的代码数（避免 URL 过长）
+    TENCENT_QUOTE_BATCH = 60
+
+    @staticmethod
+    def _parse_tencent_quote(data_str: str) -> Optional[Dict[str, Any]]:
+        """解析腾讯实时行情字符串（'~' 分隔）"""
+        parts = data_str.split('~')
+        if len(parts) <= 32:
+            return None
+        return {
+            'last': float(parts[3]) if parts[3] else 0,
+            'change': float(parts[31]) if parts[31] else 0,
+            'changePercent': float(parts[32]) if parts[32] else 0,
+            'high': float(parts[33]) if len(parts) > 33 and parts[33] else 0,
+            'low': float(parts[34]) if len(parts) > 34 and parts[34] else 0,
+            'open': float(parts[5]) if len(parts) > 5 and parts[5] else 0,
+            'previousClose': float(parts[4]) if parts[4] else 0
+        }
+
+    def _fetch_tencent_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取腾讯实时报价：http://qt.gtimg.cn/q=sh600000,sz000001,...
+
+        Returns:
+            {symbol: ticker}，按传入的 symbol 作为 key；获取失败的不在结果中
+        """
+        wanted: Dict[str, List[str]] = {}
+        for symbol in symbols:
+            code = self._to_tencent_symbol((symbol or '').strip())
+            if code:
+                wanted.setdefault(code, []).append(symbol)
+
+        result = {}
+        codes = list(wanted)
+        for i in range(0, len(codes), self.TENCENT_QUOTE_BATCH):
+            chunk = codes[i:i + self.TENCENT_QUOTE_BATCH]
+            try:
+                response = requests.get(f"http://qt.gtimg.cn/q={','.join(chunk)}", timeout=10)
+                content = response.content.decode('gbk', errors='ignore')
+            except Exception as e:
+                logger.debug(f"Tencent batch quote failed for {len(chunk)} symbols: {e}")
+                continue
+            # 每行: v_sh600000="1~浦发银行~600000~...";
+            for line in content.split(';'):
+                line = line.strip()
+                if not line.startswith('v_') or '="' not in line:
+                    continue
+                code, data_str = line[2:].split('="', 1)
+                try:
+                    ticker = self._parse_tencent_quote(data_str.strip('"'))
+                except ValueError:
+                    continue
+                if ticker and ticker['last'] > 0:
+                    for symbol in wanted.get(code, []):
+                        result[symbol] = ticker
+        return result
+
 
 class AShareDataSource(BaseDataSource, TencentDataMixin):
     """A-Share data source."""
@@ -458,18 +515,9 @@ class AShareDataSource(BaseDataSource, TencentDataMixin):
                 content = response.content.decode('gbk', errors='ignore')
                 if '="' in content:
                     data_str = content.split('="')[1].strip('";\n')
-                    if data_str:
-                        parts = data_str.split('~')
-                        if len(parts) > 32:
-                            return {
-                                'last': float(parts[3]) if parts[3] else 0,
-                                'change': float(parts[31]) if parts[31] else 0,
-                                'changePercent': float(parts[32]) if parts[32] else 0,
-                                'high': float(parts[33]) if len(parts) > 33 and parts[33] else 0,
-                                'low': float(parts[34]) if len(parts) > 34 and parts[34] else 0,
-                                'open': float(parts[5]) if len(parts) > 5 and parts[5] else 0,
-                                'previousClose': float(parts[4]) if parts[4] else 0
-                            }
+                    ticker = self._parse_tencent_quote(data_str) if data_str else None
+                    if ticker:
+                        return ticker
         except Exception as e:
             logger.debug(f"Tencent ticker failed for {symbol}: {e}")
         
@@ -497,6 +545,15 @@ class AShareDataSource(BaseDataSource, TencentDataMixin):
         
         return {'last': 0, 'symbol': symbol}
 
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取A股实时报价
+
+        使用腾讯多代码行情接口（每 TENCENT_QUOTE_BATCH 个代码一次请求），只返回取到的代码；
+        其余由调用方（KlineService.get_realtime_prices）在线程池里逐个降级
+        """
+        return self._fetch_tencent_quotes(symbols)
+
 
 class HShareDataSource(BaseDataSource, TencentDataMixin):
     """港股数据源"""
@@ -751,18 +808,9 @@ class HShareDataSource(BaseDataSource, TencentDataMixin):
             content = response.content.decode('gbk', errors='ignore')
             if '="' in content:
                 data_str = content.split('="')[1].strip('";\n')
-                if data_str:
-                    parts = data_str.split('~')
-                    if len(parts) > 32:
-                        return {
-                            'last': float(parts[3]) if parts[3] else 0,
-                            'change': float(parts[31]) if parts[31] else 0,
-                            'changePercent': float(parts[32]) if parts[32] else 0,
-                            'high': float(parts[33]) if len(parts) > 33 and parts[33] else 0,
-                            'low': float(parts[34]) if len(parts) > 34 and parts[34] else 0,
-                            'open': float(parts[5]) if len(parts) > 5 and parts[5] else 0,
-                            'previousClose': float(parts[4]) if parts[4] else 0
-                        }
+                ticker = self._parse_tencent_quote(data_str) if data_str else None
+                if ticker:
+                    return ticker
         except Exception as e:
             logger.debug(f"Tencent ticker failed for {symbol}: {e}")
         
@@ -839,3 +887,12 @@ class HShareDataSource(BaseDataSource, TencentDataMixin):
             logger.debug(f"yfinance ticker failed for {symbol}: {e}")
         
         return {'last': 0, 'symbol': symbol}
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取港股实时报价
+
+        使用腾讯多代码行情接口（每 TENCENT_QUOTE_BATCH 个代码一次请求），只返回取到的代码；
+        其余由调用方（KlineService.get_realtime_prices）在线程池里逐个降级
+        """
+        return self._fetch_tencent_quotes(symbols)
@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 import ccxt
 
 from app.data_sources.base import BaseDataSource, TIMEFRAME_SECONDS
+from app.data_sources.crypto_stream import get_crypto_stream
 from app.utils.logger import get_logger
 from app.config import CCXTConfig, APIKeys
 
@@ -44,9 +45,10 @@ class CryptoDataSource(BaseDataSource):
         exchange_class = getattr(ccxt, exchange_id)
         self.exchange = exchange_class(config)
 
-    def get_ticker(self, symbol: str) -> Dict[str, Any]:
+    @staticmethod
+    def _ticker_symbol(symbol: str) -> str:
         """
-        Get latest ticker for a crypto symbol via CCXT.
+        Normalize a symbol for ticker calls.
 
         Accepts common formats:
         - BTC/USDT
@@ -63,7 +65,46 @@ class CryptoDataSource(BaseDataSource):
                 sym = f"{sym[:-4]}/USDT"
             elif sym.endswith("USD") and len(sym) > 3:
                 sym = f"{sym[:-3]}/USD"
-        return self.exchange.fetch_ticker(sym)
+        return sym
+
+    def get_ticker(self, symbol: str) -> Dict[str, Any]:
+        """
+        Get latest ticker for a crypto symbol (see _ticker_symbol for accepted formats).
+
+        A live WebSocket ticker is used when the symbol is streamed (CRYPTO_STREAM_ENABLED),
+        otherwise CCXT fetch_ticker.
+        """
+        stream = get_crypto_stream()
+        ticker = stream.get_ticker(symbol) if stream is not None else None
+        if ticker:
+            return ticker
+        return self.exchange.fetch_ticker(self._ticker_symbol(symbol))
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get tickers for several symbols with one CCXT fetch_tickers call when the exchange supports it."""
+        result = {}
+        stream = get_crypto_stream()
+        if stream is not None:
+            for symbol in symbols or []:
+                ticker = stream.get_ticker(symbol)
+                if ticker:
+                    result[symbol] = ticker
+            symbols = [s for s in symbols if s not in result]
+        if not symbols:
+            return result
+        if not (getattr(self.exchange, 'has', None) or {}).get('fetchTickers'):
+            # No batch endpoint: callers load the rest one by one (KlineService on its pool)
+            return result
+        wanted = {}
+        for symbol in symbols:
+            wanted.setdefault(self._ticker_symbol(symbol), []).append(symbol)
+        tickers = self.exchange.fetch_tickers(list(wanted)) or {}
+        for sym, originals in wanted.items():
+            ticker = tickers.get(sym)
+            if ticker:
+                for original in originals:
+                    result[original] = ticker
+        return result
     
     def get_kline(
         self,
@@ -0,0 +1,398 @@
+"""
+WebSocket streaming ingestion for crypto tickers and candles.
+
+When CRYPTO_STREAM_ENABLED is on and the configured CCXT exchange is the stream's venue
+(CRYPTO_STREAM_EXCHANGE, default binance), a background thread keeps one WebSocket connection to a
+Binance-compatible public stream endpoint (CRYPTO_STREAM_URL) and subscribes
+`<symbol>@ticker` / `<symbol>@kline_<interval>` for every symbol the market-data hub
+subscribes. Incoming events maintain in-memory live tickers and the newest candles
+(closed + forming) per (symbol, timeframe), which readers get with no network round-trip:
+
+    stream = get_crypto_stream()          # None when disabled / `websockets` not installed
+    ticker = stream.get_ticker('BTC/USDT') if stream else None
+    klines = stream.get_klines('BTC/USDT', '1m', 5) if stream else None
+
+Both return None while disconnected, before the first event, or when the data is older than
+CRYPTO_STREAM_MAX_AGE_SEC, and callers then fall back to REST. On disconnect all streamed
+state is dropped and the client reconnects with backoff, re-subscribing everything.
+
+Candle buffers start empty; REST candles fetched for a subscribed symbol can be merged in with
+`seed_klines()` so small tail requests are served from the stream right away.
+
+`scripts/crypto_stream_standin.py` runs a local stand-in server speaking this protocol subset.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import CCXTConfig
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import websockets
+    HAS_WEBSOCKETS = True
+except ImportError:
+    websockets = None
+    HAS_WEBSOCKETS = False
+
+
+def stream_symbol(symbol: str) -> str:
+    """'BTC/USDT', 'BTC/USDT:USDT' or 'BTCUSDT' -> 'btcusdt' (stream naming)."""
+    sym = (symbol or '').strip()
+    if ':' in sym:
+        sym = sym.split(':', 1)[0]
+    return sym.replace('/', '').replace('-', '').lower()
+
+
+def _float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class CryptoStream:
+    """One WebSocket connection feeding live tickers and candles for subscribed symbols."""
+
+    def __init__(self, url: str, max_age_sec: float = 30.0, candle_buffer: int = 50):
+        self.url = url
+        self.max_age_sec = float(max_age_sec)
+        self.candle_buffer = max(2, int(candle_buffer))
+        self._lock = threading.Lock()
+        # stream name (e.g. 'btcusdt@kline_1m') -> subscriber refcount
+        self._streams: Dict[str, int] = {}
+        # 'btcusdt' -> (ticker, received_at)
+        self._tickers: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        # ('btcusdt', '1m') -> OrderedDict(open_time -> candle), received_at of the newest event
+        self._candles: Dict[Tuple[str, str], 'OrderedDict[int, Dict[str, Any]]'] = {}
+        self._candles_at: Dict[Tuple[str, str], float] = {}
+        self._connected = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ws = None
+        self._thread: Optional[threading.Thread] = None
+        self._request_id = 0
+        self._stats = {
+            'messages': 0, 'connects': 0, 'disconnects': 0,
+            'ticker_hits': 0, 'ticker_misses': 0, 'kline_hits': 0, 'kline_misses': 0,
+        }
+        self._last_message_at = 0.0
+
+    # ---------------------------------------------------------------- lifecycle
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._thread_main, name='crypto-stream', daemon=True)
+            self._thread.start()
+
+    def _thread_main(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        try:
+            loop.run_until_complete(self._run())
+        finally:
+            loop.close()
+
+    async def _run(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20, open_timeout=10) as ws:
+                    with self._lock:
+                        self._ws = ws
+                        self._connected = True
+                        self._stats['connects'] += 1
+                        streams = list(self._streams)
+                    logger.info(f"Crypto stream connected: {self.url} ({len(streams)} streams)")
+                    backoff = 1.0
+                    if streams:
+                        await self._send('SUBSCRIBE', streams)
+                    async for message in ws:
+                        self._handle(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Crypto stream disconnected: {e}; using REST until reconnected")
+            finally:
+                self._drop_state()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _drop_state(self) -> None:
+        with self._lock:
+            if self._connected:
+                self._stats['disconnects'] += 1
+            self._connected = False
+            self._ws = None
+            self._tickers.clear()
+            self._candles.clear()
+            self._candles_at.clear()
+
+    async def _send(self, method: str, streams: List[str]) -> None:
+        with self._lock:
+            ws = self._ws
+            self._request_id += 1
+            request_id = self._request_id
+        if ws is None or not streams:
+            return
+        try:
+            await ws.send(json.dumps({'method': method, 'params': streams, 'id': request_id}))
+        except Exception as e:
+            # The receive loop notices the broken connection and reconnects (re-subscribing all)
+            logger.warning(f"Crypto stream {method} failed: {e}")
+
+    def _schedule_send(self, method: str, streams: List[str]) -> None:
+        loop = self._loop
+        if loop is None or not streams or not self._connected:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._send(method, streams), loop)
+        except RuntimeError:
+            pass
+
+    # ---------------------------------------------------------------- subscriptions
+
+    def _stream_names(self, symbol: str, timeframe: Optional[str]) -> List[str]:
+        sym = stream_symbol(symbol)
+        names = [f"{sym}@ticker"]
+        interval = CCXTConfig.TIMEFRAME_MAP.get(timeframe) if timeframe else None
+        if interval:
+            names.append(f"{sym}@kline_{interval}")
+        return names
+
+    def subscribe(self, symbol: str, timeframe: Optional[str] = None) -> None:
+        added = []
+        with self._lock:
+            for name in self._stream_names(symbol, timeframe):
+                self._streams[name] = self._streams.get(name, 0) + 1
+                if self._streams[name] == 1:
+                    added.append(name)
+        self.start()
+        self._schedule_send('SUBSCRIBE', added)
+
+    def unsubscribe(self, symbol: str, timeframe: Optional[str] = None) -> None:
+        removed = []
+        with self._lock:
+            for name in self._stream_names(symbol, timeframe):
+                count = self._streams.get(name, 0) - 1
+                if count > 0:
+                    self._streams[name] = count
+                elif name in self._streams:
+                    del self._streams[name]
+                    removed.append(name)
+            for name in removed:
+                sym, _, kind = name.partition('@')
+                if kind == 'ticker':
+                    self._tickers.pop(sym, None)
+                elif kind.startswith('kline_'):
+                    key = (sym, kind[len('kline_'):])
+                    self._candles.pop(key, None)
+                    self._candles_at.pop(key, None)
+        self._schedule_send('UNSUBSCRIBE', removed)
+
+    # ---------------------------------------------------------------- events
+
+    def _handle(self, message: Any) -> None:
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            return
+        if isinstance(data, dict) and 'data' in data and 'stream' in data:
+            data = data['data']  # combined-stream envelope
+        if not isinstance(data, dict):
+            return
+        now = time.time()
+        event = data.get('e')
+        with self._lock:
+            self._stats['messages'] += 1
+            self._last_message_at = now
+            if event == '24hrTicker':
+                self._on_ticker(data, now)
+            elif event == 'kline':
+                self._on_kline(data, now)
+
+    def _on_ticker(self, data: Dict[str, Any], now: float) -> None:
+        # Caller holds self._lock
+        sym = str(data.get('s') or '').lower()
+        if f"{sym}@ticker" not in self._streams:
+            return
+        last = _float(data.get('c'))
+        open_price = _float(data.get('o'))
+        self._tickers[sym] = ({
+            'symbol': data.get('s'),
+            'timestamp': int(data.get('E') or now * 1000),
+            'last': last,
+            'close': last,
+            'open': open_price,
+            'high': _float(data.get('h')),
+            'low': _float(data.get('l')),
+            'bid': _float(data.get('b')),
+            'ask': _float(data.get('a')),
+            'change': _float(data.get('p')),
+            'percentage': _float(data.get('P')),
+            'changePercent': _float(data.get('P')),
+            'previousClose': _float(data.get('x')) or open_price,
+            'baseVolume': _float(data.get('v')),
+            'quoteVolume': _float(data.get('q')),
+            'source': 'stream',
+        }, now)
+
+    def _on_kline(self, data: Dict[str, Any], now: float) -> None:
+        # Caller holds self._lock
+        k = data.get('k') or {}
+        sym = str(data.get('s') or k.get('s') or '').lower()
+        interval = str(k.get('i') or '')
+        if f"{sym}@kline_{interval}" not in self._streams:
+            return
+        candle = {
+            'time': int(_float(k.get('t')) // 1000),
+            'open': _float(k.get('o')),
+            'high': _float(k.get('h')),
+            'low': _float(k.get('l')),
+            'close': _float(k.get('c')),
+            'volume': _float(k.get('v')),
+        }
+        self._put_candles((sym, interval), [candle])
+        self._candles_at[(sym, interval)] = now
+
+    def _put_candles(self, key: Tuple[str, str], candles: List[Dict[str, Any]]) -> None:
+        # Caller holds self._lock
+        buf = self._candles.setdefault(key, OrderedDict())
+        unordered = False
+        for candle in candles:
+            if buf and candle['time'] not in buf and candle['time'] < next(reversed(buf)):
+                unordered = True
+            buf[candle['time']] = candle
+        if unordered:
+            ordered = sorted(buf.items())
+            buf.clear()
+            buf.update(ordered)
+        while len(buf) > self.candle_buffer:
+            buf.popitem(last=False)
+
+    # ---------------------------------------------------------------- reads
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def get_ticker(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Live ticker (CCXT-like dict), or None if not streamed / stale / disconnected."""
+        sym = stream_symbol(symbol)
+        with self._lock:
+            item = self._tickers.get(sym) if self._connected else None
+            if item and time.time() - item[1] < self.max_age_sec:
+                self._stats['ticker_hits'] += 1
+                return dict(item[0])
+            self._stats['ticker_misses'] += 1
+            return None
+
+    def get_klines(self, symbol: str, timeframe: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Newest `limit` candles (the last one may be forming), or None if the buffer cannot
+        serve the request (not streamed, too few contiguous candles, stale, disconnected).
+        """
+        interval = CCXTConfig.TIMEFRAME_MAP.get(timeframe)
+        tf = TIMEFRAME_SECONDS.get(timeframe)
+        key = (stream_symbol(symbol), interval)
+        limit = int(limit)
+        with self._lock:
+            buf = self._candles.get(key) if (self._connected and interval and tf) else None
+            fresh = buf is not None and time.time() - self._candles_at.get(key, 0.0) < self.max_age_sec
+            if fresh and len(buf) >= limit > 0:
+                candles = list(buf.values())[-limit:]
+                contiguous = all(b['time'] - a['time'] == tf for a, b in zip(candles[:-1], candles[1:]))
+                current = candles[-1]['time'] >= int(time.time() // tf) * tf
+                if contiguous and current:
+                    self._stats['kline_hits'] += 1
+                    return [dict(c) for c in candles]
+            self._stats['kline_misses'] += 1
+            return None
+
+    def seed_klines(self, symbol: str, timeframe: str, klines: List[Dict[str, Any]]) -> None:
+        """Merge REST candles into a streamed symbol's buffer (ignored if not subscribed/connected)."""
+        interval = CCXTConfig.TIMEFRAME_MAP.get(timeframe)
+        sym = stream_symbol(symbol)
+        if not interval or not klines:
+            return
+        with self._lock:
+            if not self._connected or f"{sym}@kline_{interval}" not in self._streams:
+                return
+            # Streamed candles are newer than REST snapshots of the same bar; keep them.
+            buf = self._candles.get((sym, interval)) or {}
+            rest = [
+                {c: (int(k['time']) if c == 'time' else _float(k.get(c)))
+                 for c in ('time', 'open', 'high', 'low', 'close', 'volume')}
+                for k in klines[-self.candle_buffer:] if int(k.get('time', 0)) not in buf
+            ]
+            # Freshness still comes from stream events only (see get_klines)
+            self._put_candles((sym, interval), rest)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'url': self.url,
+                'connected': self._connected,
+                'streams': len(self._streams),
+                'last_message_age_sec': round(time.time() - self._last_message_at, 1) if self._last_message_at else None,
+            })
+            return stats
+
+
+def crypto_stream_enabled() -> bool:
+    return os.getenv('CRYPTO_STREAM_ENABLED', 'false').strip().lower() in ('1', 'true', 'yes')
+
+
+def crypto_stream_exchange() -> str:
+    """CCXT exchange id whose market data CRYPTO_STREAM_URL carries (Binance by default)."""
+    return os.getenv('CRYPTO_STREAM_EXCHANGE', 'binance').strip().lower()
+
+
+_stream: Optional[CryptoStream] = None
+_stream_lock = threading.Lock()
+_missing_dependency_logged = False
+_venue_mismatch_logged = False
+
+
+def get_crypto_stream() -> Optional[CryptoStream]:
+    """
+    Process-wide crypto stream, or None when disabled, `websockets` is not installed, or the
+    stream's venue (CRYPTO_STREAM_EXCHANGE) is not the configured CCXT exchange - prices must
+    not silently switch venue between REST and streamed data.
+    """
+    global _stream, _missing_dependency_logged, _venue_mismatch_logged
+    if not crypto_stream_enabled():
+        return None
+    exchange_id = str(CCXTConfig.DEFAULT_EXCHANGE or '').strip().lower()
+    if exchange_id != crypto_stream_exchange():
+        if not _venue_mismatch_logged:
+            _venue_mismatch_logged = True
+            logger.warning(
+                f"CRYPTO_STREAM_ENABLED is set but the stream carries '{crypto_stream_exchange()}' data "
+                f"while the crypto data source uses '{exchange_id}'; using REST"
+            )
+        return None
+    if not HAS_WEBSOCKETS:
+        if not _missing_dependency_logged:
+            _missing_dependency_logged = True
+            logger.warning("CRYPTO_STREAM_ENABLED is set but the 'websockets' package is not installed; using REST")
+        return None
+    if _stream is None:
+        with _stream_lock:
+            if _stream is None:
+                _stream = CryptoStream(
+                    url=os.getenv('CRYPTO_STREAM_URL', 'wss://stream.binance.com:9443/ws').strip(),
+                    max_age_sec=float(os.getenv('CRYPTO_STREAM_MAX_AGE_SEC', '30')),
+                    candle_buffer=int(os.getenv('CRYPTO_STREAM_CANDLES', '50')),
+                )
+    return _stream
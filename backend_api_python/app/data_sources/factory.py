@@ -5,6 +5,7 @@
 from typing import Dict, List, Any, Optional
 
 from app.data_sources.base import BaseDataSource
+from app.data_sources.kline_store import get_kline_store, kline_store_enabled
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -94,7 +95,14 @@ class DataSourceFactory:
         """
         try:
             source = cls.get_source(market)
-            klines = source.get_kline(symbol, timeframe, limit, before_time)
+            if before_time and kline_store_enabled(market, timeframe):
+                # 历史区间优先走本地K线存储，只从网络补齐缺失部分
+                klines = get_kline_store().get_kline(
+                    market, symbol, timeframe, limit, before_time,
+                    fetch=lambda n, before: source.get_kline(symbol, timeframe, n, before)
+                )
+            else:
+                klines = source.get_kline(symbol, timeframe, limit, before_time)
             
             # 确保数据按时间排序
             klines.sort(key=lambda x: x['time'])
@@ -131,3 +139,29 @@ class DataSourceFactory:
             logger.error(f"Failed to fetch ticker {market}:{symbol} - {str(e)}")
             return {'last': 0, 'symbol': symbol}
 
+    @classmethod
+    def get_tickers(cls, market: str, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取实时报价（数据源支持时使用批量接口，如 CCXT fetch_tickers）
+
+        Returns:
+            {symbol: ticker}，获取失败的 symbol 不在结果中
+        """
+        try:
+            source = cls.get_source(market)
+            return source.get_tickers(list(symbols or []))
+        except NotImplementedError:
+            logger.warning(f"get_ticker not implemented for market: {market}")
+            return {}
+        except Exception as e:
+            logger.error(f"Failed to fetch tickers {market}:{len(symbols or [])} symbols - {str(e)}")
+            return {}
+
+    @classmethod
+    def supports_batch_tickers(cls, market: str) -> bool:
+        """数据源是否有真正的批量报价接口（而非逐个 get_ticker）"""
+        try:
+            source = cls.get_source(market)
+        except Exception:
+            return False
+        return type(source).get_tickers is not BaseDataSource.get_tickers
@@ -187,9 +187,126 @@ class ForexDataSource(BaseDataSource):
                 
         except Exception as e:
             logger.error(f"Failed to get forex ticker for {symbol}: {e}")
-        
+
         return {'last': 0, 'symbol': symbol}
-    
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取外汇实时报价
+
+        一次 Tiingo FX Top-of-Book 请求（tickers=eurusd,gbpusd,...）取所有报价，
+        再用一次多 ticker 日线请求取昨收价；共享 get_ticker 的 60 秒缓存
+        """
+        api_key = APIKeys.TIINGO_API_KEY
+        if not api_key:
+            logger.warning("Tiingo API key not configured")
+            return {}
+
+        result = {}
+        wanted: Dict[str, List[str]] = {}
+        now = time.time()
+        with _forex_cache_lock:
+            for symbol in symbols:
+                cached = _forex_cache.get(f"ticker_{symbol}")
+                if cached and now - cached.get('_cache_time', 0) < _FOREX_CACHE_TTL:
+                    result[symbol] = cached
+                else:
+                    wanted.setdefault(self.SYMBOL_MAP.get(symbol) or symbol.lower(), []).append(symbol)
+        if not wanted:
+            return result
+
+        try:
+            tickers = ','.join(wanted)
+            response = None
+            for attempt in range(3):
+                response = requests.get(
+                    f"{self.base_url}/fx/top",
+                    params={'tickers': tickers, 'token': api_key},
+                    timeout=TiingoConfig.TIMEOUT
+                )
+                if response.status_code == 429:
+                    wait_time = 2 * (attempt + 1)
+                    logger.warning(f"Tiingo rate limit (429), waiting {wait_time}s before retry ({attempt+1}/3)")
+                    time.sleep(wait_time)
+                    continue
+                break
+
+            if response.status_code == 429:
+                logger.warning("Tiingo rate limit exceeded for batch ticker request")
+                # 返回缓存数据（即使已过期）
+                with _forex_cache_lock:
+                    for originals in wanted.values():
+                        for symbol in originals:
+                            if f"ticker_{symbol}" in _forex_cache:
+                                result[symbol] = _forex_cache[f"ticker_{symbol}"]
+                return result
+
+            response.raise_for_status()
+            tops = {str(item.get('ticker') or '').lower(): item for item in (response.json() or [])}
+
+            # 昨收价（用于涨跌计算），一次多 ticker 请求；失败不影响主要功能
+            prev_closes: Dict[str, float] = {}
+            try:
+                price_resp = requests.get(
+                    f"{self.base_url}/fx/prices",
+                    params={
+                        'tickers': ','.join(tops),
+                        'startDate': (datetime.now() - timedelta(days=2)).strftime('%Y-%m-%d'),
+                        'endDate': datetime.now().strftime('%Y-%m-%d'),
+                        'resampleFreq': '1day',
+                        'token': api_key
+                    },
+                    timeout=TiingoConfig.TIMEOUT
+                )
+                if price_resp.status_code == 200:
+                    # 按日期升序返回，保留每个 ticker 最后一条
+                    for row in price_resp.json() or []:
+                        close = float(row.get('close', 0) or 0)
+                        if close:
+                            prev_closes[str(row.get('ticker') or '').lower()] = close
+            except Exception:
+                pass
+
+            fetched_at = time.time()
+            for tiingo_symbol, originals in wanted.items():
+                item = tops.get(tiingo_symbol)
+                if not item:
+                    continue
+                ticker = self._ticker_from_top(item, prev_closes.get(tiingo_symbol, 0))
+                if not ticker:
+                    continue
+                ticker['_cache_time'] = fetched_at
+                with _forex_cache_lock:
+                    for symbol in originals:
+                        _forex_cache[f"ticker_{symbol}"] = ticker
+                        result[symbol] = ticker
+        except Exception as e:
+            logger.error(f"Failed to get forex tickers for {len(wanted)} symbols: {e}")
+
+        return result
+
+    @staticmethod
+    def _ticker_from_top(item: Dict[str, Any], prev_close: float) -> Optional[Dict[str, Any]]:
+        """Tiingo FX top-of-book 记录 -> ticker（与 get_ticker 返回格式一致）"""
+        bid = float(item.get('bidPrice', 0) or 0)
+        ask = float(item.get('askPrice', 0) or 0)
+        mid = float(item.get('midPrice', 0) or 0)
+        if not mid and bid and ask:
+            mid = (bid + ask) / 2
+        last_price = mid or bid or ask
+        if not last_price:
+            return None
+        change = last_price - prev_close if prev_close else 0
+        change_pct = change / prev_close * 100 if prev_close else 0
+        return {
+            'last': round(last_price, 5),
+            'bid': round(bid, 5),
+            'ask': round(ask, 5),
+            'change': round(change, 5),
+            'changePercent': round(change_pct, 2),
+            'previousClose': round(prev_close, 5) if prev_close else 0,
+        }
+
     def _get_timeframe_seconds(self, timeframe: str) -> int:
         """获取时间周期对应的秒数"""
         return TIMEFRAME_SECONDS.get(timeframe, 86400)
@@ -0,0 +1,362 @@
+"""
+本地K线存储 (Local columnar OHLCV store)
+
+Persists closed candles per market/symbol/timeframe on disk so that repeated backtests
+serve historical ranges locally and only fetch the missing parts from the network.
+
+Layout (one directory per series):
+    <KLINE_STORE_DIR>/<market>/<symbol>/<timeframe>/
+        index.json          coverage index: {"gen", "rows", "coverage": [[start, end), ...]}
+        time.<gen>.i8       int64 candle open time (unix seconds), sorted, unique
+        open.<gen>.f8       float64 columns, raw little-endian, memory-mappable
+        high/low/close/volume.<gen>.f8
+
+- Column files are append-only within a generation. Candles that land in front of or
+  between stored rows are merged by writing a new generation; index.json (written via
+  atomic rename) is the commit point, so a crash never exposes a half-written series.
+- `coverage` lists the time intervals known to be complete, so gaps in exchange data
+  (maintenance, delistings) don't trigger refetches.
+- Only closed candles are stored; the still-forming candle is always fetched live.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Optional dependency: fcntl (POSIX only) for cross-process locking (gunicorn workers)
+try:
+    import fcntl  # type: ignore
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+_DTYPES = {'time': np.dtype('<i8')}
+_DEFAULT_DTYPE = np.dtype('<f8')
+
+# Fetcher signature: fetch(limit, before_time) -> list of kline dicts (DataSource.get_kline semantics)
+Fetcher = Callable[[int, int], List[Dict[str, Any]]]
+
+
+def _default_store_dir() -> str:
+    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return os.path.join(base_dir, 'data', 'kline_store')
+
+
+def _safe_name(value: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(value or '').strip()) or '_'
+
+
+def _merge_intervals(intervals: List[List[int]]) -> List[List[int]]:
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_intervals(coverage: List[List[int]], start: int, end: int) -> List[Tuple[int, int]]:
+    """Parts of [start, end) not covered by the (merged) coverage intervals."""
+    gaps = []
+    cursor = start
+    for cov_start, cov_end in coverage:
+        if cov_end <= cursor:
+            continue
+        if cov_start >= end:
+            break
+        if cov_start > cursor:
+            gaps.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class _Series:
+    """One market/symbol/timeframe series on disk. Callers must hold the series lock."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.json')
+        self.gen = 0
+        self.rows = 0
+        self.coverage: List[List[int]] = []
+        self._load_index()
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.gen = int(meta.get('gen') or 0)
+            self.rows = int(meta.get('rows') or 0)
+            self.coverage = _merge_intervals([[int(s), int(e)] for s, e in (meta.get('coverage') or [])])
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"K-line store index unreadable, resetting {self.path}: {e}")
+            self.gen, self.rows, self.coverage = 0, 0, []
+            return
+
+        for col in COLUMNS:
+            size = os.path.getsize(self._column_path(col)) if os.path.exists(self._column_path(col)) else -1
+            if size < self.rows * self._dtype(col).itemsize:
+                logger.warning(f"K-line store column '{col}' is truncated, resetting {self.path}")
+                self.gen, self.rows, self.coverage = 0, 0, []
+                return
+
+    @staticmethod
+    def _dtype(col: str) -> np.dtype:
+        return _DTYPES.get(col, _DEFAULT_DTYPE)
+
+    def _column_path(self, col: str, gen: Optional[int] = None) -> str:
+        ext = 'i8' if col == 'time' else 'f8'
+        return os.path.join(self.path, f"{col}.{self.gen if gen is None else gen}.{ext}")
+
+    def column(self, col: str) -> np.ndarray:
+        """Memory-mapped view of a committed column (empty array if the series is empty)."""
+        if self.rows <= 0:
+            return np.empty(0, dtype=self._dtype(col))
+        return np.memmap(self._column_path(col), dtype=self._dtype(col), mode='r', shape=(self.rows,))
+
+    def read_range(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Copy rows with start <= time < end out of the memory-mapped columns."""
+        times = self.column('time')
+        lo = int(np.searchsorted(times, start, side='left'))
+        hi = int(np.searchsorted(times, end, side='left'))
+        return {col: np.array(self.column(col)[lo:hi]) for col in COLUMNS}
+
+    def _write_index(self) -> None:
+        meta = {
+            'version': 1,
+            'gen': self.gen,
+            'rows': self.rows,
+            'coverage': self.coverage,
+            'updated_at': int(time.time()),
+        }
+        tmp = f"{self.index_path}.tmp.{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.index_path)
+
+    def write(self, data: Dict[str, np.ndarray], covered: List[List[int]]) -> None:
+        """Merge new candles (sorted by time) and coverage intervals into the series."""
+        os.makedirs(self.path, exist_ok=True)
+        new_times = data['time']
+        if len(new_times) == 0:
+            pass
+        elif self.rows == 0 or int(new_times[0]) > int(self.column('time')[-1]):
+            # Fast path: pure append to the current generation
+            for col in COLUMNS:
+                with open(self._column_path(col), 'ab') as f:
+                    f.truncate(self.rows * self._dtype(col).itemsize)
+                    f.write(np.ascontiguousarray(data[col], dtype=self._dtype(col)).tobytes())
+            self.rows += len(new_times)
+        else:
+            # Overlapping/preceding candles: rebuild into a new generation (new values win)
+            old = {col: np.array(self.column(col)) for col in COLUMNS}
+            all_times = np.concatenate([new_times, old['time']])
+            uniq, first = np.unique(all_times, return_index=True)
+            new_gen = self.gen + 1
+            for col in COLUMNS:
+                merged = np.concatenate([np.asarray(data[col], dtype=self._dtype(col)), old[col]])[first]
+                with open(self._column_path(col, new_gen), 'wb') as f:
+                    f.write(np.ascontiguousarray(merged).tobytes())
+            old_gen = self.gen
+            self.gen = new_gen
+            self.rows = len(uniq)
+            self.coverage = _merge_intervals(self.coverage + covered)
+            self._write_index()
+            for col in COLUMNS:
+                try:
+                    os.remove(self._column_path(col, old_gen))
+                except OSError:
+                    pass
+            return
+
+        self.coverage = _merge_intervals(self.coverage + covered)
+        self._write_index()
+
+
+class KlineStore:
+    """
+    On-disk candle store used by DataSourceFactory.get_kline for historical queries.
+
+    get_kline() serves `limit` candles before `before_time` from disk and calls the
+    fetcher only for the sub-ranges missing from the coverage index.
+    """
+
+    BUFFER_RATIO = 1.2
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.getenv('KLINE_STORE_DIR') or _default_store_dir()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'queries': 0, 'local_hits': 0, 'network_fetches': 0, 'candles_fetched': 0}
+
+    # ----------------------------------------------------------------- helpers
+
+    def _series_path(self, market: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, _safe_name(market), _safe_name(symbol.upper()), _safe_name(timeframe))
+
+    def _thread_lock(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.Lock()
+            return lock
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    # -------------------------------------------------------------------- API
+
+    def get_kline(
+        self,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        limit: int,
+        before_time: int,
+        fetch: Fetcher,
+        now: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return up to `limit` candles with time < before_time (same contract as DataSource.get_kline).
+
+        Args:
+            fetch: Network fetcher with DataSource.get_kline(limit, before_time) semantics
+            now: Current unix time (for tests/replays), defaults to time.time()
+        """
+        tf_seconds = TIMEFRAME_SECONDS[timeframe]
+        end = int(before_time)
+        # Same lookback window as BaseDataSource.calculate_time_range (20% buffer for exchange gaps)
+        start = end - int(tf_seconds * int(limit) * self.BUFFER_RATIO)
+        now = int(now if now is not None else time.time())
+        # Candles with time < closed_end have closed and never change any more
+        closed_end = min(end, now - tf_seconds)
+
+        path = self._series_path(market, symbol, timeframe)
+        self._count('queries')
+
+        with self._thread_lock(path):
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, '.lock'), 'a') as lock_file:
+                if HAS_FCNTL:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    series = _Series(path)
+                    live = self._fill_gaps(series, start, end, closed_end, tf_seconds, fetch)
+                    data = series.read_range(start, end)
+                finally:
+                    if HAS_FCNTL:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+        klines = [
+            {'time': t, 'open': o, 'high': h, 'low': lo, 'close': c, 'volume': v}
+            for t, o, h, lo, c, v in zip(*(data[col].tolist() for col in COLUMNS))
+        ]
+        if live:
+            last = klines[-1]['time'] if klines else None
+            klines.extend(k for k in live if last is None or k['time'] > last)
+        if len(klines) > limit:
+            klines = klines[-limit:]
+        return klines
+
+    def _fill_gaps(
+        self,
+        series: _Series,
+        start: int,
+        end: int,
+        closed_end: int,
+        tf_seconds: int,
+        fetch: Fetcher
+    ) -> List[Dict[str, Any]]:
+        """Fetch and persist missing closed ranges; return live (unclosed) candles of the last fetch."""
+        gaps = _missing_intervals(series.coverage, start, closed_end) if closed_end > start else []
+        live_start = max(start, closed_end)
+        if end > live_start:
+            # Fold the unclosed tail into the last gap so it costs no extra request
+            if gaps and gaps[-1][1] >= live_start:
+                gaps[-1] = (gaps[-1][0], end)
+            else:
+                gaps.append((live_start, end))
+
+        if not gaps:
+            self._count('local_hits')
+            return []
+
+        live: List[Dict[str, Any]] = []
+        for gap_start, gap_end in gaps:
+            # Align to candle boundaries so coverage intervals line up between queries
+            gap_start = gap_start - gap_start % tf_seconds
+            gap_limit = int(math.ceil((gap_end - gap_start) / tf_seconds)) + 1
+            klines = fetch(gap_limit, gap_end) or []
+            self._count('network_fetches')
+            self._count('candles_fetched', len(klines))
+            klines = sorted((k for k in klines if gap_start <= int(k['time']) < gap_end), key=lambda k: k['time'])
+            if not klines:
+                continue
+
+            closed = [k for k in klines if int(k['time']) < closed_end]
+            live = [k for k in klines if int(k['time']) >= closed_end]
+            if not closed:
+                continue
+            # Pagination runs forward from gap_start, so a partial fetch loses the tail, not the head:
+            # the interval is complete from gap_start up to the last received candle.
+            covered_end = min(closed_end, gap_end)
+            next_time = int(closed[-1]['time']) + tf_seconds
+            if next_time < covered_end:
+                covered_end = next_time
+            data = {col: np.array([k[col] for k in closed]) for col in COLUMNS}
+            data['time'] = data['time'].astype(np.int64)
+            data['time'], first = np.unique(data['time'], return_index=True)
+            for col in COLUMNS[1:]:
+                data[col] = data[col][first]
+            series.write(data, [[gap_start, covered_end]])
+        return live
+
+
+_store: Optional[KlineStore] = None
+_store_lock = threading.Lock()
+
+
+def get_kline_store() -> KlineStore:
+    """Process-wide KlineStore singleton."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = KlineStore()
+    return _store
+
+
+def kline_store_enabled(market: str, timeframe: str) -> bool:
+    """Whether historical queries for this market/timeframe go through the local store."""
+    if os.getenv('KLINE_STORE_ENABLED', 'true').lower() != 'true':
+        return False
+    if timeframe not in TIMEFRAME_SECONDS:
+        return False
+    markets = [m.strip() for m in os.getenv('KLINE_STORE_MARKETS', 'Crypto').split(',') if m.strip()]
+    return market in markets
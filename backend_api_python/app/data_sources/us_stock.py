@@ -5,6 +5,7 @@
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
+import pandas as pd
 import yfinance as yf
 
 from app.data_sources.base import BaseDataSource
@@ -159,9 +160,66 @@ class USStockDataSource(BaseDataSource):
                 
         except Exception as e:
             logger.error(f"Failed to get ticker for {symbol}: {e}")
-        
+
         return {'last': 0, 'symbol': symbol}
-    
+
+    def get_tickers(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取美股实时报价
+
+        一次 yf.download 取所有代码最近几天的日线（当日K线即最新价），只返回取到的代码；
+        其余由调用方（KlineService.get_realtime_prices）在线程池里逐个降级
+        """
+        wanted: Dict[str, List[str]] = {}
+        for symbol in symbols:
+            code = (symbol or '').strip().upper()
+            if code:
+                wanted.setdefault(code, []).append(symbol)
+
+        result = {}
+        if wanted:
+            try:
+                df = yf.download(
+                    list(wanted), period='5d', interval='1d', group_by='ticker',
+                    auto_adjust=False, progress=False, threads=True
+                )
+            except Exception as e:
+                logger.warning(f"yfinance batch download failed for {len(wanted)} symbols: {e}")
+                df = None
+
+            if df is not None and not df.empty:
+                for code, originals in wanted.items():
+                    try:
+                        if isinstance(df.columns, pd.MultiIndex):
+                            if code not in df.columns.get_level_values(0):
+                                continue
+                            sub = df[code]
+                        else:
+                            sub = df
+                        sub = sub.dropna(subset=['Close'])
+                        if sub.empty:
+                            continue
+                        last_row = sub.iloc[-1]
+                        last_price = float(last_row['Close'])
+                        prev_close = float(sub['Close'].iloc[-2]) if len(sub) > 1 else 0
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    if last_price <= 0:
+                        continue
+                    change = (last_price - prev_close) if prev_close else 0
+                    ticker = {
+                        'last': last_price,
+                        'change': round(change, 4),
+                        'changePercent': round(change / prev_close * 100, 2) if prev_close else 0,
+                        'high': float(last_row['High']),
+                        'low': float(last_row['Low']),
+                        'open': float(last_row['Open']),
+                        'previousClose': prev_close
+                    }
+                    for original in originals:
+                        result[original] = ticker
+        return result
+
     def get_kline(
         self,
         symbol: str,
@@ -9,6 +9,13 @@ import time
 import os
 
 from app.services.backtest import BacktestService
+from app.services.backtest_jobs import (
+    JOB_KIND_BACKTEST, JOB_KIND_PORTFOLIO, JOB_KIND_SWEEP, BacktestQueueFullError, get_backtest_job_manager,
+)
+from app.services.backtest_portfolio import (
+    build_walk_forward_windows, get_backtest_portfolio_service, normalize_symbols,
+)
+from app.services.backtest_sweep import SWEEP_SORT_KEYS, expand_param_grid, get_backtest_sweep_service
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
 from app.utils.auth import login_required
@@ -94,6 +101,7 @@ def get_precision_info():
         market: 市场类型
         startDate: 开始日期 (YYYY-MM-DD)
         endDate: 结束日期 (YYYY-MM-DD)
+        engine: 回测引擎 'loop' 或 'array' (可选, array 引擎支持更长的高精度区间)
         
     Returns:
         精度信息，包含推荐的执行时间框架和预估K线数量
@@ -110,7 +118,9 @@ def get_precision_info():
         start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
         
-        exec_tf, precision_info = backtest_service.get_execution_timeframe(start_date, end_date, market)
+        engine = request.args.get('engine') or None
+        
+        exec_tf, precision_info = backtest_service.get_execution_timeframe(start_date, end_date, market, engine=engine)
         
         return jsonify({
             'code': 1,
@@ -122,11 +132,99 @@ def get_precision_info():
         return jsonify({'code': 0, 'msg': str(e)}), 400
 
 
+def _parse_backtest_params(data: dict) -> dict:
+    """
+    Validate backtest request body and convert it into job params (see BacktestJobManager.submit).
+
+    Raises:
+        ValueError: Missing parameters or date range over the timeframe limit
+    """
+    indicator_code = data.get('indicatorCode', '')
+    indicator_id = data.get('indicatorId')
+    symbol = data.get('symbol', '')
+    market = data.get('market', '')
+    timeframe = data.get('timeframe', '1D')
+    start_date_str = data.get('startDate', '')
+    end_date_str = data.get('endDate', '')
+    # 多时间框架回测开关（默认开启，仅加密货币市场有效）
+    enable_mtf = data.get('enableMtf', True)
+    if isinstance(enable_mtf, str):
+        enable_mtf = enable_mtf.lower() in ['true', '1', 'yes']
+
+    # If frontend only provides indicatorId, load code from local DB.
+    if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
+        try:
+            iid = int(indicator_id)
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
+                row = cur.fetchone()
+                cur.close()
+            if row and row.get('code'):
+                indicator_code = row.get('code')
+        except Exception:
+            pass
+
+    # 参数验证
+    if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
+        raise ValueError('Missing required parameters')
+
+    # 转换日期
+    # 开始日期：当天的 00:00:00
+    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
+    # 结束日期：当天的 23:59:59，确保包含整天的数据
+    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+    # 验证时间范围限制
+    days_diff = (end_date - start_date).days
+
+    # 根据周期设置不同的时间限制
+    if timeframe == '1m':
+        max_days = 30  # 1分钟K线最多1个月
+        max_range_text = '1 month'
+    elif timeframe == '5m':
+        max_days = 180  # 5分钟K线最多6个月
+        max_range_text = '6 months'
+    elif timeframe in ['15m', '30m']:
+        max_days = 365  # 15分钟和30分钟K线最多1年
+        max_range_text = '1 year'
+    else:  # 1H, 4H, 1D, 1W
+        max_days = 1095  # 1小时及以上最多3年
+        max_range_text = '3 years'
+
+    if days_diff > max_days:
+        raise ValueError(
+            f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} '
+            f'({max_days} days), but you selected {days_diff} days'
+        )
+
+    return {
+        'indicator_code': indicator_code,
+        'indicator_id': int(indicator_id) if indicator_id is not None else None,
+        'market': market,
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'start_date': start_date_str,
+        'end_date': end_date_str,
+        'initial_capital': float(data.get('initialCapital', 10000)),
+        'commission': float(data.get('commission', 0.001)),
+        'slippage': float(data.get('slippage', 0.0)),
+        'leverage': int(data.get('leverage', 1)),
+        'trade_direction': data.get('tradeDirection', 'long'),  # long, short, both
+        'strategy_config': data.get('strategyConfig') or {},
+        'enable_mtf': bool(enable_mtf),
+        'engine': data.get('engine'),
+    }
+
+
 @backtest_bp.route('/backtest', methods=['POST'])
 @login_required
 def run_backtest():
     """
-    Run indicator backtest for the current user.
+    Run indicator backtest for the current user (synchronous).
+
+    Thin wrapper over the backtest job queue: submits a job and waits for its result.
+    Use POST /backtest/jobs + GET /backtest/jobs/<jobId> for long runs.
     
     Params:
         indicatorId: Indicator ID (optional)
@@ -139,7 +237,10 @@ def run_backtest():
         initialCapital: Initial capital (default 10000)
         commission: Commission rate (default 0.001)
         enableMtf: Enable multi-timeframe backtest (default true, only for crypto)
+        engine: Simulation engine, 'loop' or 'array' (optional, default from BACKTEST_ENGINE env)
     """
+    data = None
+    run_id = None
     try:
         data = request.get_json()
         if not data:
@@ -149,160 +250,11 @@ def run_backtest():
                 'data': None
             }), 400
         
-        # Extract params - use current user's ID
-        user_id = g.user_id
-        indicator_code = data.get('indicatorCode', '')
-        indicator_id = data.get('indicatorId')
-        symbol = data.get('symbol', '')
-        market = data.get('market', '')
-        timeframe = data.get('timeframe', '1D')
-        start_date_str = data.get('startDate', '')
-        end_date_str = data.get('endDate', '')
-        initial_capital = float(data.get('initialCapital', 10000))
-        commission = float(data.get('commission', 0.001))
-        slippage = float(data.get('slippage', 0.0))
-        leverage = int(data.get('leverage', 1))
-        trade_direction = data.get('tradeDirection', 'long')  # long, short, both
-        strategy_config = data.get('strategyConfig') or {}
-        # 多时间框架回测开关（默认开启，仅加密货币市场有效）
-        enable_mtf = data.get('enableMtf', True)
-        if isinstance(enable_mtf, str):
-            enable_mtf = enable_mtf.lower() in ['true', '1', 'yes']
-        
-        # (Debug) log received params if needed
-        
-        # If frontend only provides indicatorId, load code from local DB.
-        if (not indicator_code or not str(indicator_code).strip()) and indicator_id:
-            try:
-                iid = int(indicator_id)
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    cur.execute("SELECT code FROM qd_indicator_codes WHERE id = ?", (iid,))
-                    row = cur.fetchone()
-                    cur.close()
-                if row and row.get('code'):
-                    indicator_code = row.get('code')
-            except Exception:
-                pass
-
-        # 参数验证
-        if not all([indicator_code, symbol, market, timeframe, start_date_str, end_date_str]):
-            return jsonify({
-                'code': 0,
-                'msg': 'Missing required parameters',
-                'data': None
-            }), 400
-        
-        # 转换日期
-        # 开始日期：当天的 00:00:00
-        start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-        # 结束日期：当天的 23:59:59，确保包含整天的数据
-        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-        
-        # 验证时间范围限制
-        days_diff = (end_date - start_date).days
-        
-        # 根据周期设置不同的时间限制
-        if timeframe == '1m':
-            max_days = 30  # 1分钟K线最多1个月
-            max_range_text = '1 month'
-        elif timeframe == '5m':
-            max_days = 180  # 5分钟K线最多6个月
-            max_range_text = '6 months'
-        elif timeframe in ['15m', '30m']:
-            max_days = 365  # 15分钟和30分钟K线最多1年
-            max_range_text = '1 year'
-        else:  # 1H, 4H, 1D, 1W
-            max_days = 1095  # 1小时及以上最多3年
-            max_range_text = '3 years'
-        
-        if days_diff > max_days:
-            return jsonify({
-                'code': 0,
-                'msg': f'Backtest range exceeds limit: timeframe {timeframe} supports up to {max_range_text} ({max_days} days), but you selected {days_diff} days',
-                'data': None
-            }), 400
-        
-        
-        # 执行回测（支持多时间框架高精度回测）
-        # 加密货币市场且启用MTF时，使用多时间框架回测
-        if enable_mtf and market.lower() in ['crypto', 'cryptocurrency']:
-            result = backtest_service.run_multi_timeframe(
-                indicator_code=indicator_code,
-                market=market,
-                symbol=symbol,
-                timeframe=timeframe,
-                start_date=start_date,
-                end_date=end_date,
-                initial_capital=initial_capital,
-                commission=commission,
-                slippage=slippage,
-                leverage=leverage,
-                trade_direction=trade_direction,
-                strategy_config=strategy_config,
-                enable_mtf=True
-            )
-        else:
-            result = backtest_service.run(
-                indicator_code=indicator_code,
-                market=market,
-                symbol=symbol,
-                timeframe=timeframe,
-                start_date=start_date,
-                end_date=end_date,
-                initial_capital=initial_capital,
-                commission=commission,
-                slippage=slippage,
-                leverage=leverage,
-                trade_direction=trade_direction,
-                strategy_config=strategy_config
-            )
-            # 添加标准回测的精度信息
-            result['precision_info'] = {
-                'enabled': False,
-                'timeframe': timeframe,
-                'precision': 'standard',
-                'message': '使用标准K线回测'
-            }
-
-        # Persist backtest run for AI optimization / history
-        run_id = None
-        try:
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO qd_backtest_runs
-                    (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
-                     initial_capital, commission, slippage, leverage, trade_direction,
-                     strategy_config, status, error_message, result_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NOW())
-                    """,
-                    (
-                        user_id,
-                        int(indicator_id) if indicator_id is not None else None,
-                        market,
-                        symbol,
-                        timeframe,
-                        start_date_str,
-                        end_date_str,
-                        initial_capital,
-                        commission,
-                        slippage,
-                        leverage,
-                        trade_direction,
-                        json.dumps(strategy_config or {}, ensure_ascii=False),
-                        'success',
-                        '',
-                        json.dumps(result or {}, ensure_ascii=False)
-                    )
-                )
-                run_id = cur.lastrowid
-                db.commit()
-                cur.close()
-        except Exception:
-            # Do not break the main backtest response if persistence fails.
-            logger.warning("Failed to persist backtest run", exc_info=True)
+        params = _parse_backtest_params(data)
+        # The job persists the run (success or failure) into qd_backtest_runs; persistence is
+        # best-effort here, so a DB failure still returns the result (runId None)
+        run_id, future = get_backtest_job_manager().submit(g.user_id, params, row_required=False)
+        result = future.result()
         
         return jsonify({
             'code': 1,
@@ -313,6 +265,8 @@ def run_backtest():
             }
         })
         
+    except BacktestQueueFullError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
     except ValueError as e:
         logger.warning(f"Invalid backtest parameters: {str(e)}")
         return jsonify({
@@ -323,44 +277,45 @@ def run_backtest():
     except Exception as e:
         logger.error(f"Backtest failed: {str(e)}")
         logger.error(traceback.format_exc())
-        # Best-effort persist failed run (if we have enough context)
-        try:
-            data = data if isinstance(data, dict) else {}
-            user_id = g.user_id
-            indicator_id = data.get('indicatorId')
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO qd_backtest_runs
-                    (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
-                     initial_capital, commission, slippage, leverage, trade_direction,
-                     strategy_config, status, error_message, result_json, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NOW())
-                    """,
-                    (
-                        user_id,
-                        int(indicator_id) if indicator_id is not None else None,
-                        str(data.get('market', '') or ''),
-                        str(data.get('symbol', '') or ''),
-                        str(data.get('timeframe', '') or ''),
-                        str(data.get('startDate', '') or ''),
-                        str(data.get('endDate', '') or ''),
-                        float(data.get('initialCapital', 0) or 0),
-                        float(data.get('commission', 0) or 0),
-                        float(data.get('slippage', 0) or 0),
-                        int(data.get('leverage', 1) or 1),
-                        str(data.get('tradeDirection', 'long') or 'long'),
-                        json.dumps(data.get('strategyConfig') or {}, ensure_ascii=False),
-                        'failed',
-                        str(e),
-                        ''
+        # Best-effort persist failed run if it failed before a job row existed
+        if run_id is None:
+            try:
+                data = data if isinstance(data, dict) else {}
+                user_id = g.user_id
+                indicator_id = data.get('indicatorId')
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    cur.execute(
+                        """
+                        INSERT INTO qd_backtest_runs
+                        (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
+                         initial_capital, commission, slippage, leverage, trade_direction,
+                         strategy_config, status, error_message, result_json, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NOW())
+                        """,
+                        (
+                            user_id,
+                            int(indicator_id) if indicator_id is not None else None,
+                            str(data.get('market', '') or ''),
+                            str(data.get('symbol', '') or ''),
+                            str(data.get('timeframe', '') or ''),
+                            str(data.get('startDate', '') or ''),
+                            str(data.get('endDate', '') or ''),
+                            float(data.get('initialCapital', 0) or 0),
+                            float(data.get('commission', 0) or 0),
+                            float(data.get('slippage', 0) or 0),
+                            int(data.get('leverage', 1) or 1),
+                            str(data.get('tradeDirection', 'long') or 'long'),
+                            json.dumps(data.get('strategyConfig') or {}, ensure_ascii=False),
+                            'failed',
+                            str(e),
+                            ''
+                        )
                     )
-                )
-                db.commit()
-                cur.close()
-        except Exception:
-            pass
+                    db.commit()
+                    cur.close()
+            except Exception:
+                pass
         return jsonify({
             'code': 0,
             'msg': f'Backtest failed: {str(e)}',
@@ -368,6 +323,186 @@ def run_backtest():
         }), 500
 
 
+@backtest_bp.route('/backtest/jobs', methods=['POST'])
+@login_required
+def submit_backtest_job():
+    """
+    Submit an asynchronous backtest job for the current user.
+
+    Params: same as POST /backtest
+
+    Returns:
+        jobId (= runId in qd_backtest_runs), poll GET /backtest/jobs/<jobId> for progress/result
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'code': 0, 'msg': 'Request body is required', 'data': None}), 400
+
+        params = _parse_backtest_params(data)
+        run_id, _ = get_backtest_job_manager().submit(g.user_id, params)
+        return jsonify({
+            'code': 1,
+            'msg': 'Backtest job submitted',
+            'data': {'jobId': run_id, 'runId': run_id, 'status': 'queued'}
+        })
+    except BacktestQueueFullError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
+    except ValueError as e:
+        logger.warning(f"Invalid backtest parameters: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    except Exception as e:
+        logger.error(f"submit_backtest_job failed: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_backtest_job(job_id: int):
+    """
+    Get backtest job status for the current user.
+
+    Returns:
+        status (queued/running/success/failed), phase (fetch/indicator/simulate/metrics/done),
+        progress (bars_processed/bars_total/...), percent, error, and result once succeeded
+    """
+    try:
+        job = get_backtest_job_manager().get_job(g.user_id, job_id)
+        if not job:
+            return jsonify({'code': 0, 'msg': 'job not found', 'data': None}), 404
+        return jsonify({'code': 1, 'msg': 'OK', 'data': job})
+    except Exception as e:
+        logger.error(f"get_backtest_job failed: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/optimize', methods=['POST'])
+@login_required
+def optimize_backtest():
+    """
+    Submit a parameter sweep job: run many strategyConfig combinations on one set of candles/signals.
+
+    Params: same as POST /backtest, plus
+        paramRanges: {dotted strategyConfig path: [values] | {start, stop, step}}
+                     e.g. {"risk.stopLossPct": {"start": 0.01, "stop": 0.05, "step": 0.01},
+                           "risk.takeProfitPct": [0.05, 0.1]}
+        sortBy: Ranking metric (default totalReturn), see SWEEP_SORT_KEYS
+        topN: Only return the best N rows (optional)
+
+    Simulation runs on the strategy timeframe (no multi-timeframe execution); engine defaults to 'array'.
+
+    Returns:
+        jobId, poll GET /backtest/jobs/<jobId>; the finished job's result is
+        {'total', 'sortBy', 'candles', 'results': [{'rank', 'params', 'metrics', 'error'}, ...]}
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'code': 0, 'msg': 'Request body is required', 'data': None}), 400
+
+        params = _parse_backtest_params(data)
+        sort_by = data.get('sortBy') or 'totalReturn'
+        if sort_by not in SWEEP_SORT_KEYS:
+            raise ValueError(f"sortBy must be one of {', '.join(SWEEP_SORT_KEYS)}")
+        param_ranges = data.get('paramRanges') or {}
+        # Reject malformed / oversized grids before queueing
+        expand_param_grid(params['strategy_config'], param_ranges, get_backtest_sweep_service().max_combinations)
+        top_n = data.get('topN')
+        params.update(
+            kind=JOB_KIND_SWEEP,
+            param_ranges=param_ranges,
+            sort_by=sort_by,
+            top_n=int(top_n) if top_n else None,
+        )
+        run_id, _ = get_backtest_job_manager().submit(g.user_id, params)
+        return jsonify({
+            'code': 1,
+            'msg': 'Optimization job submitted',
+            'data': {'jobId': run_id, 'runId': run_id, 'kind': JOB_KIND_SWEEP, 'status': 'queued'}
+        })
+    except BacktestQueueFullError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
+    except ValueError as e:
+        logger.warning(f"Invalid optimize parameters: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    except Exception as e:
+        logger.error(f"optimize_backtest failed: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
+@backtest_bp.route('/backtest/portfolio', methods=['POST'])
+@login_required
+def portfolio_backtest():
+    """
+    Submit a portfolio / walk-forward backtest job: one indicator across a basket of symbols with shared capital.
+
+    Params: same as POST /backtest, plus
+        symbols: ["BTC/USDT", "ETH/USDT", ...] (falls back to [symbol])
+        walkForward: {"trainDays": 90, "testDays": 30, "stepDays": 30} (optional)
+        paramRanges: Grid optimized on every train window (optional, see /backtest/optimize)
+        sortBy: Metric used to pick the best train-window config (default totalReturn)
+
+    Capital is split equally across symbols; simulation runs on the strategy timeframe.
+
+    Returns:
+        jobId, poll GET /backtest/jobs/<jobId>; the finished job's result is the portfolio
+        result ('_format_result' shape plus 'symbols' and 'walkForward')
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'code': 0, 'msg': 'Request body is required', 'data': None}), 400
+
+        symbols = data.get('symbols')
+        if symbols is None:
+            symbols = [data.get('symbol')] if data.get('symbol') else []
+        if not isinstance(symbols, list):
+            raise ValueError('symbols must be a list')
+        symbols = normalize_symbols(symbols, get_backtest_portfolio_service().max_symbols)
+        params = _parse_backtest_params(dict(data, symbol=symbols[0]))
+        sort_by = data.get('sortBy') or 'totalReturn'
+        if sort_by not in SWEEP_SORT_KEYS:
+            raise ValueError(f"sortBy must be one of {', '.join(SWEEP_SORT_KEYS)}")
+        walk_forward = data.get('walkForward') or None
+        param_ranges = data.get('paramRanges') or None
+        # Reject invalid windows / grids before queueing
+        if walk_forward:
+            build_walk_forward_windows(
+                datetime.strptime(params['start_date'], '%Y-%m-%d'),
+                datetime.strptime(params['end_date'], '%Y-%m-%d').replace(hour=23, minute=59, second=59),
+                int(walk_forward.get('trainDays') or 0),
+                int(walk_forward.get('testDays') or 0),
+                int(walk_forward.get('stepDays') or 0) or None
+            )
+        if param_ranges:
+            expand_param_grid(params['strategy_config'], param_ranges, get_backtest_sweep_service().max_combinations)
+        params.update(
+            kind=JOB_KIND_PORTFOLIO,
+            symbols=symbols,
+            walk_forward=walk_forward,
+            param_ranges=param_ranges,
+            sort_by=sort_by,
+        )
+        run_id, _ = get_backtest_job_manager().submit(g.user_id, params)
+        return jsonify({
+            'code': 1,
+            'msg': 'Portfolio backtest job submitted',
+            'data': {'jobId': run_id, 'runId': run_id, 'kind': JOB_KIND_PORTFOLIO, 'status': 'queued'}
+        })
+    except BacktestQueueFullError as e:
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 429
+    except ValueError as e:
+        logger.warning(f"Invalid portfolio backtest parameters: {str(e)}")
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 400
+    except Exception as e:
+        logger.error(f"portfolio_backtest failed: {e}")
+        logger.error(traceback.format_exc())
+        return jsonify({'code': 0, 'msg': str(e), 'data': None}), 500
+
+
 @backtest_bp.route('/backtest/history', methods=['GET'])
 @login_required
 def get_backtest_history():
@@ -381,10 +516,12 @@ def get_backtest_history():
         symbol: Optional symbol filter
         market: Optional market filter
         timeframe: Optional timeframe filter
+        kind: Job kind filter (default backtest; sweep, portfolio, or all)
     """
     try:
         # Use current user's ID
         user_id = g.user_id
+        get_backtest_job_manager().ensure_columns()
         limit = int(request.args.get('limit') or 50)
         offset = int(request.args.get('offset') or 0)
         limit = max(1, min(limit, 200))
@@ -395,8 +532,13 @@ def get_backtest_history():
         market = (request.args.get('market') or '').strip()
         timeframe = (request.args.get('timeframe') or '').strip()
 
+        kind = (request.args.get('kind') or JOB_KIND_BACKTEST).strip()
+
         where = ["user_id = ?"]
         params = [user_id]
+        if kind != 'all':
+            where.append("job_kind = ?")
+            params.append(kind)
         if indicator_id is not None and str(indicator_id).strip() != "":
             try:
                 where.append("indicator_id = ?")
@@ -421,7 +563,7 @@ def get_backtest_history():
                 SELECT id, user_id, indicator_id, market, symbol, timeframe,
                        start_date, end_date, initial_capital, commission, slippage,
                        leverage, trade_direction, strategy_config, status, error_message,
-                       created_at
+                       job_kind, created_at
                 FROM qd_backtest_runs
                 WHERE {where_sql}
                 ORDER BY id DESC
@@ -461,6 +603,7 @@ def get_backtest_run():
         if not run_id:
             return jsonify({'code': 0, 'msg': 'runId is required', 'data': None}), 400
 
+        get_backtest_job_manager().ensure_columns()
         with get_db_connection() as db:
             cur = db.cursor()
             cur.execute(
@@ -468,7 +611,7 @@ def get_backtest_run():
                 SELECT id, user_id, indicator_id, market, symbol, timeframe,
                        start_date, end_date, initial_capital, commission, slippage,
                        leverage, trade_direction, strategy_config, status, error_message,
-                       result_json, created_at
+                       job_kind, result_json, created_at
                 FROM qd_backtest_runs
                 WHERE id = ? AND user_id = ?
                 """,
@@ -735,6 +878,8 @@ def ai_analyze_backtest_runs():
         if not run_ids:
             return jsonify({'code': 0, 'msg': 'runIds is required', 'data': None}), 400
 
+        # Only single backtests; sweep results have a different shape
+        get_backtest_job_manager().ensure_columns()
         placeholders = ",".join(["?"] * len(run_ids))
         with get_db_connection() as db:
             cur = db.cursor()
@@ -745,10 +890,10 @@ def ai_analyze_backtest_runs():
                        leverage, trade_direction, strategy_config, status, error_message,
                        result_json, created_at
                 FROM qd_backtest_runs
-                WHERE user_id = ? AND id IN ({placeholders})
+                WHERE user_id = ? AND id IN ({placeholders}) AND job_kind = ?
                 ORDER BY id DESC
                 """,
-                (user_id, *run_ids),
+                (user_id, *run_ids, JOB_KIND_BACKTEST),
             )
             rows = cur.fetchall() or []
             cur.close()
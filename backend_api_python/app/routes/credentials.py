@@ -11,6 +11,7 @@ import traceback
 import json
 from flask import Blueprint, request, jsonify, g
 
+from app.services.live_trading.client_registry import get_exchange_client_registry
 from app.utils.db import get_db_connection
 from app.utils.logger import get_logger
 from app.utils.auth import login_required
@@ -121,6 +122,9 @@ def delete_credential():
             db.commit()
             cur.close()
 
+        # Drop cached exchange clients built from this credential
+        get_exchange_client_registry().evict_credential(cred_id)
+
         return jsonify({'code': 1, 'msg': 'success', 'data': None})
     except Exception as e:
         logger.error(f"delete_credential failed: {str(e)}")
@@ -1,6 +1,8 @@
 """
 健康检查路由
 """
+import os
+
 from flask import Blueprint, jsonify
 from datetime import datetime
 
@@ -31,3 +33,37 @@ def health_check():
 def api_health_check():
     """兼容路径：用于容器健康检查/反代探针等场景。"""
     return health_check()
+
+
+@health_bp.route('/api/health/metrics', methods=['GET'])
+def runtime_metrics():
+    """进程内运行指标（缓存命中率等），用于排查性能问题。"""
+    from app import get_pending_order_worker
+    from app.data_sources.kline_store import get_kline_store
+    from app.services.live_trading.base import get_http_stats
+    from app.services.live_trading.client_registry import get_exchange_client_registry
+    from app.services.market_data_collector import get_cache_stats as get_market_data_cache_stats
+    from app.services.market_data_hub import get_market_data_hub
+    from app.services.portfolio_monitor import get_monitor_stats
+    from app.services.price_alert_engine import get_price_alert_engine
+    from app.services.strategy_scheduler import get_strategy_scheduler
+    from app.services.strategy_status import get_strategy_status_registry
+    from app.utils.cache import CacheManager
+    from app.utils.safe_exec import get_compiled_code_cache
+
+    return jsonify({
+        'pid': os.getpid(),
+        'timestamp': datetime.now().isoformat(),
+        'cache': CacheManager().get_stats(),
+        'indicator_code_cache': get_compiled_code_cache().get_stats(),
+        'kline_store': get_kline_store().get_stats(),
+        'exchange_clients': get_exchange_client_registry().get_stats(),
+        'live_http': get_http_stats(),
+        'market_data_cache': get_market_data_cache_stats(),
+        'market_data_hub': get_market_data_hub().get_stats(),
+        'pending_order_worker': get_pending_order_worker().get_stats(),
+        'portfolio_monitor': get_monitor_stats(),
+        'price_alerts': get_price_alert_engine().get_stats(),
+        'strategy_scheduler': get_strategy_scheduler().get_stats(),
+        'strategy_status': get_strategy_status_registry().get_stats(),
+    })
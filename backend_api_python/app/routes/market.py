@@ -6,7 +6,6 @@ from flask import Blueprint, request, jsonify, g
 import traceback
 import json
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from app.services.kline import KlineService
 from app.utils.logger import get_logger
@@ -27,9 +26,6 @@ market_bp = Blueprint('market', __name__)
 kline_service = KlineService()
 cache = CacheManager()
 
-# Thread pool for parallel price fetching
-executor = ThreadPoolExecutor(max_workers=10)
-
 def _now_ts() -> int:
     return int(time.time())
 
@@ -340,49 +336,26 @@ def get_watchlist_prices():
         
         # logger.info(f"开始获取 {len(watchlist)} 个自选股价格数据")
         
-        results = []
-        
-        # 使用线程池并行获取价格
-        futures = {}
+        items = []
         for item in watchlist:
             market = item.get('market', '')
             symbol = item.get('symbol', '')
-            
             if market and symbol:
-                future = executor.submit(get_single_price, market, symbol)
-                futures[future] = (market, symbol)
+                items.append((market, symbol))
         
-        # 收集结果（带超时保护）
-        completed_futures = set()
-        try:
-            for future in as_completed(futures, timeout=30):
-                completed_futures.add(future)
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    market, symbol = futures[future]
-                    logger.warning(f"Price fetch failed: {market}:{symbol} - {str(e)}")
-                    results.append({
-                        'market': market,
-                        'symbol': symbol,
-                        'price': 0,
-                        'change': 0,
-                        'changePercent': 0
-                    })
-        except TimeoutError:
-            # 超时时，为未完成的任务添加默认结果
-            for future, (market, symbol) in futures.items():
-                if future not in completed_futures:
-                    logger.warning(f"Price fetch timed out: {market}:{symbol}")
-                    results.append({
-                        'market': market,
-                        'symbol': symbol,
-                        'price': 0,
-                        'change': 0,
-                        'changePercent': 0,
-                        'error': 'timeout'
-                    })
+        # 按市场批量取价（去重后每个市场一次批量请求，而不是每个 symbol 一次），整体最多等 30 秒
+        snapshot = kline_service.get_realtime_price_snapshot(items, timeout=30)
+        
+        results = []
+        for market, symbol in items:
+            price_data = snapshot.get((market, symbol)) or {}
+            results.append({
+                'market': market,
+                'symbol': symbol,
+                'price': price_data.get('price', 0),
+                'change': price_data.get('change', 0),
+                'changePercent': price_data.get('changePercent', 0)
+            })
         
         success_count = sum(1 for r in results if r.get('price', 0) > 0)
         logger.info(f"Watchlist prices: {success_count}/{len(results)} successful")
@@ -6,10 +6,9 @@ from flask import Blueprint, request, jsonify, g
 import json
 import traceback
 import time
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from app.services.kline import KlineService
+from app.services.price_alert_engine import get_price_alert_engine
 from app.utils.logger import get_logger
 from app.utils.cache import CacheManager
 from app.utils.db import get_db_connection
@@ -23,17 +22,6 @@ portfolio_bp = Blueprint('portfolio', __name__)
 kline_service = KlineService()
 cache = CacheManager()
 
-# Thread pool for parallel price fetching
-# Lower concurrency to avoid triggering API limits (especially for forex/US stocks)
-executor = ThreadPoolExecutor(max_workers=3)
-
-# Request interval (seconds) to avoid too frequent requests
-REQUEST_INTERVAL = 0.3
-
-# Rate limiting related
-_request_lock = threading.Lock()
-_last_request_time = {}  # {market: timestamp}
-
 
 def _now_ts() -> int:
     return int(time.time())
@@ -59,52 +47,6 @@ def _safe_json_loads(value, default=None):
     return default
 
 
-def _get_single_price(market: str, symbol: str, force_refresh: bool = False) -> dict:
-    """
-    Get price data for a single symbol.
-    
-    优先使用实时报价 API（ticker），降级使用分钟/日线 K 线数据。
-    这样可以在交易时段获取更实时的价格，而不是只显示日线收盘价。
-    
-    内置速率限制：同一市场的请求间隔至少 REQUEST_INTERVAL 秒，
-    避免触发 API 限制（如 yfinance、Tiingo、Finnhub 等）。
-    
-    Args:
-        force_refresh: 是否强制刷新（跳过缓存）
-    """
-    try:
-        # 速率限制：同一市场的请求间隔
-        with _request_lock:
-            now = time.time()
-            last_time = _last_request_time.get(market, 0)
-            wait_time = REQUEST_INTERVAL - (now - last_time)
-            if wait_time > 0:
-                time.sleep(wait_time)
-            _last_request_time[market] = time.time()
-        
-        # 使用新的 get_realtime_price 方法获取实时价格
-        price_data = kline_service.get_realtime_price(market, symbol, force_refresh=force_refresh)
-        
-        return {
-            'market': market,
-            'symbol': symbol,
-            'price': price_data.get('price', 0),
-            'change': price_data.get('change', 0),
-            'changePercent': price_data.get('changePercent', 0),
-            'source': price_data.get('source', 'unknown')  # 记录数据来源，便于调试
-        }
-    except Exception as e:
-        logger.error(f"Failed to fetch price {market}:{symbol} - {str(e)}")
-        return {
-            'market': market,
-            'symbol': symbol,
-            'price': 0,
-            'change': 0,
-            'changePercent': 0,
-            'source': 'error'
-        }
-
-
 # ==================== Position CRUD ====================
 
 @portfolio_bp.route('/positions', methods=['GET'])
@@ -131,9 +73,8 @@ def get_positions():
             cur.close()
 
         positions = []
-        price_futures = {}
         
-        # Prepare positions and submit price fetch tasks
+        # Prepare positions
         for row in rows:
             pos = {
                 'id': row.get('id'),
@@ -159,29 +100,15 @@ def get_positions():
                 'pnl_percent': 0
             }
             positions.append(pos)
-            
-            # Submit price fetch task (with force_refresh support)
-            market = row.get('market')
-            symbol = row.get('symbol')
-            if market and symbol:
-                key = f"{market}:{symbol}"
-                if key not in price_futures:
-                    future = executor.submit(_get_single_price, market, symbol, force_refresh)
-                    price_futures[key] = future
-
-        # Collect price results
-        price_map = {}
-        for key, future in price_futures.items():
-            try:
-                result = future.result(timeout=10)
-                price_map[key] = result
-            except Exception as e:
-                logger.warning(f"Price fetch failed for {key}: {e}")
+
+        # Fetch prices in batches per market (with force_refresh support), 10s overall
+        price_map = kline_service.get_realtime_price_snapshot(
+            ((pos['market'], pos['symbol']) for pos in positions), force_refresh=force_refresh, timeout=10
+        )
 
         # Calculate PnL for each position
         for pos in positions:
-            key = f"{pos['market']}:{pos['symbol']}"
-            price_data = price_map.get(key, {})
+            price_data = price_map.get((pos['market'], pos['symbol'])) or {}
             
             current_price = float(price_data.get('price') or 0)
             entry_price = pos['entry_price']
@@ -340,6 +267,7 @@ def update_position(position_id):
             db.commit()
             cur.close()
 
+        get_price_alert_engine().request_reload()
         return jsonify({'code': 1, 'msg': 'success', 'data': None})
     except Exception as e:
         logger.error(f"update_position failed: {str(e)}")
@@ -362,6 +290,7 @@ def delete_position(position_id):
             db.commit()
             cur.close()
 
+        get_price_alert_engine().request_reload()
         return jsonify({'code': 1, 'msg': 'success', 'data': None})
     except Exception as e:
         logger.error(f"delete_position failed: {str(e)}")
@@ -405,23 +334,10 @@ def get_portfolio_summary():
                 }
             })
 
-        # Fetch prices in parallel (with force_refresh support)
-        price_futures = {}
-        for row in rows:
-            market = row.get('market')
-            symbol = row.get('symbol')
-            key = f"{market}:{symbol}"
-            if key not in price_futures:
-                future = executor.submit(_get_single_price, market, symbol, force_refresh)
-                price_futures[key] = future
-
-        price_map = {}
-        for key, future in price_futures.items():
-            try:
-                result = future.result(timeout=10)
-                price_map[key] = result
-            except Exception:
-                pass
+        # Fetch prices in batches per market (with force_refresh support), 10s overall
+        price_map = kline_service.get_realtime_price_snapshot(
+            ((row.get('market'), row.get('symbol')) for row in rows), force_refresh=force_refresh, timeout=10
+        )
 
         # Calculate totals
         total_cost = 0
@@ -436,8 +352,7 @@ def get_portfolio_summary():
             quantity = float(row.get('quantity') or 0)
             entry_price = float(row.get('entry_price') or 0)
             
-            key = f"{market}:{symbol}"
-            price_data = price_map.get(key, {})
+            price_data = price_map.get((market, symbol)) or {}
             current_price = float(price_data.get('price') or 0)
             
             cost = entry_price * quantity
@@ -883,6 +798,7 @@ def add_alert():
             db.commit()
             cur.close()
 
+        get_price_alert_engine().request_reload()
         return jsonify({'code': 1, 'msg': 'success', 'data': {'id': alert_id}})
     except Exception as e:
         logger.error(f"add_alert failed: {str(e)}")
@@ -946,6 +862,7 @@ def update_alert(alert_id):
             db.commit()
             cur.close()
 
+        get_price_alert_engine().request_reload()
         return jsonify({'code': 1, 'msg': 'success', 'data': None})
     except Exception as e:
         logger.error(f"update_alert failed: {str(e)}")
@@ -968,6 +885,7 @@ def delete_alert(alert_id):
             db.commit()
             cur.close()
 
+        get_price_alert_engine().request_reload()
         return jsonify({'code': 1, 'msg': 'success', 'data': None})
     except Exception as e:
         logger.error(f"delete_alert failed: {str(e)}")
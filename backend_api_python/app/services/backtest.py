@@ -2,15 +2,21 @@
 Backtest Service
 """
 import math
+import os
 import traceback
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional
 
 import pandas as pd
 import numpy as np
 
 from app.data_sources import DataSourceFactory
+from app.services.backtest_engine import simulate_new_format_arrays, simulate_mtf_arrays
+from app.services.backtest_metrics import (
+    MAX_CURVE_POINTS, EquityCurve, compute_metrics, max_drawdown_pct, sharpe_ratio
+)
 from app.utils.logger import get_logger
+from app.utils.safe_exec import build_sandbox_globals, get_compiled_code_cache, safe_exec_code
 
 logger = get_logger(__name__)
 
@@ -27,13 +33,43 @@ class BacktestService:
     # Multi-timeframe backtest threshold configuration
     # 1m backtest: max 1 month (~43,200 candles)
     # 5m backtest: max 1 year (~105,120 candles)
+    # The array engine has no per-candle Python overhead, so it allows much longer ranges.
     MTF_CONFIG = {
         'max_1m_days': 30,        # Max days for 1-minute backtest
         'max_5m_days': 365,       # Max days for 5-minute backtest
+        'array_max_1m_days': 180,   # Max days for 1-minute backtest (array engine, ~259,200 candles)
+        'array_max_5m_days': 1825,  # Max days for 5-minute backtest (array engine, ~525,600 candles)
         'default_exec_tf': '1m',  # Default execution timeframe
         'fallback_exec_tf': '5m', # Fallback execution timeframe
     }
     
+    # Simulation engines:
+    # - loop: reference implementation (iterates DataFrame rows)
+    # - array: array-backed kernel in backtest_engine (numba-compiled when available), same results
+    SIMULATION_ENGINES = ('loop', 'array')
+    
+    # Loop engines report simulation progress every N bars (array engines report once at the end)
+    PROGRESS_EVERY_BARS = 5000
+    
+    @classmethod
+    def resolve_engine(cls, engine: Optional[str] = None) -> str:
+        """Resolve requested simulation engine, falling back to BACKTEST_ENGINE env (default: loop)."""
+        name = str(engine or os.getenv('BACKTEST_ENGINE', 'loop') or 'loop').strip().lower()
+        if name not in cls.SIMULATION_ENGINES:
+            logger.warning(f"Unknown backtest engine '{name}', using 'loop'")
+            return 'loop'
+        return name
+    
+    @staticmethod
+    def _report_progress(progress_callback: Optional[Callable[..., None]], phase: str, **info) -> None:
+        """Invoke progress callback (phase: fetch/indicator/simulate/metrics), never failing the backtest."""
+        if progress_callback is None:
+            return
+        try:
+            progress_callback(phase, **info)
+        except Exception as e:
+            logger.debug(f"Backtest progress callback failed: {e}")
+    
     @staticmethod
     def _infer_candle_path(open_: float, high: float, low: float, close: float) -> List[float]:
         """
@@ -53,7 +89,19 @@ class BacktestService:
             # Bearish: rally first then dip
             return [open_, high, low, close]
     
-    def get_execution_timeframe(self, start_date: datetime, end_date: datetime, market: str = 'crypto') -> tuple:
+    def get_mtf_limits(self, engine: Optional[str] = None) -> tuple:
+        """Return (max_1m_days, max_5m_days) for the given simulation engine."""
+        if self.resolve_engine(engine) == 'array':
+            return self.MTF_CONFIG['array_max_1m_days'], self.MTF_CONFIG['array_max_5m_days']
+        return self.MTF_CONFIG['max_1m_days'], self.MTF_CONFIG['max_5m_days']
+    
+    def get_execution_timeframe(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        market: str = 'crypto',
+        engine: Optional[str] = None
+    ) -> tuple:
         """
         Automatically select execution timeframe based on backtest date range.
         
@@ -61,6 +109,7 @@ class BacktestService:
             start_date: Start date
             end_date: End date
             market: Market type
+            engine: Simulation engine, the array engine allows longer ranges (see MTF_CONFIG)
             
         Returns:
             (execution_timeframe, precision_info)
@@ -77,8 +126,10 @@ class BacktestService:
                 'message': 'High-precision backtest only supports cryptocurrency market'
             }
         
-        if days_diff <= self.MTF_CONFIG['max_1m_days']:
-            # Within 1 month: use 1-minute precision
+        max_1m_days, max_5m_days = self.get_mtf_limits(engine)
+        
+        if days_diff <= max_1m_days:
+            # Within 1-minute limit: use 1-minute precision
             estimated_candles = days_diff * 24 * 60
             return '1m', {
                 'enabled': True,
@@ -88,8 +139,8 @@ class BacktestService:
                 'precision': 'high',
                 'message': f'Using 1-minute precision backtest (~{estimated_candles:,} candles)'
             }
-        elif days_diff <= self.MTF_CONFIG['max_5m_days']:
-            # 1 month to 1 year: use 5-minute precision
+        elif days_diff <= max_5m_days:
+            # Within 5-minute limit: use 5-minute precision
             estimated_candles = days_diff * 24 * 12
             return '5m', {
                 'enabled': True,
@@ -97,16 +148,16 @@ class BacktestService:
                 'days': days_diff,
                 'estimated_candles': estimated_candles,
                 'precision': 'medium',
-                'message': f'Range exceeds 30 days, using 5-minute precision (~{estimated_candles:,} candles)'
+                'message': f'Range exceeds {max_1m_days} days, using 5-minute precision (~{estimated_candles:,} candles)'
             }
         else:
-            # Over 1 year: high-precision backtest not supported
+            # Over 5-minute limit: high-precision backtest not supported
             return None, {
                 'enabled': False,
                 'reason': 'too_long',
                 'days': days_diff,
-                'max_days': self.MTF_CONFIG['max_5m_days'],
-                'message': f'Backtest range {days_diff} days exceeds max limit {self.MTF_CONFIG["max_5m_days"]} days'
+                'max_days': max_5m_days,
+                'message': f'Backtest range {days_diff} days exceeds max limit {max_5m_days} days'
             }
     
     def run_multi_timeframe(
@@ -123,7 +174,9 @@ class BacktestService:
         leverage: int = 1,
         trade_direction: str = 'long',
         strategy_config: Optional[Dict[str, Any]] = None,
-        enable_mtf: bool = True
+        enable_mtf: bool = True,
+        engine: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Dict[str, Any]:
         """
         Multi-timeframe backtest.
@@ -145,12 +198,14 @@ class BacktestService:
             trade_direction: Trade direction
             strategy_config: Strategy configuration
             enable_mtf: Whether to enable multi-timeframe backtest
+            engine: Simulation engine ('loop' or 'array'), see SIMULATION_ENGINES
+            progress_callback: Optional callable(phase, **info) for job progress reporting
             
         Returns:
             Backtest result with precision info
         """
         # Get execution timeframe
-        exec_tf, precision_info = self.get_execution_timeframe(start_date, end_date, market)
+        exec_tf, precision_info = self.get_execution_timeframe(start_date, end_date, market, engine=engine)
         
         if not enable_mtf or not precision_info.get('enabled'):
             # Fallback to standard candle backtest
@@ -166,7 +221,9 @@ class BacktestService:
                 slippage=slippage,
                 leverage=leverage,
                 trade_direction=trade_direction,
-                strategy_config=strategy_config
+                strategy_config=strategy_config,
+                engine=engine,
+                progress_callback=progress_callback
             )
             result['precision_info'] = precision_info or {
                 'enabled': False,
@@ -179,6 +236,7 @@ class BacktestService:
         logger.info(f"Multi-timeframe backtest: strategy_tf={timeframe}, exec_tf={exec_tf}, range={start_date} ~ {end_date}")
         
         # 1. Fetch strategy timeframe candles (for signal generation)
+        self._report_progress(progress_callback, 'fetch', timeframe=timeframe)
         df_signal = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
         if df_signal.empty:
             raise ValueError("No candle data available in the backtest date range")
@@ -190,9 +248,11 @@ class BacktestService:
             'commission': commission,
             'trade_direction': trade_direction
         }
+        self._report_progress(progress_callback, 'indicator', signal_candles=len(df_signal))
         signals = self._execute_indicator(indicator_code, df_signal, backtest_params)
         
         # 3. Fetch execution timeframe candles (for precise trade simulation)
+        self._report_progress(progress_callback, 'fetch', timeframe=exec_tf, signal_candles=len(df_signal))
         df_exec = self._fetch_kline_data(market, symbol, exec_tf, start_date, end_date)
         if df_exec.empty:
             logger.warning(f"Cannot fetch {exec_tf} candles, falling back to standard backtest")
@@ -208,7 +268,9 @@ class BacktestService:
                 slippage=slippage,
                 leverage=leverage,
                 trade_direction=trade_direction,
-                strategy_config=strategy_config
+                strategy_config=strategy_config,
+                engine=engine,
+                progress_callback=progress_callback
             )
             result['precision_info'] = {
                 'enabled': False,
@@ -220,6 +282,7 @@ class BacktestService:
         logger.info(f"Data fetched: signal_candles={len(df_signal)}, exec_candles={len(df_exec)}")
         
         # 4. Use execution timeframe for precise trade simulation
+        self._report_progress(progress_callback, 'simulate', bars_processed=0, bars_total=len(df_exec))
         equity_curve, trades, total_commission = self._simulate_trading_mtf(
             df_signal=df_signal,
             df_exec=df_exec,
@@ -231,10 +294,13 @@ class BacktestService:
             trade_direction=trade_direction,
             strategy_config=strategy_config,
             signal_timeframe=timeframe,
-            exec_timeframe=exec_tf
+            exec_timeframe=exec_tf,
+            engine=engine,
+            progress_callback=progress_callback
         )
         
         # 5. Calculate metrics
+        self._report_progress(progress_callback, 'metrics', bars_processed=len(df_exec), bars_total=len(df_exec))
         metrics = self._calculate_metrics(equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission)
         
         # 6. Format result
@@ -258,14 +324,26 @@ class BacktestService:
         trade_direction: str,
         strategy_config: Optional[Dict[str, Any]],
         signal_timeframe: str,
-        exec_timeframe: str
+        exec_timeframe: str,
+        engine: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> tuple:
         """
         Multi-timeframe trading simulation.
         
         Simulates trades candle by candle on execution timeframe, 
         using inferred candle price path to determine trigger order.
+        With engine='array' the loop runs in backtest_engine over columnar arrays (same results).
         """
+        if self.resolve_engine(engine) == 'array':
+            fast = simulate_mtf_arrays(
+                df_signal, df_exec, signals, initial_capital, commission, slippage, leverage,
+                trade_direction, strategy_config, self.TIMEFRAME_SECONDS.get(signal_timeframe, 3600)
+            )
+            if fast is not None:
+                return fast
+            logger.warning("Signals cannot be mapped onto arrays, falling back to loop MTF simulation")
+        
         equity_curve = []
         trades = []
         total_commission_paid = 0.0
@@ -443,6 +521,9 @@ class BacktestService:
         executed_trades_count = 0  # Debug counter
         
         for i, (timestamp, row) in enumerate(df_exec.iterrows()):
+            if progress_callback is not None and i % self.PROGRESS_EVERY_BARS == 0:
+                self._report_progress(progress_callback, 'simulate', bars_processed=i, bars_total=len(df_exec))
+            
             # 爆仓后直接停止回测，输出结果
             if is_liquidated:
                 break
@@ -982,7 +1063,9 @@ class BacktestService:
         slippage: float = 0.0,  # Ideal backtest environment, no slippage
         leverage: int = 1,
         trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> Dict[str, Any]:
         """
         Run backtest.
@@ -997,12 +1080,15 @@ class BacktestService:
             initial_capital: Initial capital
             commission: Commission rate
             slippage: Slippage
+            engine: Simulation engine ('loop' or 'array'), see SIMULATION_ENGINES
+            progress_callback: Optional callable(phase, **info) for job progress reporting
             
         Returns:
             Backtest result
         """
         
         # 1. Fetch candle data
+        self._report_progress(progress_callback, 'fetch', timeframe=timeframe)
         df = self._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
         if df.empty:
             raise ValueError("No candle data available in the backtest date range")
@@ -1015,14 +1101,18 @@ class BacktestService:
             'commission': commission,
             'trade_direction': trade_direction
         }
+        self._report_progress(progress_callback, 'indicator', signal_candles=len(df))
         signals = self._execute_indicator(indicator_code, df, backtest_params)
         
         # 3. Simulate trading
+        self._report_progress(progress_callback, 'simulate', bars_processed=0, bars_total=len(df))
         equity_curve, trades, total_commission = self._simulate_trading(
-            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config
+            df, signals, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            engine=engine, progress_callback=progress_callback
         )
         
         # 4. Calculate metrics
+        self._report_progress(progress_callback, 'metrics', bars_processed=len(df), bars_total=len(df))
         metrics = self._calculate_metrics(equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission)
         
         # 5. Format result
@@ -1117,51 +1207,20 @@ class BacktestService:
             # Add technical indicator functions
             local_vars.update(self._get_indicator_functions())
             
-            # Add safe builtins (keep full builtins to support lambda etc.)
-            # but remove dangerous functions like eval, exec, open etc.
-            import builtins
-            
-            # Create restricted __import__ that only allows safe modules
-            def safe_import(name, *args, **kwargs):
-                """Only allow importing numpy, pandas, math, json etc."""
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'datetime', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"Import not allowed: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit',
-                               'copyright', 'credits', 'license'
-                           ]}
-            
-            # Add restricted __import__
-            safe_builtins['__import__'] = safe_import
-            
-            # Create unified execution environment (globals and locals use same dict)
-            # This allows functions to access np, pd etc.
-            exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            # Pre-execute import statements to ensure np and pd are available
-            pre_import_code = """
-import numpy as np
-import pandas as pd
-"""
-            exec(pre_import_code, exec_env)
+            # Security check + compile, cached by code content (validated once per script)
+            try:
+                code_obj = get_compiled_code_cache().get(code, validate=True)
+            except ValueError as e:
+                logger.error(f"Backtest code security check failed: {e}")
+                raise
             
-            # Security check: validate code doesn't contain dangerous operations
-            from app.utils.safe_exec import validate_code_safety
-            is_safe, error_msg = validate_code_safety(code)
-            if not is_safe:
-                logger.error(f"Backtest code security check failed: {error_msg}")
-                raise ValueError(f"Code contains unsafe operations: {error_msg}")
+            # Unified execution environment (globals and locals use same dict) with safe builtins:
+            # full builtins to support lambda etc., minus eval/exec/open..., and a restricted __import__
+            exec_env = build_sandbox_globals(local_vars)
             
             # Execute user code safely (with timeout)
-            from app.utils.safe_exec import safe_exec_code
             exec_result = safe_exec_code(
-                code=code,
+                code=code_obj,
                 exec_globals=exec_env,
                 exec_locals=exec_env,
                 timeout=60  # Backtest allows longer time (60 seconds)
@@ -1278,7 +1337,9 @@ import pandas as pd
         slippage: float,
         leverage: int = 1,
         trade_direction: str = 'long',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> tuple:
         """
         Simulate trading.
@@ -1289,6 +1350,7 @@ import pandas as pd
                 - 'long': Long only (buy->sell)
                 - 'short': Short only (sell->buy, reversed PnL)
                 - 'both': Both directions (buy->sell long + sell->buy short)
+            engine: Simulation engine ('loop' or 'array'), see SIMULATION_ENGINES
         """
         # Normalize supported signal formats into 4-way signals.
         if not isinstance(signals, dict):
@@ -1337,7 +1399,13 @@ import pandas as pd
         else:
             raise ValueError("signals dict must contain either 4-way keys or buy/sell keys.")
 
-        return self._simulate_trading_new_format(df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config)
+        if self.resolve_engine(engine) == 'array':
+            return simulate_new_format_arrays(df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config)
+
+        return self._simulate_trading_new_format(
+            df, norm, initial_capital, commission, slippage, leverage, trade_direction, strategy_config,
+            progress_callback=progress_callback
+        )
     
     def _simulate_trading_new_format(
         self,
@@ -1348,7 +1416,8 @@ import pandas as pd
         slippage: float,
         leverage: int = 1,
         trade_direction: str = 'both',
-        strategy_config: Optional[Dict[str, Any]] = None
+        strategy_config: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[Callable[..., None]] = None
     ) -> tuple:
         """
         Simulate trading with 4-way signal format (supports position management and scaling).
@@ -1518,6 +1587,9 @@ import pandas as pd
         add_short_price_arr = signals.get('add_short_price', pd.Series([0.0] * len(df))).values
         
         for i, (timestamp, row) in enumerate(df.iterrows()):
+            if progress_callback is not None and i % self.PROGRESS_EVERY_BARS == 0:
+                self._report_progress(progress_callback, 'simulate', bars_processed=i, bars_total=len(df))
+            
             # 爆仓后直接停止回测，输出结果
             if is_liquidated:
                 break
@@ -3647,75 +3719,14 @@ import pandas as pd
         end_date: datetime,
         total_commission: float = 0
     ) -> Dict:
-        """计算回测指标"""
-        if not equity_curve:
-            return {}
-        
-        final_value = equity_curve[-1]['value']
-        total_return = (final_value - initial_capital) / initial_capital * 100
-        
-        # Calculate annualized return: simple, not compound
-        # For high-return strategies, compound annualization produces unrealistic numbers
-        actual_days = (end_date - start_date).total_seconds() / 86400
-        years = actual_days / 365.0
-        
-        # Simple annualization: annualized return = total return / years
-        if years > 0:
-            annual_return = total_return / years
-        else:
-            annual_return = 0
-        
-        # Calculate max drawdown
-        values = [e['value'] for e in equity_curve]
-        max_drawdown = self._calculate_max_drawdown(values)
-        
-        # Calculate Sharpe ratio
-        sharpe = self._calculate_sharpe(values, timeframe)
-        
-        # Calculate total PnL: final equity - initial capital (most accurate)
-        total_profit = final_value - initial_capital
-        
-        # Calculate win rate (all exit trades)
-        # Exit trades: trades with profit != 0
-        closing_trades = [t for t in trades if t.get('profit', 0) != 0]
-        win_trades = [t for t in closing_trades if t['profit'] > 0]
-        loss_trades = [t for t in closing_trades if t['profit'] < 0]
-        total_trades = len(closing_trades)
-        win_rate = len(win_trades) / total_trades * 100 if total_trades > 0 else 0
-        
-        # Calculate profit factor (= total profit / total loss)
-        total_wins = sum(t['profit'] for t in win_trades)
-        total_losses = abs(sum(t['profit'] for t in loss_trades))
-        profit_factor = total_wins / total_losses if total_losses > 0 else (total_wins if total_wins > 0 else 0)
-        
-        return {
-            'totalReturn': round(total_return, 2),
-            'annualReturn': round(annual_return, 2),
-            'maxDrawdown': round(max_drawdown, 2),
-            'sharpeRatio': round(sharpe, 2),
-            'winRate': round(win_rate, 2),
-            'profitFactor': round(profit_factor, 2),
-            'totalTrades': total_trades,
-            'totalProfit': round(total_profit, 2),
-            'totalCommission': round(total_commission, 2)
-        }
+        """计算回测指标 (see backtest_metrics.compute_metrics)"""
+        return compute_metrics(
+            equity_curve, trades, initial_capital, timeframe, start_date, end_date, total_commission
+        )
     
     def _calculate_max_drawdown(self, values: List[float]) -> float:
         """计算最大回撤"""
-        if not values:
-            return 0
-        
-        peak = values[0]
-        max_dd = 0
-        
-        for value in values:
-            if value > peak:
-                peak = value
-            dd = (peak - value) / peak * 100
-            if dd > max_dd:
-                max_dd = dd
-        
-        return -max_dd
+        return max_drawdown_pct(values)
     
     def _calculate_sharpe(self, values: List[float], timeframe: str = '1D', risk_free_rate: float = 0.02) -> float:
         """
@@ -3726,50 +3737,7 @@ import pandas as pd
             timeframe: 时间周期
             risk_free_rate: 无风险收益率（年化）
         """
-        if len(values) < 2:
-            return 0
-        
-        # Filter out zero values (post-liquidation data), avoid division by 0
-        valid_values = [v for v in values if v > 0]
-        if len(valid_values) < 2:
-            return 0
-        
-        # Determine annualization factor by timeframe
-        annualization_factor = {
-            '1m': 252 * 24 * 60,      # 1m candle: ~362,880
-            '5m': 252 * 24 * 12,      # 5分钟K：约72,576
-            '15m': 252 * 24 * 4,      # 15分钟K：约24,192
-            '30m': 252 * 24 * 2,      # 30分钟K：约12,096
-            '1H': 252 * 24,           # 1H candle: 6,048
-            '4H': 252 * 6,            # 4小时K：1,512
-            '1D': 252,                # 1D candle: 252
-            '1W': 52                  # 1W candle: 52
-        }.get(timeframe, 252)
-        
-        try:
-            # Calculate period returns
-            returns = np.diff(valid_values) / valid_values[:-1]
-            
-            # Filter invalid values
-            returns = returns[np.isfinite(returns)]
-            if len(returns) == 0:
-                return 0
-            
-            # Annualized mean return
-            avg_return = np.mean(returns) * annualization_factor
-            
-            # Annualized std (volatility)
-            std_return = np.std(returns) * np.sqrt(annualization_factor)
-            
-            if std_return == 0 or not np.isfinite(std_return):
-                return 0
-            
-            # Sharpe ratio = (annualized return - risk-free rate) / annualized volatility
-            sharpe = (avg_return - risk_free_rate) / std_return
-            return sharpe if np.isfinite(sharpe) else 0
-        except Exception as e:
-            logger.warning(f"Sharpe ratio calculation failed: {e}")
-            return 0
+        return sharpe_ratio(values, timeframe, risk_free_rate)
     
     def _format_result(
         self,
@@ -3778,12 +3746,6 @@ import pandas as pd
         trades: List
     ) -> Dict[str, Any]:
         """格式化回测结果"""
-        # Simplify equity curve
-        max_points = 500
-        if len(equity_curve) > max_points:
-            step = len(equity_curve) // max_points
-            equity_curve = equity_curve[::step]
-        
         # Clean NaN/Inf values for JSON serialization
         def clean_value(value):
             """清理数值，将NaN/Inf转换为0"""
@@ -3797,13 +3759,8 @@ import pandas as pd
         for key, value in metrics.items():
             cleaned_metrics[key] = clean_value(value)
         
-        # Clean equity_curve
-        cleaned_curve = []
-        for item in equity_curve:
-            cleaned_curve.append({
-                'time': item['time'],
-                'value': clean_value(item['value'])
-            })
+        # Simplify equity curve (the only place it becomes a list of dicts)
+        cleaned_curve = EquityCurve.from_records(equity_curve).to_records(max_points=MAX_CURVE_POINTS)
         
         # Clean trades
         cleaned_trades = []
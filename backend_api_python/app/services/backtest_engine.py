@@ -0,0 +1,1603 @@
+"""
+Array-backed backtest simulation engine.
+
+Runs the same 4-way signal + SL/TP/trailing/scale-in/scale-out state machine as
+`BacktestService._simulate_trading_new_format`, but over pre-extracted NumPy columns
+instead of `df.iterrows()`. The multi-timeframe loop of
+`BacktestService._simulate_trading_mtf` has an array counterpart as well
+(`simulate_mtf_arrays`), where signals are mapped onto execution candles with
+`np.searchsorted`.
+
+- If numba is installed the bar loop is JIT-compiled (nopython mode).
+- Otherwise the very same kernel runs as plain Python over list-converted columns,
+  which still avoids the per-row Series construction and dict lookups of iterrows.
+
+Trades/equity are recorded as numeric event arrays inside the kernel and converted
+to the usual list-of-dicts format once at the end, so results are identical to the
+reference implementation (see scripts/backtest_engine_parity.py).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.backtest_metrics import EquityCurve, format_bar_times
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Optional dependency: numba
+try:
+    from numba import njit  # type: ignore
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+def _jit(func):
+    """JIT-compile with numba when available, otherwise return the Python function unchanged."""
+    if HAS_NUMBA:
+        return njit(cache=True, nogil=True)(func)
+    return func
+
+
+# Trade type codes used inside the kernel (index -> trade 'type' string).
+TRADE_TYPES = (
+    'open_long',            # 0
+    'open_short',           # 1
+    'close_long',           # 2
+    'close_short',          # 3
+    'close_long_stop',      # 4
+    'close_long_profit',    # 5
+    'close_long_trailing',  # 6
+    'close_short_stop',     # 7
+    'close_short_profit',   # 8
+    'close_short_trailing', # 9
+    'add_long',             # 10
+    'add_short',            # 11
+    'reduce_long',          # 12
+    'reduce_short',         # 13
+    'liquidation',          # 14
+)
+T_OPEN_LONG = 0
+T_OPEN_SHORT = 1
+T_CLOSE_LONG = 2
+T_CLOSE_SHORT = 3
+T_CLOSE_LONG_STOP = 4
+T_CLOSE_LONG_PROFIT = 5
+T_CLOSE_LONG_TRAILING = 6
+T_CLOSE_SHORT_STOP = 7
+T_CLOSE_SHORT_PROFIT = 8
+T_CLOSE_SHORT_TRAILING = 9
+T_ADD_LONG = 10
+T_ADD_SHORT = 11
+T_REDUCE_LONG = 12
+T_REDUCE_SHORT = 13
+T_LIQUIDATION = 14
+
+# Trade types whose 'profit' field is always the literal 0 in the reference implementation.
+_ZERO_PROFIT_TYPES = {T_OPEN_LONG, T_OPEN_SHORT, T_ADD_LONG, T_ADD_SHORT}
+
+NEXT_BAR_OPEN_TIMINGS = ('next_bar_open', 'next_open', 'nextopen', 'next')
+
+
+def parse_new_format_config(strategy_config: Optional[Dict[str, Any]], leverage: int) -> Dict[str, Any]:
+    """
+    Parse strategyConfig into effective (post-leverage) parameters.
+
+    Mirrors the parsing at the top of `_simulate_trading_new_format`, including its
+    precedence quirks (the trailing activation fallback is recomputed away there, so it
+    is not applied here either).
+    """
+    cfg = strategy_config or {}
+    exec_cfg = cfg.get('execution') or {}
+    signal_timing = str(exec_cfg.get('signalTiming') or 'next_bar_open').strip().lower()
+    risk_cfg = cfg.get('risk') or {}
+    trailing_cfg = risk_cfg.get('trailing') or {}
+
+    lev = max(int(leverage or 1), 1)
+
+    pos_cfg = cfg.get('position') or {}
+    entry_pct_cfg = float(pos_cfg.get('entryPct') or 1.0)
+    if entry_pct_cfg > 1:
+        entry_pct_cfg = entry_pct_cfg / 100.0
+    entry_pct_cfg = max(0.0, min(entry_pct_cfg, 1.0))
+
+    scale_cfg = cfg.get('scale') or {}
+
+    def _rule(name: str) -> Tuple[bool, float, float, int]:
+        rule_cfg = scale_cfg.get(name) or {}
+        return (
+            bool(rule_cfg.get('enabled')),
+            float(rule_cfg.get('stepPct') or 0.0) / lev,
+            float(rule_cfg.get('sizePct') or 0.0),
+            int(rule_cfg.get('maxTimes') or 0),
+        )
+
+    trend_add = _rule('trendAdd')
+    dca_add = _rule('dcaAdd')
+    # Trend scale-in and mean-reversion scale-in never run together.
+    if trend_add[0] and dca_add[0]:
+        dca_add = (False,) + dca_add[1:]
+
+    return {
+        'next_bar_open': signal_timing in NEXT_BAR_OPEN_TIMINGS,
+        'stop_loss_pct_eff': float(risk_cfg.get('stopLossPct') or 0.0) / lev,
+        'take_profit_pct_eff': float(risk_cfg.get('takeProfitPct') or 0.0) / lev,
+        'trailing_enabled': bool(trailing_cfg.get('enabled')),
+        'trailing_pct_eff': float(trailing_cfg.get('pct') or 0.0) / lev,
+        'trailing_activation_pct_eff': float(trailing_cfg.get('activationPct') or 0.0) / lev,
+        'entry_pct_cfg': entry_pct_cfg,
+        'trend_add': trend_add,
+        'dca_add': dca_add,
+        'trend_reduce': _rule('trendReduce'),
+        'adverse_reduce': _rule('adverseReduce'),
+    }
+
+
+@_jit
+def _push_event(ev_bar, ev_type, ev_num, n_ev, bar, trade_type, price, amount, profit, balance):
+    """Append one trade event; writes are skipped once capacity is exceeded (caller re-runs larger)."""
+    if n_ev < ev_bar.shape[0]:
+        ev_bar[n_ev] = bar
+        ev_type[n_ev] = trade_type
+        ev_num[n_ev, 0] = price
+        ev_num[n_ev, 1] = amount
+        ev_num[n_ev, 2] = profit
+        ev_num[n_ev, 3] = balance
+    return n_ev + 1
+
+
+@_jit
+def _simulate_new_format_kernel(
+    open_arr, high_arr, low_arr, close_arr,
+    open_long_arr, close_long_arr, open_short_arr, close_short_arr,
+    add_long_arr, add_short_arr, position_size_arr,
+    open_long_price_arr, open_short_price_arr,
+    close_long_price_arr, close_short_price_arr,
+    add_long_price_arr, add_short_price_arr,
+    has_position_management, both_mode_active, next_bar_open,
+    initial_capital, commission, slippage, leverage,
+    stop_loss_pct_eff, take_profit_pct_eff,
+    trailing_enabled, trailing_pct_eff, trailing_activation_pct_eff,
+    entry_pct_cfg,
+    trend_add_enabled, trend_add_step_pct_eff, trend_add_size_pct, trend_add_max_times,
+    dca_add_enabled, dca_add_step_pct_eff, dca_add_size_pct, dca_add_max_times,
+    trend_reduce_enabled, trend_reduce_step_pct_eff, trend_reduce_size_pct, trend_reduce_max_times,
+    adverse_reduce_enabled, adverse_reduce_step_pct_eff, adverse_reduce_size_pct, adverse_reduce_max_times,
+    ev_bar, ev_type, ev_num, eq_value, eq_raw,
+):
+    """
+    Bar loop of the 4-way signal state machine.
+
+    Only scalars and arrays are used so the same code runs under numba and CPython.
+    `None` states of the reference implementation are represented by NaN, and
+    position_type by 0 (flat), 1 (long), -1 (short).
+
+    Returns:
+        (n_events, n_equity, total_commission_paid)
+    """
+    n = len(close_arr)
+    n_ev = 0
+    n_eq = 0
+    total_commission_paid = 0.0
+    is_liquidated = False
+    liquidation_price = 0.0
+    min_capital_to_trade = 1.0
+
+    capital = initial_capital
+    position = 0.0
+    entry_price = 0.0
+    position_type = 0
+
+    nan = np.nan
+    highest_since_entry = nan
+    lowest_since_entry = nan
+    trend_add_times = 0
+    dca_add_times = 0
+    trend_reduce_times = 0
+    adverse_reduce_times = 0
+    last_trend_add_anchor = nan
+    last_dca_add_anchor = nan
+    last_trend_reduce_anchor = nan
+    last_adverse_reduce_anchor = nan
+
+    for i in range(n):
+        if is_liquidated:
+            break
+
+        high = high_arr[i]
+        low = low_arr[i]
+        close = close_arr[i]
+        open_ = open_arr[i]
+
+        # If no position and balance low, stop trading
+        if position == 0 and capital < min_capital_to_trade:
+            is_liquidated = True
+            capital = 0.0
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, close, 0.0, -initial_capital, 0.0)
+            eq_value[n_eq] = 0.0
+            n_eq += 1
+            break
+
+        # --- Risk controls: SL / TP / trailing exit (highest priority) ---
+        if position != 0 and position_type != 0:
+            if highest_since_entry != highest_since_entry:
+                highest_since_entry = entry_price
+            if lowest_since_entry != lowest_since_entry:
+                lowest_since_entry = entry_price
+            highest_since_entry = max(highest_since_entry, high)
+            lowest_since_entry = min(lowest_since_entry, low)
+
+            # Priority: StopLoss > TrailingStop > TakeProfit
+            if position_type == 1 and position > 0:
+                exit_type = -1
+                trigger_price = 0.0
+                if stop_loss_pct_eff > 0:
+                    sl_price = entry_price * (1 - stop_loss_pct_eff)
+                    if low <= sl_price:
+                        exit_type = 4
+                        trigger_price = sl_price
+                if exit_type < 0 and trailing_enabled and trailing_pct_eff > 0:
+                    trail_active = True
+                    if trailing_activation_pct_eff > 0:
+                        trail_active = highest_since_entry >= entry_price * (1 + trailing_activation_pct_eff)
+                    if trail_active:
+                        tr_price = highest_since_entry * (1 - trailing_pct_eff)
+                        if low <= tr_price:
+                            exit_type = 6
+                            trigger_price = tr_price
+                if exit_type < 0 and (not trailing_enabled) and take_profit_pct_eff > 0:
+                    tp_price = entry_price * (1 + take_profit_pct_eff)
+                    if high >= tp_price:
+                        exit_type = 5
+                        trigger_price = tp_price
+
+                if exit_type >= 0:
+                    exec_price_close = trigger_price * (1 - slippage)
+                    commission_fee_close = position * exec_price_close * commission
+                    profit = (exec_price_close - entry_price) * position - commission_fee_close
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, exit_type, exec_price_close, position, profit, capital)
+
+                    position = 0.0
+                    position_type = 0
+                    liquidation_price = 0.0
+                    highest_since_entry = nan
+                    lowest_since_entry = nan
+                    trend_add_times = 0
+                    dca_add_times = 0
+                    trend_reduce_times = 0
+                    adverse_reduce_times = 0
+                    last_trend_add_anchor = nan
+                    last_dca_add_anchor = nan
+                    last_trend_reduce_anchor = nan
+                    last_adverse_reduce_anchor = nan
+
+                    eq_value[n_eq] = capital
+                    n_eq += 1
+                    continue
+
+            if position_type == -1 and position < 0:
+                shares = abs(position)
+                exit_type = -1
+                trigger_price = 0.0
+                if stop_loss_pct_eff > 0:
+                    sl_price = entry_price * (1 + stop_loss_pct_eff)
+                    if high >= sl_price:
+                        exit_type = 7
+                        trigger_price = sl_price
+                if exit_type < 0 and trailing_enabled and trailing_pct_eff > 0:
+                    trail_active = True
+                    if trailing_activation_pct_eff > 0:
+                        trail_active = lowest_since_entry <= entry_price * (1 - trailing_activation_pct_eff)
+                    if trail_active:
+                        tr_price = lowest_since_entry * (1 + trailing_pct_eff)
+                        if high >= tr_price:
+                            exit_type = 9
+                            trigger_price = tr_price
+                if exit_type < 0 and (not trailing_enabled) and take_profit_pct_eff > 0:
+                    tp_price = entry_price * (1 - take_profit_pct_eff)
+                    if low <= tp_price:
+                        exit_type = 8
+                        trigger_price = tp_price
+
+                if exit_type >= 0:
+                    exec_price_close = trigger_price * (1 + slippage)
+                    commission_fee_close = shares * exec_price_close * commission
+                    profit = (entry_price - exec_price_close) * shares - commission_fee_close
+
+                    if capital + profit <= 0:
+                        capital = 0.0
+                        is_liquidated = True
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price_close, shares, -initial_capital, 0.0)
+                        position = 0.0
+                        position_type = 0
+                        liquidation_price = 0.0
+                        eq_value[n_eq] = 0.0
+                        n_eq += 1
+                        continue
+
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, exit_type, exec_price_close, shares, profit, capital)
+
+                    position = 0.0
+                    position_type = 0
+                    liquidation_price = 0.0
+                    highest_since_entry = nan
+                    lowest_since_entry = nan
+                    trend_add_times = 0
+                    dca_add_times = 0
+                    trend_reduce_times = 0
+                    adverse_reduce_times = 0
+                    last_trend_add_anchor = nan
+                    last_dca_add_anchor = nan
+                    last_trend_reduce_anchor = nan
+                    last_adverse_reduce_anchor = nan
+
+                    eq_value[n_eq] = capital
+                    n_eq += 1
+                    continue
+
+        # Handle exit signals
+        if position > 0 and close_long_arr[i]:
+            if next_bar_open:
+                target_price = open_
+            else:
+                target_price = close_long_price_arr[i] if close_long_price_arr[i] > 0 else close
+            exec_price = target_price * (1 - slippage)
+            commission_fee = position * exec_price * commission
+            profit = (exec_price - entry_price) * position - commission_fee
+            capital += profit
+            total_commission_paid += commission_fee
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 2, exec_price, position, profit, capital)
+
+            position = 0.0
+            position_type = 0
+            liquidation_price = 0.0
+            highest_since_entry = nan
+            lowest_since_entry = nan
+            trend_add_times = 0
+            dca_add_times = 0
+            trend_reduce_times = 0
+            adverse_reduce_times = 0
+            last_trend_add_anchor = nan
+            last_dca_add_anchor = nan
+            last_trend_reduce_anchor = nan
+            last_adverse_reduce_anchor = nan
+
+            if capital < min_capital_to_trade:
+                is_liquidated = True
+                capital = 0.0
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price, 0.0, -initial_capital, 0.0)
+
+        elif position < 0 and close_short_arr[i]:
+            if next_bar_open:
+                target_price = open_
+            else:
+                target_price = close_short_price_arr[i] if close_short_price_arr[i] > 0 else close
+            exec_price = target_price * (1 + slippage)
+            shares = abs(position)
+            commission_fee = shares * exec_price * commission
+            profit = (entry_price - exec_price) * shares - commission_fee
+
+            if capital + profit <= 0:
+                capital = 0.0
+                is_liquidated = True
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price, shares, 0.0, 0.0)
+                position = 0.0
+                position_type = 0
+                eq_value[n_eq] = 0.0
+                n_eq += 1
+                continue
+
+            capital += profit
+            total_commission_paid += commission_fee
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 3, exec_price, shares, profit, capital)
+
+            position = 0.0
+            position_type = 0
+            liquidation_price = 0.0
+            highest_since_entry = nan
+            lowest_since_entry = nan
+            trend_add_times = 0
+            dca_add_times = 0
+            trend_reduce_times = 0
+            adverse_reduce_times = 0
+            last_trend_add_anchor = nan
+            last_dca_add_anchor = nan
+            last_trend_reduce_anchor = nan
+            last_adverse_reduce_anchor = nan
+
+            if capital < min_capital_to_trade:
+                is_liquidated = True
+                capital = 0.0
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price, 0.0, -initial_capital, 0.0)
+
+        # No scale-in/scale-out on a bar that carries a main strategy signal.
+        main_signal_on_bar = bool(open_long_arr[i] or open_short_arr[i] or close_long_arr[i] or close_short_arr[i])
+
+        # --- Parameterized scaling rules ---
+        if (not main_signal_on_bar) and position != 0 and position_type != 0 and capital >= min_capital_to_trade:
+            if position_type == 1 and position > 0:
+                # Trend scale-in (trigger on higher price)
+                if trend_add_enabled and trend_add_step_pct_eff > 0 and trend_add_size_pct > 0 and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                    anchor = last_trend_add_anchor if last_trend_add_anchor == last_trend_add_anchor else entry_price
+                    trigger = anchor * (1 + trend_add_step_pct_eff)
+                    if high >= trigger:
+                        exec_price_add = trigger * (1 + slippage)
+                        use_capital = capital * trend_add_size_pct
+                        shares_add = (use_capital * leverage) / exec_price_add
+                        commission_fee = shares_add * exec_price_add * commission
+                        total_cost_after = position * entry_price + shares_add * exec_price_add
+                        position += shares_add
+                        entry_price = total_cost_after / position
+                        capital -= commission_fee
+                        total_commission_paid += commission_fee
+                        liquidation_price = entry_price * (1 - 1.0 / leverage)
+                        trend_add_times += 1
+                        last_trend_add_anchor = trigger
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 10, exec_price_add, shares_add, 0.0, capital)
+
+                # Mean-reversion DCA (trigger on lower price)
+                if dca_add_enabled and dca_add_step_pct_eff > 0 and dca_add_size_pct > 0 and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                    anchor = last_dca_add_anchor if last_dca_add_anchor == last_dca_add_anchor else entry_price
+                    trigger = anchor * (1 - dca_add_step_pct_eff)
+                    if low <= trigger:
+                        exec_price_add = trigger * (1 + slippage)
+                        use_capital = capital * dca_add_size_pct
+                        shares_add = (use_capital * leverage) / exec_price_add
+                        commission_fee = shares_add * exec_price_add * commission
+                        total_cost_after = position * entry_price + shares_add * exec_price_add
+                        position += shares_add
+                        entry_price = total_cost_after / position
+                        capital -= commission_fee
+                        total_commission_paid += commission_fee
+                        liquidation_price = entry_price * (1 - 1.0 / leverage)
+                        dca_add_times += 1
+                        last_dca_add_anchor = trigger
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 10, exec_price_add, shares_add, 0.0, capital)
+
+                # Trend reduce (trigger on higher price)
+                if trend_reduce_enabled and trend_reduce_step_pct_eff > 0 and trend_reduce_size_pct > 0 and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                    anchor = last_trend_reduce_anchor if last_trend_reduce_anchor == last_trend_reduce_anchor else entry_price
+                    trigger = anchor * (1 + trend_reduce_step_pct_eff)
+                    if high >= trigger:
+                        reduce_shares = position * max(trend_reduce_size_pct, 0.0)
+                        if reduce_shares > 0:
+                            exec_price_reduce = trigger * (1 - slippage)
+                            commission_fee = reduce_shares * exec_price_reduce * commission
+                            profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            position -= reduce_shares
+                            if position <= 1e-12:
+                                position = 0.0
+                                position_type = 0
+                                liquidation_price = 0.0
+                            else:
+                                liquidation_price = entry_price * (1 - 1.0 / leverage)
+                            trend_reduce_times += 1
+                            last_trend_reduce_anchor = trigger
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 12, exec_price_reduce, reduce_shares, profit, capital)
+
+                # Adverse reduce (trigger on lower price)
+                if position_type == 1 and position > 0 and adverse_reduce_enabled and adverse_reduce_step_pct_eff > 0 and adverse_reduce_size_pct > 0 and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                    anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor == last_adverse_reduce_anchor else entry_price
+                    trigger = anchor * (1 - adverse_reduce_step_pct_eff)
+                    if low <= trigger:
+                        reduce_shares = position * max(adverse_reduce_size_pct, 0.0)
+                        if reduce_shares > 0:
+                            exec_price_reduce = trigger * (1 - slippage)
+                            commission_fee = reduce_shares * exec_price_reduce * commission
+                            profit = (exec_price_reduce - entry_price) * reduce_shares - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            position -= reduce_shares
+                            if position <= 1e-12:
+                                position = 0.0
+                                position_type = 0
+                                liquidation_price = 0.0
+                            else:
+                                liquidation_price = entry_price * (1 - 1.0 / leverage)
+                            adverse_reduce_times += 1
+                            last_adverse_reduce_anchor = trigger
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 12, exec_price_reduce, reduce_shares, profit, capital)
+
+            if position_type == -1 and position < 0:
+                shares_total = abs(position)
+
+                # Trend scale-in (trigger on lower price)
+                if trend_add_enabled and trend_add_step_pct_eff > 0 and trend_add_size_pct > 0 and (trend_add_max_times == 0 or trend_add_times < trend_add_max_times):
+                    anchor = last_trend_add_anchor if last_trend_add_anchor == last_trend_add_anchor else entry_price
+                    trigger = anchor * (1 - trend_add_step_pct_eff)
+                    if low <= trigger:
+                        exec_price_add = trigger * (1 - slippage)
+                        use_capital = capital * trend_add_size_pct
+                        shares_add = (use_capital * leverage) / exec_price_add
+                        commission_fee = shares_add * exec_price_add * commission
+                        total_cost_after = shares_total * entry_price + shares_add * exec_price_add
+                        position -= shares_add
+                        shares_total = abs(position)
+                        entry_price = total_cost_after / shares_total
+                        capital -= commission_fee
+                        total_commission_paid += commission_fee
+                        liquidation_price = entry_price * (1 + 1.0 / leverage)
+                        trend_add_times += 1
+                        last_trend_add_anchor = trigger
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 11, exec_price_add, shares_add, 0.0, capital)
+
+                # Mean-reversion DCA (trigger on higher price)
+                if dca_add_enabled and dca_add_step_pct_eff > 0 and dca_add_size_pct > 0 and (dca_add_max_times == 0 or dca_add_times < dca_add_max_times):
+                    anchor = last_dca_add_anchor if last_dca_add_anchor == last_dca_add_anchor else entry_price
+                    trigger = anchor * (1 + dca_add_step_pct_eff)
+                    if high >= trigger:
+                        exec_price_add = trigger * (1 - slippage)
+                        use_capital = capital * dca_add_size_pct
+                        shares_add = (use_capital * leverage) / exec_price_add
+                        commission_fee = shares_add * exec_price_add * commission
+                        total_cost_after = shares_total * entry_price + shares_add * exec_price_add
+                        position -= shares_add
+                        shares_total = abs(position)
+                        entry_price = total_cost_after / shares_total
+                        capital -= commission_fee
+                        total_commission_paid += commission_fee
+                        liquidation_price = entry_price * (1 + 1.0 / leverage)
+                        dca_add_times += 1
+                        last_dca_add_anchor = trigger
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 11, exec_price_add, shares_add, 0.0, capital)
+
+                # Trend reduce (trigger on lower price)
+                if trend_reduce_enabled and trend_reduce_step_pct_eff > 0 and trend_reduce_size_pct > 0 and (trend_reduce_max_times == 0 or trend_reduce_times < trend_reduce_max_times):
+                    anchor = last_trend_reduce_anchor if last_trend_reduce_anchor == last_trend_reduce_anchor else entry_price
+                    trigger = anchor * (1 - trend_reduce_step_pct_eff)
+                    if low <= trigger:
+                        reduce_shares = shares_total * max(trend_reduce_size_pct, 0.0)
+                        if reduce_shares > 0:
+                            exec_price_reduce = trigger * (1 + slippage)
+                            commission_fee = reduce_shares * exec_price_reduce * commission
+                            profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            position += reduce_shares
+                            shares_total = abs(position)
+                            if shares_total <= 1e-12:
+                                position = 0.0
+                                position_type = 0
+                                liquidation_price = 0.0
+                            else:
+                                liquidation_price = entry_price * (1 + 1.0 / leverage)
+                            trend_reduce_times += 1
+                            last_trend_reduce_anchor = trigger
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 13, exec_price_reduce, reduce_shares, profit, capital)
+
+                # Adverse reduce (trigger on higher price)
+                if position_type == -1 and position < 0 and adverse_reduce_enabled and adverse_reduce_step_pct_eff > 0 and adverse_reduce_size_pct > 0 and (adverse_reduce_max_times == 0 or adverse_reduce_times < adverse_reduce_max_times):
+                    anchor = last_adverse_reduce_anchor if last_adverse_reduce_anchor == last_adverse_reduce_anchor else entry_price
+                    trigger = anchor * (1 + adverse_reduce_step_pct_eff)
+                    if high >= trigger:
+                        reduce_shares = shares_total * max(adverse_reduce_size_pct, 0.0)
+                        if reduce_shares > 0:
+                            exec_price_reduce = trigger * (1 + slippage)
+                            commission_fee = reduce_shares * exec_price_reduce * commission
+                            profit = (entry_price - exec_price_reduce) * reduce_shares - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            position += reduce_shares
+                            shares_total = abs(position)
+                            if shares_total <= 1e-12:
+                                position = 0.0
+                                position_type = 0
+                                liquidation_price = 0.0
+                            else:
+                                liquidation_price = entry_price * (1 + 1.0 / leverage)
+                            adverse_reduce_times += 1
+                            last_adverse_reduce_anchor = trigger
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 13, exec_price_reduce, reduce_shares, profit, capital)
+
+        # Handle add position signals
+        if has_position_management and (not main_signal_on_bar):
+            if position > 0 and add_long_arr[i] and capital >= min_capital_to_trade:
+                target_price = add_long_price_arr[i] if add_long_price_arr[i] > 0 else close
+                exec_price = target_price * (1 + slippage)
+                position_pct = position_size_arr[i] if position_size_arr[i] > 0 else 0.1
+                shares = (capital * position_pct * leverage) / exec_price
+                commission_fee = shares * exec_price * commission
+                total_cost_after = position * entry_price + shares * exec_price
+                position += shares
+                entry_price = total_cost_after / position
+                capital -= commission_fee
+                total_commission_paid += commission_fee
+                liquidation_price = entry_price * (1 - 1.0 / leverage)
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 10, exec_price, shares, 0.0, capital)
+
+            elif position < 0 and add_short_arr[i] and capital >= min_capital_to_trade:
+                target_price = add_short_price_arr[i] if add_short_price_arr[i] > 0 else close
+                exec_price = target_price * (1 - slippage)
+                position_pct = position_size_arr[i] if position_size_arr[i] > 0 else 0.1
+                shares = (capital * position_pct * leverage) / exec_price
+                commission_fee = shares * exec_price * commission
+                total_cost_after = abs(position) * entry_price + shares * exec_price
+                position -= shares
+                entry_price = total_cost_after / abs(position)
+                capital -= commission_fee
+                total_commission_paid += commission_fee
+                liquidation_price = entry_price * (1 + 1.0 / leverage)
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 11, exec_price, shares, 0.0, capital)
+
+        # Handle entry signals (both mode auto-closes the opposing position first)
+        if open_long_arr[i] and (position == 0 or (both_mode_active and position < 0)) and capital >= min_capital_to_trade:
+            if both_mode_active and position < 0:
+                shares_to_close = abs(position)
+                close_price = open_ * (1 + slippage)
+                close_commission = shares_to_close * close_price * commission
+                close_profit = (entry_price - close_price) * shares_to_close - close_commission
+                capital += close_profit
+                if capital < 0:
+                    capital = 0.0
+                total_commission_paid += close_commission
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 3, close_price, shares_to_close, close_profit, capital)
+                position = 0.0
+                position_type = 0
+                liquidation_price = 0.0
+                highest_since_entry = nan
+                lowest_since_entry = nan
+                trend_add_times = 0
+                dca_add_times = 0
+                trend_reduce_times = 0
+                adverse_reduce_times = 0
+                last_trend_add_anchor = nan
+                last_dca_add_anchor = nan
+                last_trend_reduce_anchor = nan
+                last_adverse_reduce_anchor = nan
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0.0
+                    eq_value[n_eq] = 0.0
+                    n_eq += 1
+                    continue
+
+            if next_bar_open:
+                base_price = open_
+            else:
+                base_price = open_long_price_arr[i] if open_long_price_arr[i] > 0 else close
+            exec_price = base_price * (1 + slippage)
+
+            # Use specified pct (entryPct > position_size > full)
+            position_pct = -1.0
+            if entry_pct_cfg > 0:
+                position_pct = entry_pct_cfg
+            elif has_position_management and position_size_arr[i] > 0:
+                position_pct = position_size_arr[i]
+            if position_pct > 0 and position_pct < 1:
+                shares = (capital * position_pct * leverage) / exec_price
+            else:
+                shares = (capital * leverage) / exec_price
+
+            commission_fee = shares * exec_price * commission
+            position = shares
+            entry_price = exec_price
+            position_type = 1
+            capital -= commission_fee
+            total_commission_paid += commission_fee
+            liquidation_price = entry_price * (1 - 1.0 / leverage)
+            highest_since_entry = entry_price
+            lowest_since_entry = entry_price
+            last_trend_add_anchor = entry_price
+            last_dca_add_anchor = entry_price
+            last_trend_reduce_anchor = entry_price
+            last_adverse_reduce_anchor = entry_price
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 0, exec_price, shares, 0.0, capital)
+
+            # Strict intrabar stop-loss / liquidation check right after entry.
+            has_sl = stop_loss_pct_eff > 0
+            sl_price = entry_price * (1 - stop_loss_pct_eff) if has_sl else 0.0
+            hit_sl = has_sl and (low <= sl_price)
+            hit_liq = liquidation_price > 0 and (low <= liquidation_price)
+            if hit_sl or hit_liq:
+                if hit_liq and (not hit_sl or (has_sl and sl_price <= liquidation_price)):
+                    is_liquidated = True
+                    capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, liquidation_price, position, -initial_capital, 0.0)
+                else:
+                    exec_price_close = sl_price * (1 - slippage)
+                    commission_fee_close = position * exec_price_close * commission
+                    profit = (exec_price_close - entry_price) * position - commission_fee_close
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    if capital <= 0:
+                        is_liquidated = True
+                        capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 4, exec_price_close, position, profit, capital)
+
+                position = 0.0
+                position_type = 0
+                liquidation_price = 0.0
+                highest_since_entry = nan
+                lowest_since_entry = nan
+                eq_value[n_eq] = capital
+                n_eq += 1
+                continue
+
+        elif open_short_arr[i] and (position == 0 or (both_mode_active and position > 0)) and capital >= min_capital_to_trade:
+            if both_mode_active and position > 0:
+                close_price = open_ * (1 - slippage)
+                close_commission = position * close_price * commission
+                close_profit = (close_price - entry_price) * position - close_commission
+                capital += close_profit
+                if capital < 0:
+                    capital = 0.0
+                total_commission_paid += close_commission
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 2, close_price, position, close_profit, capital)
+                position = 0.0
+                position_type = 0
+                liquidation_price = 0.0
+                highest_since_entry = nan
+                lowest_since_entry = nan
+                trend_add_times = 0
+                dca_add_times = 0
+                trend_reduce_times = 0
+                adverse_reduce_times = 0
+                last_trend_add_anchor = nan
+                last_dca_add_anchor = nan
+                last_trend_reduce_anchor = nan
+                last_adverse_reduce_anchor = nan
+                if capital < min_capital_to_trade:
+                    is_liquidated = True
+                    capital = 0.0
+                    eq_value[n_eq] = 0.0
+                    n_eq += 1
+                    continue
+
+            if next_bar_open:
+                base_price = open_
+            else:
+                base_price = open_short_price_arr[i] if open_short_price_arr[i] > 0 else close
+            exec_price = base_price * (1 - slippage)
+
+            position_pct = -1.0
+            if entry_pct_cfg > 0:
+                position_pct = entry_pct_cfg
+            elif has_position_management and position_size_arr[i] > 0:
+                position_pct = position_size_arr[i]
+            if position_pct > 0 and position_pct < 1:
+                shares = (capital * position_pct * leverage) / exec_price
+            else:
+                shares = (capital * leverage) / exec_price
+
+            commission_fee = shares * exec_price * commission
+            position = -shares
+            entry_price = exec_price
+            position_type = -1
+            capital -= commission_fee
+            total_commission_paid += commission_fee
+            liquidation_price = entry_price * (1 + 1.0 / leverage)
+            highest_since_entry = entry_price
+            lowest_since_entry = entry_price
+            last_trend_add_anchor = entry_price
+            last_dca_add_anchor = entry_price
+            last_trend_reduce_anchor = entry_price
+            last_adverse_reduce_anchor = entry_price
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 1, exec_price, shares, 0.0, capital)
+
+            has_sl = stop_loss_pct_eff > 0
+            sl_price = entry_price * (1 + stop_loss_pct_eff) if has_sl else 0.0
+            hit_sl = has_sl and (high >= sl_price)
+            hit_liq = liquidation_price > 0 and (high >= liquidation_price)
+            if hit_sl or hit_liq:
+                if hit_liq and (not hit_sl or (has_sl and sl_price >= liquidation_price)):
+                    is_liquidated = True
+                    capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, liquidation_price, abs(position), -initial_capital, 0.0)
+                else:
+                    exec_price_close = sl_price * (1 + slippage)
+                    shares_close = abs(position)
+                    commission_fee_close = shares_close * exec_price_close * commission
+                    profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    if capital <= 0:
+                        is_liquidated = True
+                        capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 7, exec_price_close, shares_close, profit, capital)
+
+                position = 0.0
+                position_type = 0
+                liquidation_price = 0.0
+                highest_since_entry = nan
+                lowest_since_entry = nan
+                eq_value[n_eq] = capital
+                n_eq += 1
+                continue
+
+        # Liquidation safety net (after all active exits)
+        if position != 0 and not is_liquidated:
+            if position_type == 1 and low <= liquidation_price:
+                has_stop_loss = close_long_arr[i] and close_long_price_arr[i] > 0
+                stop_loss_price = close_long_price_arr[i] if has_stop_loss else 0.0
+                if has_stop_loss and stop_loss_price > liquidation_price:
+                    exec_price_close = stop_loss_price * (1 - slippage)
+                    commission_fee_close = position * exec_price_close * commission
+                    profit = (exec_price_close - entry_price) * position - commission_fee_close
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 4, exec_price_close, position, profit, capital)
+                else:
+                    is_liquidated = True
+                    capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, liquidation_price, abs(position), -initial_capital, 0.0)
+                position = 0.0
+                position_type = 0
+                # The reference implementation records this equity point unrounded.
+                eq_value[n_eq] = capital
+                eq_raw[n_eq] = True
+                n_eq += 1
+                continue
+
+            elif position_type == -1 and high >= liquidation_price:
+                has_stop_loss = close_short_arr[i] and close_short_price_arr[i] > 0
+                stop_loss_price = close_short_price_arr[i] if has_stop_loss else 0.0
+                if has_stop_loss and stop_loss_price < liquidation_price:
+                    exec_price_close = stop_loss_price * (1 + slippage)
+                    shares_close = abs(position)
+                    commission_fee_close = shares_close * exec_price_close * commission
+                    profit = (entry_price - exec_price_close) * shares_close - commission_fee_close
+                    capital += profit
+                    total_commission_paid += commission_fee_close
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 7, exec_price_close, shares_close, profit, capital)
+                else:
+                    is_liquidated = True
+                    capital = 0.0
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, liquidation_price, abs(position), -initial_capital, 0.0)
+                position = 0.0
+                position_type = 0
+                eq_value[n_eq] = capital
+                eq_raw[n_eq] = True
+                n_eq += 1
+                continue
+
+        # Record equity (unrealized PnL from close)
+        if position_type == 1:
+            total_value = capital + (close - entry_price) * position
+        elif position_type == -1:
+            total_value = capital + (entry_price - close) * abs(position)
+        else:
+            total_value = capital
+        if total_value < 0:
+            total_value = 0.0
+        eq_value[n_eq] = total_value
+        n_eq += 1
+
+    # Force exit at backtest end
+    if position != 0 and n > 0:
+        final_close = close_arr[n - 1]
+        if position > 0:
+            exec_price = final_close * (1 - slippage)
+            commission_fee = position * exec_price * commission
+            profit = (exec_price - entry_price) * position - commission_fee
+            capital += profit
+            total_commission_paid += commission_fee
+            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, n - 1, 2, exec_price, position, profit, capital)
+        else:
+            exec_price = final_close * (1 + slippage)
+            shares = abs(position)
+            commission_fee = shares * exec_price * commission
+            profit = (entry_price - exec_price) * shares - commission_fee
+            if capital + profit <= 0:
+                capital = 0.0
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, n - 1, 14, exec_price, shares, 0.0, 0.0)
+            else:
+                capital += profit
+                total_commission_paid += commission_fee
+                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, n - 1, 3, exec_price, shares, profit, capital)
+
+        if n_eq > 0:
+            eq_value[n_eq - 1] = capital
+            eq_raw[n_eq - 1] = False
+
+    return n_ev, n_eq, total_commission_paid
+
+
+def _bool_array(values, n: int) -> np.ndarray:
+    arr = np.asarray(values)
+    if arr.dtype != np.bool_:
+        arr = pd.Series(arr).fillna(False).astype(bool).values
+    if len(arr) != n:
+        raise ValueError(f"signal length {len(arr)} does not match candle count {n}")
+    return arr
+
+
+def _float_array(signals: dict, key: str, n: int) -> np.ndarray:
+    if key not in signals:
+        return np.zeros(n, dtype=np.float64)
+    return np.asarray(signals[key], dtype=np.float64)
+
+
+def _shift_next_bar(arr: np.ndarray) -> np.ndarray:
+    """Delay a signal array by one bar (signal confirmed on close executes on next bar open)."""
+    if len(arr) == 0:
+        return arr
+    return np.insert(arr[:-1], 0, False)
+
+
+def build_result_lists(
+    index: pd.Index,
+    ev_bar: np.ndarray,
+    ev_type: np.ndarray,
+    ev_num: np.ndarray,
+    n_ev: int,
+    eq_value: np.ndarray,
+    eq_raw: np.ndarray,
+    n_eq: int,
+) -> Tuple[EquityCurve, List[Dict[str, Any]]]:
+    """
+    Convert kernel event/equity arrays into the reference result format.
+
+    Trades become the usual list of dicts; the equity curve stays an `EquityCurve` over the
+    candle index (only trade bars get their time formatted here).
+    """
+    trades = []
+    bar_times = format_bar_times(index[ev_bar[:n_ev]]) if n_ev else []
+    for k in range(n_ev):
+        t = int(ev_type[k])
+        price, amount, profit, balance = ev_num[k].tolist()
+        if t == T_LIQUIDATION:
+            trade_balance = 0
+            trade_profit = round(profit, 2)
+        else:
+            trade_balance = round(max(0, balance), 2)
+            trade_profit = 0 if t in _ZERO_PROFIT_TYPES else round(profit, 2)
+        trades.append({
+            'time': bar_times[k],
+            'type': TRADE_TYPES[t],
+            'price': round(price, 4),
+            'amount': round(amount, 4),
+            'profit': trade_profit,
+            'balance': trade_balance
+        })
+
+    values = eq_value[:n_eq]
+    raw = eq_raw[:n_eq]
+    if not raw.all():
+        # Python round() per value, to match the reference implementation bit for bit
+        values = np.array([v if r else round(v, 2) for v, r in zip(values.tolist(), raw.tolist())], dtype=np.float64)
+    return EquityCurve.from_index(values, index), trades
+
+
+def simulate_new_format_arrays(
+    df: pd.DataFrame,
+    signals: dict,
+    initial_capital: float,
+    commission: float,
+    slippage: float,
+    leverage: int = 1,
+    trade_direction: str = 'both',
+    strategy_config: Optional[Dict[str, Any]] = None
+) -> tuple:
+    """
+    Array engine counterpart of `BacktestService._simulate_trading_new_format`.
+
+    Takes the same arguments and returns the same (equity_curve, trades, total_commission) tuple.
+    """
+    n = len(df)
+    p = parse_new_format_config(strategy_config, leverage)
+    next_bar_open = p['next_bar_open']
+
+    close_arr = df['close'].to_numpy(dtype=np.float64)
+    high_arr = df['high'].to_numpy(dtype=np.float64)
+    low_arr = df['low'].to_numpy(dtype=np.float64)
+    open_arr = df['open'].to_numpy(dtype=np.float64) if 'open' in df.columns else close_arr
+
+    open_long_arr = _bool_array(signals['open_long'], n)
+    close_long_arr = _bool_array(signals['close_long'], n)
+    open_short_arr = _bool_array(signals['open_short'], n)
+    close_short_arr = _bool_array(signals['close_short'], n)
+    if next_bar_open:
+        open_long_arr = _shift_next_bar(open_long_arr)
+        close_long_arr = _shift_next_bar(close_long_arr)
+        open_short_arr = _shift_next_bar(open_short_arr)
+        close_short_arr = _shift_next_bar(close_short_arr)
+
+    if trade_direction == 'long':
+        open_short_arr = np.zeros(n, dtype=bool)
+        close_short_arr = np.zeros(n, dtype=bool)
+    elif trade_direction == 'short':
+        open_long_arr = np.zeros(n, dtype=bool)
+        close_long_arr = np.zeros(n, dtype=bool)
+
+    has_position_management = 'add_long' in signals and 'add_short' in signals
+    if has_position_management:
+        add_long_arr = _bool_array(signals['add_long'], n)
+        add_short_arr = _bool_array(signals['add_short'], n)
+        if trade_direction == 'long':
+            add_short_arr = np.zeros(n, dtype=bool)
+        elif trade_direction == 'short':
+            add_long_arr = np.zeros(n, dtype=bool)
+    else:
+        add_long_arr = np.zeros(n, dtype=bool)
+        add_short_arr = np.zeros(n, dtype=bool)
+
+    columns = [
+        open_arr, high_arr, low_arr, close_arr,
+        open_long_arr, close_long_arr, open_short_arr, close_short_arr,
+        add_long_arr, add_short_arr, _float_array(signals, 'position_size', n),
+        _float_array(signals, 'open_long_price', n), _float_array(signals, 'open_short_price', n),
+        _float_array(signals, 'close_long_price', n), _float_array(signals, 'close_short_price', n),
+        _float_array(signals, 'add_long_price', n), _float_array(signals, 'add_short_price', n),
+    ]
+    if not HAS_NUMBA:
+        # CPython indexes lists of floats/bools much faster than NumPy scalars.
+        columns = [c.tolist() for c in columns]
+
+    scalars = (
+        bool(has_position_management), bool(signals.get('_both_mode', False)), bool(next_bar_open),
+        float(initial_capital), float(commission), float(slippage), float(leverage),
+        p['stop_loss_pct_eff'], p['take_profit_pct_eff'],
+        p['trailing_enabled'], p['trailing_pct_eff'], p['trailing_activation_pct_eff'],
+        p['entry_pct_cfg'],
+        *p['trend_add'], *p['dca_add'], *p['trend_reduce'], *p['adverse_reduce'],
+    )
+
+    capacity = 2 * n + 16
+    while True:
+        ev_bar = np.zeros(capacity, dtype=np.int64)
+        ev_type = np.zeros(capacity, dtype=np.int64)
+        ev_num = np.zeros((capacity, 4), dtype=np.float64)
+        eq_value = np.zeros(max(n, 1), dtype=np.float64)
+        eq_raw = np.zeros(max(n, 1), dtype=np.bool_)
+        n_ev, n_eq, total_commission_paid = _simulate_new_format_kernel(
+            *columns, *scalars, ev_bar, ev_type, ev_num, eq_value, eq_raw
+        )
+        if n_ev <= capacity:
+            break
+        capacity = n_ev
+
+    equity_curve, trades = build_result_lists(df.index, ev_bar, ev_type, ev_num, n_ev, eq_value, eq_raw, n_eq)
+
+    if trades and trades[-1]['type'] == 'liquidation':
+        logger.warning(f"Backtest liquidated at {trades[-1]['time']}, price={trades[-1]['price']}")
+
+    return equity_curve, trades, float(total_commission_paid)
+
+
+# ---------------------------------------------------------------------------
+# Multi-timeframe (signal timeframe + 1m/5m execution timeframe) engine
+# ---------------------------------------------------------------------------
+
+# Signal codes inside the MTF kernel (also the order signals of one candle are queued in).
+SIG_OPEN_LONG = 0
+SIG_CLOSE_LONG = 1
+SIG_OPEN_SHORT = 2
+SIG_CLOSE_SHORT = 3
+_MTF_SIGNAL_KEYS = ('open_long', 'close_long', 'open_short', 'close_short')
+
+
+def parse_mtf_config(strategy_config: Optional[Dict[str, Any]], leverage: int) -> Dict[str, Any]:
+    """Parse strategyConfig the same way `BacktestService._simulate_trading_mtf` does."""
+    cfg = strategy_config or {}
+    risk_cfg = cfg.get('risk') or {}
+    stop_loss_pct = float(risk_cfg.get('stopLossPct') or 0.0)
+    take_profit_pct = float(risk_cfg.get('takeProfitPct') or 0.0)
+    trailing_cfg = risk_cfg.get('trailing') or {}
+    trailing_enabled = bool(trailing_cfg.get('enabled'))
+    trailing_pct = float(trailing_cfg.get('pct') or 0.0)
+    trailing_activation_pct = float(trailing_cfg.get('activationPct') or 0.0)
+
+    lev = max(int(leverage or 1), 1)
+    stop_loss_pct_eff = stop_loss_pct / lev if stop_loss_pct > 0 else 0.0
+    take_profit_pct_eff = take_profit_pct / lev if take_profit_pct > 0 else 0.0
+    trailing_pct_eff = trailing_pct / lev if trailing_pct > 0 else 0.0
+    trailing_activation_pct_eff = trailing_activation_pct / lev if trailing_activation_pct > 0 else 0.0
+    # If trailing stop enabled but no activation threshold set, use take profit threshold
+    if trailing_enabled and trailing_pct_eff > 0:
+        if trailing_activation_pct_eff <= 0 and take_profit_pct_eff > 0:
+            trailing_activation_pct_eff = take_profit_pct_eff
+
+    pos_cfg = cfg.get('position') or {}
+    raw_entry_pct = pos_cfg.get('entryPct')
+    if raw_entry_pct is None or raw_entry_pct == 0:
+        entry_pct_cfg = 1.0
+    else:
+        entry_pct_cfg = float(raw_entry_pct)
+        if entry_pct_cfg > 1:
+            entry_pct_cfg = entry_pct_cfg / 100.0
+    entry_pct_cfg = max(0.01, min(entry_pct_cfg, 1.0))
+
+    return {
+        'lev': lev,
+        'stop_loss_pct_eff': stop_loss_pct_eff,
+        'take_profit_pct_eff': take_profit_pct_eff,
+        'trailing_enabled': trailing_enabled,
+        'trailing_pct_eff': trailing_pct_eff,
+        'trailing_activation_pct_eff': trailing_activation_pct_eff,
+        'entry_pct_cfg': entry_pct_cfg,
+    }
+
+
+def _datetime_index_ns(index: pd.Index) -> np.ndarray:
+    """Naive DatetimeIndex -> int64 nanoseconds, independent of the index resolution."""
+    return np.asarray(index.values, dtype='datetime64[ns]').view(np.int64)
+
+
+def build_mtf_signal_queue(
+    df_signal: pd.DataFrame,
+    signals: dict,
+    exec_times_ns: np.ndarray,
+    signal_tf_seconds: int
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Build the signal queue as columnar arrays.
+
+    Each signal becomes effective when its candle closes (start + signal timeframe) and is
+    mapped onto the first execution bar at or after that time with `np.searchsorted`.
+
+    Returns:
+        (queue_bar, queue_type) sorted by effective time, or None when signals are not aligned
+        with df_signal (callers fall back to the reference loop in that case).
+    """
+    index = df_signal.index
+    if not isinstance(index, pd.DatetimeIndex) or index.tz is not None or not index.is_unique:
+        return None
+
+    columns = []
+    for key in _MTF_SIGNAL_KEYS:
+        series = signals[key]
+        if not isinstance(series, pd.Series) or not series.index.equals(index):
+            return None
+        try:
+            columns.append(np.asarray(series.values).astype(bool))
+        except (TypeError, ValueError):
+            return None
+
+    # (n_candles, 4) -> row-major flatten keeps the per-candle order open_long, close_long, open_short, close_short
+    flags = np.column_stack(columns).ravel()
+    hit = np.flatnonzero(flags)
+    candle_idx = hit // 4
+    queue_type = (hit % 4).astype(np.int64)
+    effective_ns = _datetime_index_ns(index)[candle_idx] + np.int64(signal_tf_seconds) * 1_000_000_000
+
+    order = np.argsort(effective_ns, kind='stable')
+    queue_bar = np.searchsorted(exec_times_ns, effective_ns[order], side='left').astype(np.int64)
+    return queue_bar, queue_type[order]
+
+
+@_jit
+def _simulate_mtf_kernel(
+    open_arr, high_arr, low_arr, close_arr,
+    queue_bar, queue_type,
+    both_mode_active, initial_capital, commission, slippage, lev,
+    stop_loss_pct_eff, take_profit_pct_eff,
+    trailing_enabled, trailing_pct_eff, trailing_activation_pct_eff,
+    entry_pct_cfg,
+    ev_bar, ev_type, ev_num, eq_value,
+):
+    """
+    Execution-timeframe bar loop of the multi-timeframe backtest.
+
+    Evaluates the inferred intrabar path (open -> low -> high -> close for bullish candles,
+    open -> high -> low -> close otherwise) point by point without allocating a path list.
+
+    Returns:
+        (n_events, n_equity, total_commission_paid, executed_signals, queue_pointer)
+    """
+    n = len(close_arr)
+    nq = len(queue_bar)
+    n_ev = 0
+    n_eq = 0
+    total_commission_paid = 0.0
+    is_liquidated = False
+    min_capital_to_trade = 1.0
+
+    capital = initial_capital
+    position = 0.0
+    entry_price = 0.0
+    position_type = 0
+    nan = np.nan
+    highest_since_entry = nan
+    lowest_since_entry = nan
+
+    q = 0
+    pending = -1
+    executed = 0
+
+    for i in range(n):
+        if is_liquidated:
+            break
+
+        if position == 0 and capital < min_capital_to_trade:
+            is_liquidated = True
+            capital = 0.0
+            eq_value[n_eq] = 0.0
+            n_eq += 1
+            continue
+
+        open_ = open_arr[i]
+        high = high_arr[i]
+        low = low_arr[i]
+        close = close_arr[i]
+        bullish = close >= open_
+
+        # Pick up the next signal that became effective and can execute with the current position.
+        while q < nq and i >= queue_bar[q]:
+            sig = queue_type[q]
+            q += 1
+            can_execute = False
+            if sig == 0:
+                can_execute = position == 0 or (both_mode_active and position < 0)
+            elif sig == 1:
+                can_execute = position > 0
+            elif sig == 2:
+                can_execute = position == 0 or (both_mode_active and position > 0)
+            else:
+                can_execute = position < 0
+            if can_execute:
+                pending = sig
+                break
+
+        for k in range(4):
+            if k == 0:
+                path_price = open_
+            elif k == 1:
+                path_price = low if bullish else high
+            elif k == 2:
+                path_price = high if bullish else low
+            else:
+                path_price = close
+
+            if is_liquidated:
+                break
+
+            # 1. Stop-loss / trailing stop / take-profit (highest priority)
+            if position != 0 and position_type != 0:
+                triggered = False
+
+                if position_type == 1 and position > 0:
+                    if highest_since_entry != highest_since_entry:
+                        highest_since_entry = entry_price
+                    highest_since_entry = max(highest_since_entry, path_price)
+
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 - stop_loss_pct_eff)
+                        if path_price <= sl_price:
+                            exec_price = sl_price * (1 - slippage)
+                            commission_fee = position * exec_price * commission
+                            profit = (exec_price - entry_price) * position - commission_fee
+                            capital += profit
+                            if capital < 0:
+                                capital = 0.0
+                                is_liquidated = True
+                            total_commission_paid += commission_fee
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 4, exec_price, position, profit, capital)
+                            position = 0.0
+                            position_type = 0
+                            highest_since_entry = nan
+                            lowest_since_entry = nan
+                            triggered = True
+
+                    if not triggered and trailing_enabled and trailing_pct_eff > 0:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = highest_since_entry >= entry_price * (1 + trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = highest_since_entry * (1 - trailing_pct_eff)
+                            if path_price <= tr_price:
+                                exec_price = tr_price * (1 - slippage)
+                                commission_fee = position * exec_price * commission
+                                profit = (exec_price - entry_price) * position - commission_fee
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 6, exec_price, position, profit, capital)
+                                position = 0.0
+                                position_type = 0
+                                highest_since_entry = nan
+                                lowest_since_entry = nan
+                                triggered = True
+
+                    if not triggered and not trailing_enabled and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 + take_profit_pct_eff)
+                        if path_price >= tp_price:
+                            exec_price = tp_price * (1 - slippage)
+                            commission_fee = position * exec_price * commission
+                            profit = (exec_price - entry_price) * position - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 5, exec_price, position, profit, capital)
+                            position = 0.0
+                            position_type = 0
+                            highest_since_entry = nan
+                            lowest_since_entry = nan
+                            triggered = True
+
+                elif position_type == -1 and position < 0:
+                    shares = abs(position)
+                    if lowest_since_entry != lowest_since_entry:
+                        lowest_since_entry = entry_price
+                    lowest_since_entry = min(lowest_since_entry, path_price)
+
+                    if stop_loss_pct_eff > 0:
+                        sl_price = entry_price * (1 + stop_loss_pct_eff)
+                        if path_price >= sl_price:
+                            exec_price = sl_price * (1 + slippage)
+                            commission_fee = shares * exec_price * commission
+                            profit = (entry_price - exec_price) * shares - commission_fee
+                            if capital + profit <= 0:
+                                capital = 0.0
+                                is_liquidated = True
+                                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price, shares, -initial_capital, 0.0)
+                            else:
+                                capital += profit
+                                total_commission_paid += commission_fee
+                                n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 7, exec_price, shares, profit, capital)
+                            position = 0.0
+                            position_type = 0
+                            highest_since_entry = nan
+                            lowest_since_entry = nan
+                            triggered = True
+
+                    if not triggered and trailing_enabled and trailing_pct_eff > 0:
+                        trail_active = True
+                        if trailing_activation_pct_eff > 0:
+                            trail_active = lowest_since_entry <= entry_price * (1 - trailing_activation_pct_eff)
+                        if trail_active:
+                            tr_price = lowest_since_entry * (1 + trailing_pct_eff)
+                            if path_price >= tr_price:
+                                exec_price = tr_price * (1 + slippage)
+                                commission_fee = shares * exec_price * commission
+                                profit = (entry_price - exec_price) * shares - commission_fee
+                                if capital + profit <= 0:
+                                    capital = 0.0
+                                    is_liquidated = True
+                                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 14, exec_price, shares, -initial_capital, 0.0)
+                                else:
+                                    capital += profit
+                                    total_commission_paid += commission_fee
+                                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 9, exec_price, shares, profit, capital)
+                                position = 0.0
+                                position_type = 0
+                                highest_since_entry = nan
+                                lowest_since_entry = nan
+                                triggered = True
+
+                    if not triggered and not trailing_enabled and take_profit_pct_eff > 0:
+                        tp_price = entry_price * (1 - take_profit_pct_eff)
+                        if path_price <= tp_price:
+                            exec_price = tp_price * (1 + slippage)
+                            commission_fee = shares * exec_price * commission
+                            profit = (entry_price - exec_price) * shares - commission_fee
+                            capital += profit
+                            total_commission_paid += commission_fee
+                            n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 8, exec_price, shares, profit, capital)
+                            position = 0.0
+                            position_type = 0
+                            highest_since_entry = nan
+                            lowest_since_entry = nan
+                            triggered = True
+
+                if triggered:
+                    pending = -1
+                    continue
+
+            # 2. Execute pending signal (at open price)
+            if pending >= 0 and path_price == open_:
+                if pending == 0 and (position == 0 or (both_mode_active and position < 0)):
+                    exec_price = open_ * (1 + slippage)
+                    if both_mode_active and position < 0:
+                        shares_to_close = abs(position)
+                        close_price = open_ * (1 + slippage)
+                        close_commission = shares_to_close * close_price * commission
+                        close_profit = (entry_price - close_price) * shares_to_close - close_commission
+                        capital += close_profit
+                        if capital < 0:
+                            capital = 0.0
+                        total_commission_paid += close_commission
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 3, close_price, shares_to_close, close_profit, capital)
+                        position = 0.0
+                        position_type = 0
+                        executed += 1
+                        if capital < min_capital_to_trade:
+                            is_liquidated = True
+                            capital = 0.0
+                            pending = -1
+                            continue
+
+                    if exec_price > 0:
+                        shares = (capital * entry_pct_cfg * lev) / exec_price
+                    else:
+                        pending = -1
+                        continue
+                    commission_fee = shares * exec_price * commission
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    position = shares
+                    entry_price = exec_price
+                    position_type = 1
+                    highest_since_entry = exec_price
+                    lowest_since_entry = exec_price
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 0, exec_price, shares, 0.0, capital)
+                    executed += 1
+                    pending = -1
+
+                elif pending == 1 and position > 0:
+                    exec_price = open_ * (1 - slippage)
+                    commission_fee = position * exec_price * commission
+                    profit = (exec_price - entry_price) * position - commission_fee
+                    capital += profit
+                    if capital < 0:
+                        capital = 0.0
+                    total_commission_paid += commission_fee
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 2, exec_price, position, profit, capital)
+                    position = 0.0
+                    position_type = 0
+                    highest_since_entry = nan
+                    lowest_since_entry = nan
+                    pending = -1
+                    if capital < min_capital_to_trade:
+                        is_liquidated = True
+                        capital = 0.0
+
+                elif pending == 2 and (position == 0 or (both_mode_active and position > 0)):
+                    exec_price = open_ * (1 - slippage)
+                    if both_mode_active and position > 0:
+                        close_price = open_ * (1 - slippage)
+                        close_commission = position * close_price * commission
+                        close_profit = (close_price - entry_price) * position - close_commission
+                        capital += close_profit
+                        if capital < 0:
+                            capital = 0.0
+                        total_commission_paid += close_commission
+                        n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 2, close_price, position, close_profit, capital)
+                        position = 0.0
+                        position_type = 0
+                        executed += 1
+                        if capital < min_capital_to_trade:
+                            is_liquidated = True
+                            capital = 0.0
+                            pending = -1
+                            continue
+
+                    if exec_price > 0:
+                        shares = (capital * entry_pct_cfg * lev) / exec_price
+                    else:
+                        pending = -1
+                        continue
+                    commission_fee = shares * exec_price * commission
+                    capital -= commission_fee
+                    total_commission_paid += commission_fee
+                    position = -shares
+                    entry_price = exec_price
+                    position_type = -1
+                    highest_since_entry = exec_price
+                    lowest_since_entry = exec_price
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 1, exec_price, shares, 0.0, capital)
+                    executed += 1
+                    pending = -1
+
+                elif pending == 3 and position < 0:
+                    shares = abs(position)
+                    exec_price = open_ * (1 + slippage)
+                    commission_fee = shares * exec_price * commission
+                    profit = (entry_price - exec_price) * shares - commission_fee
+                    capital += profit
+                    if capital < 0:
+                        capital = 0.0
+                    total_commission_paid += commission_fee
+                    n_ev = _push_event(ev_bar, ev_type, ev_num, n_ev, i, 3, exec_price, shares, profit, capital)
+                    position = 0.0
+                    position_type = 0
+                    highest_since_entry = nan
+                    lowest_since_entry = nan
+                    pending = -1
+                    if capital < min_capital_to_trade:
+                        is_liquidated = True
+                        capital = 0.0
+
+        # Current equity (unrealized PnL at close)
+        if position > 0:
+            current_equity = capital + (close - entry_price) * position
+        elif position < 0:
+            current_equity = capital + (entry_price - close) * abs(position)
+        else:
+            current_equity = capital
+        eq_value[n_eq] = max(0.0, current_equity)
+        n_eq += 1
+
+    return n_ev, n_eq, total_commission_paid, executed, q
+
+
+def normalize_mtf_signals(df_signal: pd.DataFrame, signals: dict, trade_direction: str) -> dict:
+    """Normalize buy/sell or 4-way signals into 4-way signals plus the '_both_mode' flag (MTF rules)."""
+    if not isinstance(signals, dict):
+        raise ValueError("signals must be a dict")
+
+    if all(k in signals for k in _MTF_SIGNAL_KEYS):
+        norm = dict(signals)
+        norm['_both_mode'] = False
+        return norm
+    if all(k in signals for k in ['buy', 'sell']):
+        buy = signals['buy'].fillna(False).astype(bool)
+        sell = signals['sell'].fillna(False).astype(bool)
+        none = pd.Series(False, index=df_signal.index)
+        td = str(trade_direction or 'both').lower()
+        if td == 'long':
+            return {'open_long': buy, 'close_long': sell, 'open_short': none, 'close_short': none}
+        if td == 'short':
+            return {'open_long': none, 'close_long': none, 'open_short': sell, 'close_short': buy}
+        return {'open_long': buy, 'close_long': none, 'open_short': sell, 'close_short': none, '_both_mode': True}
+    raise ValueError("Invalid signal format")
+
+
+def simulate_mtf_arrays(
+    df_signal: pd.DataFrame,
+    df_exec: pd.DataFrame,
+    signals: dict,
+    initial_capital: float,
+    commission: float,
+    slippage: float,
+    leverage: int,
+    trade_direction: str,
+    strategy_config: Optional[Dict[str, Any]],
+    signal_tf_seconds: int
+) -> Optional[tuple]:
+    """
+    Array engine counterpart of `BacktestService._simulate_trading_mtf`.
+
+    Returns:
+        (equity_curve, trades, total_commission), or None if the signals cannot be mapped onto
+        columnar arrays (e.g. index mismatch) and the reference loop should be used instead.
+    """
+    p = parse_mtf_config(strategy_config, leverage)
+    norm = normalize_mtf_signals(df_signal, signals, trade_direction)
+
+    if not isinstance(df_exec.index, pd.DatetimeIndex) or df_exec.index.tz is not None:
+        return None
+    exec_times_ns = _datetime_index_ns(df_exec.index)
+    if len(exec_times_ns) > 1 and not bool(np.all(exec_times_ns[1:] >= exec_times_ns[:-1])):
+        return None
+    queue = build_mtf_signal_queue(df_signal, norm, exec_times_ns, signal_tf_seconds)
+    if queue is None:
+        return None
+    queue_bar, queue_type = queue
+
+    n = len(df_exec)
+    columns = [
+        df_exec['open'].to_numpy(dtype=np.float64),
+        df_exec['high'].to_numpy(dtype=np.float64),
+        df_exec['low'].to_numpy(dtype=np.float64),
+        df_exec['close'].to_numpy(dtype=np.float64),
+        queue_bar,
+        queue_type,
+    ]
+    if not HAS_NUMBA:
+        columns = [c.tolist() for c in columns]
+
+    scalars = (
+        bool(norm.get('_both_mode', False)),
+        float(initial_capital), float(commission), float(slippage), float(p['lev']),
+        p['stop_loss_pct_eff'], p['take_profit_pct_eff'],
+        p['trailing_enabled'], p['trailing_pct_eff'], p['trailing_activation_pct_eff'],
+        p['entry_pct_cfg'],
+    )
+
+    capacity = 2 * len(queue_bar) + 16
+    while True:
+        ev_bar = np.zeros(capacity, dtype=np.int64)
+        ev_type = np.zeros(capacity, dtype=np.int64)
+        ev_num = np.zeros((capacity, 4), dtype=np.float64)
+        eq_value = np.zeros(max(n, 1), dtype=np.float64)
+        n_ev, n_eq, total_commission_paid, executed, q = _simulate_mtf_kernel(
+            *columns, *scalars, ev_bar, ev_type, ev_num, eq_value
+        )
+        if n_ev <= capacity:
+            break
+        capacity = n_ev
+
+    eq_raw = np.zeros(max(n, 1), dtype=np.bool_)
+    equity_curve, trades = build_result_lists(df_exec.index, ev_bar, ev_type, ev_num, n_ev, eq_value, eq_raw, n_eq)
+
+    logger.info(
+        f"MTF array simulation complete: signals={len(queue_bar)}, consumed={q}, executed_trades={executed}, "
+        f"total_trades_recorded={len(trades)}, exec_candles={n}"
+    )
+    return equity_curve, trades, float(total_commission_paid)
@@ -0,0 +1,427 @@
+"""
+Backtest job queue.
+
+Backtests run in a bounded process pool instead of the HTTP worker, so a long
+high-precision run neither blocks a gunicorn worker nor gets killed by its timeout.
+
+Job state lives in `qd_backtest_runs` (one row per job, status queued/running/success/failed
+plus a `progress` JSON column), so any API worker process can answer progress polls and the
+finished result is persisted exactly like a synchronous run.
+
+Besides single backtests (`job_kind` 'backtest'), parameter sweeps ('sweep', see
+backtest_sweep) and portfolio / walk-forward backtests ('portfolio', see backtest_portfolio)
+run as jobs too; result_json then holds that kind's result.
+"""
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCESS = 'success'
+JOB_STATUS_FAILED = 'failed'
+ACTIVE_JOB_STATUSES = (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)
+
+JOB_KIND_BACKTEST = 'backtest'
+JOB_KIND_SWEEP = 'sweep'
+JOB_KIND_PORTFOLIO = 'portfolio'
+
+# Minimum interval between progress writes of the same job (phase changes are always written)
+PROGRESS_WRITE_INTERVAL_SEC = 1.0
+
+
+class BacktestQueueFullError(RuntimeError):
+    """Raised when too many backtest jobs are pending in this process."""
+
+
+def ensure_job_columns() -> None:
+    """Make sure qd_backtest_runs has the job columns (for databases created before the job queue)."""
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute("ALTER TABLE qd_backtest_runs ADD COLUMN IF NOT EXISTS progress TEXT DEFAULT ''")
+            cur.execute("ALTER TABLE qd_backtest_runs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW()")
+            cur.execute(f"ALTER TABLE qd_backtest_runs ADD COLUMN IF NOT EXISTS job_kind VARCHAR(20) DEFAULT '{JOB_KIND_BACKTEST}'")
+            db.commit()
+            cur.close()
+    except Exception as e:
+        logger.error(f"Failed to check/ensure backtest job columns: {e}")
+
+
+def _update_run(run_id: Optional[int], **fields: Any) -> None:
+    """Update job columns of a qd_backtest_runs row (best-effort; no-op for jobs without a row)."""
+    if not fields or run_id is None:
+        return
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    try:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                f"UPDATE qd_backtest_runs SET {assignments}, updated_at = NOW() WHERE id = ?",
+                (*fields.values(), run_id)
+            )
+            db.commit()
+            cur.close()
+    except Exception:
+        logger.warning(f"Failed to update backtest job {run_id}", exc_info=True)
+
+
+class _ProgressWriter:
+    """BacktestService progress callback that throttles writes to the job row."""
+
+    def __init__(self, run_id: Optional[int]):
+        self.run_id = run_id
+        self.state: Dict[str, Any] = {'phase': JOB_STATUS_QUEUED}
+        self._last_write = 0.0
+
+    def __call__(self, phase: str, **info: Any) -> None:
+        phase_changed = phase != self.state.get('phase')
+        self.state['phase'] = phase
+        self.state.update(info)
+        now = time.time()
+        if phase_changed or now - self._last_write >= PROGRESS_WRITE_INTERVAL_SEC:
+            self._last_write = now
+            _update_run(self.run_id, progress=json.dumps(self.state))
+
+
+def execute_backtest(params: Dict[str, Any], progress_callback: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+    """
+    Run one backtest described by job params (see BacktestJobManager.submit).
+
+    Crypto with enableMtf uses the multi-timeframe backtest, everything else the standard one.
+    """
+    from app.services.backtest import BacktestService
+
+    service = BacktestService()
+    start_date = datetime.strptime(params['start_date'], '%Y-%m-%d')
+    end_date = datetime.strptime(params['end_date'], '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    kwargs = dict(
+        indicator_code=params['indicator_code'],
+        market=params['market'],
+        symbol=params['symbol'],
+        timeframe=params['timeframe'],
+        start_date=start_date,
+        end_date=end_date,
+        initial_capital=params['initial_capital'],
+        commission=params['commission'],
+        slippage=params['slippage'],
+        leverage=params['leverage'],
+        trade_direction=params['trade_direction'],
+        strategy_config=params['strategy_config'],
+        engine=params.get('engine'),
+        progress_callback=progress_callback
+    )
+
+    if params.get('enable_mtf') and str(params['market']).lower() in ['crypto', 'cryptocurrency']:
+        return service.run_multi_timeframe(enable_mtf=True, **kwargs)
+
+    result = service.run(**kwargs)
+    # 添加标准回测的精度信息
+    result['precision_info'] = {
+        'enabled': False,
+        'timeframe': params['timeframe'],
+        'precision': 'standard',
+        'message': '使用标准K线回测'
+    }
+    return result
+
+
+def execute_sweep(params: Dict[str, Any], progress_callback: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+    """Run a parameter sweep job (job params plus param_ranges, sort_by, top_n)."""
+    from app.services.backtest_sweep import get_backtest_sweep_service
+
+    return get_backtest_sweep_service().run_sweep(
+        indicator_code=params['indicator_code'],
+        market=params['market'],
+        symbol=params['symbol'],
+        timeframe=params['timeframe'],
+        start_date=datetime.strptime(params['start_date'], '%Y-%m-%d'),
+        end_date=datetime.strptime(params['end_date'], '%Y-%m-%d').replace(hour=23, minute=59, second=59),
+        param_ranges=params['param_ranges'],
+        initial_capital=params['initial_capital'],
+        commission=params['commission'],
+        slippage=params['slippage'],
+        leverage=params['leverage'],
+        trade_direction=params['trade_direction'],
+        strategy_config=params['strategy_config'],
+        engine=params.get('engine') or 'array',
+        sort_by=params.get('sort_by') or 'totalReturn',
+        top_n=params.get('top_n'),
+        progress_callback=progress_callback
+    )
+
+
+def execute_portfolio(params: Dict[str, Any], progress_callback: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+    """Run a portfolio / walk-forward job (job params plus symbols, walk_forward, param_ranges, sort_by)."""
+    from app.services.backtest_portfolio import get_backtest_portfolio_service
+
+    return get_backtest_portfolio_service().run_portfolio(
+        indicator_code=params['indicator_code'],
+        market=params['market'],
+        symbols=params['symbols'],
+        timeframe=params['timeframe'],
+        start_date=datetime.strptime(params['start_date'], '%Y-%m-%d'),
+        end_date=datetime.strptime(params['end_date'], '%Y-%m-%d').replace(hour=23, minute=59, second=59),
+        initial_capital=params['initial_capital'],
+        commission=params['commission'],
+        slippage=params['slippage'],
+        leverage=params['leverage'],
+        trade_direction=params['trade_direction'],
+        strategy_config=params['strategy_config'],
+        engine=params.get('engine'),
+        walk_forward=params.get('walk_forward'),
+        param_ranges=params.get('param_ranges'),
+        sort_by=params.get('sort_by') or 'totalReturn',
+        progress_callback=progress_callback
+    )
+
+
+_JOB_RUNNERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    JOB_KIND_BACKTEST: execute_backtest,
+    JOB_KIND_SWEEP: execute_sweep,
+    JOB_KIND_PORTFOLIO: execute_portfolio,
+}
+
+
+def run_backtest_job(run_id: Optional[int], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Process pool entry point: run the job and persist status/result into its row."""
+    progress = _ProgressWriter(run_id)
+    _update_run(run_id, status=JOB_STATUS_RUNNING)
+    try:
+        runner = _JOB_RUNNERS[params.get('kind') or JOB_KIND_BACKTEST]
+        result = runner(params, progress_callback=progress)
+    except Exception as e:
+        logger.error(f"Backtest job {run_id} failed: {e}", exc_info=True)
+        progress.state['phase'] = JOB_STATUS_FAILED
+        _update_run(run_id, status=JOB_STATUS_FAILED, error_message=str(e), progress=json.dumps(progress.state))
+        raise
+
+    progress.state['phase'] = 'done'
+    _update_run(
+        run_id,
+        status=JOB_STATUS_SUCCESS,
+        result_json=json.dumps(result or {}, ensure_ascii=False),
+        progress=json.dumps(progress.state)
+    )
+    return result
+
+
+class BacktestJobManager:
+    """
+    Submits backtest jobs to a bounded process pool.
+
+    Config (env):
+        BACKTEST_JOB_WORKERS: Worker processes per API process (default 2)
+        BACKTEST_JOB_MAX_PENDING: Max queued+running jobs per API process (default 32)
+        BACKTEST_JOB_STALE_SEC: Active jobs without progress for this long are reported failed (default 3600)
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max(1, int(max_workers or os.getenv('BACKTEST_JOB_WORKERS', '2')))
+        self.max_pending = max(1, int(max_pending or os.getenv('BACKTEST_JOB_MAX_PENDING', '32')))
+        self.stale_sec = int(os.getenv('BACKTEST_JOB_STALE_SEC', '3600'))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Set[Future] = set()
+        # Slots taken by submitters that are still inserting their job row
+        self._reserved = 0
+        self._lock = threading.Lock()
+        self._columns_checked = False
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: children must not inherit DB pools / threads of the API process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def ensure_columns(self) -> None:
+        """Run ensure_job_columns() once per process (before reading or writing job columns)."""
+        if not self._columns_checked:
+            ensure_job_columns()
+            self._columns_checked = True
+
+    def submit(
+        self, user_id: int, params: Dict[str, Any], row_required: bool = True
+    ) -> Tuple[Optional[int], Future]:
+        """
+        Create the job row and queue the run.
+
+        Args:
+            params: indicator_code, indicator_id, market, symbol, timeframe, start_date, end_date
+                    (YYYY-MM-DD), initial_capital, commission, slippage, leverage, trade_direction,
+                    strategy_config, enable_mtf, engine; optional kind (JOB_KIND_*, default
+                    backtest) plus that kind's params (sweep: param_ranges, sort_by, top_n;
+                    portfolio: symbols, walk_forward, param_ranges, sort_by)
+            row_required: When False (synchronous callers that wait for the result), a failed
+                          row insert is logged and the job runs without a row (run_id None)
+
+        Returns:
+            (run_id, future); the future resolves to the backtest result or raises its error
+        """
+        self.ensure_columns()
+        with self._lock:
+            if len(self._pending) + self._reserved >= self.max_pending:
+                raise BacktestQueueFullError(f'Too many backtest jobs pending ({self.max_pending}), please retry later')
+            self._reserved += 1
+
+        # Insert outside the lock so submitters don't queue behind each other's DB round-trip
+        try:
+            run_id: Optional[int] = self._create_run(user_id, params)
+        except Exception:
+            if row_required:
+                with self._lock:
+                    self._reserved -= 1
+                raise
+            logger.warning("Failed to persist backtest run, running it without a job row", exc_info=True)
+            run_id = None
+
+        with self._lock:
+            self._reserved -= 1
+            try:
+                future = self._get_executor().submit(run_backtest_job, run_id, params)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM) earlier; start a fresh pool
+                self._executor = None
+                future = self._get_executor().submit(run_backtest_job, run_id, params)
+            self._pending.add(future)
+
+        future.add_done_callback(lambda f: self._on_done(run_id, f))
+        logger.info(f"Backtest job {run_id} queued: {params.get('market')}:{params.get('symbol')} {params.get('timeframe')}")
+        return run_id, future
+
+    def _on_done(self, run_id: Optional[int], future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        exc = future.exception() if not future.cancelled() else None
+        if isinstance(exc, BrokenProcessPool):
+            # The worker process died, so it could not record the failure itself
+            _update_run(run_id, status=JOB_STATUS_FAILED, error_message='Backtest worker process terminated unexpectedly')
+            with self._lock:
+                self._executor = None
+
+    def _create_run(self, user_id: int, params: Dict[str, Any]) -> int:
+        indicator_id = params.get('indicator_id')
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                """
+                INSERT INTO qd_backtest_runs
+                (user_id, indicator_id, market, symbol, timeframe, start_date, end_date,
+                 initial_capital, commission, slippage, leverage, trade_direction,
+                 strategy_config, status, error_message, result_json, progress, job_kind, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NOW(), NOW())
+                """,
+                (
+                    user_id,
+                    int(indicator_id) if indicator_id is not None else None,
+                    params['market'],
+                    params['symbol'],
+                    params['timeframe'],
+                    params['start_date'],
+                    params['end_date'],
+                    params['initial_capital'],
+                    params['commission'],
+                    params['slippage'],
+                    params['leverage'],
+                    params['trade_direction'],
+                    json.dumps(params.get('strategy_config') or {}, ensure_ascii=False),
+                    JOB_STATUS_QUEUED,
+                    '',
+                    '',
+                    json.dumps({'phase': JOB_STATUS_QUEUED}),
+                    params.get('kind') or JOB_KIND_BACKTEST
+                )
+            )
+            run_id = cur.lastrowid
+            db.commit()
+            cur.close()
+        if not run_id:
+            raise RuntimeError('Failed to create backtest job')
+        return int(run_id)
+
+    def get_job(self, user_id: int, run_id: int) -> Optional[Dict[str, Any]]:
+        """Job status/progress for polling; includes the result once finished."""
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                """
+                SELECT id, job_kind, status, progress, error_message, result_json, created_at, updated_at,
+                       EXTRACT(EPOCH FROM (NOW() - updated_at)) AS idle_sec
+                FROM qd_backtest_runs
+                WHERE id = ? AND user_id = ?
+                """,
+                (run_id, user_id)
+            )
+            row = cur.fetchone()
+            cur.close()
+        if not row:
+            return None
+
+        try:
+            progress = json.loads(row.get('progress') or '{}')
+        except Exception:
+            progress = {}
+        status = row.get('status') or JOB_STATUS_SUCCESS
+        error = row.get('error_message') or ''
+
+        if status in ACTIVE_JOB_STATUSES and float(row.get('idle_sec') or 0) > self.stale_sec:
+            # No progress for a long time: the worker was lost (e.g. server restart)
+            status = JOB_STATUS_FAILED
+            error = error or 'Backtest job lost (no progress), please resubmit'
+
+        result = None
+        if status == JOB_STATUS_SUCCESS:
+            try:
+                result = json.loads(row.get('result_json') or '{}')
+            except Exception:
+                result = {}
+
+        # Backtests report bars, sweeps parameter combinations, portfolios symbols
+        percent = None
+        for done_key, total_key in (
+            ('bars_processed', 'bars_total'), ('combos_done', 'combos_total'), ('symbols_done', 'symbols_total')
+        ):
+            total = progress.get(total_key) or 0
+            if total:
+                percent = round(100.0 * (progress.get(done_key) or 0) / total, 1)
+                break
+        return {
+            'jobId': row.get('id'),
+            'runId': row.get('id'),
+            'kind': row.get('job_kind') or JOB_KIND_BACKTEST,
+            'status': status,
+            'phase': progress.get('phase') or status,
+            'progress': progress,
+            'percent': percent,
+            'error': error,
+            'result': result,
+            'created_at': row.get('created_at'),
+            'updated_at': row.get('updated_at'),
+        }
+
+
+_manager: Optional[BacktestJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_backtest_job_manager() -> BacktestJobManager:
+    """Process-wide BacktestJobManager singleton."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = BacktestJobManager()
+    return _manager
@@ -0,0 +1,304 @@
+"""
+Backtest metrics engine.
+
+The equity curve is kept as arrays (`EquityCurve`: float64 values plus bar times) from the
+simulator to the metrics, and only turned into the API's list-of-dicts at
+`BacktestService._format_result` time. `compute_metrics` derives all statistics from one
+NumPy pass over the values: drawdown via `np.maximum.accumulate`, Sharpe/Sortino/Calmar,
+the longest underwater stretch, market exposure and trade statistics.
+
+Bar times of array-engine curves stay as a datetime64 column and are formatted lazily,
+so only the points that are actually returned (downsampled curve, trade bars) become strings.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# Bars per year used to annualize per-bar returns
+ANNUALIZATION_FACTORS = {
+    '1m': 252 * 24 * 60,      # 1m candle: ~362,880
+    '5m': 252 * 24 * 12,      # 5m candle: ~72,576
+    '15m': 252 * 24 * 4,      # 15m candle: ~24,192
+    '30m': 252 * 24 * 2,      # 30m candle: ~12,096
+    '1H': 252 * 24,           # 1H candle: 6,048
+    '4H': 252 * 6,            # 4H candle: 1,512
+    '1D': 252,                # 1D candle: 252
+    '1W': 52                  # 1W candle: 52
+}
+
+# Max equity points returned to the frontend
+MAX_CURVE_POINTS = 500
+
+_OPEN_TRADE_PREFIX = 'open_'
+_CLOSE_TRADE_PREFIX = 'close_'
+
+
+def format_bar_times(index: pd.Index) -> List[str]:
+    """Format a DatetimeIndex as '%Y-%m-%d %H:%M' strings (vectorized; strftime is slow on 100k bars)."""
+    if not isinstance(index, pd.DatetimeIndex) or index.tz is not None:
+        return list(pd.DatetimeIndex(index).strftime('%Y-%m-%d %H:%M'))
+    return _format_datetime64(index.values)
+
+
+def _format_datetime64(values: np.ndarray) -> List[str]:
+    strs = np.datetime_as_string(values.astype('datetime64[m]'), unit='m')
+    return [t.replace('T', ' ') for t in strs.tolist()]
+
+
+class EquityCurve:
+    """
+    Equity curve as arrays.
+
+    Behaves like the reference list of {'time', 'value'} dicts for reading (len, indexing,
+    iteration), so code written against the list format keeps working.
+    """
+
+    __slots__ = ('values', '_times', '_time64')
+
+    def __init__(
+        self,
+        values: Union[np.ndarray, Sequence[float]],
+        times: Optional[List[str]] = None,
+        time64: Optional[np.ndarray] = None
+    ):
+        self.values = np.asarray(values, dtype=np.float64)
+        self._times = times
+        self._time64 = time64
+        if times is None and time64 is None:
+            raise ValueError('EquityCurve needs times or time64')
+
+    @classmethod
+    def from_index(cls, values: np.ndarray, index: pd.Index) -> 'EquityCurve':
+        """Curve over the first len(values) bars of a candle index (times formatted lazily)."""
+        n = len(values)
+        if isinstance(index, pd.DatetimeIndex) and index.tz is None:
+            return cls(values, time64=index.values[:n])
+        return cls(values, times=format_bar_times(index[:n]))
+
+    @classmethod
+    def from_records(cls, curve: Union['EquityCurve', Iterable[Dict[str, Any]]]) -> 'EquityCurve':
+        """Accept an EquityCurve or the list-of-dicts format of the loop engines."""
+        if isinstance(curve, EquityCurve):
+            return curve
+        curve = list(curve or [])
+        return cls([e['value'] for e in curve], times=[e['time'] for e in curve])
+
+    @classmethod
+    def concat(cls, curves: Sequence['EquityCurve']) -> 'EquityCurve':
+        curves = [cls.from_records(c) for c in curves]
+        if not curves:
+            return cls([], times=[])
+        values = np.concatenate([c.values for c in curves])
+        if all(c._time64 is not None for c in curves):
+            return cls(values, time64=np.concatenate([c._time64 for c in curves]))
+        times: List[str] = []
+        for c in curves:
+            times.extend(c.times)
+        return cls(values, times=times)
+
+    @property
+    def times(self) -> List[str]:
+        if self._times is None:
+            self._times = _format_datetime64(self._time64)
+        return self._times
+
+    def time_at(self, i: int) -> str:
+        if self._times is not None:
+            return self._times[i]
+        return _format_datetime64(self._time64[i:i + 1 or None])[0]
+
+    def elapsed_days(self, i: int, j: int) -> float:
+        """Calendar days between bars i and j."""
+        if self._time64 is not None:
+            delta = self._time64[j] - self._time64[i]
+            return float(delta / np.timedelta64(1, 's')) / 86400
+        try:
+            return (pd.Timestamp(self._times[j]) - pd.Timestamp(self._times[i])).total_seconds() / 86400
+        except (ValueError, TypeError):
+            return 0.0
+
+    def bar_positions(self, times: Sequence[str]) -> np.ndarray:
+        """Curve positions of the given time strings (first bar at or after each time)."""
+        if self._time64 is not None:
+            keys = pd.to_datetime(list(times)).values.astype(self._time64.dtype)
+            return np.searchsorted(self._time64, keys, side='left')
+        return np.searchsorted(np.asarray(self._times), np.asarray(list(times)), side='left')
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if self._time64 is not None:
+                return EquityCurve(self.values[key], time64=self._time64[key])
+            return EquityCurve(self.values[key], times=self._times[key])
+        return {'time': self.time_at(key), 'value': float(self.values[key])}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        times = self.times
+        for t, v in zip(times, self.values.tolist()):
+            yield {'time': t, 'value': v}
+
+    def to_records(self, max_points: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List of {'time', 'value'} dicts, downsampled to about max_points; NaN/Inf become 0."""
+        curve = self
+        if max_points and len(self) > max_points:
+            curve = self[::len(self) // max_points]
+        values = np.where(np.isfinite(curve.values), curve.values, 0.0).tolist()
+        return [{'time': t, 'value': v} for t, v in zip(curve.times, values)]
+
+
+def max_drawdown_pct(values: np.ndarray) -> float:
+    """Max drawdown in percent (negative number)."""
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return 0
+    peak = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dd = (peak - values) / peak * 100
+    dd = dd[np.isfinite(dd)]
+    return -float(dd.max()) if dd.size else 0
+
+
+def _period_returns(values: np.ndarray) -> np.ndarray:
+    # Skip zero/negative values (post-liquidation data) to avoid division by 0
+    valid = values[values > 0]
+    if valid.size < 2:
+        return valid[:0]
+    returns = np.diff(valid) / valid[:-1]
+    return returns[np.isfinite(returns)]
+
+
+def sharpe_ratio(values: np.ndarray, timeframe: str = '1D', risk_free_rate: float = 0.02) -> float:
+    """Annualized Sharpe ratio of the per-bar returns."""
+    returns = _period_returns(np.asarray(values, dtype=np.float64))
+    return _sharpe_from_returns(returns, ANNUALIZATION_FACTORS.get(timeframe, 252), risk_free_rate)
+
+
+def _sharpe_from_returns(returns: np.ndarray, factor: float, risk_free_rate: float) -> float:
+    if returns.size == 0:
+        return 0
+    avg_return = np.mean(returns) * factor
+    std_return = np.std(returns) * np.sqrt(factor)
+    if std_return == 0 or not np.isfinite(std_return):
+        return 0
+    sharpe = (avg_return - risk_free_rate) / std_return
+    return float(sharpe) if np.isfinite(sharpe) else 0
+
+
+def _sortino_from_returns(returns: np.ndarray, factor: float, risk_free_rate: float) -> float:
+    if returns.size == 0:
+        return 0
+    avg_return = np.mean(returns) * factor
+    downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2)) * np.sqrt(factor)
+    if downside == 0 or not np.isfinite(downside):
+        return 0
+    sortino = (avg_return - risk_free_rate) / downside
+    return float(sortino) if np.isfinite(sortino) else 0
+
+
+def _max_underwater_span(values: np.ndarray) -> tuple:
+    """(start, end) bar positions of the longest stretch below a previous equity peak."""
+    n = values.size
+    if n < 2:
+        return 0, 0
+    peak = np.maximum.accumulate(values)
+    bars = np.arange(n)
+    last_peak = np.maximum.accumulate(np.where(values >= peak, bars, 0))
+    duration = bars - last_peak
+    end = int(duration.argmax())
+    return int(last_peak[end]), end
+
+
+def _exposure_pct(curve: EquityCurve, trades: List[Dict[str, Any]]) -> float:
+    """Share of curve bars with an open position, from the open/close trade events."""
+    n = len(curve)
+    if n == 0 or not trades:
+        return 0
+    types = [str(t.get('type', '')) for t in trades]
+    is_open = np.fromiter((ty.startswith(_OPEN_TRADE_PREFIX) for ty in types), dtype=bool, count=len(types))
+    is_close = np.fromiter(
+        (ty.startswith(_CLOSE_TRADE_PREFIX) or ty == 'liquidation' for ty in types),
+        dtype=bool, count=len(types)
+    )
+    if not is_open.any():
+        return 0
+    positions = np.minimum(curve.bar_positions([t['time'] for t in trades]), n)
+    delta = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(delta, positions[is_open], 1)
+    np.add.at(delta, positions[is_close], -1)
+    in_market = np.cumsum(delta[:n]) > 0
+    return float(in_market.mean() * 100)
+
+
+def compute_metrics(
+    equity_curve: Union[EquityCurve, List[Dict[str, Any]]],
+    trades: List[Dict[str, Any]],
+    initial_capital: float,
+    timeframe: str,
+    start_date: datetime,
+    end_date: datetime,
+    total_commission: float = 0,
+    risk_free_rate: float = 0.02
+) -> Dict[str, Any]:
+    """
+    Backtest statistics in one pass over the equity values.
+
+    Returns:
+        totalReturn, annualReturn (%, simple), maxDrawdown (%, negative), sharpeRatio, sortinoRatio,
+        calmarRatio, maxDrawdownDuration (days), exposure (% of bars in a position), winRate,
+        profitFactor, totalTrades, avgWin, avgLoss, largestWin, largestLoss, totalProfit, totalCommission
+    """
+    curve = EquityCurve.from_records(equity_curve)
+    if len(curve) == 0:
+        return {}
+    values = curve.values
+
+    final_value = float(values[-1])
+    total_return = (final_value - initial_capital) / initial_capital * 100
+
+    # Simple (not compound) annualization: compounding produces unrealistic numbers for high-return strategies
+    years = (end_date - start_date).total_seconds() / 86400 / 365.0
+    annual_return = total_return / years if years > 0 else 0
+
+    max_drawdown = max_drawdown_pct(values)
+    factor = ANNUALIZATION_FACTORS.get(timeframe, 252)
+    returns = _period_returns(values)
+    sharpe = _sharpe_from_returns(returns, factor, risk_free_rate)
+    sortino = _sortino_from_returns(returns, factor, risk_free_rate)
+    calmar = annual_return / abs(max_drawdown) if max_drawdown < 0 else 0
+    dd_start, dd_end = _max_underwater_span(values)
+    dd_days = curve.elapsed_days(dd_start, dd_end) if dd_end > dd_start else 0
+
+    # Exit trades: trades with profit != 0
+    profits = np.fromiter((t.get('profit', 0) or 0 for t in trades), dtype=np.float64, count=len(trades))
+    wins = profits[profits > 0]
+    losses = profits[profits < 0]
+    total_trades = int(wins.size + losses.size)
+    win_rate = wins.size / total_trades * 100 if total_trades > 0 else 0
+    total_wins = float(wins.sum())
+    total_losses = abs(float(losses.sum()))
+    profit_factor = total_wins / total_losses if total_losses > 0 else (total_wins if total_wins > 0 else 0)
+
+    return {
+        'totalReturn': round(total_return, 2),
+        'annualReturn': round(annual_return, 2),
+        'maxDrawdown': round(max_drawdown, 2),
+        'sharpeRatio': round(sharpe, 2),
+        'sortinoRatio': round(sortino, 2),
+        'calmarRatio': round(calmar, 2),
+        'maxDrawdownDuration': round(dd_days, 2),
+        'exposure': round(_exposure_pct(curve, trades), 2),
+        'winRate': round(win_rate, 2),
+        'profitFactor': round(profit_factor, 2),
+        'totalTrades': total_trades,
+        'avgWin': round(float(wins.mean()), 2) if wins.size else 0,
+        'avgLoss': round(float(losses.mean()), 2) if losses.size else 0,
+        'largestWin': round(float(wins.max()), 2) if wins.size else 0,
+        'largestLoss': round(float(losses.min()), 2) if losses.size else 0,
+        # Total PnL: final equity - initial capital (most accurate)
+        'totalProfit': round(final_value - initial_capital, 2),
+        'totalCommission': round(total_commission, 2)
+    }
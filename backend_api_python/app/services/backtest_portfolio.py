@@ -0,0 +1,359 @@
+"""
+Portfolio and walk-forward backtesting.
+
+Runs one indicator across a basket of symbols in parallel worker processes, reusing the
+per-symbol simulator (`BacktestService._simulate_trading`). Capital is shared by equal
+allocation: each symbol gets initial_capital / N, unused sleeves stay in cash, and the
+portfolio equity curve is the sum of all sleeves on the union of their timestamps.
+
+Walk-forward: the date range is split into rolling windows (train + test). Each symbol's
+candles and signals are computed once for the whole range; every test window is simulated
+with the capital carried over from the previous window. With `paramRanges`, the best
+strategyConfig of the train window (grid search, see backtest_sweep) is used on its test window.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.services.backtest_metrics import EquityCurve
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _clean_metrics(metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """Plain floats with NaN/inf replaced by 0 (JSON-safe), like BacktestService._format_result."""
+    out = {}
+    for key, value in (metrics or {}).items():
+        if isinstance(value, (float, np.floating)):
+            value = float(value) if np.isfinite(value) else 0
+        out[key] = value
+    return out
+
+
+def normalize_symbols(symbols: Any, max_symbols: int) -> List[str]:
+    """De-duplicated, stripped symbol list; raises ValueError when empty or above max_symbols."""
+    if symbols is not None and not isinstance(symbols, (list, tuple)):
+        raise ValueError('symbols must be a list')
+    # Codes such as 600519 may arrive as JSON numbers
+    symbols = [str(s).strip() for s in (symbols or []) if s is not None]
+    symbols = list(dict.fromkeys(s for s in symbols if s))
+    if not symbols:
+        raise ValueError('symbols is required')
+    if len(symbols) > max_symbols:
+        raise ValueError(f'Too many symbols: {len(symbols)} (max {max_symbols})')
+    return symbols
+
+
+def build_walk_forward_windows(
+    start_date: datetime,
+    end_date: datetime,
+    train_days: int,
+    test_days: int,
+    step_days: Optional[int] = None
+) -> List[Tuple[Optional[str], str, str]]:
+    """
+    Rolling windows as (train_start, test_start, test_end) ISO strings.
+
+    train_start is None when train_days is 0 (plain rolling out-of-sample windows).
+    """
+    if test_days <= 0:
+        raise ValueError('walkForward.testDays must be positive')
+    # Overlapping test windows would compound the same bars' returns twice
+    if step_days and step_days < test_days:
+        raise ValueError('walkForward.stepDays must be >= testDays')
+    step = timedelta(days=step_days or test_days)
+    train = timedelta(days=max(int(train_days or 0), 0))
+    test = timedelta(days=test_days)
+
+    windows = []
+    cursor = start_date
+    while cursor + train < end_date:
+        test_start = cursor + train
+        test_end = min(test_start + test, end_date)
+        windows.append((cursor.isoformat() if train else None, test_start.isoformat(), test_end.isoformat()))
+        cursor += step
+    if not windows:
+        raise ValueError('Date range is too short for the walk-forward windows')
+    return windows
+
+
+def run_symbol_backtest(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pool task: backtest one symbol over all windows.
+
+    Returns:
+        {'symbol', 'metrics', 'windows', 'times', 'values', 'trades', 'commission', 'error'}
+    """
+    from app.services.backtest import BacktestService
+    from app.services.backtest_sweep import SWEEP_SORT_KEYS, expand_param_grid
+
+    symbol = task['symbol']
+    allocation = task['allocation']
+    timeframe = task['timeframe']
+    out = {'symbol': symbol, 'allocation': allocation, 'metrics': {}, 'windows': [], 'times': [], 'values': [],
+           'trades': [], 'commission': 0.0, 'error': ''}
+    try:
+        service = BacktestService()
+        start_date = datetime.fromisoformat(task['start_date'])
+        end_date = datetime.fromisoformat(task['end_date'])
+        df = service._fetch_kline_data(task['market'], symbol, timeframe, start_date, end_date)
+        if df.empty:
+            raise ValueError("No candle data available in the backtest date range")
+        backtest_params = {
+            'leverage': task['leverage'],
+            'initial_capital': allocation,
+            'commission': task['commission'],
+            'trade_direction': task['trade_direction']
+        }
+        signals = service._execute_indicator(task['indicator_code'], df, backtest_params)
+        if not isinstance(signals, dict):
+            raise ValueError("Indicator code did not produce buy/sell or 4-way signals")
+
+        sort_by = task.get('sort_by') or 'totalReturn'
+        if sort_by not in SWEEP_SORT_KEYS:
+            sort_by = 'totalReturn'
+        combos = expand_param_grid(task['strategy_config'], task['param_ranges'], task['max_combinations']) \
+            if task.get('param_ranges') else None
+
+        def _simulate(mask, capital, cfg, window_start, window_end):
+            df_w = df[mask]
+            if df_w.empty:
+                return None
+            sig_w = {k: v[mask] for k, v in signals.items()}
+            equity, trades, commission = service._simulate_trading(
+                df_w, sig_w, capital, task['commission'], task['slippage'], task['leverage'],
+                task['trade_direction'], cfg, engine=task['engine']
+            )
+            metrics = service._calculate_metrics(equity, trades, capital, timeframe, window_start, window_end, commission)
+            return equity, trades, commission, metrics
+
+        capital = allocation
+        curves: List[EquityCurve] = []
+        all_trades: List[Dict[str, Any]] = []
+        total_commission = 0.0
+        for train_start, test_start, test_end in task['windows']:
+            test_start_dt = datetime.fromisoformat(test_start)
+            test_end_dt = datetime.fromisoformat(test_end)
+            cfg = task['strategy_config']
+            best_params = None
+            if combos and train_start:
+                # In-sample grid search on the train window, pick the best config for the test window
+                train_start_dt = datetime.fromisoformat(train_start)
+                train_mask = (df.index >= train_start_dt) & (df.index < test_start_dt)
+                best_score = None
+                for params, combo_cfg in combos:
+                    res = _simulate(train_mask, capital, combo_cfg, train_start_dt, test_start_dt)
+                    score = res[3].get(sort_by) if res else None
+                    if score is not None and np.isfinite(score) and (best_score is None or score > best_score):
+                        best_score, cfg, best_params = score, combo_cfg, params
+
+            test_mask = (df.index >= test_start_dt) & (df.index < test_end_dt)
+            res = _simulate(test_mask, capital, cfg, test_start_dt, test_end_dt)
+            if res is None:
+                continue
+            equity, trades, commission, metrics = res
+            out['windows'].append({
+                'trainStart': train_start,
+                'testStart': test_start,
+                'testEnd': test_end,
+                'params': best_params,
+                'metrics': _clean_metrics(metrics),
+            })
+            equity = EquityCurve.from_records(equity)
+            curves.append(equity)
+            all_trades.extend(trades)
+            total_commission += commission
+            if len(equity):
+                capital = float(equity.values[-1])
+            if capital <= 0:
+                break
+
+        equity_curve = EquityCurve.concat(curves)
+        if not len(equity_curve):
+            raise ValueError("No candle data in the test windows")
+        first_test = datetime.fromisoformat(task['windows'][0][1])
+        out['metrics'] = service._calculate_metrics(
+            equity_curve, all_trades, allocation, timeframe, first_test, end_date, total_commission
+        )
+        out['times'] = equity_curve.times
+        out['values'] = equity_curve.values.tolist()
+        out['trades'] = [dict(t, symbol=symbol) for t in all_trades]
+        out['commission'] = total_commission
+    except Exception as e:
+        logger.warning(f"Portfolio backtest failed for {symbol}: {e}")
+        out['error'] = str(e)
+    return out
+
+
+class BacktestPortfolioService:
+    """
+    Multi-symbol / walk-forward backtests.
+
+    Config (env):
+        BACKTEST_PORTFOLIO_WORKERS: Pool processes (default min(4, cpu_count))
+        BACKTEST_PORTFOLIO_MAX_SYMBOLS: Max symbols per request (default 50)
+    """
+
+    def __init__(self):
+        self.max_workers = max(1, int(os.getenv('BACKTEST_PORTFOLIO_WORKERS', str(min(4, os.cpu_count() or 1)))))
+        self.max_symbols = int(os.getenv('BACKTEST_PORTFOLIO_MAX_SYMBOLS', '50'))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def run_portfolio(
+        self,
+        indicator_code: str,
+        market: str,
+        symbols: List[str],
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = None,
+        walk_forward: Optional[Dict[str, Any]] = None,
+        param_ranges: Optional[Dict[str, Any]] = None,
+        sort_by: str = 'totalReturn',
+        progress_callback: Optional[Callable[..., None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run the indicator on every symbol and aggregate a portfolio result.
+
+        Args:
+            walk_forward: {'trainDays', 'testDays', 'stepDays'} (optional)
+            param_ranges: Grid for in-sample optimization per train window (requires walk_forward.trainDays)
+            progress_callback: Optional callable(phase, **info) (simulate with symbols_done/symbols_total)
+
+        Returns:
+            Portfolio result in the `_format_result` shape plus 'symbols' (per-symbol metrics/windows)
+        """
+        from app.services.backtest import BacktestService
+        from app.services.backtest_sweep import get_backtest_sweep_service
+
+        symbols = normalize_symbols(symbols, self.max_symbols)
+
+        if walk_forward:
+            windows = build_walk_forward_windows(
+                start_date, end_date,
+                int(walk_forward.get('trainDays') or 0),
+                int(walk_forward.get('testDays') or 0),
+                int(walk_forward.get('stepDays') or 0) or None
+            )
+        else:
+            windows = [(None, start_date.isoformat(), (end_date + timedelta(seconds=1)).isoformat())]
+
+        allocation = float(initial_capital) / len(symbols)
+        tasks = [{
+            'symbol': symbol,
+            'allocation': allocation,
+            'indicator_code': indicator_code,
+            'market': market,
+            'timeframe': timeframe,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'commission': float(commission),
+            'slippage': float(slippage),
+            'leverage': int(leverage),
+            'trade_direction': trade_direction,
+            'strategy_config': strategy_config or {},
+            'engine': engine,
+            'windows': windows,
+            'param_ranges': param_ranges or None,
+            'max_combinations': get_backtest_sweep_service().max_combinations,
+            'sort_by': sort_by,
+        } for symbol in symbols]
+
+        report = BacktestService._report_progress
+        report(progress_callback, 'simulate', symbols_total=len(tasks), symbols_done=0)
+        outputs = []
+        if len(tasks) == 1 or self.max_workers <= 1:
+            for task in tasks:
+                outputs.append(run_symbol_backtest(task))
+                report(progress_callback, 'simulate', symbols_done=len(outputs))
+        else:
+            for out in self._get_executor().map(run_symbol_backtest, tasks):
+                outputs.append(out)
+                report(progress_callback, 'simulate', symbols_done=len(outputs))
+        report(progress_callback, 'metrics')
+
+        return self._aggregate(BacktestService(), outputs, initial_capital, allocation, timeframe, windows, end_date)
+
+    @staticmethod
+    def _aggregate(
+        service,
+        outputs: List[Dict[str, Any]],
+        initial_capital: float,
+        allocation: float,
+        timeframe: str,
+        windows: List[Tuple[Optional[str], str, str]],
+        end_date: datetime
+    ) -> Dict[str, Any]:
+        sleeves = [
+            pd.Series(o['values'], index=o['times'], dtype=float, name=o['symbol'])
+            for o in outputs if not o['error'] and o['times']
+        ]
+        sleeves = [s[~s.index.duplicated(keep='last')] for s in sleeves]
+        if not sleeves:
+            errors = '; '.join(f"{o['symbol']}: {o['error']}" for o in outputs if o['error'])
+            raise ValueError(f"No symbol produced a backtest result ({errors})")
+
+        # Shared capital: sleeves hold their allocation until their first bar and keep the last value after it;
+        # sleeves of failed symbols stay in cash.
+        combined = pd.concat(sleeves, axis=1).sort_index().ffill().fillna(allocation)
+        idle_cash = allocation * (len(outputs) - len(sleeves))
+        portfolio_values = combined.sum(axis=1) + idle_cash
+        equity_curve = EquityCurve(np.round(portfolio_values.to_numpy(dtype=np.float64), 2), times=list(portfolio_values.index))
+
+        trades = sorted((t for o in outputs for t in o['trades']), key=lambda t: t['time'])
+        total_commission = sum(o['commission'] for o in outputs)
+        first_test = datetime.fromisoformat(windows[0][1])
+        metrics = service._calculate_metrics(
+            equity_curve, trades, initial_capital, timeframe, first_test, end_date, total_commission
+        )
+        result = service._format_result(metrics, equity_curve, trades)
+        result['symbols'] = [{
+            'symbol': o['symbol'],
+            'allocation': round(o['allocation'], 2),
+            'metrics': _clean_metrics(o['metrics']),
+            'windows': o['windows'],
+            'totalTrades': len(o['trades']),
+            'error': o['error'],
+        } for o in outputs]
+        result['walkForward'] = [
+            {'trainStart': w[0], 'testStart': w[1], 'testEnd': w[2]} for w in windows
+        ] if len(windows) > 1 or windows[0][0] else None
+        return result
+
+
+_portfolio_service: Optional[BacktestPortfolioService] = None
+_portfolio_lock = threading.Lock()
+
+
+def get_backtest_portfolio_service() -> BacktestPortfolioService:
+    """Process-wide BacktestPortfolioService singleton (keeps its worker pool warm)."""
+    global _portfolio_service
+    if _portfolio_service is None:
+        with _portfolio_lock:
+            if _portfolio_service is None:
+                _portfolio_service = BacktestPortfolioService()
+    return _portfolio_service
@@ -0,0 +1,357 @@
+"""
+Backtest parameter sweep (grid optimization).
+
+Fetches candles and executes the indicator once, then simulates every strategyConfig
+combination of a parameter grid. OHLCV and signal columns are placed in one
+`multiprocessing.shared_memory` block that pool workers attach to, so each task only
+ships a list of configs, and results come back as `_calculate_metrics` dicts.
+"""
+import copy
+import itertools
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# All _calculate_metrics keys are "higher is better" (maxDrawdown is reported as a negative number)
+SWEEP_SORT_KEYS = (
+    'totalReturn', 'annualReturn', 'maxDrawdown', 'sharpeRatio', 'winRate',
+    'profitFactor', 'totalProfit', 'totalTrades',
+)
+
+
+def _set_path(cfg: Dict[str, Any], path: str, value: Any) -> None:
+    """Set a dotted path (e.g. 'scale.trendAdd.stepPct') in a nested dict, creating levels as needed."""
+    keys = path.split('.')
+    node = cfg
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    node[keys[-1]] = value
+
+
+def _range_values(spec: Any) -> List[Any]:
+    """Parameter values from a list or a {'start', 'stop', 'step'} range (stop inclusive)."""
+    if isinstance(spec, (list, tuple)):
+        return list(spec)
+    if isinstance(spec, dict) and 'start' in spec and 'stop' in spec:
+        start, stop = float(spec['start']), float(spec['stop'])
+        step = float(spec.get('step') or 0)
+        if step <= 0:
+            raise ValueError(f"Invalid range step: {spec}")
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(max(count, 0))]
+    return [spec]
+
+
+def expand_param_grid(
+    base_config: Optional[Dict[str, Any]],
+    param_ranges: Dict[str, Any],
+    max_combinations: int
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Cartesian product of parameter ranges applied on top of base strategyConfig.
+
+    Args:
+        param_ranges: {'risk.stopLossPct': [0.02, 0.03], 'scale.trendAdd.stepPct': {'start': 0.01, 'stop': 0.05, 'step': 0.01}}
+
+    Returns:
+        [(params, strategy_config), ...]
+    """
+    if not isinstance(param_ranges, dict) or not param_ranges:
+        raise ValueError('paramRanges is required')
+
+    paths = list(param_ranges.keys())
+    values = [_range_values(param_ranges[p]) for p in paths]
+    total = 1
+    for v in values:
+        if not v:
+            raise ValueError('paramRanges contains an empty range')
+        total *= len(v)
+    if total > max_combinations:
+        raise ValueError(f'Too many parameter combinations: {total} (max {max_combinations})')
+
+    combos = []
+    for combo in itertools.product(*values):
+        cfg = copy.deepcopy(base_config or {})
+        params = {}
+        for path, value in zip(paths, combo):
+            _set_path(cfg, path, value)
+            params[path] = value
+        combos.append((params, cfg))
+    return combos
+
+
+# ---------------------------------------------------------------------------
+# Shared-memory column block
+# ---------------------------------------------------------------------------
+
+def _pack_columns(columns: Dict[str, np.ndarray]) -> Tuple[shared_memory.SharedMemory, List[Tuple[str, str, int, int]]]:
+    """Copy equally long 1-D arrays into one shared memory block; returns (block, layout)."""
+    layout = []
+    offset = 0
+    for name, arr in columns.items():
+        arr = np.ascontiguousarray(arr)
+        layout.append((name, arr.dtype.str, offset, len(arr)))
+        offset += arr.nbytes
+        offset += (-offset) % 8  # keep 8-byte alignment
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+    for (name, dtype, start, length), arr in zip(layout, columns.values()):
+        view = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=start)
+        view[:] = arr
+    return shm, layout
+
+
+# Per worker process: the currently attached block (previous sweeps are closed on switch)
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach_columns(shm_name: str, layout: List[Tuple[str, str, int, int]]) -> Dict[str, np.ndarray]:
+    shm = _attached.get(shm_name)
+    if shm is None:
+        for old in list(_attached.values()):
+            try:
+                old.close()
+            except Exception:
+                pass
+        _attached.clear()
+        # The creating process owns the block and unlinks it. Workers share its resource tracker,
+        # so they must not unregister the name (that drops the parent's registration).
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name, track=False)  # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=shm_name)
+        _attached[shm_name] = shm
+    return {
+        name: np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=start)
+        for name, dtype, start, length in layout
+    }
+
+
+def _simulate_chunk(
+    shm_name: str,
+    layout: List[Tuple[str, str, int, int]],
+    signal_keys: List[str],
+    meta: Dict[str, Any],
+    configs: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Pool task: simulate a chunk of configs on the shared candles/signals, return metrics."""
+    from app.services.backtest import BacktestService
+
+    cols = _attach_columns(shm_name, layout)
+    index = pd.DatetimeIndex(cols['__time__'].view('datetime64[ns]'))
+    df = pd.DataFrame({k: cols[k] for k in ('open', 'high', 'low', 'close', 'volume')}, index=index, copy=False)
+    signals = {k: pd.Series(cols[f'sig:{k}'], index=index, copy=False) for k in signal_keys}
+    return _simulate_configs(BacktestService(), df, signals, meta, configs)
+
+
+def _simulate_configs(
+    service,
+    df: pd.DataFrame,
+    signals: Dict[str, pd.Series],
+    meta: Dict[str, Any],
+    configs: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    start_date = datetime.fromisoformat(meta['start_date'])
+    end_date = datetime.fromisoformat(meta['end_date'])
+    out = []
+    for cfg in configs:
+        try:
+            equity_curve, trades, total_commission = service._simulate_trading(
+                df, dict(signals), meta['initial_capital'], meta['commission'], meta['slippage'],
+                meta['leverage'], meta['trade_direction'], cfg, engine=meta['engine']
+            )
+            metrics = service._calculate_metrics(
+                equity_curve, trades, meta['initial_capital'], meta['timeframe'], start_date, end_date, total_commission
+            )
+            out.append({'metrics': metrics, 'error': ''})
+        except Exception as e:
+            out.append({'metrics': {}, 'error': str(e)})
+    return out
+
+
+class BacktestSweepService:
+    """
+    Grid optimization over strategyConfig parameters.
+
+    Config (env):
+        BACKTEST_SWEEP_WORKERS: Pool processes (default min(4, cpu_count))
+        BACKTEST_SWEEP_MAX_COMBINATIONS: Max combinations per request (default 1000)
+    """
+
+    # Small grids run inline; the pool only pays off once several chunks can run in parallel
+    INLINE_MAX_COMBINATIONS = 8
+
+    def __init__(self):
+        self.max_workers = max(1, int(os.getenv('BACKTEST_SWEEP_WORKERS', str(min(4, os.cpu_count() or 1)))))
+        self.max_combinations = int(os.getenv('BACKTEST_SWEEP_MAX_COMBINATIONS', '1000'))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def run_sweep(
+        self,
+        indicator_code: str,
+        market: str,
+        symbol: str,
+        timeframe: str,
+        start_date: datetime,
+        end_date: datetime,
+        param_ranges: Dict[str, Any],
+        initial_capital: float = 10000.0,
+        commission: float = 0.001,
+        slippage: float = 0.0,
+        leverage: int = 1,
+        trade_direction: str = 'long',
+        strategy_config: Optional[Dict[str, Any]] = None,
+        engine: Optional[str] = 'array',
+        sort_by: str = 'totalReturn',
+        top_n: Optional[int] = None,
+        progress_callback: Optional[Callable[..., None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run every parameter combination on the strategy timeframe and rank by `sort_by`.
+
+        Args:
+            progress_callback: Optional callable(phase, **info) (fetch/indicator/simulate with
+                               combos_done/combos_total), as for BacktestService.run
+
+        Returns:
+            {'total', 'sortBy', 'candles', 'results': [{'rank', 'params', 'metrics', 'error'}, ...]}
+        """
+        from app.services.backtest import BacktestService
+
+        if sort_by not in SWEEP_SORT_KEYS:
+            raise ValueError(f"sortBy must be one of {', '.join(SWEEP_SORT_KEYS)}")
+        combos = expand_param_grid(strategy_config, param_ranges, self.max_combinations)
+
+        service = BacktestService()
+        report = BacktestService._report_progress
+        report(progress_callback, 'fetch', timeframe=timeframe, combos_total=len(combos), combos_done=0)
+        df = service._fetch_kline_data(market, symbol, timeframe, start_date, end_date)
+        if df.empty:
+            raise ValueError("No candle data available in the backtest date range")
+        report(progress_callback, 'indicator', signal_candles=len(df))
+        backtest_params = {
+            'leverage': leverage,
+            'initial_capital': initial_capital,
+            'commission': commission,
+            'trade_direction': trade_direction
+        }
+        signals = service._execute_indicator(indicator_code, df, backtest_params)
+        if not isinstance(signals, dict):
+            raise ValueError("Indicator code did not produce buy/sell or 4-way signals")
+
+        meta = {
+            'initial_capital': float(initial_capital),
+            'commission': float(commission),
+            'slippage': float(slippage),
+            'leverage': int(leverage),
+            'trade_direction': trade_direction,
+            'engine': engine,
+            'timeframe': timeframe,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+        }
+        configs = [cfg for _, cfg in combos]
+
+        report(progress_callback, 'simulate', combos_done=0)
+        if len(configs) <= self.INLINE_MAX_COMBINATIONS or self.max_workers <= 1:
+            outputs = _simulate_configs(service, df, signals, meta, configs)
+        else:
+            outputs = self._run_in_pool(
+                df, signals, meta, configs,
+                on_chunk=lambda done: report(progress_callback, 'simulate', combos_done=done)
+            )
+        report(progress_callback, 'metrics', combos_done=len(configs))
+
+        rows = []
+        for (params, _), out in zip(combos, outputs):
+            rows.append({'params': params, 'metrics': out['metrics'], 'error': out['error']})
+
+        def _score(row):
+            value = row['metrics'].get(sort_by)
+            if value is None or not np.isfinite(value):
+                return -math.inf
+            return value
+
+        rows.sort(key=_score, reverse=True)
+        for rank, row in enumerate(rows, start=1):
+            row['rank'] = rank
+        if top_n:
+            rows = rows[:max(1, int(top_n))]
+
+        return {
+            'total': len(combos),
+            'sortBy': sort_by,
+            'candles': len(df),
+            'results': rows,
+        }
+
+    def _run_in_pool(
+        self,
+        df: pd.DataFrame,
+        signals: Dict[str, pd.Series],
+        meta: Dict[str, Any],
+        configs: List[Dict[str, Any]],
+        on_chunk: Optional[Callable[[int], None]] = None
+    ) -> List[Dict[str, Any]]:
+        columns = {'__time__': np.asarray(df.index.values, dtype='datetime64[ns]').view(np.int64)}
+        for k in ('open', 'high', 'low', 'close', 'volume'):
+            columns[k] = df[k].to_numpy(dtype=np.float64)
+        # _execute_indicator returns boolean Series aligned with df
+        signal_keys = list(signals.keys())
+        for k in signal_keys:
+            columns[f'sig:{k}'] = signals[k].reindex(df.index).fillna(False).to_numpy(dtype=bool)
+
+        shm, layout = _pack_columns(columns)
+        try:
+            executor = self._get_executor()
+            chunk_size = max(1, math.ceil(len(configs) / (self.max_workers * 4)))
+            futures = [
+                executor.submit(_simulate_chunk, shm.name, layout, signal_keys, meta, configs[i:i + chunk_size])
+                for i in range(0, len(configs), chunk_size)
+            ]
+            outputs = []
+            for f in futures:
+                outputs.extend(f.result())
+                if on_chunk is not None:
+                    on_chunk(len(outputs))
+            return outputs
+        finally:
+            shm.close()
+            shm.unlink()
+
+
+_sweep_service: Optional[BacktestSweepService] = None
+_sweep_lock = threading.Lock()
+
+
+def get_backtest_sweep_service() -> BacktestSweepService:
+    """Process-wide BacktestSweepService singleton (keeps its worker pool warm)."""
+    global _sweep_service
+    if _sweep_service is None:
+        with _sweep_lock:
+            if _sweep_service is None:
+                _sweep_service = BacktestSweepService()
+    return _sweep_service
@@ -11,7 +11,7 @@ Notes:
 from __future__ import annotations
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from app.utils.db import get_db_connection
 from app.utils.logger import get_logger
@@ -55,21 +55,7 @@ def safe_exchange_config_for_log(cfg: Dict[str, Any]) -> Dict[str, Any]:
     return out
 
 
-def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
-    """Load strategy config fields needed for live execution."""
-    with get_db_connection() as db:
-        cur = db.cursor()
-        cur.execute(
-            """
-            SELECT id, exchange_config, trading_config, market_type, leverage, execution_mode, market_category
-            FROM qd_strategies_trading
-            WHERE id = %s
-            """,
-            (int(strategy_id),),
-        )
-        row = cur.fetchone() or {}
-        cur.close()
-
+def _strategy_configs_from_row(strategy_id: int, row: Dict[str, Any]) -> Dict[str, Any]:
     exchange_config = _safe_json_loads(row.get("exchange_config"), {})
     trading_config = _safe_json_loads(row.get("trading_config"), {})
 
@@ -89,6 +75,44 @@ def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
     }
 
 
+def load_strategy_configs(strategy_id: int) -> Dict[str, Any]:
+    """Load strategy config fields needed for live execution."""
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            """
+            SELECT id, exchange_config, trading_config, market_type, leverage, execution_mode, market_category
+            FROM qd_strategies_trading
+            WHERE id = %s
+            """,
+            (int(strategy_id),),
+        )
+        row = cur.fetchone() or {}
+        cur.close()
+
+    return _strategy_configs_from_row(strategy_id, row)
+
+
+def load_strategy_configs_many(strategy_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Batch version of `load_strategy_configs` (one query); missing ids are omitted."""
+    ids = sorted({int(i) for i in strategy_ids or [] if int(i or 0) > 0})
+    if not ids:
+        return {}
+    with get_db_connection() as db:
+        cur = db.cursor()
+        cur.execute(
+            """
+            SELECT id, exchange_config, trading_config, market_type, leverage, execution_mode, market_category
+            FROM qd_strategies_trading
+            WHERE id = ANY(%s)
+            """,
+            (ids,),
+        )
+        rows = cur.fetchall() or []
+        cur.close()
+    return {int(row["id"]): _strategy_configs_from_row(int(row["id"]), row) for row in rows}
+
+
 def _load_credential_config(credential_id: int, user_id: int = 1) -> Dict[str, Any]:
     """Load credential JSON from qd_exchange_credentials (plaintext in local mode)."""
     with get_db_connection() as db:
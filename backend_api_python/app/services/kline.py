@@ -1,15 +1,34 @@
 """
 K线数据服务
 """
-from typing import Dict, List, Any, Optional
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 
 from app.data_sources import DataSourceFactory
+from app.data_sources.crypto_stream import get_crypto_stream
 from app.utils.cache import CacheManager
 from app.utils.logger import get_logger
 from app.config import CacheConfig
 
 logger = get_logger(__name__)
 
+# 批量取价时，没有批量接口或批量未取到的 symbol 逐个回源用的线程池（惰性创建）
+_price_executor: Optional[ThreadPoolExecutor] = None
+_price_executor_lock = threading.Lock()
+
+
+def _get_price_executor() -> ThreadPoolExecutor:
+    global _price_executor
+    if _price_executor is None:
+        with _price_executor_lock:
+            if _price_executor is None:
+                workers = max(1, int(os.getenv('PRICE_FALLBACK_WORKERS', '4')))
+                _price_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='price-fallback')
+    return _price_executor
+
 
 class KlineService:
     """K线数据服务"""
@@ -39,30 +58,31 @@ class KlineService:
         Returns:
             K线数据列表
         """
-        # 构建缓存键（历史数据不缓存）
-        if not before_time:
-            cache_key = f"kline:{market}:{symbol}:{timeframe}:{limit}"
-            cached = self.cache.get(cache_key)
-            if cached:
-                # logger.info(f"命中缓存: {cache_key}")
-                return cached
-        
-        # 获取数据
-        klines = DataSourceFactory.get_kline(
-            market=market,
-            symbol=symbol,
-            timeframe=timeframe,
-            limit=limit,
-            before_time=before_time
+        # 加密货币：已订阅推送的 symbol 直接读内存中的实时K线（断线时回退 REST）
+        if not before_time and market == 'Crypto':
+            stream = get_crypto_stream()
+            streamed = stream.get_klines(symbol, timeframe, limit) if stream is not None else None
+            if streamed:
+                return streamed
+
+        # 历史数据不缓存
+        if before_time:
+            return DataSourceFactory.get_kline(
+                market=market,
+                symbol=symbol,
+                timeframe=timeframe,
+                limit=limit,
+                before_time=before_time
+            )
+
+        # 最新数据：同一 key 的并发请求只回源一次，过期后短时间内先返回旧值并后台刷新
+        ttl = self.cache_ttl.get(timeframe, 300)
+        return self.cache.get_or_load(
+            f"kline:{market}:{symbol}:{timeframe}:{limit}",
+            lambda: DataSourceFactory.get_kline(market=market, symbol=symbol, timeframe=timeframe, limit=limit),
+            ttl=ttl,
+            stale_ttl=int(ttl * CacheConfig.STALE_TTL_RATIO),
         )
-        
-        # 设置缓存（仅最新数据）
-        if klines and not before_time:
-            ttl = self.cache_ttl.get(timeframe, 300)
-            self.cache.set(cache_key, klines, ttl)
-            # logger.info(f"缓存设置: {cache_key}, TTL: {ttl}s")
-        
-        return klines
     
     def get_latest_price(self, market: str, symbol: str) -> Optional[Dict[str, Any]]:
         """获取最新价格（使用1分钟K线，已弃用，建议使用 get_realtime_price）"""
@@ -92,16 +112,152 @@ class KlineService:
                 'source': 数据来源 ('ticker' 或 'kline')
             }
         """
-        # 构建缓存键（短时间缓存，避免频繁请求）
-        cache_key = f"realtime_price:{market}:{symbol}"
-        
-        # 如果不是强制刷新，尝试使用缓存
-        if not force_refresh:
-            cached = self.cache.get(cache_key)
-            if cached:
-                return cached
-        
-        result = {
+        # 短时间缓存，避免频繁请求；并发请求合并为一次回源
+        return self.cache.get_or_load(
+            self._realtime_price_key(market, symbol),
+            lambda: self._load_realtime_price(market, symbol),
+            ttl=self._realtime_price_ttl,
+            stale_ttl=int(30 * CacheConfig.STALE_TTL_RATIO),
+            force_refresh=force_refresh,
+        )
+
+    def get_realtime_prices(
+        self,
+        market: str,
+        symbols: Iterable[str],
+        force_refresh: bool = False,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取同一市场多个标的的实时价格（格式同 get_realtime_price）
+
+        与 get_realtime_price 共用缓存：新鲜的缓存直接返回，其余 symbol 去重后用数据源的
+        批量接口一次取回（CCXT fetch_tickers / 腾讯多代码行情 / yf.download / Tiingo 多 ticker），
+        批量未取到的再在 PRICE_FALLBACK_WORKERS 线程池里逐个走 ticker -> K线 的降级链路。
+
+        Args:
+            timeout: 逐个降级的最长等待时间（秒）；超时的 symbol 返回过期缓存值或空价格
+
+        Returns:
+            {symbol: price_data}
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        unique = list(dict.fromkeys(s for s in symbols if s))
+        result: Dict[str, Dict[str, Any]] = {}
+        stale: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for symbol in unique:
+            cached = None if force_refresh else self.cache.peek(self._realtime_price_key(market, symbol))
+            if cached and cached[1]:
+                result[symbol] = cached[0]
+            else:
+                if cached:
+                    stale[symbol] = cached[0]
+                missing.append(symbol)
+        if not missing:
+            return result
+
+        batched = len(missing) > 1 and DataSourceFactory.supports_batch_tickers(market)
+        if batched:
+            tickers = DataSourceFactory.get_tickers(market, missing)
+            for symbol in missing:
+                data = self._price_from_ticker(tickers.get(symbol))
+                if data:
+                    self.cache.put(
+                        self._realtime_price_key(market, symbol), data,
+                        ttl=self._realtime_price_ttl, stale_ttl=int(30 * CacheConfig.STALE_TTL_RATIO),
+                    )
+                    result[symbol] = data
+
+        rest = [s for s in missing if s not in result]
+        if len(rest) == 1 and deadline is None:
+            result[rest[0]] = self._fallback_realtime_price(market, rest[0], not batched, force_refresh)
+        elif rest:
+            executor = _get_price_executor()
+            futures = {
+                executor.submit(self._fallback_realtime_price, market, s, not batched, force_refresh): s
+                for s in rest
+            }
+            remaining = max(0.0, deadline - time.time()) if deadline is not None else None
+            done, pending = wait(futures, timeout=remaining)
+            for future in done:
+                result[futures[future]] = future.result()
+            if pending:
+                logger.warning(f"Price fallback timed out for {len(pending)}/{len(rest)} {market} symbols")
+                for future in pending:
+                    # 已在运行的加载会继续完成并写入缓存，下次请求即可命中
+                    future.cancel()
+                    symbol = futures[future]
+                    result[symbol] = stale.get(symbol) or self._empty_price()
+        return result
+
+    def get_realtime_price_snapshot(
+        self,
+        items: Iterable[Tuple[str, str]],
+        force_refresh: bool = False,
+        timeout: Optional[float] = None
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        批量获取多个市场的实时价格：按市场分组后各调用一次 get_realtime_prices
+
+        Args:
+            items: (market, symbol) 列表，可重复
+            timeout: 整体超时（秒）；到期后剩余市场只返回缓存值（含过期值）或空价格
+
+        Returns:
+            {(market, symbol): price_data}
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        by_market: Dict[str, List[str]] = {}
+        for market, symbol in items:
+            if market and symbol:
+                by_market.setdefault(market, []).append(symbol)
+        snapshot = {}
+        for market, symbols in by_market.items():
+            remaining = deadline - time.time() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                logger.warning(f"Price snapshot deadline reached, skipping fetch for {market} ({len(symbols)} symbols)")
+                for symbol in symbols:
+                    cached = self.cache.peek(self._realtime_price_key(market, symbol))
+                    snapshot[(market, symbol)] = cached[0] if cached else self._empty_price()
+                continue
+            try:
+                prices = self.get_realtime_prices(market, symbols, force_refresh=force_refresh, timeout=remaining)
+            except Exception as e:
+                logger.error(f"Batch price fetch failed for {market} ({len(symbols)} symbols): {e}")
+                continue
+            for symbol, data in prices.items():
+                snapshot[(market, symbol)] = data
+        return snapshot
+
+    def _fallback_realtime_price(
+        self,
+        market: str,
+        symbol: str,
+        try_ticker: bool,
+        force_refresh: bool
+    ) -> Dict[str, Any]:
+        """逐个加载（过期缓存仍先返回旧值并后台刷新，与 get_realtime_price 一致）"""
+        try:
+            data = self.cache.get_or_load(
+                self._realtime_price_key(market, symbol),
+                lambda: self._load_realtime_price(market, symbol, try_ticker=try_ticker),
+                ttl=self._realtime_price_ttl,
+                stale_ttl=int(30 * CacheConfig.STALE_TTL_RATIO),
+                force_refresh=force_refresh,
+            )
+        except Exception as e:
+            logger.debug(f"Price fallback failed for {market}:{symbol}: {e}")
+            data = None
+        return data or self._empty_price()
+
+    @staticmethod
+    def _realtime_price_key(market: str, symbol: str) -> str:
+        return f"realtime_price:{market}:{symbol}"
+
+    @staticmethod
+    def _empty_price() -> Dict[str, Any]:
+        return {
             'price': 0,
             'change': 0,
             'changePercent': 0,
@@ -111,26 +267,42 @@ class KlineService:
             'previousClose': 0,
             'source': 'unknown'
         }
+
+    @staticmethod
+    def _price_from_ticker(ticker: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """ticker -> 实时价格数据；无有效价格时返回 None"""
+        if not ticker or not (ticker.get('last') or 0) > 0:
+            return None
+        return {
+            'price': ticker.get('last', 0),
+            'change': ticker.get('change', 0),
+            'changePercent': ticker.get('changePercent', 0),
+            'high': ticker.get('high', 0),
+            'low': ticker.get('low', 0),
+            'open': ticker.get('open', 0),
+            'previousClose': ticker.get('previousClose', 0),
+            'source': 'ticker'
+        }
+
+    @staticmethod
+    def _realtime_price_ttl(result: Dict[str, Any]) -> int:
+        # 日线数据缓存 5 分钟，其余 30 秒；取不到价格时不缓存
+        if not result or not result.get('price'):
+            return 0
+        return 300 if result.get('source') == 'kline_1d' else 30
+
+    def _load_realtime_price(self, market: str, symbol: str, try_ticker: bool = True) -> Dict[str, Any]:
+        """按 ticker -> 1分钟K线 -> 日线 的顺序获取实时价格（不读写缓存）"""
+        result = self._empty_price()
         
-        # 优先尝试使用 ticker API 获取实时价格
-        try:
-            ticker = DataSourceFactory.get_ticker(market, symbol)
-            if ticker and ticker.get('last', 0) > 0:
-                result = {
-                    'price': ticker.get('last', 0),
-                    'change': ticker.get('change', 0),
-                    'changePercent': ticker.get('changePercent', 0),
-                    'high': ticker.get('high', 0),
-                    'low': ticker.get('low', 0),
-                    'open': ticker.get('open', 0),
-                    'previousClose': ticker.get('previousClose', 0),
-                    'source': 'ticker'
-                }
-                # 缓存 30 秒
-                self.cache.set(cache_key, result, 30)
-                return result
-        except Exception as e:
-            logger.debug(f"Ticker API failed for {market}:{symbol}, falling back to kline: {e}")
+        # 优先尝试使用 ticker API 获取实时价格（批量接口已取过 ticker 时跳过）
+        if try_ticker:
+            try:
+                data = self._price_from_ticker(DataSourceFactory.get_ticker(market, symbol))
+                if data:
+                    return data
+            except Exception as e:
+                logger.debug(f"Ticker API failed for {market}:{symbol}, falling back to kline: {e}")
         
         # 降级：使用 1 分钟 K 线
         try:
@@ -153,8 +325,6 @@ class KlineService:
                     'previousClose': prev_close,
                     'source': 'kline_1m'
                 }
-                # 缓存 30 秒
-                self.cache.set(cache_key, result, 30)
                 return result
         except Exception as e:
             logger.debug(f"1m kline failed for {market}:{symbol}, trying daily: {e}")
@@ -180,8 +350,6 @@ class KlineService:
                     'previousClose': prev_close,
                     'source': 'kline_1d'
                 }
-                # 日线数据缓存 5 分钟
-                self.cache.set(cache_key, result, 300)
                 return result
         except Exception as e:
             logger.error(f"All price sources failed for {market}:{symbol}: {e}")
@@ -0,0 +1,256 @@
+"""
+Rolling candle window and incremental indicator evaluation for live strategies.
+
+`CandleWindow` keeps the last N candles of a strategy in preallocated NumPy columns.
+Ticks update the forming candle in place (or start a new one), and periodic refreshes
+merge only the few most recent exchange candles instead of re-downloading the history.
+
+Incremental indicators (opt-in): an indicator script that defines
+
+    def on_bar(state, bar, position):
+        ...
+        return {'buy': ..., 'sell': ...}   # or 4-way / add_* / reduce_* flags, position_size, reduce_size
+
+is evaluated per tick instead of re-running the whole script over the window:
+
+- `state` is a dict kept between ticks (the script may pre-fill a module-level `state = {...}`).
+- `bar` has time (epoch seconds), open, high, low, close, volume and `closed`.
+  Every candle is passed exactly once with closed=True (update indicator state then); the
+  forming candle is passed with closed=False on every tick (do not commit state then).
+- `position` has side (1/-1/0), entry_price, highest_price, count, last_add_price.
+- Setting state['highest_price'] updates the trailing high, like `highest_price` in df scripts.
+
+The script body still runs once at strategy start (and backtests keep using its df columns);
+after that, closed candles are replayed through on_bar to warm the state up.
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CANDLE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+SIGNAL_FLAG_COLUMNS = (
+    'buy', 'sell', 'open_long', 'close_long', 'open_short', 'close_short',
+    'add_long', 'add_short', 'reduce_long', 'reduce_short',
+)
+FOUR_WAY_COLUMNS = ('open_long', 'close_long', 'open_short', 'close_short')
+
+
+def _utc_index(epoch_seconds: np.ndarray) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(epoch_seconds.astype('datetime64[s]').astype('datetime64[ns]'), tz='UTC')
+
+
+class CandleWindow:
+    """
+    Fixed-capacity candle window (oldest candles drop out as new ones arrive).
+
+    Storage is 2x capacity so the live candles are always one contiguous slice; compaction
+    happens once every `capacity` appends, so appends and in-place updates are O(1) amortized.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(2, int(capacity))
+        size = self.capacity * 2
+        self._time = np.zeros(size, dtype=np.int64)
+        self._cols = {c: np.zeros(size, dtype=np.float64) for c in CANDLE_COLUMNS}
+        self._start = 0
+        self._end = 0
+
+    @classmethod
+    def from_klines(cls, klines: List[Dict[str, Any]], capacity: Optional[int] = None) -> 'CandleWindow':
+        window = cls(capacity or len(klines or []))
+        window.merge_klines(klines)
+        return window
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def last_time(self) -> int:
+        return int(self._time[self._end - 1]) if len(self) else 0
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._time[self._start:self._end]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._cols[name][self._start:self._end]
+
+    def bar(self, i: int = -1) -> Dict[str, Any]:
+        """Candle at position i (negative counts from the newest) as a dict."""
+        pos = (self._end + i) if i < 0 else (self._start + i)
+        out = {'time': int(self._time[pos])}
+        for c in CANDLE_COLUMNS:
+            out[c] = float(self._cols[c][pos])
+        return out
+
+    def _append(self, t: int, values: Dict[str, float]) -> None:
+        if self._end == len(self._time):
+            # Compact: move the live slice to the front of the buffer
+            n = len(self)
+            self._time[:n] = self._time[self._start:self._end]
+            for arr in self._cols.values():
+                arr[:n] = arr[self._start:self._end]
+            self._start, self._end = 0, n
+        self._time[self._end] = t
+        for c in CANDLE_COLUMNS:
+            self._cols[c][self._end] = values[c]
+        self._end += 1
+        if len(self) > self.capacity:
+            self._start += 1
+
+    def upsert(self, t: int, values: Dict[str, float]) -> str:
+        """
+        Insert or overwrite the candle starting at t.
+
+        Returns:
+            'appended', 'updated' or 'ignored' (older than the window, or not an existing candle)
+        """
+        if not len(self) or t > self.last_time:
+            self._append(t, values)
+            return 'appended'
+        pos = self._start + int(np.searchsorted(self.times, t))
+        if pos < self._end and self._time[pos] == t:
+            for c in CANDLE_COLUMNS:
+                self._cols[c][pos] = values[c]
+            return 'updated'
+        return 'ignored'
+
+    def merge_klines(self, klines: List[Dict[str, Any]], timeframe_seconds: Optional[int] = None) -> bool:
+        """
+        Merge exchange candles ({time, open, high, low, close, volume}) into the window.
+
+        Returns:
+            False if the candles leave a gap after the window's newest candle (the caller should reload)
+        """
+        rows = []
+        for k in klines or []:
+            try:
+                t = int(k.get('time', k.get('timestamp')))
+                values = {c: float(k[c]) for c in CANDLE_COLUMNS}
+            except (TypeError, ValueError, KeyError):
+                continue
+            if any(np.isnan(v) for v in values.values()):
+                continue
+            rows.append((t, values))
+        rows.sort(key=lambda r: r[0])
+        if not rows:
+            return True
+        if timeframe_seconds and len(self) and rows[0][0] > self.last_time + timeframe_seconds:
+            return False
+        for t, values in rows:
+            self.upsert(t, values)
+        return True
+
+    def apply_price(self, price: float, timeframe_seconds: int, now_ts: float) -> Optional[str]:
+        """
+        Apply a realtime price: update the forming candle, or start a new one when a period began.
+
+        Returns:
+            'updated', 'appended' or None (price belongs to an older candle)
+        """
+        if not len(self):
+            return None
+        tf = max(int(timeframe_seconds or 60), 1)
+        period_start = int(now_ts // tf) * tf
+        last_time = self.last_time
+        if abs(last_time - period_start) < 2:
+            pos = self._end - 1
+            self._cols['close'][pos] = price
+            self._cols['high'][pos] = max(self._cols['high'][pos], price)
+            self._cols['low'][pos] = min(self._cols['low'][pos], price)
+            return 'updated'
+        if period_start > last_time:
+            self._append(period_start, {'open': price, 'high': price, 'low': price, 'close': price, 'volume': 0.0})
+            return 'appended'
+        return None
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame for indicator scripts (UTC DatetimeIndex, float64 OHLCV columns)."""
+        return pd.DataFrame({c: self.column(c).copy() for c in CANDLE_COLUMNS}, index=_utc_index(self.times))
+
+
+class IncrementalIndicator:
+    """Drives an indicator script's on_bar() over a CandleWindow (see module docstring)."""
+
+    def __init__(self, on_bar: Callable, state: Dict[str, Any], timeframe_seconds: int):
+        self.on_bar = on_bar
+        self.state = state
+        self.timeframe_seconds = max(int(timeframe_seconds or 60), 1)
+        self.finalized_time = 0
+        # bar time -> flags of the latest on_bar call for that candle (only the newest two are kept)
+        self._signals: Dict[int, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_env(cls, exec_env: Optional[Dict[str, Any]], timeframe_seconds: int) -> Optional['IncrementalIndicator']:
+        """Build from a script's execution env if it defines on_bar, else None."""
+        on_bar = (exec_env or {}).get('on_bar')
+        if not callable(on_bar):
+            return None
+        state = exec_env.get('state')
+        if not isinstance(state, dict):
+            state = {}
+            exec_env['state'] = state
+        return cls(on_bar, state, timeframe_seconds)
+
+    def _call(self, bar: Dict[str, Any], closed: bool, position: Dict[str, Any]) -> None:
+        bar = dict(bar, closed=closed)
+        flags = self.on_bar(self.state, bar, dict(position))
+        row = dict(flags) if isinstance(flags, dict) else {}
+        row['close'] = bar['close']
+        self._signals[bar['time']] = row
+        if len(self._signals) > 2:
+            for t in sorted(self._signals)[:-2]:
+                del self._signals[t]
+        if closed:
+            self.finalized_time = bar['time']
+
+    def update(self, window: CandleWindow, position: Dict[str, Any], now_ts: float) -> None:
+        """
+        Finalize candles that closed since the last call, then evaluate the forming candle.
+
+        The first call replays every closed candle of the window (warm-up).
+        """
+        n = len(window)
+        if not n:
+            return
+        times = window.times
+        forming_closed = int(times[-1]) + self.timeframe_seconds <= now_ts
+        last_closed = n if forming_closed else n - 1
+        first = int(np.searchsorted(times, self.finalized_time, side='right')) if self.finalized_time else 0
+        for i in range(first, last_closed):
+            self._call(window.bar(i), True, position)
+        if not forming_closed:
+            self._call(window.bar(-1), False, position)
+
+    def signal_frame(self) -> pd.DataFrame:
+        """Signals of the newest two candles, shaped like an executed indicator df."""
+        times = sorted(self._signals)
+        rows = [self._signals[t] for t in times]
+        keys = set()
+        for r in rows:
+            keys.update(r)
+        if keys.intersection(FOUR_WAY_COLUMNS) or not keys.intersection(('buy', 'sell')):
+            keys.update(FOUR_WAY_COLUMNS)
+        data = {}
+        for k in keys:
+            if k in SIGNAL_FLAG_COLUMNS:
+                data[k] = [bool(r.get(k, False)) for r in rows]
+            else:
+                data[k] = [r.get(k, 0) for r in rows]
+        if 'buy' in keys or 'sell' in keys:
+            data.setdefault('buy', [False] * len(rows))
+            data.setdefault('sell', [False] * len(rows))
+        return pd.DataFrame(data, index=_utc_index(np.asarray(times, dtype=np.int64)))
+
+    @property
+    def highest_price(self) -> float:
+        try:
+            return float(self.state.get('highest_price', 0.0) or 0.0)
+        except (TypeError, ValueError):
+            return 0.0
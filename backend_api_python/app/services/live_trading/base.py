@@ -4,16 +4,28 @@ Base REST client helpers for direct exchange connections.
 Notes:
 - Keep this minimal and dependency-light (requests only).
 - All secrets must be excluded from logs.
+- HTTP goes through one keep-alive `requests.Session` per base URL, shared by all client
+  instances, so signed orders / fill polls reuse TCP+TLS connections. Pool size and retries:
+  LIVE_HTTP_POOL_SIZE, LIVE_HTTP_RETRIES. Only connection failures (request never sent) and
+  idempotent GETs are retried; an order POST is never re-sent.
+- Per-endpoint latency histograms are available via `get_http_stats()`; order-id path segments
+  are collapsed to "{id}" so the number of endpoints stays bounded.
 """
 
 from __future__ import annotations
 
 import json
+import os
+import re
+import threading
 import time
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 @dataclass
@@ -29,11 +41,126 @@ class LiveTradingError(Exception):
     pass
 
 
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS_MS: List[float] = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+# (host, METHOD, path template) -> {"count", "errors", "total_ms", "max_ms", "buckets"}
+_latency: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+_latency_lock = threading.Lock()
+# Hard cap on histogram keys; further endpoints are folded into one "{other}" entry per host.
+_LATENCY_MAX_ENDPOINTS = 500
+# Path segments that carry order / client ids (Coinbase, Gate, KuCoin, Bitfinex, ...)
+_ID_SEGMENT = re.compile(
+    r"^(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+    r"|[^/]*:[^/]*|(?=[^/]*\d)[0-9A-Za-z_-]{16,})$"
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def get_http_session(base_url: str) -> requests.Session:
+    """Shared keep-alive session for a base URL (created on first use)."""
+    key = (base_url or "").rstrip("/")
+    session = _sessions.get(key)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            pool_size = max(1, _env_int("LIVE_HTTP_POOL_SIZE", 10))
+            retries = max(0, _env_int("LIVE_HTTP_RETRIES", 2))
+            retry = Retry(
+                total=retries,
+                connect=retries,
+                read=retries,
+                status=retries,
+                # Read/status retries only for idempotent reads; orders (POST/DELETE) are never re-sent
+                allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+                status_forcelist=(502, 503, 504),
+                backoff_factor=0.1,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+        return session
+
+
+def _endpoint_path(path: str) -> str:
+    """Path with id-like segments replaced by "{id}", so per-order URLs share one histogram."""
+    return "/".join("{id}" if seg and _ID_SEGMENT.match(seg) else seg for seg in (path or "").split("/"))
+
+
+def _record_latency(host: str, method: str, path: str, elapsed_ms: float, error: bool) -> None:
+    key = (host, method, _endpoint_path(path))
+    with _latency_lock:
+        item = _latency.get(key)
+        if item is None and len(_latency) >= _LATENCY_MAX_ENDPOINTS:
+            key = (host, method, "{other}")
+            item = _latency.get(key)
+        if item is None:
+            item = _latency[key] = {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        item["count"] += 1
+        item["errors"] += 1 if error else 0
+        item["total_ms"] += elapsed_ms
+        item["max_ms"] = max(item["max_ms"], elapsed_ms)
+        idx = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                idx = i
+                break
+        item["buckets"][idx] += 1
+
+
+def get_http_stats() -> Dict[str, Any]:
+    """Pooled sessions and per-endpoint latency histograms (bucket upper bounds in ms)."""
+    labels = [f"le_{int(b)}" for b in LATENCY_BUCKETS_MS] + ["inf"]
+    with _latency_lock:
+        endpoints = {
+            f"{method} {host}{path}": {
+                "count": item["count"],
+                "errors": item["errors"],
+                "avg_ms": round(item["total_ms"] / item["count"], 1) if item["count"] else 0.0,
+                "max_ms": round(item["max_ms"], 1),
+                "histogram": dict(zip(labels, item["buckets"])),
+            }
+            for (host, method, path), item in sorted(_latency.items())
+        }
+    with _sessions_lock:
+        sessions = sorted(_sessions.keys())
+    return {"sessions": sessions, "endpoints": endpoints}
+
+
 class BaseRestClient:
     def __init__(self, base_url: str, timeout_sec: float = 15.0):
         self.base_url = (base_url or "").rstrip("/")
         self.timeout_sec = float(timeout_sec)
 
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send over the pooled session for this base URL and record endpoint latency."""
+        method = str(method or "GET").upper()
+        parts = urlsplit(url)
+        started = time.perf_counter()
+        error = True
+        try:
+            resp = get_http_session(self.base_url).request(method=method, url=url, timeout=self.timeout_sec, **kwargs)
+            error = resp.status_code >= 500
+            return resp
+        finally:
+            _record_latency(parts.netloc, method, parts.path, (time.perf_counter() - started) * 1000.0, error)
+
     def _url(self, path: str) -> str:
         p = str(path or "")
         if not p.startswith("/"):
@@ -51,14 +178,13 @@ class BaseRestClient:
         data: Optional[Any] = None,
     ) -> Tuple[int, Dict[str, Any], str]:
         url = self._url(path)
-        resp = requests.request(
-            method=str(method or "GET").upper(),
-            url=url,
+        resp = self._send(
+            method,
+            url,
             params=params or None,
             json=json_body if json_body is not None else None,
             data=data,
             headers=headers or None,
-            timeout=self.timeout_sec,
         )
         text = resp.text or ""
         parsed: Dict[str, Any] = {}
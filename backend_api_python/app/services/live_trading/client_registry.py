@@ -0,0 +1,214 @@
+"""
+Registry of long-lived exchange clients.
+
+`create_client()` builds a fresh client, so the per-instance metadata caches (Binance symbol
+filters / dual-side mode, OKX instruments / leverage, ...) were thrown away after every order
+and position sync. The registry keeps one client per (exchange, market type, account) and hands
+it out again, so those caches stay warm across orders.
+
+- Account = credential_id, else a fingerprint of the API key.
+- A client is rebuilt when anything in its resolved config changes (e.g. rotated secret) and
+  dropped after LIVE_CLIENT_IDLE_SEC without use.
+- IBKR / MT5 clients manage their own terminal connections and are not cached here.
+- `prefetch_running_strategies()` warms symbol metadata for all running live strategies.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.live_trading.base import BaseRestClient
+from app.services.live_trading.factory import create_client
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Exchanges whose clients hold their own terminal/gateway connection.
+_UNCACHED_EXCHANGES = ("ibkr", "mt5")
+
+
+def _norm_market_type(exchange_config: Dict[str, Any], market_type: str) -> str:
+    # Same normalization as create_client()
+    mt = (market_type or exchange_config.get("market_type") or exchange_config.get("defaultType") or "swap").strip().lower()
+    if mt in ("futures", "future", "perp", "perpetual"):
+        mt = "swap"
+    return mt
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ExchangeClientRegistry:
+    """Reuses exchange clients (and their metadata caches) across orders."""
+
+    def __init__(self, idle_ttl_sec: Optional[float] = None):
+        self.idle_ttl_sec = float(idle_ttl_sec if idle_ttl_sec is not None else os.getenv("LIVE_CLIENT_IDLE_SEC", "1800"))
+        self._lock = threading.Lock()
+        # (exchange_id, market_type, account) -> (config fingerprint, client, last_used)
+        self._clients: Dict[Tuple[str, str, str], Tuple[str, BaseRestClient, float]] = {}
+        self._stats = {"hits": 0, "misses": 0, "rebuilt": 0, "evicted_idle": 0, "evicted_credential": 0}
+
+    @staticmethod
+    def account_key(exchange_config: Dict[str, Any], market_type: str) -> Tuple[str, str, str]:
+        """(exchange_id, market_type, account) identifying one exchange account/market."""
+        exchange_id = str(exchange_config.get("exchange_id") or exchange_config.get("exchangeId") or "").strip().lower()
+        credential_id = exchange_config.get("credential_id") or exchange_config.get("credentials_id")
+        if credential_id:
+            account = f"credential:{credential_id}"
+        else:
+            api_key = str(exchange_config.get("api_key") or exchange_config.get("apiKey") or "").strip()
+            account = f"key:{_digest(api_key)}"
+        return exchange_id, _norm_market_type(exchange_config, market_type), account
+
+    def get_client(self, exchange_config: Dict[str, Any], *, market_type: str = "swap") -> BaseRestClient:
+        """Drop-in for `create_client()` that returns a cached client when the config is unchanged."""
+        if not isinstance(exchange_config, dict):
+            return create_client(exchange_config, market_type=market_type)
+        key = self.account_key(exchange_config, market_type)
+        if key[0] in _UNCACHED_EXCHANGES:
+            return create_client(exchange_config, market_type=market_type)
+
+        fingerprint = _digest(exchange_config)
+        now = time.time()
+        with self._lock:
+            self._evict_idle(now)
+            item = self._clients.get(key)
+            if item and item[0] == fingerprint:
+                self._clients[key] = (fingerprint, item[1], now)
+                self._stats["hits"] += 1
+                return item[1]
+
+        # Build outside the lock; creating a client does no I/O for REST exchanges.
+        client = create_client(exchange_config, market_type=market_type)
+        with self._lock:
+            current = self._clients.get(key)
+            if current and current[0] == fingerprint:
+                # Another thread built the same client meanwhile; keep the first one.
+                self._clients[key] = (fingerprint, current[1], now)
+                self._stats["hits"] += 1
+                return current[1]
+            if current:
+                self._stats["rebuilt"] += 1
+                logger.info(f"Exchange client config changed, rebuilding: exchange={key[0]}, market_type={key[1]}")
+            self._clients[key] = (fingerprint, client, now)
+            self._stats["misses"] += 1
+        return client
+
+    def _evict_idle(self, now: float) -> None:
+        # Caller holds self._lock
+        if self.idle_ttl_sec <= 0:
+            return
+        for key in [k for k, (_, _, used) in self._clients.items() if now - used > self.idle_ttl_sec]:
+            del self._clients[key]
+            self._stats["evicted_idle"] += 1
+
+    def evict_credential(self, credential_id: Any) -> int:
+        """Drop all clients built from a credential (e.g. after it was deleted)."""
+        account = f"credential:{credential_id}"
+        with self._lock:
+            keys = [k for k in self._clients if k[2] == account]
+            for key in keys:
+                del self._clients[key]
+            self._stats["evicted_credential"] += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def prefetch_running_strategies(self) -> int:
+        """
+        Build clients for all running live strategies and warm their symbol metadata
+        (filters / instruments / position mode), so the first order skips those round-trips.
+
+        Returns:
+            Number of strategies warmed
+        """
+        # Imported lazily: exchange_execution pulls in the DB layer.
+        from app.services.exchange_execution import load_strategy_configs, resolve_exchange_config
+        from app.utils.db import get_db_connection
+
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute("SELECT id FROM qd_strategies_trading WHERE status = 'running' AND execution_mode = 'live'")
+                rows = cur.fetchall() or []
+                cur.close()
+        except Exception as e:
+            logger.warning(f"Exchange client prefetch skipped: {e}")
+            return 0
+
+        warmed = 0
+        for row in rows:
+            strategy_id = int(row.get("id") or 0)
+            try:
+                sc = load_strategy_configs(strategy_id)
+                exchange_config = resolve_exchange_config(sc.get("exchange_config") or {})
+                market_type = _norm_market_type(exchange_config, sc.get("market_type") or "")
+                if self.account_key(exchange_config, market_type)[0] in _UNCACHED_EXCHANGES:
+                    continue
+                client = self.get_client(exchange_config, market_type=market_type)
+                symbol = str((sc.get("trading_config") or {}).get("symbol") or "").strip()
+                self._warm(client, symbol, market_type)
+                warmed += 1
+            except Exception as e:
+                logger.warning(f"Exchange client prefetch failed: strategy_id={strategy_id}, err={e}")
+        logger.info(f"Exchange client prefetch: {warmed}/{len(rows)} live strategies warmed, {len(self._clients)} clients")
+        return warmed
+
+    @staticmethod
+    def _warm(client: BaseRestClient, symbol: str, market_type: str) -> None:
+        from app.services.live_trading.binance import BinanceFuturesClient
+        from app.services.live_trading.okx import OkxClient
+        from app.services.live_trading.symbols import to_okx_spot_inst_id, to_okx_swap_inst_id
+
+        if isinstance(client, BinanceFuturesClient):
+            client.get_dual_side_position()
+        if not symbol:
+            return
+        if hasattr(client, "get_symbol_filters"):
+            # Binance futures / spot
+            client.get_symbol_filters(symbol=symbol)
+        elif isinstance(client, OkxClient):
+            if market_type == "spot":
+                client.get_instrument(inst_type="SPOT", inst_id=to_okx_spot_inst_id(symbol))
+            else:
+                client.get_instrument(inst_type="SWAP", inst_id=to_okx_swap_inst_id(symbol))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            now = time.time()
+            clients: List[Dict[str, Any]] = [
+                {
+                    "exchange_id": key[0],
+                    "market_type": key[1],
+                    "client": type(client).__name__,
+                    "idle_sec": round(now - used, 1),
+                }
+                for key, (_, client, used) in self._clients.items()
+            ]
+        stats["clients"] = clients
+        stats["idle_ttl_sec"] = self.idle_ttl_sec
+        return stats
+
+
+_registry: Optional[ExchangeClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_exchange_client_registry() -> ExchangeClientRegistry:
+    """Process-wide exchange client registry (lazily created)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ExchangeClientRegistry()
+    return _registry
@@ -168,9 +168,9 @@ class DeepcoinClient(BaseRestClient):
         
         try:
             if method.upper() == "GET":
-                resp = requests.get(url=url, timeout=self.timeout_sec)
+                resp = self._send("GET", url)
             else:
-                resp = requests.post(url=url, json=params, timeout=self.timeout_sec)
+                resp = self._send("POST", url, json=params)
             
             if resp.status_code >= 400:
                 raise LiveTradingError(f"Deepcoin HTTP {resp.status_code}: {resp.text[:500]}")
@@ -215,9 +215,9 @@ class DeepcoinClient(BaseRestClient):
         try:
             if method_upper == "POST":
                 body_str = json.dumps(params, separators=(',', ':')) if params else ""
-                resp = requests.post(url=url, headers=headers, data=body_str, timeout=self.timeout_sec)
+                resp = self._send("POST", url, headers=headers, data=body_str)
             else:
-                resp = requests.get(url=url, headers=headers, timeout=self.timeout_sec)
+                resp = self._send("GET", url, headers=headers)
             
             if resp.status_code >= 400:
                 raise LiveTradingError(f"Deepcoin HTTP {resp.status_code}: {resp.text[:500]}")
@@ -238,7 +238,7 @@ class DeepcoinClient(BaseRestClient):
         try:
             # Try public endpoint to check connectivity
             url = f"{self.base_url}/deepcoin/market/time"
-            resp = requests.get(url=url, timeout=self.timeout_sec)
+            resp = self._send("GET", url)
             return resp.status_code == 200
         except Exception:
             return False
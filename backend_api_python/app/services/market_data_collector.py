@@ -14,20 +14,73 @@
 - 基本面: Finnhub (美股) / akshare (A股) / 固定描述 (加密)
 """
 
+import os
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import yfinance as yf
 
 from app.data_sources import DataSourceFactory
 from app.services.kline import KlineService
+from app.utils.cache import CacheManager, MemoryCache
 from app.utils.logger import get_logger
-from app.config import APIKeys
+from app.config import APIKeys, CacheConfig
 
 logger = get_logger(__name__)
 
+# 所有分析请求共用的数据采集线程池 (常驻，避免每次分析新建/销毁线程)
+MARKET_DATA_WORKERS = int(os.getenv("MARKET_DATA_WORKERS", "16"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=max(1, MARKET_DATA_WORKERS),
+                    thread_name_prefix="market-data",
+                )
+    return _executor
+
+
+# 基本面 / 公司信息 / 新闻的跨请求缓存 (秒)，按数据类型设置新鲜期；<= 0 表示不缓存
+FUNDAMENTAL_CACHE_TTL = int(os.getenv("MARKET_DATA_FUNDAMENTAL_TTL_SEC", "21600"))
+COMPANY_CACHE_TTL = int(os.getenv("MARKET_DATA_COMPANY_TTL_SEC", "86400"))
+NEWS_CACHE_TTL = int(os.getenv("MARKET_DATA_NEWS_TTL_SEC", "600"))
+# Redis 启用时，在进程内再加一层小 LRU，热门标的不必每次读 Redis 并反序列化
+LOCAL_CACHE_TTL = int(os.getenv("MARKET_DATA_LOCAL_TTL_SEC", "60"))
+
+_local_cache = MemoryCache(max_bytes=32 * 1024 * 1024, max_entries=2000)
+_cache_stats = {"local_hits": 0, "lookups": 0}
+_cache_stats_lock = threading.Lock()
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """基本面/公司/新闻缓存的统计 (共享层的命中率见 CacheManager.get_stats)"""
+    with _cache_stats_lock:
+        stats = dict(_cache_stats)
+    stats["ttl_sec"] = {
+        "fundamental": FUNDAMENTAL_CACHE_TTL,
+        "company": COMPANY_CACHE_TTL,
+        "news": NEWS_CACHE_TTL,
+        "local": LOCAL_CACHE_TTL,
+    }
+    stats["local"] = _local_cache.get_stats()
+    return stats
+
+
+def _timed_call(fn: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """执行 fn 并返回 (结果, 完成时间)，用于统计各数据源耗时"""
+    result = fn(*args, **kwargs)
+    return result, time.time()
+
 
 class MarketDataCollector:
     """
@@ -84,7 +137,7 @@ class MarketDataCollector:
             timeframe: K线周期
             include_macro: 是否包含宏观数据
             include_news: 是否包含新闻
-            timeout: 总超时时间(秒)
+            timeout: 总超时时间(秒)，到期后返回已获取的部分数据
             
         Returns:
             完整的市场数据字典
@@ -112,74 +165,89 @@ class MarketDataCollector:
             "_meta": {
                 "success_items": [],
                 "failed_items": [],
+                "timed_out_items": [],
+                # 每个数据源从提交到返回的耗时
+                "latency_ms": {},
                 "duration_ms": 0
             }
         }
         
-        # === 阶段1: 核心数据 (并行获取) ===
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            core_futures = {
-                executor.submit(self._get_price, market, symbol): "price",
-                executor.submit(self._get_kline, market, symbol, timeframe, 60): "kline",
-            }
-            
-            # 如果需要基本面，也并行获取
-            if market in ('USStock', 'AShare', 'HShare'):
-                core_futures[executor.submit(self._get_fundamental, market, symbol)] = "fundamental"
-                core_futures[executor.submit(self._get_company, market, symbol)] = "company"
-            elif market == 'Crypto':
-                # 加密货币的"基本面"是固定描述
-                core_futures[executor.submit(self._get_crypto_info, symbol)] = "fundamental"
-            
-            try:
-                for future in as_completed(core_futures, timeout=15):
-                    key = core_futures[future]
-                    try:
-                        result = future.result(timeout=3)
-                        if result:
-                            data[key] = result
-                            data["_meta"]["success_items"].append(key)
-                        else:
-                            data["_meta"]["failed_items"].append(key)
-                    except Exception as e:
-                        logger.warning(f"Core data fetch failed ({key}): {e}")
+        # 所有独立数据源同时提交到共享线程池，总体只等一个截止时间；
+        # 到期仍未返回的数据源记为超时，返回已拿到的部分结果。
+        executor = _get_executor()
+        deadline = start_time + timeout
+        tasks: Dict[Any, str] = {}
+        submitted_at: Dict[Any, float] = {}
+
+        def submit(key: str, fn: Callable, *args, **kwargs):
+            future = executor.submit(_timed_call, fn, *args, **kwargs)
+            tasks[future] = key
+            submitted_at[future] = time.time()
+
+        submit("price", self._get_price, market, symbol)
+        submit("kline", self._get_kline, market, symbol, timeframe, 60)
+        if market in ('USStock', 'AShare', 'HShare'):
+            # 基本面/公司信息至多每日变化，跨请求、跨用户复用缓存
+            submit("fundamental", self._cached, "fundamental", f"{market}:{symbol}", FUNDAMENTAL_CACHE_TTL,
+                   lambda: self._get_fundamental(market, symbol))
+            submit("company", self._cached, "company", f"{market}:{symbol}", COMPANY_CACHE_TTL,
+                   lambda: self._get_company(market, symbol))
+        elif market == 'Crypto':
+            # 加密货币的"基本面"是固定描述
+            submit("fundamental", self._get_crypto_info, symbol)
+
+        if include_macro:
+            # 命中 global_market 缓存时无需任何网络请求
+            data["macro"] = self._get_cached_macro()
+            if not data["macro"]:
+                for key, fn in self._macro_fetchers().items():
+                    submit(f"macro.{key}", fn)
+
+        if include_news:
+            # 新闻检索不依赖公司信息，和其它数据源一起并行获取
+            # 非美股/A股取的是通用新闻，与具体标的无关，按市场共用一份缓存
+            news_key = f"{market}:{symbol}" if market in ('USStock', 'AShare') else f"{market}:general"
+            submit("news", self._cached, "news", news_key, NEWS_CACHE_TTL,
+                   lambda: self._get_news(market, symbol), self._has_news)
+
+        pending = set(tasks)
+        while pending:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = tasks[future]
+                try:
+                    result, finished_at = future.result()
+                    data["_meta"]["latency_ms"][key] = int((finished_at - submitted_at[future]) * 1000)
+                    self._apply_source(data, key, result)
+                except Exception as e:
+                    data["_meta"]["latency_ms"][key] = int((time.time() - submitted_at[future]) * 1000)
+                    logger.warning(f"Market data fetch failed ({key}): {e}")
+                    if not key.startswith("macro."):
                         data["_meta"]["failed_items"].append(key)
-            except TimeoutError:
-                logger.warning(f"Core data fetch timed out for {market}:{symbol}")
-        
-        # 计算技术指标 (本地计算，不需要外部API)
-        if data.get("kline"):
-            data["indicators"] = self._calculate_indicators(data["kline"])
-            data["_meta"]["success_items"].append("indicators")
-        
-        # === 阶段2: 宏观数据 (如果需要) ===
+
+        for future in pending:
+            # 尚未开始的任务直接取消；已在运行的任务结果将被丢弃
+            future.cancel()
+            key = tasks[future]
+            data["_meta"]["latency_ms"][key] = int((time.time() - submitted_at[future]) * 1000)
+            data["_meta"]["timed_out_items"].append(key)
+            if not key.startswith("macro."):
+                data["_meta"]["failed_items"].append(key)
+        if pending:
+            logger.warning(
+                f"Market data collection for {market}:{symbol} hit the {timeout}s deadline, "
+                f"timed out: {data['_meta']['timed_out_items']}"
+            )
+
         if include_macro:
-            try:
-                data["macro"] = self._get_macro_data(market, timeout=10)
-                if data["macro"]:
-                    data["_meta"]["success_items"].append("macro")
-            except Exception as e:
-                logger.warning(f"Macro data fetch failed: {e}")
+            if data["macro"]:
+                data["_meta"]["success_items"].append("macro")
+            else:
                 data["_meta"]["failed_items"].append("macro")
         
-        # === 阶段3: 新闻/情绪 (如果需要) ===
-        if include_news:
-            try:
-                # 获取公司名称以改善搜索
-                company_name = None
-                if data.get("company"):
-                    company_name = data["company"].get("name")
-                
-                news_result = self._get_news(market, symbol, company_name, timeout=8)
-                data["news"] = news_result.get("news", [])
-                data["sentiment"] = news_result.get("sentiment", {})
-                
-                if data["news"]:
-                    data["_meta"]["success_items"].append("news")
-            except Exception as e:
-                logger.warning(f"News fetch failed: {e}")
-                data["_meta"]["failed_items"].append("news")
-        
         # 记录总耗时
         data["_meta"]["duration_ms"] = int((time.time() - start_time) * 1000)
         logger.info(f"Market data collection completed for {market}:{symbol} in {data['_meta']['duration_ms']}ms")
@@ -188,6 +256,68 @@ class MarketDataCollector:
         
         return data
     
+    def _apply_source(self, data: Dict[str, Any], key: str, result: Any) -> None:
+        """把单个数据源的结果写入 data"""
+        meta = data["_meta"]
+        if key.startswith("macro."):
+            if result:
+                name = key.split(".", 1)[1]
+                data["macro"][name] = self._format_macro(name, result)
+            return
+        if key == "news":
+            result = result or {}
+            data["news"] = result.get("news", [])
+            data["sentiment"] = result.get("sentiment", {})
+            if data["news"]:
+                meta["success_items"].append("news")
+            return
+        if not result:
+            meta["failed_items"].append(key)
+            return
+        data[key] = result
+        meta["success_items"].append(key)
+        if key == "kline":
+            # 计算技术指标 (本地计算，不需要外部API)，K线一到就算，不等其它数据源
+            data["indicators"] = self._calculate_indicators(result)
+            meta["success_items"].append("indicators")
+    
+    def _cached(
+        self,
+        kind: str,
+        key: str,
+        ttl: int,
+        loader: Callable[[], Any],
+        keep: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        跨请求缓存：进程内 LRU (仅 Redis 启用时) -> CacheManager -> loader。
+
+        CacheManager.get_or_load 保证同一 key 的并发未命中只加载一次，过期后在
+        ttl * CACHE_STALE_RATIO 内先返回旧值并后台刷新。空结果 (或 keep 返回 False) 不缓存。
+        """
+        if ttl <= 0:
+            return loader()
+        cache = CacheManager()
+        cache_key = f"market_data:{kind}:{key}"
+        with _cache_stats_lock:
+            _cache_stats["lookups"] += 1
+        if cache.is_redis:
+            value = _local_cache.get(cache_key)
+            if value is not None:
+                with _cache_stats_lock:
+                    _cache_stats["local_hits"] += 1
+                return value
+
+        value = cache.get_or_load(
+            cache_key,
+            loader,
+            ttl=(lambda v: ttl if keep(v) else 0) if keep else ttl,
+            stale_ttl=int(ttl * CacheConfig.STALE_TTL_RATIO),
+        )
+        if value and cache.is_redis and (keep is None or keep(value)):
+            _local_cache.setex(cache_key, min(ttl, LOCAL_CACHE_TTL), value)
+        return value
+    
     # ==================== 核心数据获取 ====================
     
     def _get_price(self, market: str, symbol: str) -> Optional[Dict[str, Any]]:
@@ -737,153 +867,97 @@ class MarketDataCollector:
     
     # ==================== 宏观数据 (复用全球金融板块) ====================
     
-    def _get_macro_data(self, market: str, timeout: int = 10) -> Dict[str, Any]:
+    # global_market 缓存键 -> 统一格式的指标键
+    _MACRO_KEYS = (("VIX", "vix"), ("DXY", "dxy"), ("TNX", "yield_curve"), ("FEAR_GREED", "fear_greed"))
+    MACRO_CACHE_TTL = 21600  # 6 hours
+
+    @staticmethod
+    def _format_macro(key: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """把 global_market 的指标数据转换为统一格式"""
+        if key == 'VIX':
+            return {
+                'name': 'VIX恐慌指数',
+                'description': data.get('interpretation', ''),
+                'price': data.get('value', 0),
+                'change': data.get('change', 0),
+                'changePercent': data.get('change', 0),
+                'level': data.get('level', 'unknown'),
+            }
+        if key == 'DXY':
+            return {
+                'name': '美元指数',
+                'description': data.get('interpretation', ''),
+                'price': data.get('value', 0),
+                'change': data.get('change', 0),
+                'changePercent': data.get('change', 0),
+                'level': data.get('level', 'unknown'),
+            }
+        if key == 'TNX':
+            return {
+                'name': '美债10年收益率',
+                'description': data.get('interpretation', ''),
+                'price': data.get('yield_10y', 0),
+                'change': data.get('change', 0),
+                'changePercent': 0,
+                'spread': data.get('spread', 0),
+                'level': data.get('level', 'unknown'),
+            }
+        return {
+            'name': '恐惧贪婪指数',
+            'description': data.get('classification', 'Neutral'),
+            'price': data.get('value', 50),
+            'change': 0,
+            'changePercent': 0,
+        }
+
+    def _get_cached_macro(self) -> Dict[str, Any]:
+        """从 global_market 的缓存读取宏观数据 (6小时有效)，未命中返回空字典"""
+        try:
+            from app.routes.global_market import _get_cached
+        except ImportError as e:
+            logger.warning(f"Could not import from global_market: {e}")
+            return {}
+        cached_sentiment = _get_cached("market_sentiment", self.MACRO_CACHE_TTL)
+        if not cached_sentiment:
+            return {}
+        result = {}
+        for key, cache_key in self._MACRO_KEYS:
+            if cached_sentiment.get(cache_key):
+                result[key] = self._format_macro(key, cached_sentiment[cache_key])
+        if result:
+            logger.info("Using cached sentiment data from global_market (6h cache)")
+        return result
+
+    @staticmethod
+    def _macro_fetchers() -> Dict[str, Callable[[], Any]]:
         """
-        获取宏观经济数据 - 复用 global_market.py 的函数和缓存
-        
-        优势：
-        1. 数据与全球金融页面一致
-        2. 复用30秒/5分钟缓存，降低API调用
-        3. 已有完整的数据解读和级别判断
+        宏观指标 -> global_market 的获取函数
+
+        collect_all 把每个指标作为独立任务提交到共享线程池（不在池内线程里等待同一个池）。
+        黄金等大宗商品不作为宏观指标获取：分析黄金时价格已在 _get_price 中获取。
         """
         try:
-            # 复用 global_market.py 的市场情绪数据 (有5分钟缓存)
             from app.routes.global_market import (
                 _fetch_vix, _fetch_dollar_index, _fetch_yield_curve,
                 _fetch_fear_greed_index,
-                _get_cached, _set_cached
             )
-            
-            result = {}
-            
-            # 1) 尝试从缓存获取 (global_market 的缓存, 6小时有效)
-            MACRO_CACHE_TTL = 21600  # 6 hours
-            cached_sentiment = _get_cached("market_sentiment", MACRO_CACHE_TTL)
-            if cached_sentiment:
-                logger.info("Using cached sentiment data from global_market (6h cache)")
-                # 转换格式
-                if cached_sentiment.get('vix'):
-                    vix = cached_sentiment['vix']
-                    result['VIX'] = {
-                        'name': 'VIX恐慌指数',
-                        'description': vix.get('interpretation', ''),
-                        'price': vix.get('value', 0),
-                        'change': vix.get('change', 0),
-                        'changePercent': vix.get('change', 0),
-                        'level': vix.get('level', 'unknown'),
-                    }
-                
-                if cached_sentiment.get('dxy'):
-                    dxy = cached_sentiment['dxy']
-                    result['DXY'] = {
-                        'name': '美元指数',
-                        'description': dxy.get('interpretation', ''),
-                        'price': dxy.get('value', 0),
-                        'change': dxy.get('change', 0),
-                        'changePercent': dxy.get('change', 0),
-                        'level': dxy.get('level', 'unknown'),
-                    }
-                
-                if cached_sentiment.get('yield_curve'):
-                    yc = cached_sentiment['yield_curve']
-                    result['TNX'] = {
-                        'name': '美债10年收益率',
-                        'description': yc.get('interpretation', ''),
-                        'price': yc.get('yield_10y', 0),
-                        'change': yc.get('change', 0),
-                        'changePercent': 0,
-                        'spread': yc.get('spread', 0),
-                        'level': yc.get('level', 'unknown'),
-                    }
-                
-                if cached_sentiment.get('fear_greed'):
-                    fg = cached_sentiment['fear_greed']
-                    result['FEAR_GREED'] = {
-                        'name': '恐惧贪婪指数',
-                        'description': fg.get('classification', 'Neutral'),
-                        'price': fg.get('value', 50),
-                        'change': 0,
-                        'changePercent': 0,
-                    }
-                
-                if result:
-                    return result
-            
-            # 2) 如果没有缓存，快速并行获取关键指标
-            logger.info("Fetching macro data from global_market functions")
-            
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                futures = {
-                    executor.submit(_fetch_vix): "VIX",
-                    executor.submit(_fetch_dollar_index): "DXY",
-                    executor.submit(_fetch_yield_curve): "TNX",
-                    executor.submit(_fetch_fear_greed_index): "FEAR_GREED",
-                }
-                
-                try:
-                    for future in as_completed(futures, timeout=timeout):
-                        key = futures[future]
-                        try:
-                            data = future.result(timeout=5)
-                            if data:
-                                # 转换为统一格式
-                                if key == 'VIX':
-                                    result[key] = {
-                                        'name': 'VIX恐慌指数',
-                                        'description': data.get('interpretation', ''),
-                                        'price': data.get('value', 0),
-                                        'change': data.get('change', 0),
-                                        'changePercent': data.get('change', 0),
-                                        'level': data.get('level', 'unknown'),
-                                    }
-                                elif key == 'DXY':
-                                    result[key] = {
-                                        'name': '美元指数',
-                                        'description': data.get('interpretation', ''),
-                                        'price': data.get('value', 0),
-                                        'change': data.get('change', 0),
-                                        'changePercent': data.get('change', 0),
-                                        'level': data.get('level', 'unknown'),
-                                    }
-                                elif key == 'TNX':
-                                    result[key] = {
-                                        'name': '美债10年收益率',
-                                        'description': data.get('interpretation', ''),
-                                        'price': data.get('yield_10y', 0),
-                                        'change': data.get('change', 0),
-                                        'changePercent': 0,
-                                        'spread': data.get('spread', 0),
-                                        'level': data.get('level', 'unknown'),
-                                    }
-                                elif key == 'FEAR_GREED':
-                                    result[key] = {
-                                        'name': '恐惧贪婪指数',
-                                        'description': data.get('classification', 'Neutral'),
-                                        'price': data.get('value', 50),
-                                        'change': 0,
-                                        'changePercent': 0,
-                                    }
-                        except Exception as e:
-                            logger.debug(f"Macro indicator {key} fetch failed: {e}")
-                except TimeoutError:
-                    logger.warning("Macro data fetch timed out")
-            
-            # 注：黄金等大宗商品数据不再作为宏观指标获取
-            # 原因：1) 如果分析的是黄金，价格已在 _get_price 中获取
-            #       2) 减少 API 调用，提高稳定性
-            pass
-            
-            return result
-            
         except ImportError as e:
             logger.warning(f"Could not import from global_market: {e}")
             return {}
-        except Exception as e:
-            logger.error(f"_get_macro_data failed: {e}")
-            return {}
-    
+        return {
+            "VIX": _fetch_vix,
+            "DXY": _fetch_dollar_index,
+            "TNX": _fetch_yield_curve,
+            "FEAR_GREED": _fetch_fear_greed_index,
+        }
+
     # ==================== 新闻/情绪数据 ====================
     
+    @staticmethod
+    def _has_news(result: Any) -> bool:
+        # 没取到任何新闻/情绪时不缓存，下次分析重试
+        return bool(result and (result.get("news") or result.get("sentiment")))
+    
     def _get_news(
         self, market: str, symbol: str, company_name: str = None, timeout: int = 8
     ) -> Dict[str, Any]:
@@ -967,10 +1041,13 @@ class MarketDataCollector:
 
 # 全局实例
 _collector: Optional[MarketDataCollector] = None
+_collector_lock = threading.Lock()
 
 def get_market_data_collector() -> MarketDataCollector:
     """获取市场数据采集器单例"""
     global _collector
     if _collector is None:
-        _collector = MarketDataCollector()
+        with _collector_lock:
+            if _collector is None:
+                _collector = MarketDataCollector()
     return _collector
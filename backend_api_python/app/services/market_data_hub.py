@@ -0,0 +1,265 @@
+"""
+Shared market-data hub for running strategies.
+
+Strategy loops subscribe their (market_category, symbol, timeframe) and read prices and
+candles through the hub instead of calling the data source themselves:
+
+- Prices: one upstream fetch per symbol per PRICE_CACHE_TTL_SEC, shared by every strategy on
+  that symbol. For sources with a batch endpoint (CCXT `fetch_tickers`), a stale lookup
+  refreshes every subscribed symbol of that market in one call.
+- Candles: the newest fetch of a (market, symbol, timeframe) is shared within the current
+  candle period, so N strategies refreshing after a candle closes cause one request.
+
+With CRYPTO_STREAM_ENABLED, Crypto subscriptions are also streamed over WebSocket
+(see app.data_sources.crypto_stream); live streamed tickers/candles are served first and
+REST is only used when the stream has nothing fresh (e.g. while disconnected).
+
+Concurrent misses for the same key wait for a single in-flight fetch. Counters of requests,
+cache hits and upstream calls (and the calls saved) are exposed via `get_stats()`.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from app.data_sources import DataSourceFactory
+from app.data_sources.base import TIMEFRAME_SECONDS
+from app.data_sources.crypto_stream import get_crypto_stream
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _norm(symbol: str) -> str:
+    return (symbol or '').strip().upper()
+
+
+class MarketDataHub:
+    """Subscription-aware, de-duplicated price/candle fetching shared across strategies."""
+
+    def __init__(self, ttl_sec: Optional[float] = None):
+        self.ttl_sec = float(ttl_sec if ttl_sec is not None else os.getenv('PRICE_CACHE_TTL_SEC', '10'))
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        # subscriber -> {(market, SYMBOL, timeframe)}; SYMBOL -> symbol as given (for upstream calls)
+        self._subs: Dict[Hashable, Set[Tuple[str, str, str]]] = {}
+        self._raw_symbols: Dict[Tuple[str, str], str] = {}
+        # (market, SYMBOL) -> (price, fetched_at)
+        self._prices: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        # (market, SYMBOL, timeframe) -> (klines, limit, fetched_at)
+        self._klines: Dict[Tuple[str, str, str], Tuple[List[Dict[str, Any]], int, float]] = {}
+        self._stats = {
+            'price_requests': 0, 'price_hits': 0, 'price_upstream_calls': 0,
+            'price_batch_calls': 0, 'price_batch_symbols': 0,
+            'kline_requests': 0, 'kline_hits': 0, 'kline_upstream_calls': 0,
+            'price_stream_hits': 0, 'kline_stream_hits': 0,
+        }
+
+    # ---------------------------------------------------------------- subscriptions
+
+    def _live_keys(self) -> Set[Tuple[str, str, str]]:
+        # Caller holds self._lock
+        live = set()
+        for keys in self._subs.values():
+            live.update(keys)
+        return live
+
+    def subscribe(self, subscriber: Hashable, market: str, symbol: str, timeframe: str) -> None:
+        key = (market, _norm(symbol), timeframe)
+        with self._lock:
+            is_new = key not in self._live_keys()
+            self._subs.setdefault(subscriber, set()).add(key)
+            self._raw_symbols[(market, key[1])] = symbol
+        stream = get_crypto_stream() if market == 'Crypto' else None
+        if is_new and stream is not None:
+            stream.subscribe(symbol, timeframe)
+
+    def unsubscribe(self, subscriber: Hashable) -> None:
+        """Drop a subscriber; cached data nobody subscribes to anymore is released."""
+        with self._lock:
+            dropped = self._subs.pop(subscriber, set())
+            live = self._live_keys()
+            dead = [(k, self._raw_symbols.get((k[0], k[1]), k[1])) for k in dropped if k not in live]
+            live_symbols = {(m, s) for m, s, _ in live}
+            for key in [k for k in self._klines if k not in live]:
+                del self._klines[key]
+            for key in [k for k in self._prices if k not in live_symbols]:
+                del self._prices[key]
+            for key in [k for k in self._raw_symbols if k not in live_symbols]:
+                del self._raw_symbols[key]
+        stream = get_crypto_stream() if any(k[0] == 'Crypto' for k, _ in dead) else None
+        if stream is not None:
+            for (market, _, timeframe), symbol in dead:
+                if market == 'Crypto':
+                    stream.unsubscribe(symbol, timeframe)
+
+    def _subscribed_symbols(self, market: str) -> List[str]:
+        # Caller holds self._lock
+        seen = set()
+        for keys in self._subs.values():
+            for m, s, _ in keys:
+                if m == market:
+                    seen.add(s)
+        return [self._raw_symbols.get((market, s), s) for s in seen]
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    # ---------------------------------------------------------------- prices
+
+    def _cached_price(self, key: Tuple[str, str], now: float) -> Optional[float]:
+        item = self._prices.get(key)
+        if item and self.ttl_sec > 0 and now - item[1] < self.ttl_sec:
+            return item[0]
+        return None
+
+    def get_price(self, market: str, symbol: str) -> Optional[float]:
+        """Latest price (last, else close) of a symbol, or None if unavailable."""
+        key = (market, _norm(symbol))
+        stream = get_crypto_stream() if market == 'Crypto' else None
+        ticker = stream.get_ticker(symbol) if stream is not None else None
+        if ticker and ticker.get('last'):
+            with self._lock:
+                self._stats['price_requests'] += 1
+                self._stats['price_stream_hits'] += 1
+            return float(ticker['last'])
+
+        with self._lock:
+            self._stats['price_requests'] += 1
+            price = self._cached_price(key, time.time())
+            if price is not None:
+                self._stats['price_hits'] += 1
+                return price
+
+        batch = DataSourceFactory.supports_batch_tickers(market)
+        with self._key_lock(('ticker', market) if batch else ('ticker',) + key):
+            with self._lock:
+                # Another subscriber may have fetched it while we waited
+                price = self._cached_price(key, time.time())
+                if price is not None:
+                    self._stats['price_hits'] += 1
+                    return price
+                symbols = self._subscribed_symbols(market) if batch else []
+                self._stats['price_upstream_calls'] += 1
+            if batch:
+                if key[1] not in {_norm(s) for s in symbols}:
+                    symbols.append(symbol)
+                tickers = DataSourceFactory.get_tickers(market, symbols)
+                with self._lock:
+                    self._stats['price_batch_calls'] += 1
+                    self._stats['price_batch_symbols'] += len(symbols)
+            else:
+                tickers = {symbol: DataSourceFactory.get_ticker(market, symbol)}
+
+            fetched_at = time.time()
+            result = None
+            with self._lock:
+                for sym, ticker in (tickers or {}).items():
+                    try:
+                        price = float((ticker or {}).get('last') or (ticker or {}).get('close') or 0)
+                    except (TypeError, ValueError):
+                        continue
+                    if price > 0:
+                        self._prices[(market, _norm(sym))] = (price, fetched_at)
+                        if _norm(sym) == key[1]:
+                            result = price
+            if result is None and batch:
+                # Batch tickers only return hits; load the requested symbol on its own
+                try:
+                    ticker = DataSourceFactory.get_ticker(market, symbol) or {}
+                    price = float(ticker.get('last') or ticker.get('close') or 0)
+                except (TypeError, ValueError):
+                    price = 0
+                if price > 0:
+                    result = price
+                    with self._lock:
+                        self._stats['price_upstream_calls'] += 1
+                        self._prices[key] = (price, time.time())
+            return result
+
+    # ---------------------------------------------------------------- candles
+
+    def get_klines(self, market: str, symbol: str, timeframe: str, limit: int) -> List[Dict[str, Any]]:
+        """Newest `limit` candles, shared with other subscribers within the current candle period."""
+        key = (market, _norm(symbol), timeframe)
+        tf = TIMEFRAME_SECONDS.get(timeframe, 3600)
+        limit = int(limit)
+
+        def cached(now: float) -> Optional[List[Dict[str, Any]]]:
+            item = self._klines.get(key)
+            if not item or self.ttl_sec <= 0:
+                return None
+            klines, cached_limit, fetched_at = item
+            period_start = int(now // tf) * tf
+            if cached_limit >= limit and fetched_at >= period_start and now - fetched_at < self.ttl_sec:
+                return klines[-limit:]
+            return None
+
+        stream = get_crypto_stream() if market == 'Crypto' else None
+        streamed = stream.get_klines(symbol, timeframe, limit) if stream is not None else None
+        if streamed:
+            with self._lock:
+                self._stats['kline_requests'] += 1
+                self._stats['kline_stream_hits'] += 1
+            return streamed
+
+        with self._lock:
+            self._stats['kline_requests'] += 1
+            hit = cached(time.time())
+            if hit is not None:
+                self._stats['kline_hits'] += 1
+                return hit
+
+        with self._key_lock(('kline',) + key):
+            with self._lock:
+                hit = cached(time.time())
+                if hit is not None:
+                    self._stats['kline_hits'] += 1
+                    return hit
+                self._stats['kline_upstream_calls'] += 1
+            now = time.time()
+            klines = DataSourceFactory.get_kline(market, symbol, timeframe, limit, before_time=int(now))
+            if klines:
+                with self._lock:
+                    if any(key in keys for keys in self._subs.values()):
+                        self._klines[key] = (klines, limit, now)
+                if stream is not None:
+                    stream.seed_klines(symbol, timeframe, klines)
+            return klines
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            keys = set()
+            for subscribed in self._subs.values():
+                keys.update(subscribed)
+            stats['subscribers'] = len(self._subs)
+            stats['subscriptions'] = len(keys)
+            stats['symbols'] = len({(m, s) for m, s, _ in keys})
+            stats['upstream_calls_saved'] = (
+                (stats['price_requests'] - stats['price_upstream_calls'])
+                + (stats['kline_requests'] - stats['kline_upstream_calls'])
+            )
+            stats['ttl_sec'] = self.ttl_sec
+        stream = get_crypto_stream()
+        if stream is not None:
+            stats['crypto_stream'] = stream.get_stats()
+        return stats
+
+
+_hub: Optional[MarketDataHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_market_data_hub() -> MarketDataHub:
+    """Process-wide market-data hub (lazily created)."""
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = MarketDataHub()
+    return _hub
@@ -4,20 +4,37 @@ Pending order worker.
 This worker polls `pending_orders` periodically and dispatches orders based on `execution_mode`:
 - signal: send notifications (no real trading).
 - live: not implemented (paper mode only).
+
+Dispatch is concurrent across exchange accounts (PENDING_ORDER_CONCURRENCY threads) and
+serialized within one account, so a slow fill-wait or notification only delays orders of the
+same account. PENDING_ORDER_CONCURRENCY=1 keeps the old strictly sequential loop.
+
+Orders are claimed in one statement (`FOR UPDATE SKIP LOCKED`), so several workers/processes can
+share the queue. The enqueue side NOTIFYs `qd_pending_orders`; while LISTENing the worker
+wakes up immediately and only polls every PENDING_ORDER_IDLE_POLL_SEC as a safety net.
 """
 
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import select
 import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional, Tuple
 
 from app.services.signal_notifier import SignalNotifier
-from app.services.exchange_execution import load_strategy_configs, resolve_exchange_config, safe_exchange_config_for_log
+from app.services.exchange_execution import (
+    load_strategy_configs,
+    load_strategy_configs_many,
+    resolve_exchange_config,
+    safe_exchange_config_for_log,
+)
 from app.services.live_trading.execution import place_order_from_signal
-from app.services.live_trading.factory import create_client
+from app.services.live_trading.client_registry import get_exchange_client_registry
 from app.services.live_trading.records import apply_fill_to_local_position, record_trade
 from app.services.live_trading.base import LiveTradingError
 from app.services.live_trading.binance import BinanceFuturesClient
@@ -36,7 +53,7 @@ from app.services.live_trading.bitfinex import BitfinexClient
 from app.services.live_trading.bitfinex import BitfinexDerivativesClient
 from app.services.live_trading.symbols import to_okx_swap_inst_id
 from app.services.live_trading.symbols import to_gate_currency_pair
-from app.utils.db import get_db_connection
+from app.utils.db import get_db_connection, get_db_listen_connection
 from app.utils.logger import get_logger
 
 # Lazy import IBKR to avoid ImportError if ib_insync not installed
@@ -47,6 +64,8 @@ MT5Client = None
 
 logger = get_logger(__name__)
 
+PENDING_ORDERS_CHANNEL = "qd_pending_orders"
+
 
 class PendingOrderWorker:
     def __init__(self, poll_interval_sec: float = 1.0, batch_size: int = 50):
@@ -67,8 +86,42 @@ class PendingOrderWorker:
         self._position_sync_enabled = os.getenv("POSITION_SYNC_ENABLED", "true").lower() == "true"
         self._position_sync_interval_sec = float(os.getenv("POSITION_SYNC_INTERVAL_SEC", "10"))
         self._last_position_sync_ts = 0.0
+        try:
+            self._position_sync_concurrency = max(1, int(os.getenv("POSITION_SYNC_CONCURRENCY", "4")))
+        except Exception:
+            self._position_sync_concurrency = 4
+        self._sync_executor: Optional[ThreadPoolExecutor] = None
         logger.info(f"PendingOrderWorker: sync_enabled={self._position_sync_enabled}, interval={self._position_sync_interval_sec}s")
 
+        # Wake up on NOTIFY from the enqueue side; the poll then only runs every idle_poll_sec.
+        self._listen_enabled = os.getenv("PENDING_ORDER_LISTEN", "true").strip().lower() in ("1", "true", "yes")
+        try:
+            self.idle_poll_sec = max(self.poll_interval_sec, float(os.getenv("PENDING_ORDER_IDLE_POLL_SEC", "10")))
+        except Exception:
+            self.idle_poll_sec = 10.0
+        self._listener: Optional[threading.Thread] = None
+        self._listening = False
+        self._wake_event = threading.Event()
+
+        # Concurrent dispatch: one queue per account key, drained by at most `concurrency` threads.
+        try:
+            self.concurrency = max(1, int(os.getenv("PENDING_ORDER_CONCURRENCY", "4")))
+        except Exception:
+            self.concurrency = 4
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._account_queues: Dict[str, deque] = {}
+        self._busy_lock = threading.Lock()
+        # strategy_id -> (account_key, expires_at)
+        self._account_keys: Dict[int, Tuple[str, float]] = {}
+
+        # Queue latency samples (seconds): created_at -> claimed, created_at -> sent
+        self._latency_lock = threading.Lock()
+        self._latency: Dict[str, deque] = {"claim": deque(maxlen=1000), "sent": deque(maxlen=1000)}
+        self._counters: Dict[str, int] = {
+            "claims": 0, "claimed": 0, "dispatched": 0, "sent": 0,
+            "lost_claims": 0, "notifications": 0, "queued_behind_account": 0,
+        }
+
     def start(self) -> bool:
         with self._lock:
             if self._thread and self._thread.is_alive():
@@ -76,48 +129,239 @@ class PendingOrderWorker:
             self._stop_event.clear()
             self._thread = threading.Thread(target=self._run_loop, name="PendingOrderWorker", daemon=True)
             self._thread.start()
+            if self._listen_enabled and not (self._listener and self._listener.is_alive()):
+                self._listener = threading.Thread(target=self._listen_loop, name="PendingOrderListener", daemon=True)
+                self._listener.start()
             logger.info("PendingOrderWorker started")
             return True
 
     def stop(self, timeout_sec: float = 5.0) -> None:
         with self._lock:
             self._stop_event.set()
+            self._wake_event.set()
             th = self._thread
+            executor, self._executor = self._executor, None
+            sync_executor, self._sync_executor = self._sync_executor, None
         if th and th.is_alive():
             th.join(timeout=timeout_sec)
+        for ex in (executor, sync_executor):
+            if ex is not None:
+                ex.shutdown(wait=False)
         logger.info("PendingOrderWorker stopped")
 
     def _run_loop(self) -> None:
         while not self._stop_event.is_set():
+            more = False
             try:
-                self._tick()
+                more = self._tick()
             except Exception as e:
                 logger.warning(f"PendingOrderWorker tick error: {e}")
-            time.sleep(self.poll_interval_sec)
-
-    def _tick(self) -> None:
-        # logger.info(f"[PendingOrderWorker] _tick start. last_sync={self._last_position_sync_ts}")
-        orders = self._fetch_pending_orders(limit=self.batch_size)
-        # logger.info(f"[PendingOrderWorker] orders fetched: {len(orders)}")
+            if more:
+                # Batch was full: claim the rest right away
+                continue
+            # With LISTEN active new orders wake us via NOTIFY; the poll only catches stale requeues
+            # and position sync.
+            timeout = self.poll_interval_sec
+            if self._listening:
+                timeout = self.idle_poll_sec
+                if self._position_sync_enabled:
+                    timeout = min(timeout, max(self._position_sync_interval_sec, self.poll_interval_sec))
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+    def _listen_loop(self) -> None:
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = get_db_listen_connection()
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {PENDING_ORDERS_CHANNEL}")
+                self._listening = True
+                # Orders enqueued while we were not listening
+                self._wake_event.set()
+                backoff = 1.0
+                logger.info(f"PendingOrderWorker listening on '{PENDING_ORDERS_CHANNEL}'")
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        with self._latency_lock:
+                            self._counters["notifications"] += len(conn.notifies)
+                        conn.notifies.clear()
+                        self._wake_event.set()
+            except Exception as e:
+                logger.warning(f"PendingOrderWorker listener disconnected: {e}; polling every {self.poll_interval_sec}s")
+            finally:
+                self._listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _tick(self) -> bool:
+        """Claim and dispatch one batch. Returns True if the batch was full (more may be waiting)."""
+        with self._busy_lock:
+            backlog = sum(len(q) for q in self._account_queues.values())
+        # Keep the locally held (claimed but not yet dispatched) backlog bounded.
+        limit = max(0, self.batch_size - backlog)
+        orders = self._claim_pending_orders(limit=limit) if limit > 0 else []
         if not orders:
             self._maybe_sync_positions()
-            return
+            return False
+
+        if self.concurrency > 1:
+            self._dispatch_concurrent(orders)
+        else:
+            for o in orders:
+                self._dispatch_claimed(o)
+
+        self._maybe_sync_positions()
+        return len(orders) >= limit
+
+    def _account_key(self, order_row: Dict[str, Any]) -> str:
+        """
+        Serialization key of an order: the exchange account it trades on (credential id or API key
+        fingerprint), else its strategy. Cached per strategy for a minute.
+        """
+        try:
+            strategy_id = int(order_row.get("strategy_id") or 0)
+        except Exception:
+            strategy_id = 0
+        if strategy_id <= 0:
+            return f"order:{order_row.get('id')}"
+        now = time.time()
+        cached = self._account_keys.get(strategy_id)
+        if cached and cached[1] > now:
+            return cached[0]
+        key = f"strategy:{strategy_id}"
+        try:
+            ex = (load_strategy_configs(strategy_id).get("exchange_config") or {})
+            exchange_id = str(ex.get("exchange_id") or "").strip().lower()
+            credential_id = ex.get("credential_id") or ex.get("credentials_id")
+            api_key = str(ex.get("api_key") or "").strip()
+            if credential_id:
+                key = f"credential:{credential_id}"
+            elif api_key:
+                key = f"{exchange_id}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+            elif exchange_id in ("ibkr", "mt5"):
+                # Single local gateway/terminal connection
+                key = exchange_id
+        except Exception as e:
+            logger.debug(f"account key lookup failed for strategy_id={strategy_id}: {e}")
+        self._account_keys[strategy_id] = (key, now + 60.0)
+        return key
 
+    def _dispatch_concurrent(self, orders: List[Dict[str, Any]]) -> None:
+        """Append claimed orders to their account's queue; idle accounts get a pool thread to drain it."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
         for o in orders:
-            oid = o.get("id")
-            if not oid:
-                continue
+            groups.setdefault(self._account_key(o), []).append(o)
 
-            # Mark processing (best-effort)
-            if not self._mark_processing(order_id=int(oid)):
-                continue
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="PendingOrderDispatch")
+            executor = self._executor
+
+        for key, batch in groups.items():
+            with self._busy_lock:
+                queue = self._account_queues.get(key)
+                if queue is not None:
+                    # Account busy: its running drain picks these up in order.
+                    queue.extend(batch)
+                    self._counters["queued_behind_account"] += len(batch)
+                    continue
+                self._account_queues[key] = deque(batch)
+            try:
+                executor.submit(self._drain_account_queue, key)
+            except RuntimeError:
+                # Executor shut down (worker stopping)
+                self._release_account_queue(key)
+                return
 
+    def _drain_account_queue(self, key: str) -> None:
+        """Dispatch one account's claimed orders sequentially until its queue is empty."""
+        while True:
+            if self._stop_event.is_set():
+                self._release_account_queue(key)
+                return
+            with self._busy_lock:
+                queue = self._account_queues.get(key)
+                if not queue:
+                    self._account_queues.pop(key, None)
+                    break
+                o = queue.popleft()
             try:
-                self._dispatch_one(o)
+                self._dispatch_claimed(o)
             except Exception as e:
-                self._mark_failed(order_id=int(oid), error=str(e))
+                logger.warning(f"PendingOrderWorker account queue error: key={key}, err={e}")
+        # Backlog shrank: _tick may have skipped claiming (limit 0) while NOTIFYs were consumed,
+        # so claim again now instead of waiting for idle_poll_sec.
+        self._wake_event.set()
+
+    def _release_account_queue(self, key: str) -> None:
+        with self._busy_lock:
+            queue = self._account_queues.pop(key, None) or deque()
+        self._release_claims([int(o["id"]) for o in queue])
+
+    def _dispatch_claimed(self, order_row: Dict[str, Any]) -> None:
+        oid = int(order_row["id"])
+        if not self._confirm_claim(order_row):
+            with self._latency_lock:
+                self._counters["lost_claims"] += 1
+            return
+        with self._latency_lock:
+            self._counters["dispatched"] += 1
+        try:
+            self._dispatch_one(order_row)
+        except Exception as e:
+            self._mark_failed(order_id=oid, error=str(e))
 
-        self._maybe_sync_positions()
+    def _record_latency(self, kind: str, seconds: Any) -> None:
+        try:
+            value = float(seconds)
+        except (TypeError, ValueError):
+            return
+        with self._latency_lock:
+            self._latency[kind].append(value)
+            if kind == "sent":
+                self._counters["sent"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Dispatch counters and queue latency percentiles (created_at -> claimed / sent)."""
+        def _summary(samples: List[float]) -> Dict[str, Any]:
+            if not samples:
+                return {"count": 0}
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+            return {
+                "count": len(ordered),
+                "p50_ms": pick(0.50),
+                "p95_ms": pick(0.95),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+
+        with self._latency_lock:
+            claim = list(self._latency["claim"])
+            sent = list(self._latency["sent"])
+            counters = dict(self._counters)
+        with self._busy_lock:
+            busy = len(self._account_queues)
+            backlog = sum(len(q) for q in self._account_queues.values())
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "listening": self._listening,
+            "concurrency": self.concurrency,
+            "busy_accounts": busy,
+            "claimed_backlog": backlog,
+            **counters,
+            "queue_to_claim": _summary(claim),
+            "queue_to_sent": _summary(sent),
+        }
 
     def _maybe_sync_positions(self) -> None:
         if not self._position_sync_enabled:
@@ -141,6 +385,10 @@ class PendingOrderWorker:
         - If exchange position size differs, update local size (optional best-effort).
 
         This prevents "ghost positions" when positions are closed externally on the exchange.
+
+        Strategies are grouped by exchange account: each account's positions are fetched once
+        (accounts in parallel, POSITION_SYNC_CONCURRENCY) and every strategy on it is diffed
+        against that snapshot in memory. All changes are applied in one DB transaction.
         """
         # 1) Load local positions (filtered if target_strategy_id provided)
         logger.debug(f"[PositionSync] Entering _sync_positions_best_effort for target={target_strategy_id}")
@@ -156,10 +404,6 @@ class PendingOrderWorker:
             rows = cur.fetchall() or []
             cur.close()
 
-        # [Defect Fix] Removed early return to allow syncing active strategies even if local DB is empty.
-        # if not rows and not target_strategy_id:
-        #    return
-
         # Group by strategy_id for efficient exchange queries.
         sid_to_rows: Dict[int, List[Dict[str, Any]]] = {}
         for r in rows:
@@ -167,293 +411,108 @@ class PendingOrderWorker:
             if sid <= 0:
                 continue
             sid_to_rows.setdefault(sid, []).append(r)
-        
-        # If targeted sync but no local rows found, we assume user might have opened position externally 
-        # but DB is empty. However, without knowing *which* symbol to check, we can't easily auto-discover 
-        # unless we fetch ALL positions from exchange for that strategy.
-        # But `load_strategy_configs(sid)` gives us the exchange keys. 
-        # So if target_strategy_id is set but `sid_to_rows` is empty, we SHOULD explicitly add it to `sid_to_rows`
-        # so logic below enters and calls `client.get_positions()`.
+
+        # A targeted sync with no local rows still checks the exchange (position opened externally).
         if target_strategy_id and target_strategy_id not in sid_to_rows:
              sid_to_rows[target_strategy_id] = []
 
         # [Log Fix] Load all ACTIVE LIVE strategies to ensure we sync/log them even if local DB is empty.
         # Otherwise, if we have no local positions, we would silently skip the exchange check.
-        try:
-            with get_db_connection() as db:
-                cur = db.cursor()
-                # Fetch all strategies configured for LIVE execution
-                cur.execute("SELECT id FROM qd_strategies_trading WHERE status = 'running' AND execution_mode = 'live'")
-                active_rows = cur.fetchall() or []
-                cur.close()
-            
-            logger.debug(f"[PositionSync] Found {len(active_rows)} active live strategies in DB.")
-            for _ar in active_rows:
-                _sid = int(_ar.get("id") or 0)
-                if _sid > 0 and _sid not in sid_to_rows:
-                    if target_strategy_id and target_strategy_id != _sid:
-                        continue
-                    sid_to_rows[_sid] = []
-        except Exception as e:
-            logger.error(f"Failed to load active strategies for sync: {e}", exc_info=True)
+        if not target_strategy_id:
+            try:
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    # Fetch all strategies configured for LIVE execution
+                    cur.execute("SELECT id FROM qd_strategies_trading WHERE status = 'running' AND execution_mode = 'live'")
+                    active_rows = cur.fetchall() or []
+                    cur.close()
 
-        # 2) Reconcile per strategy
-        for sid, plist in sid_to_rows.items():
-            if target_strategy_id and sid != target_strategy_id:
+                logger.debug(f"[PositionSync] Found {len(active_rows)} active live strategies in DB.")
+                for _ar in active_rows:
+                    _sid = int(_ar.get("id") or 0)
+                    if _sid > 0 and _sid not in sid_to_rows:
+                        sid_to_rows[_sid] = []
+            except Exception as e:
+                logger.error(f"Failed to load active strategies for sync: {e}", exc_info=True)
+
+        # 2) Group live strategies by exchange account
+        registry = get_exchange_client_registry()
+        configs = load_strategy_configs_many(list(sid_to_rows.keys()))
+        resolved_cache: Dict[str, Dict[str, Any]] = {}
+        accounts: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for sid in sid_to_rows:
+            sc = configs.get(sid)
+            if not sc:
+                continue
+            exec_mode = (sc.get("execution_mode") or "").strip().lower()
+            if exec_mode != "live":
+                logger.debug(f"[PositionSync] Strategy {sid} skipped: execution_mode='{exec_mode}' (needs 'live')")
                 continue
             try:
-                sc = load_strategy_configs(int(sid))
-                exec_mode = (sc.get("execution_mode") or "").strip().lower()
-                if exec_mode != "live":
-                    logger.debug(f"[PositionSync] Strategy {sid} skipped: execution_mode='{exec_mode}' (needs 'live')")
-                    continue
-                exchange_config = resolve_exchange_config(sc.get("exchange_config") or {})
-                safe_cfg = safe_exchange_config_for_log(exchange_config)
+                raw_cfg = sc.get("exchange_config") or {}
+                # Strategies sharing a credential resolve it once per pass
+                cfg_key = json.dumps(raw_cfg, sort_keys=True, default=str)
+                if cfg_key not in resolved_cache:
+                    resolved_cache[cfg_key] = resolve_exchange_config(raw_cfg)
+                exchange_config = resolved_cache[cfg_key]
                 market_type = (sc.get("market_type") or exchange_config.get("market_type") or "swap")
                 market_type = str(market_type or "swap").strip().lower()
                 if market_type in ("futures", "future", "perp", "perpetual"):
                     market_type = "swap"
+                product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "")
+                key = registry.account_key(exchange_config, market_type) + (product_type,)
+                group = accounts.setdefault(key, {"exchange_config": exchange_config, "market_type": market_type, "strategies": []})
+                group["strategies"].append(sid)
+            except Exception as e:
+                logger.error(f"position sync: strategy_id={sid} config failed: {e}", exc_info=True)
 
-                # Lazy import MT5 here to allow elif chain later
-                global MT5Client
-                if MT5Client is None:
-                    try:
-                        from app.services.mt5_trading import MT5Client as _MT5Client
-                        MT5Client = _MT5Client
-                    except ImportError:
-                        pass
-
-                client = create_client(exchange_config, market_type=market_type)
-                
-                # Build an "exchange snapshot" per symbol+side
-                exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
-                exch_entry_price: Dict[str, Dict[str, float]] = {} # {symbol: {long: px, short: px}}
-
-                if isinstance(client, BinanceFuturesClient) and market_type == "swap":
-                    all_pos = client.get_positions() or []
-                    # Handle dict response if needed (wrapper)
-                    if isinstance(all_pos, dict) and "raw" in all_pos:
-                         all_pos = all_pos["raw"]
-                    
-                    if isinstance(all_pos, list):
-                        for p in all_pos:
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            try:
-                                amt = float(p.get("positionAmt") or 0.0)
-                                ep = float(p.get("entryPrice") or 0.0)
-                            except Exception:
-                                amt = 0.0
-                                ep = 0.0
-                            if not sym or abs(amt) <= 0:
-                                continue
-                            # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if amt > 0 else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-                            exch_entry_price.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(ep))
-
-                elif isinstance(client, OkxClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") or []) if isinstance(resp, dict) else []
-                    if isinstance(data, list):
-                        for p in data:
-                            inst_id = str(p.get("instId") or "")
-                            pos_side = str(p.get("posSide") or "").lower()
-                            try:
-                                pos = float(p.get("pos") or 0.0)
-                            except Exception:
-                                pos = 0.0
-                            if not inst_id or abs(pos) <= 0:
-                                continue
-                            # instId: BTC-USDT-SWAP -> BTC/USDT
-                            hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
-                            side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
-                            # IMPORTANT: OKX swap positions `pos` is in contracts, but our system uses base-asset quantity.
-                            # Convert contracts -> base using ctVal when available.
-                            qty_base = abs(float(pos))
-                            try:
-                                inst = client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}
-                                ct_val = float(inst.get("ctVal") or 0.0)
-                                if ct_val > 0:
-                                    qty_base = qty_base * ct_val
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, BitgetMixClient) and market_type == "swap":
-                    product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
-                    resp = client.get_positions(product_type=product_type)
-                    data = resp.get("data") if isinstance(resp, dict) else None
-                    if isinstance(data, list):
-                        for p in data:
-                            sym = str(p.get("symbol") or "")
-                            hold_side = str(p.get("holdSide") or "").lower()
-                            try:
-                                total = float(p.get("total") or 0.0)
-                            except Exception:
-                                total = 0.0
-                            if not sym or abs(total) <= 0:
-                                continue
-                            # Symbol is like BTCUSDT -> BTC/USDT best-effort
-                            hb_sym = sym.upper()
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if hold_side == "long" else "short"
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
-
-                elif isinstance(client, BybitClient) and market_type == "swap":
-                    # Bybit linear positions
-                    resp = client.get_positions()
-                    lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
-                    if isinstance(lst, list):
-                        for p in lst:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip().upper()
-                            side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
-                            try:
-                                sz = float(p.get("size") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            hb_sym = sym
-                            if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
-                                hb_sym = f"{hb_sym[:-4]}/USDT"
-                            side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            if not isinstance(p, dict):
-                                continue
-                            contract = str(p.get("contract") or "").strip()
-                            try:
-                                sz_ct = float(p.get("size") or 0.0)  # contracts, signed
-                            except Exception:
-                                sz_ct = 0.0
-                            if not contract or abs(sz_ct) <= 0:
-                                continue
-                            hb_sym = contract.replace("_", "/")
-                            side = "long" if sz_ct > 0 else "short"
-                            # Convert contracts -> base using quanto_multiplier.
-                            qty_base = abs(sz_ct)
-                            try:
-                                meta = client.get_contract(contract=contract) or {}
-                                qm = float(meta.get("quanto_multiplier") or meta.get("contract_size") or 0.0)
-                                if qm > 0:
-                                    qty_base = qty_base * qm
-                            except Exception:
-                                pass
-                            exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    data = (resp.get("data") if isinstance(resp, dict) else None) or []
-                    if isinstance(data, list):
-                        for p in data:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip()
-                            try:
-                                qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
-                            except Exception:
-                                qty_ct = 0.0
-                            if not sym or abs(qty_ct) <= 0:
-                                continue
-                            side = "long" if qty_ct > 0 else "short"
-                            # Convert contracts -> base using multiplier.
-                            qty_base = abs(qty_ct)
-                            try:
-                                meta = client.get_contract(symbol=sym) or {}
-                                mult = float(meta.get("multiplier") or meta.get("lotSize") or 0.0)
-                                if mult > 0:
-                                    qty_base = qty_base * mult
-                            except Exception:
-                                pass
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
-
-                elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
-                    resp = client.get_open_positions()
-                    positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
-                    if isinstance(positions, list):
-                        for p in positions:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or p.get("instrument") or "").strip()
-                            try:
-                                sz = float(p.get("size") or p.get("positionSize") or 0.0)
-                            except Exception:
-                                sz = 0.0
-                            if not sym or abs(sz) <= 0:
-                                continue
-                            side = "long" if sz > 0 else "short"
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
-
-                elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
-                    resp = client.get_positions()
-                    items = resp if isinstance(resp, list) else []
-                    if isinstance(items, list):
-                        for p in items:
-                            # Bitfinex positions are arrays; best-effort parse:
-                            # [symbol, status, amount, base_price, ...]
-                            try:
-                                if isinstance(p, list) and len(p) >= 3:
-                                    sym = str(p[0] or "")
-                                    amt = float(p[2] or 0.0)
-                                    if not sym or abs(amt) <= 0:
-                                        continue
-                                    side = "long" if amt > 0 else "short"
-                                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
-                            except Exception:
-                                continue
-
-                elif MT5Client is not None and isinstance(client, MT5Client):
-                    # MT5 forex positions
-                    positions = client.get_positions()
-                    if isinstance(positions, list):
-                        for p in positions:
-                            if not isinstance(p, dict):
-                                continue
-                            sym = str(p.get("symbol") or "").strip()
-                            pos_type = str(p.get("type") or "").strip().lower()
-                            try:
-                                vol = float(p.get("volume") or 0.0)
-                            except Exception:
-                                vol = 0.0
-                            if not sym or vol <= 0:
-                                continue
-                            # MT5: type "buy" = long, "sell" = short
-                            side = "long" if pos_type == "buy" else "short"
-                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(vol)
-                    # Continue to reconciliation logic below
-                else:
-                    # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
-                    logger.debug(f"position sync: skip unsupported market/client: sid={sid}, cfg={safe_cfg}, market_type={market_type}, client={type(client)}")
-                    continue
-
-                # [DEBUG] Log all normalized exchange keys for inspection
-                logger.debug(f"[PositionSync] Strategy {sid} Exchange Keys: {list(exch_size.keys())}")
-
-                # [Log Optimization] Always log current positions every sync cycle (10s)
-                pos_summary_parts = []
-                for _sym, _sides in exch_size.items():
-                    for _side_key, _qty in _sides.items():
-                        if _qty > 0:
-                            _ep = exch_entry_price.get(_sym, {}).get(_side_key, 0.0)
-                            pos_summary_parts.append(f"{_sym} {_side_key} size={_qty} entry={_ep}")
+        if not accounts:
+            return
 
-                if pos_summary_parts:
-                    logger.info(f"[PositionSync] Strategy {sid} ({safe_cfg.get('exchange_id', 'unknown')}) positions: {'; '.join(pos_summary_parts)}")
-                else:
-                    logger.info(f"[PositionSync] Strategy {sid} ({safe_cfg.get('exchange_id', 'unknown')}) has NO positions on exchange.")
+        # 3) One position snapshot per account, fetched in parallel
+        snapshots: Dict[Tuple[Any, ...], Any] = {}
+        if len(accounts) == 1 or self._position_sync_concurrency <= 1:
+            for key, group in accounts.items():
+                snapshots[key] = self._fetch_account_positions_safe(group)
+        else:
+            with self._lock:
+                if self._sync_executor is None:
+                    self._sync_executor = ThreadPoolExecutor(
+                        max_workers=self._position_sync_concurrency, thread_name_prefix="PositionSync"
+                    )
+                sync_executor = self._sync_executor
+            futures = {key: sync_executor.submit(self._fetch_account_positions_safe, group) for key, group in accounts.items()}
+            for key, fut in futures.items():
+                snapshots[key] = fut.result()
+
+        # 4) Diff every strategy against its account snapshot in memory
+        all_delete_ids: List[int] = []
+        all_update: List[Dict[str, Any]] = []
+        all_insert: List[Dict[str, Any]] = []
+        for key, group in accounts.items():
+            snapshot = snapshots.get(key)
+            if snapshot is None:
+                continue
+            exch_size, exch_entry_price = snapshot
+            safe_cfg = safe_exchange_config_for_log(group["exchange_config"])
+
+            # [Log Optimization] Always log current positions every sync cycle (10s)
+            pos_summary_parts = []
+            for _sym, _sides in exch_size.items():
+                for _side_key, _qty in _sides.items():
+                    if _qty > 0:
+                        _ep = exch_entry_price.get(_sym, {}).get(_side_key, 0.0)
+                        pos_summary_parts.append(f"{_sym} {_side_key} size={_qty} entry={_ep}")
+
+            sids = group["strategies"]
+            if pos_summary_parts:
+                logger.info(f"[PositionSync] Strategies {sids} ({safe_cfg.get('exchange_id', 'unknown')}) positions: {'; '.join(pos_summary_parts)}")
+            else:
+                logger.info(f"[PositionSync] Strategies {sids} ({safe_cfg.get('exchange_id', 'unknown')}) have NO positions on exchange.")
 
-                # 3) Apply reconciliation to local rows.
+            for sid in sids:
+                plist = sid_to_rows.get(sid) or []
+                # Apply reconciliation to local rows.
                 to_delete_ids: List[int] = []
                 to_update: List[Dict[str, Any]] = []
                 eps = 1e-12
@@ -516,46 +575,300 @@ class PendingOrderWorker:
                             })
                             logger.info(f"[PositionSync] -> Flagged for INSERT: {_sym} {_side} size={_qty} entry={_ep}")
 
-                if not to_delete_ids and not to_update and not to_insert:
-                    continue
+                all_delete_ids.extend(to_delete_ids)
+                all_update.extend(to_update)
+                all_insert.extend(to_insert)
 
-                with get_db_connection() as db:
-                    cur = db.cursor()
-                    for rid in to_delete_ids:
-                        cur.execute("DELETE FROM qd_strategy_positions WHERE id = %s", (int(rid),))
-                    for u in to_update:
-                        cur.execute(
-                            "UPDATE qd_strategy_positions SET size = %s, entry_price = %s, updated_at = NOW() WHERE id = %s", 
-                            (float(u["size"]), float(u["entry_price"]), int(u["id"]))
-                        )
-                    for ins in to_insert:
-                        cur.execute(
-                            """INSERT INTO qd_strategy_positions (user_id, strategy_id, symbol, side, size, entry_price, updated_at)
-                               VALUES (%s, %s, %s, %s, %s, %s, NOW())""",
-                            (1, int(ins["strategy_id"]), str(ins["symbol"]), str(ins["side"]), float(ins["size"]), float(ins["entry_price"]))
-                        )
-                    db.commit()
-                    cur.close()
+        if not all_delete_ids and not all_update and not all_insert:
+            return
 
-                if to_delete_ids:
-                    logger.debug(f"position sync: removed {len(to_delete_ids)} ghost positions for strategy_id={sid}")
-                if to_update:
-                    logger.debug(f"position sync: updated {len(to_update)} positions for strategy_id={sid}")
-                if to_insert:
-                    logger.debug(f"position sync: inserted {len(to_insert)} new positions for strategy_id={sid}")
-            except Exception as e:
-                logger.error(f"position sync: strategy_id={sid} failed: {e}", exc_info=True)
+        # 5) Apply all changes in one transaction
+        with get_db_connection() as db:
+            cur = db.cursor()
+            if all_delete_ids:
+                cur.execute("DELETE FROM qd_strategy_positions WHERE id = ANY(%s)", ([int(rid) for rid in all_delete_ids],))
+            for u in all_update:
+                cur.execute(
+                    "UPDATE qd_strategy_positions SET size = %s, entry_price = %s, updated_at = NOW() WHERE id = %s", 
+                    (float(u["size"]), float(u["entry_price"]), int(u["id"]))
+                )
+            for ins in all_insert:
+                cur.execute(
+                    """INSERT INTO qd_strategy_positions (user_id, strategy_id, symbol, side, size, entry_price, updated_at)
+                       VALUES (%s, %s, %s, %s, %s, %s, NOW())""",
+                    (1, int(ins["strategy_id"]), str(ins["symbol"]), str(ins["side"]), float(ins["size"]), float(ins["entry_price"]))
+                )
+            db.commit()
+            cur.close()
 
-    def _fetch_pending_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+        logger.debug(
+            f"position sync: accounts={len(accounts)}, removed={len(all_delete_ids)}, "
+            f"updated={len(all_update)}, inserted={len(all_insert)}"
+        )
+
+    def _fetch_account_positions_safe(self, group: Dict[str, Any]) -> Optional[Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]]]]:
+        try:
+            return self._fetch_account_positions(group["exchange_config"], group["market_type"])
+        except Exception as e:
+            logger.error(f"position sync: strategies={group.get('strategies')} fetch failed: {e}", exc_info=True)
+            return None
+
+    def _fetch_account_positions(
+        self, exchange_config: Dict[str, Any], market_type: str
+    ) -> Optional[Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, float]]]]:
+        """
+        Fetch one exchange account's open positions.
+
+        Returns:
+            ({symbol: {long: size, short: size}}, {symbol: {long: px, short: px}}), or None if
+            this market/client is not reconciled.
+        """
+        safe_cfg = safe_exchange_config_for_log(exchange_config)
+
+        # Lazy import MT5 here to allow elif chain later
+        global MT5Client
+        if MT5Client is None:
+            try:
+                from app.services.mt5_trading import MT5Client as _MT5Client
+                MT5Client = _MT5Client
+            except ImportError:
+                pass
+
+        client = get_exchange_client_registry().get_client(exchange_config, market_type=market_type)
+
+        # Build an "exchange snapshot" per symbol+side
+        exch_size: Dict[str, Dict[str, float]] = {}  # {symbol: {long: size, short: size}}
+        exch_entry_price: Dict[str, Dict[str, float]] = {} # {symbol: {long: px, short: px}}
+
+        if isinstance(client, BinanceFuturesClient) and market_type == "swap":
+            all_pos = client.get_positions() or []
+            # Handle dict response if needed (wrapper)
+            if isinstance(all_pos, dict) and "raw" in all_pos:
+                 all_pos = all_pos["raw"]
+
+            if isinstance(all_pos, list):
+                for p in all_pos:
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    try:
+                        amt = float(p.get("positionAmt") or 0.0)
+                        ep = float(p.get("entryPrice") or 0.0)
+                    except Exception:
+                        amt = 0.0
+                        ep = 0.0
+                    if not sym or abs(amt) <= 0:
+                        continue
+                    # Map to our symbol format: BTCUSDT -> BTC/USDT (best-effort)
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if amt > 0 else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+                    exch_entry_price.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(ep))
+
+        elif isinstance(client, OkxClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") or []) if isinstance(resp, dict) else []
+            if isinstance(data, list):
+                for p in data:
+                    inst_id = str(p.get("instId") or "")
+                    pos_side = str(p.get("posSide") or "").lower()
+                    try:
+                        pos = float(p.get("pos") or 0.0)
+                    except Exception:
+                        pos = 0.0
+                    if not inst_id or abs(pos) <= 0:
+                        continue
+                    # instId: BTC-USDT-SWAP -> BTC/USDT
+                    hb_sym = inst_id.replace("-SWAP", "").replace("-", "/")
+                    side = "long" if pos_side == "long" else ("short" if pos_side == "short" else ("long" if pos > 0 else "short"))
+                    # IMPORTANT: OKX swap positions `pos` is in contracts, but our system uses base-asset quantity.
+                    # Convert contracts -> base using ctVal when available.
+                    qty_base = abs(float(pos))
+                    try:
+                        inst = client.get_instrument(inst_type="SWAP", inst_id=inst_id) or {}
+                        ct_val = float(inst.get("ctVal") or 0.0)
+                        if ct_val > 0:
+                            qty_base = qty_base * ct_val
+                    except Exception:
+                        pass
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, BitgetMixClient) and market_type == "swap":
+            product_type = str(exchange_config.get("product_type") or exchange_config.get("productType") or "USDT-FUTURES")
+            resp = client.get_positions(product_type=product_type)
+            data = resp.get("data") if isinstance(resp, dict) else None
+            if isinstance(data, list):
+                for p in data:
+                    sym = str(p.get("symbol") or "")
+                    hold_side = str(p.get("holdSide") or "").lower()
+                    try:
+                        total = float(p.get("total") or 0.0)
+                    except Exception:
+                        total = 0.0
+                    if not sym or abs(total) <= 0:
+                        continue
+                    # Symbol is like BTCUSDT -> BTC/USDT best-effort
+                    hb_sym = sym.upper()
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if hold_side == "long" else "short"
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(total))
+
+        elif isinstance(client, BybitClient) and market_type == "swap":
+            # Bybit linear positions
+            resp = client.get_positions()
+            lst = (((resp.get("result") or {}).get("list")) if isinstance(resp, dict) else None) or []
+            if isinstance(lst, list):
+                for p in lst:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip().upper()
+                    side0 = str(p.get("side") or "").strip().lower()  # Buy/Sell
+                    try:
+                        sz = float(p.get("size") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    hb_sym = sym
+                    if hb_sym.endswith("USDT") and len(hb_sym) > 4 and "/" not in hb_sym:
+                        hb_sym = f"{hb_sym[:-4]}/USDT"
+                    side = "long" if side0 == "buy" else ("short" if side0 == "sell" else ("long" if sz > 0 else "short"))
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, GateUsdtFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    if not isinstance(p, dict):
+                        continue
+                    contract = str(p.get("contract") or "").strip()
+                    try:
+                        sz_ct = float(p.get("size") or 0.0)  # contracts, signed
+                    except Exception:
+                        sz_ct = 0.0
+                    if not contract or abs(sz_ct) <= 0:
+                        continue
+                    hb_sym = contract.replace("_", "/")
+                    side = "long" if sz_ct > 0 else "short"
+                    # Convert contracts -> base using quanto_multiplier.
+                    qty_base = abs(sz_ct)
+                    try:
+                        meta = client.get_contract(contract=contract) or {}
+                        qm = float(meta.get("quanto_multiplier") or meta.get("contract_size") or 0.0)
+                        if qm > 0:
+                            qty_base = qty_base * qm
+                    except Exception:
+                        pass
+                    exch_size.setdefault(hb_sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KucoinFuturesClient) and market_type == "swap":
+            resp = client.get_positions()
+            data = (resp.get("data") if isinstance(resp, dict) else None) or []
+            if isinstance(data, list):
+                for p in data:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip()
+                    try:
+                        qty_ct = float(p.get("currentQty") or p.get("quantity") or 0.0)
+                    except Exception:
+                        qty_ct = 0.0
+                    if not sym or abs(qty_ct) <= 0:
+                        continue
+                    side = "long" if qty_ct > 0 else "short"
+                    # Convert contracts -> base using multiplier.
+                    qty_base = abs(qty_ct)
+                    try:
+                        meta = client.get_contract(symbol=sym) or {}
+                        mult = float(meta.get("multiplier") or meta.get("lotSize") or 0.0)
+                        if mult > 0:
+                            qty_base = qty_base * mult
+                    except Exception:
+                        pass
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(qty_base)
+
+        elif isinstance(client, KrakenFuturesClient) and market_type == "swap":
+            resp = client.get_open_positions()
+            positions = (resp.get("openPositions") if isinstance(resp, dict) else None) or (resp.get("open_positions") if isinstance(resp, dict) else None) or []
+            if isinstance(positions, list):
+                for p in positions:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or p.get("instrument") or "").strip()
+                    try:
+                        sz = float(p.get("size") or p.get("positionSize") or 0.0)
+                    except Exception:
+                        sz = 0.0
+                    if not sym or abs(sz) <= 0:
+                        continue
+                    side = "long" if sz > 0 else "short"
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(sz))
+
+        elif isinstance(client, BitfinexDerivativesClient) and market_type == "swap":
+            resp = client.get_positions()
+            items = resp if isinstance(resp, list) else []
+            if isinstance(items, list):
+                for p in items:
+                    # Bitfinex positions are arrays; best-effort parse:
+                    # [symbol, status, amount, base_price, ...]
+                    try:
+                        if isinstance(p, list) and len(p) >= 3:
+                            sym = str(p[0] or "")
+                            amt = float(p[2] or 0.0)
+                            if not sym or abs(amt) <= 0:
+                                continue
+                            side = "long" if amt > 0 else "short"
+                            exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = abs(float(amt))
+                    except Exception:
+                        continue
+
+        elif MT5Client is not None and isinstance(client, MT5Client):
+            # MT5 forex positions
+            positions = client.get_positions()
+            if isinstance(positions, list):
+                for p in positions:
+                    if not isinstance(p, dict):
+                        continue
+                    sym = str(p.get("symbol") or "").strip()
+                    pos_type = str(p.get("type") or "").strip().lower()
+                    try:
+                        vol = float(p.get("volume") or 0.0)
+                    except Exception:
+                        vol = 0.0
+                    if not sym or vol <= 0:
+                        continue
+                    # MT5: type "buy" = long, "sell" = short
+                    side = "long" if pos_type == "buy" else "short"
+                    exch_size.setdefault(sym, {"long": 0.0, "short": 0.0})[side] = float(vol)
+            # Continue to reconciliation logic below
+        else:
+            # Spot reconciliation is optional; skip for now (keeps self-check low-risk).
+            logger.debug(f"position sync: skip unsupported market/client: cfg={safe_cfg}, market_type={market_type}, client={type(client)}")
+            return None
+
+        # [DEBUG] Log all normalized exchange keys for inspection
+        logger.debug(f"[PositionSync] Exchange Keys: {list(exch_size.keys())}")
+        return exch_size, exch_entry_price
+
+    def _claim_pending_orders(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Atomically claim up to `limit` pending orders (status -> processing).
+
+        Rows locked by another worker/process are skipped (FOR UPDATE SKIP LOCKED), so several
+        workers can share the queue without double-dispatching. Stale "processing" rows are
+        requeued in the same transaction.
+        """
         try:
-            # Best-effort: requeue stale "processing" rows to avoid deadlocks after crashes.
             try:
                 stale_sec = int(self._stale_processing_sec or 0)
             except Exception:
                 stale_sec = 0
-            if stale_sec > 0:
-                with get_db_connection() as db:
-                    cur = db.cursor()
+            with get_db_connection() as db:
+                cur = db.cursor()
+                if stale_sec > 0:
+                    # Best-effort: requeue stale "processing" rows to avoid deadlocks after crashes.
                     cur.execute(
                         """
                         UPDATE pending_orders
@@ -565,62 +878,105 @@ class PendingOrderWorker:
                                 WHEN dispatch_note IS NULL OR dispatch_note = '' THEN 'requeued_stale_processing'
                                 ELSE dispatch_note
                             END
-                        WHERE status = 'processing'
-                          AND (updated_at IS NULL OR updated_at < NOW() - INTERVAL '%s seconds')
-                          AND (attempts < max_attempts)
+                        WHERE id IN (
+                            SELECT id FROM pending_orders
+                            WHERE status = 'processing'
+                              AND (updated_at IS NULL OR updated_at < NOW() - INTERVAL '%s seconds')
+                              AND (attempts < max_attempts)
+                            FOR UPDATE SKIP LOCKED
+                        )
                         """,
                         (stale_sec,),
                     )
-                    db.commit()
-                    cur.close()
-
-            with get_db_connection() as db:
-                cur = db.cursor()
                 cur.execute(
                     """
-                    SELECT *
-                    FROM pending_orders
-                    WHERE status = 'pending'
-                      AND (attempts < max_attempts)
-                    ORDER BY priority DESC, id ASC
-                    LIMIT %s
+                    UPDATE pending_orders
+                    SET status = 'processing',
+                        attempts = COALESCE(attempts, 0) + 1,
+                        processed_at = NOW(),
+                        updated_at = NOW()
+                    WHERE id IN (
+                        SELECT id FROM pending_orders
+                        WHERE status = 'pending'
+                          AND (attempts < max_attempts)
+                        ORDER BY priority DESC, id ASC
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *, EXTRACT(EPOCH FROM (NOW() - created_at)) AS queue_latency_sec
                     """,
                     (int(limit),),
                 )
                 rows = cur.fetchall() or []
+                db.commit()
                 cur.close()
-            return rows
         except Exception as e:
-            logger.warning(f"fetch_pending_orders failed: {e}")
+            logger.warning(f"claim_pending_orders failed: {e}")
             return []
 
-    def _mark_processing(self, order_id: int) -> bool:
+        claimed_at = time.time()
+        for row in rows:
+            row["_claimed_at"] = claimed_at
+            self._record_latency("claim", row.get("queue_latency_sec"))
+        with self._latency_lock:
+            self._counters["claims"] += 1
+            self._counters["claimed"] += len(rows)
+        # RETURNING order is unspecified
+        rows.sort(key=lambda r: (-int(r.get("priority") or 0), int(r.get("id") or 0)))
+        return rows
+
+    def _confirm_claim(self, order_row: Dict[str, Any]) -> bool:
+        """
+        Make sure a claimed order is still ours before dispatching it.
+
+        Orders held locally longer than half the stale window (e.g. queued behind a slow order of
+        the same account) may have been requeued by another worker; re-check them by their claim
+        timestamp and refresh updated_at so they are not requeued while being dispatched.
+        """
+        stale_sec = int(self._stale_processing_sec or 0)
+        if stale_sec <= 0 or time.time() - float(order_row.get("_claimed_at") or 0) < stale_sec / 2.0:
+            return True
         try:
             with get_db_connection() as db:
                 cur = db.cursor()
-                # Only claim if still pending to avoid double-processing.
                 cur.execute(
                     """
                     UPDATE pending_orders
-                    SET status = 'processing',
-                        attempts = COALESCE(attempts, 0) + 1,
-                        processed_at = NOW(),
-                        updated_at = NOW()
-                    WHERE id = %s AND status = 'pending'
+                    SET updated_at = NOW()
+                    WHERE id = %s AND status = 'processing' AND processed_at = %s
                     """,
-                    (int(order_id),),
+                    (int(order_row["id"]), order_row.get("processed_at")),
                 )
                 claimed = getattr(cur, "rowcount", None)
                 db.commit()
                 cur.close()
-            # Only treat as success if we actually changed a row.
-            if claimed is None:
-                return True
-            return int(claimed) > 0
+            return claimed is None or int(claimed) > 0
         except Exception as e:
-            logger.warning(f"mark_processing failed: id={order_id}, err={e}")
+            logger.warning(f"confirm_claim failed: id={order_row.get('id')}, err={e}")
             return False
 
+    def _release_claims(self, order_ids: List[int]) -> None:
+        """Hand claimed-but-undispatched orders back to the queue (e.g. on shutdown)."""
+        if not order_ids:
+            return
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    UPDATE pending_orders
+                    SET status = 'pending',
+                        attempts = GREATEST(COALESCE(attempts, 1) - 1, 0),
+                        updated_at = NOW()
+                    WHERE id = ANY(%s) AND status = 'processing'
+                    """,
+                    ([int(i) for i in order_ids],),
+                )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"release_claims failed: ids={order_ids}, err={e}")
+
     def _dispatch_one(self, order_row: Dict[str, Any]) -> None:
         order_id = int(order_row["id"])
         mode = (order_row.get("execution_mode") or "signal").strip().lower()
@@ -868,7 +1224,7 @@ class PendingOrderWorker:
 
         client = None
         try:
-            client = create_client(exchange_config, market_type=market_type)
+            client = get_exchange_client_registry().get_client(exchange_config, market_type=market_type)
         except Exception as e:
             self._mark_failed(order_id=order_id, error=f"create_client_failed:{e}")
             _console_print(f"[worker] create_client_failed: strategy_id={strategy_id} pending_id={order_id} err={e}")
@@ -2194,6 +2550,7 @@ class PendingOrderWorker:
                     avg_price = %s,
                     updated_at = NOW()
                 WHERE id = %s
+                RETURNING EXTRACT(EPOCH FROM (sent_at - created_at)) AS queue_latency_sec
                 """,
                 (
                     "",
@@ -2207,8 +2564,13 @@ class PendingOrderWorker:
                     int(order_id),
                 ),
             )
+            row = cur.fetchone()
             db.commit()
             cur.close()
+        # Queue latency: enqueue (created_at) -> sent, including claim wait and execution time
+        if row:
+            self._record_latency("sent", row.get("queue_latency_sec"))
+            logger.debug(f"pending order sent: id={order_id}, queue_latency={row.get('queue_latency_sec')}s")
 
     def _mark_failed(self, order_id: int, error: str) -> None:
         with get_db_connection() as db:
@@ -6,9 +6,12 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
 import threading
 import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
 from app.utils.db import get_db_connection
@@ -16,12 +19,14 @@ from app.utils.logger import get_logger
 from app.services.fast_analysis import get_fast_analysis_service
 from app.services.signal_notifier import SignalNotifier
 from app.services.kline import KlineService
+from app.services.price_alert_engine import PriceAlert, get_price_alert_engine
 
 logger = get_logger(__name__)
 
 DEFAULT_USER_ID = 1
 
 _monitor_thread: Optional[threading.Thread] = None
+_alert_thread: Optional[threading.Thread] = None
 _stop_event = threading.Event()
 
 # 多语言消息模板
@@ -109,6 +114,9 @@ def _get_positions_for_monitor(position_ids: List[int] = None, user_id: int = No
             rows = cur.fetchall() or []
             cur.close()
 
+        # Get current prices (batched per market)
+        price_map = kline_service.get_realtime_price_snapshot((row.get('market'), row.get('symbol')) for row in rows)
+
         positions = []
         for row in rows:
             market = row.get('market')
@@ -118,13 +126,7 @@ def _get_positions_for_monitor(position_ids: List[int] = None, user_id: int = No
             side = row.get('side') or 'long'
             group_name = row.get('group_name')
             
-            # Get current price (use realtime price API)
-            current_price = 0
-            try:
-                price_data = kline_service.get_realtime_price(market, symbol)
-                current_price = float(price_data.get('price') or 0)
-            except Exception:
-                pass
+            current_price = float((price_map.get((market, symbol)) or {}).get('price') or 0)
             
             # Calculate PnL
             if side == 'long':
@@ -154,10 +156,13 @@ def _get_positions_for_monitor(position_ids: List[int] = None, user_id: int = No
         return []
 
 
-def _run_ai_analysis(positions: List[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
+def _run_ai_analysis(positions: List[Dict[str, Any]], config: Dict[str, Any], deadline: Optional[float] = None) -> Dict[str, Any]:
     """
     Run fast AI analysis on positions.
     Uses the new FastAnalysisService (single LLM call, faster and more stable).
+
+    If `deadline` (epoch seconds) passes, the remaining positions are skipped and the report
+    covers the positions analyzed so far (`timed_out` is set in the result).
     """
     try:
         language = config.get('language', 'en-US')
@@ -168,6 +173,7 @@ def _run_ai_analysis(positions: List[Dict[str, Any]], config: Dict[str, Any]) ->
         
         # Analyze each position
         position_analyses = []
+        timed_out = False
         
         for pos in positions:
             market = pos.get('market')
@@ -178,6 +184,11 @@ def _run_ai_analysis(positions: List[Dict[str, Any]], config: Dict[str, Any]) ->
             if not market or not symbol:
                 continue
             
+            if deadline is not None and time.time() >= deadline:
+                timed_out = True
+                logger.warning(f"AI analysis deadline reached after {len(position_analyses)} position(s); skipping the rest")
+                break
+            
             try:
                 logger.info(f"Running fast AI analysis for {market}:{symbol}")
                 
@@ -252,6 +263,7 @@ def _run_ai_analysis(positions: List[Dict[str, Any]], config: Dict[str, Any]) ->
             'position_analyses': position_analyses,
             'position_count': len(positions),
             'analyzed_count': len([p for p in position_analyses if not p.get('error')]),
+            'timed_out': timed_out,
             'timestamp': _now_ts()
         }
         
@@ -874,7 +886,8 @@ def _send_monitor_notification(
         logger.error(f"_send_monitor_notification failed: {e}")
 
 
-def run_single_monitor(monitor_id: int, override_language: str = None, user_id: int = None) -> Dict[str, Any]:
+def run_single_monitor(monitor_id: int, override_language: str = None, user_id: int = None,
+                       deadline: Optional[float] = None) -> Dict[str, Any]:
     """Run a single monitor and return the result.
     
     Args:
@@ -882,6 +895,7 @@ def run_single_monitor(monitor_id: int, override_language: str = None, user_id:
         override_language: Optional language override (e.g., 'zh-CN', 'en-US')
                           If provided, will override the language in monitor config
         user_id: Optional user ID for user isolation
+        deadline: Optional epoch seconds after which no further positions are analyzed
     """
     try:
         # Use provided user_id or default
@@ -922,7 +936,7 @@ def run_single_monitor(monitor_id: int, override_language: str = None, user_id:
         
         # Run analysis based on type
         if monitor_type == 'ai':
-            result = _run_ai_analysis(positions, config)
+            result = _run_ai_analysis(positions, config, deadline=deadline)
         else:
             # For other types, we can add price_alert, pnl_alert logic later
             result = {'success': False, 'error': f'Unsupported monitor type: {monitor_type}'}
@@ -970,168 +984,62 @@ def run_single_monitor(monitor_id: int, override_language: str = None, user_id:
         return {'success': False, 'error': str(e)}
 
 
+def _send_alert_notification(alert: PriceAlert, current_price: float) -> None:
+    """Build the alert message and deliver it on the alert's notification channels."""
+    notification_config = alert.notification_config
+    # Get language from notification_config (saved when alert was created)
+    alert_language = notification_config.get('language', 'en-US')
+    if alert.alert_type in ('price_above', 'price_below'):
+        alert_message = _get_alert_message(
+            alert.alert_type, alert_language,
+            symbol=alert.symbol, current_price=current_price, threshold=alert.threshold
+        )
+    else:
+        alert_message = _get_alert_message(
+            alert.alert_type, alert_language,
+            symbol=alert.symbol, pnl_percent=alert.pnl_percent(current_price), threshold=alert.threshold
+        )
+    logger.info(f"Alert #{alert.id} triggered: {alert_message}")
+
+    notifier = SignalNotifier()
+    channels = notification_config.get('channels', ['browser'])
+    targets = notification_config.get('targets', {})
+    alert_title = _get_alert_title(alert_language)
+    
+    for channel in channels:
+        try:
+            ch = str(channel).strip().lower()
+            if ch == 'browser':
+                with get_db_connection() as db:
+                    cur = db.cursor()
+                    cur.execute(
+                        """
+                        INSERT INTO qd_strategy_notifications
+                        (user_id, strategy_id, symbol, signal_type, channels, title, message, payload_json, created_at)
+                        VALUES (?, NULL, ?, ?, ?, ?, ?, ?, NOW())
+                        """,
+                        (alert.user_id, alert.symbol, 'price_alert', 'browser', alert_title, alert_message,
+                         json.dumps({'alert_id': alert.id, 'alert_type': alert.alert_type}, ensure_ascii=False))
+                    )
+                    db.commit()
+                    cur.close()
+            elif ch == 'telegram':
+                chat_id = targets.get('telegram', '')
+                token_override = targets.get('telegram_bot_token', '')
+                if chat_id:
+                    notifier._notify_telegram(chat_id=chat_id, text=alert_message, token_override=token_override, parse_mode="HTML")
+            elif ch == 'email':
+                to_email = targets.get('email', '')
+                if to_email:
+                    notifier._notify_email(to_email=to_email, subject=alert_title, body_text=alert_message)
+        except Exception as e:
+            logger.warning(f"Failed to send alert notification: {e}")
+
+
 def _check_position_alerts():
     """Check all active alerts and trigger notifications if conditions are met."""
-    from datetime import datetime, timezone
     try:
-        kline_service = KlineService()
-        notifier = SignalNotifier()
-        now = datetime.now(timezone.utc)
-        
-        with get_db_connection() as db:
-            cur = db.cursor()
-            # Get active alerts for all users that haven't been triggered (or can repeat)
-            cur.execute(
-                """
-                SELECT a.id, a.user_id, a.position_id, a.market, a.symbol, a.alert_type, a.threshold,
-                       a.notification_config, a.is_triggered, a.last_triggered_at, a.repeat_interval,
-                       p.entry_price, p.quantity, p.side, p.name as position_name
-                FROM qd_position_alerts a
-                LEFT JOIN qd_manual_positions p ON a.position_id = p.id
-                WHERE a.is_active = 1
-                """
-            )
-            alerts = cur.fetchall() or []
-            cur.close()
-        
-        for alert in alerts:
-            try:
-                alert_id = alert.get('id')
-                alert_user_id = int(alert.get('user_id') or 1)
-                alert_type = alert.get('alert_type')
-                threshold = float(alert.get('threshold') or 0)
-                market = alert.get('market')
-                symbol = alert.get('symbol')
-                is_triggered = bool(alert.get('is_triggered'))
-                last_triggered_at = alert.get('last_triggered_at')  # datetime or None
-                repeat_interval = int(alert.get('repeat_interval') or 0)
-                notification_config = _safe_json_loads(alert.get('notification_config'), {})
-                
-                # Check if we can trigger (not triggered yet, or repeat interval passed)
-                can_trigger = not is_triggered
-                if is_triggered and repeat_interval > 0 and last_triggered_at:
-                    # Convert last_triggered_at to timezone-aware if needed
-                    if last_triggered_at.tzinfo is None:
-                        last_triggered_at = last_triggered_at.replace(tzinfo=timezone.utc)
-                    elapsed_seconds = (now - last_triggered_at).total_seconds()
-                    if elapsed_seconds >= repeat_interval:
-                        can_trigger = True
-                
-                if not can_trigger:
-                    continue
-                
-                # Get current price (use realtime price API)
-                current_price = 0
-                try:
-                    price_data = kline_service.get_realtime_price(market, symbol)
-                    current_price = float(price_data.get('price') or 0)
-                except Exception:
-                    continue
-                
-                if current_price <= 0:
-                    continue
-                
-                triggered = False
-                alert_message = ""
-                
-                # Get language from notification_config (saved when alert was created)
-                alert_language = notification_config.get('language', 'en-US')
-                
-                if alert_type == 'price_above':
-                    if current_price >= threshold:
-                        triggered = True
-                        alert_message = _get_alert_message(
-                            'price_above', alert_language,
-                            symbol=symbol, current_price=current_price, threshold=threshold
-                        )
-                
-                elif alert_type == 'price_below':
-                    if current_price <= threshold:
-                        triggered = True
-                        alert_message = _get_alert_message(
-                            'price_below', alert_language,
-                            symbol=symbol, current_price=current_price, threshold=threshold
-                        )
-                
-                elif alert_type in ('pnl_above', 'pnl_below'):
-                    entry_price = float(alert.get('entry_price') or 0)
-                    quantity = float(alert.get('quantity') or 0)
-                    side = alert.get('side') or 'long'
-                    
-                    if entry_price > 0 and quantity > 0:
-                        if side == 'long':
-                            pnl = (current_price - entry_price) * quantity
-                        else:
-                            pnl = (entry_price - current_price) * quantity
-                        pnl_percent = pnl / (entry_price * quantity) * 100
-                        
-                        if alert_type == 'pnl_above' and pnl_percent >= threshold:
-                            triggered = True
-                            alert_message = _get_alert_message(
-                                'pnl_above', alert_language,
-                                symbol=symbol, pnl_percent=pnl_percent, threshold=threshold
-                            )
-                        elif alert_type == 'pnl_below' and pnl_percent <= threshold:
-                            triggered = True
-                            alert_message = _get_alert_message(
-                                'pnl_below', alert_language,
-                                symbol=symbol, pnl_percent=pnl_percent, threshold=threshold
-                            )
-                
-                if triggered:
-                    logger.info(f"Alert #{alert_id} triggered: {alert_message}")
-                    
-                    # Update alert status
-                    with get_db_connection() as db:
-                        cur = db.cursor()
-                        cur.execute(
-                            """
-                            UPDATE qd_position_alerts
-                            SET is_triggered = 1, last_triggered_at = NOW(), trigger_count = trigger_count + 1, updated_at = NOW()
-                            WHERE id = ?
-                            """,
-                            (alert_id,)
-                        )
-                        db.commit()
-                        cur.close()
-                    
-                    # Send notification
-                    channels = notification_config.get('channels', ['browser'])
-                    targets = notification_config.get('targets', {})
-                    alert_title = _get_alert_title(alert_language)
-                    
-                    for channel in channels:
-                        try:
-                            ch = str(channel).strip().lower()
-                            if ch == 'browser':
-                                with get_db_connection() as db:
-                                    cur = db.cursor()
-                                    cur.execute(
-                                        """
-                                        INSERT INTO qd_strategy_notifications
-                                        (user_id, strategy_id, symbol, signal_type, channels, title, message, payload_json, created_at)
-                                        VALUES (?, NULL, ?, ?, ?, ?, ?, ?, NOW())
-                                        """,
-                                        (alert_user_id, symbol, 'price_alert', 'browser', alert_title, alert_message,
-                                         json.dumps({'alert_id': alert_id, 'alert_type': alert_type}, ensure_ascii=False))
-                                    )
-                                    db.commit()
-                                    cur.close()
-                            elif ch == 'telegram':
-                                chat_id = targets.get('telegram', '')
-                                token_override = targets.get('telegram_bot_token', '')
-                                if chat_id:
-                                    notifier._notify_telegram(chat_id=chat_id, text=alert_message, token_override=token_override, parse_mode="HTML")
-                            elif ch == 'email':
-                                to_email = targets.get('email', '')
-                                if to_email:
-                                    notifier._notify_email(to_email=to_email, subject=alert_title, body_text=alert_message)
-                        except Exception as e:
-                            logger.warning(f"Failed to send alert notification: {e}")
-                            
-            except Exception as e:
-                logger.warning(f"Error processing alert: {e}")
-                
+        get_price_alert_engine().check_once(_send_alert_notification)
     except Exception as e:
         logger.error(f"_check_position_alerts failed: {e}")
 
@@ -1216,69 +1124,201 @@ def notify_strategy_signal_for_positions(market: str, symbol: str, signal_type:
         logger.error(f"notify_strategy_signal_for_positions failed: {e}")
 
 
-def _monitor_loop():
-    """Background loop that checks and runs due monitors."""
-    logger.info("Portfolio monitor background loop started")
-    
-    while not _stop_event.is_set():
-        try:
-            # 1. Check position alerts (price/pnl alerts) for all users
-            _check_position_alerts()
-            
-            # 2. Find AI monitors that are due for all users
-            with get_db_connection() as db:
-                cur = db.cursor()
-                cur.execute(
-                    """
-                    SELECT id, user_id FROM qd_position_monitors
+class _MonitorRunner:
+    """
+    Runs due AI monitors on a bounded worker pool.
+
+    Due monitors are claimed with `FOR UPDATE SKIP LOCKED` and their next_run_at is pushed out by
+    a lease (MONITOR_RUN_TIMEOUT_SEC * 2), so several processes can share the work without running
+    a monitor twice; a run that crashes is retried once the lease expires. A successful run sets
+    next_run_at to NOW() + interval as before. Each run gets a deadline after which no further
+    positions are analyzed, so one slow LLM response only holds up its own worker.
+    """
+
+    def __init__(self):
+        self.workers = max(1, int(os.getenv('MONITOR_WORKERS', '4')))
+        self.run_timeout_sec = max(30, int(os.getenv('MONITOR_RUN_TIMEOUT_SEC', '600')))
+        self.poll_sec = max(1.0, float(os.getenv('MONITOR_POLL_SEC', '10')))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='portfolio-monitor')
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, float] = {}  # monitor_id -> started_at
+        self._wake = threading.Event()
+        self._lag: deque = deque(maxlen=1000)
+        self._durations: deque = deque(maxlen=1000)
+        self._counters = {'claimed': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'claim_errors': 0}
+
+    def _claim_due(self, limit: int) -> List[Dict[str, Any]]:
+        with get_db_connection() as db:
+            cur = db.cursor()
+            cur.execute(
+                """
+                UPDATE qd_position_monitors m
+                SET next_run_at = NOW() + INTERVAL '%s seconds'
+                FROM (
+                    SELECT id, next_run_at AS due_at FROM qd_position_monitors
                     WHERE is_active = 1 AND next_run_at <= NOW()
                     ORDER BY next_run_at ASC
-                    LIMIT 10
-                    """
-                )
-                rows = cur.fetchall() or []
-                cur.close()
-            
-            for row in rows:
-                if _stop_event.is_set():
-                    break
-                monitor_id = row.get('id')
-                monitor_user_id = int(row.get('user_id') or 1)
-                if monitor_id:
-                    logger.info(f"Running due monitor #{monitor_id} for user #{monitor_user_id}")
-                    try:
-                        run_single_monitor(monitor_id, user_id=monitor_user_id)
-                    except Exception as e:
-                        logger.error(f"Monitor #{monitor_id} execution failed: {e}")
+                    LIMIT ?
+                    FOR UPDATE SKIP LOCKED
+                ) d
+                WHERE m.id = d.id
+                RETURNING m.id, m.user_id, EXTRACT(EPOCH FROM (NOW() - d.due_at)) AS lag_sec
+                """,
+                (self.run_timeout_sec * 2, int(limit))
+            )
+            rows = cur.fetchall() or []
+            db.commit()
+            cur.close()
+        return rows
+
+    def run_due(self) -> int:
+        """Claim as many due monitors as there are free workers and submit them."""
+        with self._lock:
+            free = self.workers - len(self._in_flight)
+        if free <= 0:
+            return 0
+        try:
+            rows = self._claim_due(free)
         except Exception as e:
-            logger.error(f"Monitor loop error: {e}")
-        
-        # Sleep for 30 seconds before next check
-        _stop_event.wait(30)
-    
-    logger.info("Portfolio monitor background loop stopped")
+            logger.error(f"Claiming due monitors failed: {e}")
+            with self._lock:
+                self._counters['claim_errors'] += 1
+            return 0
+
+        for row in rows:
+            monitor_id = int(row.get('id'))
+            monitor_user_id = int(row.get('user_id') or 1)
+            with self._lock:
+                self._in_flight[monitor_id] = time.time()
+                self._counters['claimed'] += 1
+                try:
+                    self._lag.append(max(0.0, float(row.get('lag_sec') or 0)))
+                except (TypeError, ValueError):
+                    pass
+            logger.info(f"Running due monitor #{monitor_id} for user #{monitor_user_id} (lag {float(row.get('lag_sec') or 0):.1f}s)")
+            self._executor.submit(self._run, monitor_id, monitor_user_id)
+        return len(rows)
+
+    def _run(self, monitor_id: int, monitor_user_id: int) -> None:
+        started = time.time()
+        outcome = 'failed'
+        try:
+            result = run_single_monitor(monitor_id, user_id=monitor_user_id, deadline=started + self.run_timeout_sec)
+            if result.get('timed_out'):
+                outcome = 'timed_out'
+            elif result.get('success'):
+                outcome = 'completed'
+        except Exception as e:
+            logger.error(f"Monitor #{monitor_id} execution failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(monitor_id, None)
+                self._durations.append(time.time() - started)
+                self._counters[outcome] += 1
+            # A worker is free again; claim the next due monitor without waiting for the poll
+            self._wake.set()
+
+    def loop(self) -> None:
+        logger.info(f"Portfolio monitor background loop started ({self.workers} workers)")
+        while not _stop_event.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Monitor loop error: {e}")
+            self._wake.wait(self.poll_sec)
+            self._wake.clear()
+        logger.info("Portfolio monitor background loop stopped")
+
+    def stop(self) -> None:
+        self._wake.set()
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        def _summary(samples: List[float]) -> Dict[str, Any]:
+            if not samples:
+                return {'count': 0}
+            ordered = sorted(samples)
+            pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+            return {
+                'count': len(ordered),
+                'p50_sec': pick(0.50),
+                'p95_sec': pick(0.95),
+                'max_sec': round(ordered[-1], 1),
+            }
+
+        now = time.time()
+        with self._lock:
+            lag = list(self._lag)
+            durations = list(self._durations)
+            counters = dict(self._counters)
+            in_flight = {str(k): round(now - v, 1) for k, v in self._in_flight.items()}
+        return {
+            'workers': self.workers,
+            'run_timeout_sec': self.run_timeout_sec,
+            'in_flight': in_flight,
+            **counters,
+            'schedule_lag': _summary(lag),
+            'run_duration': _summary(durations),
+        }
+
+
+_runner: Optional[_MonitorRunner] = None
+
+
+def _monitor_loop():
+    """Background loop that claims and runs due monitors (price/pnl alerts run in _alert_loop)."""
+    _runner.loop()
+
+
+def get_monitor_stats() -> Dict[str, Any]:
+    """Scheduled monitor runner stats (schedule lag, run durations, outcomes)."""
+    if _runner is None:
+        return {'running': False}
+    stats = _runner.get_stats()
+    stats['running'] = bool(_monitor_thread and _monitor_thread.is_alive())
+    return stats
+
+
+def _alert_loop():
+    """Background loop that checks price/pnl alerts for all users every ALERT_CHECK_INTERVAL_SEC."""
+    interval = max(0.5, float(os.getenv('ALERT_CHECK_INTERVAL_SEC', '5')))
+    logger.info(f"Position alert loop started (interval {interval}s)")
+    while not _stop_event.is_set():
+        _check_position_alerts()
+        _stop_event.wait(interval)
+    logger.info("Position alert loop stopped")
 
 
 def start_monitor_service():
     """Start the background monitor service."""
-    global _monitor_thread
+    global _monitor_thread, _alert_thread, _runner
     
     if _monitor_thread and _monitor_thread.is_alive():
         logger.info("Portfolio monitor service already running")
         return
     
     _stop_event.clear()
+    if _runner is None:
+        _runner = _MonitorRunner()
     _monitor_thread = threading.Thread(target=_monitor_loop, daemon=True, name="PortfolioMonitor")
     _monitor_thread.start()
+    _alert_thread = threading.Thread(target=_alert_loop, daemon=True, name="PositionAlerts")
+    _alert_thread.start()
     logger.info("Portfolio monitor service started")
 
 
 def stop_monitor_service():
     """Stop the background monitor service."""
-    global _monitor_thread
+    global _monitor_thread, _alert_thread, _runner
     
     _stop_event.set()
+    if _runner is not None:
+        _runner.stop()
     if _monitor_thread:
         _monitor_thread.join(timeout=5)
         _monitor_thread = None
+    if _alert_thread:
+        _alert_thread.join(timeout=5)
+        _alert_thread = None
+    _runner = None
     logger.info("Portfolio monitor service stopped")
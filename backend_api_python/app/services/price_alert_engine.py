@@ -0,0 +1,403 @@
+"""
+In-memory evaluation engine for price / P&L alerts (qd_position_alerts).
+
+Every alert reduces to a price level that is crossed either upwards or downwards:
+
+- price_above / price_below: the threshold itself
+- pnl_above / pnl_below: the price at which the position's P&L % reaches the threshold
+  (entry * (1 ± threshold / 100), direction flipped for short positions)
+
+Active alerts are kept indexed by (market, symbol) with two sorted level arrays per symbol, so
+all alerts of a symbol are evaluated with two bisections when its price changes, independent of
+how many alerts it has. Symbols whose price did not change (and that have no repeat alert coming
+due) are skipped.
+
+Alerts are reloaded incrementally: rows whose alert or position changed since the last load
+(updated_at watermark) plus the list of active ids to drop deleted/deactivated ones. In-process
+edits call `request_reload()` for an immediate full reload; a full reload also runs every
+ALERT_ENGINE_RESYNC_SEC as a safety net.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.services.kline import KlineService
+from app.utils.db import get_db_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_ABOVE = 1   # triggers when price >= level
+_BELOW = -1  # triggers when price <= level
+_NEVER = float('inf')
+
+_ALERT_COLUMNS = """
+    SELECT a.id, a.user_id, a.position_id, a.market, a.symbol, a.alert_type, a.threshold,
+           a.notification_config, a.is_active, a.is_triggered, a.last_triggered_at, a.repeat_interval,
+           p.entry_price, p.quantity, p.side, p.name as position_name,
+           GREATEST(a.updated_at, p.updated_at) AS changed_at
+    FROM qd_position_alerts a
+    LEFT JOIN qd_manual_positions p ON a.position_id = p.id
+"""
+
+
+def _to_epoch(value: Any) -> Optional[float]:
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        # Naive timestamps are treated as UTC (as the monitor always did)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PriceAlert:
+    """One active alert with its precomputed trigger level."""
+
+    __slots__ = (
+        'id', 'user_id', 'market', 'symbol', 'alert_type', 'threshold', 'notification_config',
+        'entry_price', 'quantity', 'side', 'position_name', 'repeat_interval', 'level', 'direction', 'ready_at',
+    )
+
+    def __init__(self, row: Dict[str, Any]):
+        self.id = int(row['id'])
+        self.user_id = int(row.get('user_id') or 1)
+        self.market = row.get('market')
+        self.symbol = row.get('symbol')
+        self.alert_type = row.get('alert_type')
+        self.threshold = float(row.get('threshold') or 0)
+        try:
+            config = json.loads(row.get('notification_config') or '{}')
+        except Exception:
+            config = {}
+        self.notification_config = config if isinstance(config, dict) else {}
+        self.entry_price = float(row.get('entry_price') or 0)
+        self.quantity = float(row.get('quantity') or 0)
+        self.side = row.get('side') or 'long'
+        self.position_name = row.get('position_name')
+        self.repeat_interval = int(row.get('repeat_interval') or 0)
+        self.level, self.direction = self._trigger_level()
+        self.ready_at = self._ready_at(bool(row.get('is_triggered')), _to_epoch(row.get('last_triggered_at')))
+
+    def _trigger_level(self) -> Tuple[Optional[float], int]:
+        if self.alert_type == 'price_above':
+            return self.threshold, _ABOVE
+        if self.alert_type == 'price_below':
+            return self.threshold, _BELOW
+        if self.alert_type in ('pnl_above', 'pnl_below'):
+            if self.entry_price <= 0 or self.quantity <= 0:
+                return None, 0
+            move = self.entry_price * self.threshold / 100
+            if self.side == 'long':
+                return self.entry_price + move, (_ABOVE if self.alert_type == 'pnl_above' else _BELOW)
+            return self.entry_price - move, (_BELOW if self.alert_type == 'pnl_above' else _ABOVE)
+        return None, 0
+
+    def _ready_at(self, is_triggered: bool, last_triggered_at: Optional[float]) -> float:
+        # Not triggered yet, or triggered and the repeat interval has passed
+        if not is_triggered:
+            return 0.0
+        if self.repeat_interval > 0 and last_triggered_at:
+            return last_triggered_at + self.repeat_interval
+        return _NEVER
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.market, self.symbol
+
+    def pnl_percent(self, price: float) -> float:
+        if self.entry_price <= 0 or self.quantity <= 0:
+            return 0.0
+        if self.side == 'long':
+            pnl = (price - self.entry_price) * self.quantity
+        else:
+            pnl = (self.entry_price - price) * self.quantity
+        return pnl / (self.entry_price * self.quantity) * 100
+
+
+class _SymbolBook:
+    """Alerts of one (market, symbol) as sorted level arrays."""
+
+    __slots__ = ('ids', 'above_levels', 'above_ids', 'below_levels', 'below_ids',
+                 'min_ready', 'next_ready', 'last_price', 'dirty')
+
+    def __init__(self):
+        self.ids: set = set()
+        self.above_levels: List[float] = []
+        self.above_ids: List[int] = []
+        self.below_levels: List[float] = []
+        self.below_ids: List[int] = []
+        self.min_ready = _NEVER   # earliest ready_at of any alert in the book
+        self.next_ready = _NEVER  # earliest ready_at of a crossed alert still waiting to repeat
+        self.last_price: Optional[float] = None
+        self.dirty = True
+
+    def rebuild(self, alerts: Dict[int, PriceAlert]) -> None:
+        above, below = [], []
+        self.min_ready = _NEVER
+        for alert_id in self.ids:
+            alert = alerts[alert_id]
+            (above if alert.direction == _ABOVE else below).append((alert.level, alert_id))
+            self.min_ready = min(self.min_ready, alert.ready_at)
+        above.sort()
+        below.sort()
+        self.above_levels = [level for level, _ in above]
+        self.above_ids = [alert_id for _, alert_id in above]
+        self.below_levels = [level for level, _ in below]
+        self.below_ids = [alert_id for _, alert_id in below]
+        self.next_ready = _NEVER
+        self.dirty = False
+
+    def crossed(self, price: float) -> List[int]:
+        """Ids of all alerts whose level the price is at or beyond."""
+        return self.above_ids[:bisect_right(self.above_levels, price)] + \
+            self.below_ids[bisect_left(self.below_levels, price):]
+
+
+class PriceAlertEngine:
+    """Indexed, incrementally reloaded price/P&L alert evaluation."""
+
+    def __init__(self, reload_sec: Optional[float] = None, resync_sec: Optional[float] = None):
+        self.reload_sec = float(reload_sec if reload_sec is not None else os.getenv('ALERT_ENGINE_RELOAD_SEC', '5'))
+        self.resync_sec = float(resync_sec if resync_sec is not None else os.getenv('ALERT_ENGINE_RESYNC_SEC', '300'))
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+        self._kline_service = KlineService()
+        self._alerts: Dict[int, PriceAlert] = {}
+        self._books: Dict[Hashable, _SymbolBook] = {}
+        self._watermark: Optional[datetime] = None
+        self._reloaded_at = 0.0
+        self._resynced_at = 0.0
+        self._reload_requested = True
+        self._stats = {
+            'checks': 0, 'symbols_evaluated': 0, 'symbols_skipped': 0, 'triggered': 0,
+            'full_reloads': 0, 'incremental_reloads': 0, 'rows_reloaded': 0, 'reload_errors': 0,
+            'last_check_ms': 0.0,
+        }
+
+    # ---------------------------------------------------------------- index
+
+    def _remove(self, alert_id: int) -> None:
+        # Caller holds self._lock
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return
+        book = self._books.get(alert.key)
+        if book is not None:
+            book.ids.discard(alert_id)
+            book.dirty = True
+            if not book.ids:
+                del self._books[alert.key]
+
+    def _upsert(self, row: Dict[str, Any]) -> None:
+        # Caller holds self._lock
+        alert_id = int(row['id'])
+        self._remove(alert_id)
+        if not int(row.get('is_active') or 0):
+            return
+        alert = PriceAlert(row)
+        if not alert.market or not alert.symbol or alert.level is None or alert.ready_at == _NEVER:
+            return
+        self._alerts[alert_id] = alert
+        book = self._books.get(alert.key)
+        if book is None:
+            book = self._books[alert.key] = _SymbolBook()
+        book.ids.add(alert_id)
+        book.dirty = True
+
+    def request_reload(self) -> None:
+        """Reload all alerts before the next check (call after editing alerts or positions)."""
+        with self._lock:
+            self._reload_requested = True
+
+    def reload(self, full: bool = False) -> int:
+        """
+        Load changed alerts from the DB.
+
+        Args:
+            full: Re-read all active alerts instead of only rows changed since the last load
+
+        Returns:
+            Number of rows read
+        """
+        started = time.time()
+        watermark = self._watermark
+        full = full or watermark is None
+        with get_db_connection() as db:
+            cur = db.cursor()
+            if full:
+                cur.execute(_ALERT_COLUMNS + " WHERE a.is_active = 1")
+                rows = cur.fetchall() or []
+                active_ids = None
+            else:
+                # >= : rows sharing the watermark timestamp are re-read rather than missed
+                cur.execute(_ALERT_COLUMNS + " WHERE a.updated_at >= ? OR p.updated_at >= ?", (watermark, watermark))
+                rows = cur.fetchall() or []
+                cur.execute("SELECT id FROM qd_position_alerts WHERE is_active = 1")
+                active_ids = {int(r['id']) for r in cur.fetchall() or []}
+            cur.close()
+
+        with self._lock:
+            if full:
+                self._alerts.clear()
+                self._books.clear()
+                self._resynced_at = started
+                self._stats['full_reloads'] += 1
+            else:
+                for alert_id in [i for i in self._alerts if i not in active_ids]:
+                    self._remove(alert_id)
+                self._stats['incremental_reloads'] += 1
+            for row in rows:
+                try:
+                    self._upsert(row)
+                except Exception as e:
+                    logger.warning(f"Skipping malformed alert #{row.get('id')}: {e}")
+                changed_at = row.get('changed_at')
+                if changed_at is not None and (watermark is None or changed_at > watermark):
+                    watermark = changed_at
+            self._watermark = watermark
+            self._reloaded_at = started
+            self._stats['rows_reloaded'] += len(rows)
+        return len(rows)
+
+    def _maybe_reload(self) -> None:
+        now = time.time()
+        with self._lock:
+            full = self._reload_requested or now - self._resynced_at >= self.resync_sec
+            due = full or now - self._reloaded_at >= self.reload_sec
+            self._reload_requested = False
+        if not due:
+            return
+        try:
+            self.reload(full=full)
+        except Exception as e:
+            logger.warning(f"Alert reload failed: {e}")
+            with self._lock:
+                self._stats['reload_errors'] += 1
+                if full:
+                    self._reload_requested = True
+
+    # ---------------------------------------------------------------- evaluation
+
+    def evaluate(self, key: Hashable, price: float, now: Optional[float] = None) -> List[PriceAlert]:
+        """
+        Evaluate all alerts of one symbol against its new price.
+
+        Returns:
+            Alerts that fired (they are marked triggered in memory; the caller persists/notifies)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            book = self._books.get(key)
+            if book is None or price <= 0:
+                return []
+            if book.dirty:
+                book.rebuild(self._alerts)
+            elif price == book.last_price and now < book.next_ready:
+                self._stats['symbols_skipped'] += 1
+                return []
+            book.last_price = price
+            book.next_ready = _NEVER
+            self._stats['symbols_evaluated'] += 1
+
+            fired = []
+            for alert_id in book.crossed(price):
+                alert = self._alerts[alert_id]
+                if alert.ready_at <= now:
+                    fired.append(alert)
+                else:
+                    book.next_ready = min(book.next_ready, alert.ready_at)
+            for alert in fired:
+                if alert.repeat_interval > 0:
+                    alert.ready_at = now + alert.repeat_interval
+                    book.next_ready = min(book.next_ready, alert.ready_at)
+                    book.dirty = True
+                else:
+                    self._remove(alert.id)
+            self._stats['triggered'] += len(fired)
+            return fired
+
+    def check_once(self, on_trigger: Callable[[PriceAlert, float], None]) -> int:
+        """
+        Reload changed alerts, fetch prices of all symbols with an alert that can fire, evaluate them
+        and persist + report the triggered alerts.
+
+        Returns:
+            Number of alerts triggered
+        """
+        with self._check_lock:
+            started = time.time()
+            self._maybe_reload()
+            with self._lock:
+                keys = [key for key, book in self._books.items() if book.min_ready <= started or book.dirty]
+            prices = self._kline_service.get_realtime_price_snapshot(keys) if keys else {}
+
+            fired: List[Tuple[PriceAlert, float]] = []
+            now = time.time()
+            for key in keys:
+                price = float((prices.get(key) or {}).get('price') or 0)
+                for alert in self.evaluate(key, price, now):
+                    fired.append((alert, price))
+
+            if fired:
+                self._mark_triggered([alert.id for alert, _ in fired])
+                for alert, price in fired:
+                    try:
+                        on_trigger(alert, price)
+                    except Exception as e:
+                        logger.warning(f"Alert #{alert.id} notification failed: {e}")
+
+            with self._lock:
+                self._stats['checks'] += 1
+                self._stats['last_check_ms'] = round((time.time() - started) * 1000, 1)
+            return len(fired)
+
+    def _mark_triggered(self, alert_ids: List[int]) -> None:
+        try:
+            with get_db_connection() as db:
+                cur = db.cursor()
+                cur.execute(
+                    """
+                    UPDATE qd_position_alerts
+                    SET is_triggered = 1, last_triggered_at = NOW(), trigger_count = trigger_count + 1, updated_at = NOW()
+                    WHERE id = ANY(?)
+                    """,
+                    (list(alert_ids),)
+                )
+                db.commit()
+                cur.close()
+        except Exception as e:
+            logger.error(f"Failed to mark alerts triggered {alert_ids}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'alerts': len(self._alerts),
+                'symbols': len(self._books),
+                'reload_sec': self.reload_sec,
+                'snapshot_age_sec': round(time.time() - self._reloaded_at, 1) if self._reloaded_at else None,
+            })
+            return stats
+
+
+_engine: Optional[PriceAlertEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_price_alert_engine() -> PriceAlertEngine:
+    """Process-wide price alert engine (lazily created)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PriceAlertEngine()
+    return _engine
@@ -8,6 +8,7 @@ from datetime import datetime
 
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
+from app.services.strategy_status import get_strategy_status_registry
 
 logger = get_logger(__name__)
 
@@ -445,8 +446,14 @@ class StrategyService:
                         "UPDATE qd_strategies_trading SET status = ?, updated_at = NOW() WHERE id = ?",
                         (status, strategy_id)
                     )
+                changed = bool(cur.rowcount)
+                if changed:
+                    get_strategy_status_registry().publish(cur, strategy_id, status)
                 db.commit()
                 cur.close()
+            if changed:
+                # Running strategy loops read status from the in-process registry
+                get_strategy_status_registry().set_status(strategy_id, status)
             return True
         except Exception as e:
             logger.error(f"update_strategy_status failed: {e}")
@@ -822,8 +829,13 @@ class StrategyService:
                     cur.execute("DELETE FROM qd_strategies_trading WHERE id = ? AND user_id = ?", (strategy_id, user_id))
                 else:
                     cur.execute("DELETE FROM qd_strategies_trading WHERE id = ?", (strategy_id,))
+                deleted = bool(cur.rowcount)
+                if deleted:
+                    get_strategy_status_registry().publish(cur, strategy_id, None)
                 db.commit()
                 cur.close()
+            if deleted:
+                get_strategy_status_registry().set_status(strategy_id, None)
             return True
         except Exception as e:
             logger.error(f"delete_strategy failed: {e}")
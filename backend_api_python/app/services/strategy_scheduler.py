@@ -0,0 +1,255 @@
+"""
+Central scheduler for live strategy loops.
+
+Each strategy loop is a generator that runs one step (initialization, or one tick) per
+`next()` call and yields the number of seconds until it wants to run again. The scheduler
+keeps a heap of due times; a single dispatcher thread hands due steps to a bounded worker
+pool, so the number of threads stays fixed no matter how many strategies are running.
+
+A strategy never has more than one step in flight. Lag (step start - due time) and step
+duration are tracked per strategy and exposed through `get_stats()`.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Generator, Hashable, List, Optional, Tuple
+
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Smoothing factor of the moving averages in per-strategy stats
+_EWMA_ALPHA = 0.2
+
+
+class _Job:
+    __slots__ = (
+        'key', 'steps', 'due', 'seq', 'running', 'cancelled',
+        'ticks', 'last_lag', 'avg_lag', 'max_lag', 'last_duration', 'avg_duration', 'started_at',
+    )
+
+    def __init__(self, key: Hashable, steps: Generator[float, None, None]):
+        self.key = key
+        self.steps = steps
+        self.due = 0.0
+        self.seq = 0
+        self.running = False
+        self.cancelled = False
+        self.ticks = 0
+        self.last_lag = 0.0
+        self.avg_lag = 0.0
+        self.max_lag = 0.0
+        self.last_duration = 0.0
+        self.avg_duration = 0.0
+        self.started_at = time.time()
+
+    def record(self, lag: float, duration: float) -> None:
+        if self.ticks == 0:
+            self.avg_lag, self.avg_duration = lag, duration
+        else:
+            self.avg_lag += _EWMA_ALPHA * (lag - self.avg_lag)
+            self.avg_duration += _EWMA_ALPHA * (duration - self.avg_duration)
+        self.ticks += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.last_duration = duration
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            'ticks': self.ticks,
+            'running': self.running,
+            'cancelled': self.cancelled,
+            'next_due_in_ms': round(max(self.due - now, 0.0) * 1000, 1) if not self.running else 0.0,
+            'last_lag_ms': round(self.last_lag * 1000, 1),
+            'avg_lag_ms': round(self.avg_lag * 1000, 1),
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'last_duration_ms': round(self.last_duration * 1000, 1),
+            'avg_duration_ms': round(self.avg_duration * 1000, 1),
+            'uptime_sec': round(now - self.started_at, 1),
+        }
+
+
+class StrategyScheduler:
+    """Timer heap + bounded worker pool driving strategy step generators."""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max(1, int(max_workers or os.getenv('STRATEGY_SCHEDULER_WORKERS', '16')))
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._jobs: Dict[Hashable, _Job] = {}
+        self._seq = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self._in_flight = 0
+        self._total_steps = 0
+        self._total_errors = 0
+
+    def _ensure_started(self) -> None:
+        # Caller holds self._cond
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='strategy-worker')
+        if self._dispatcher is None or not self._dispatcher.is_alive():
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='strategy-scheduler', daemon=True)
+            self._dispatcher.start()
+
+    def _push(self, job: _Job, due: float) -> None:
+        # Caller holds self._cond
+        job.due = due
+        job.seq = next(self._seq)
+        heapq.heappush(self._heap, (due, job.seq, job.key))
+        self._cond.notify()
+
+    def register(self, key: Hashable, steps: Generator[float, None, None], delay: float = 0.0) -> bool:
+        """
+        Schedule a step generator; its first step runs after `delay` seconds.
+
+        Returns:
+            False if `key` is still registered (including a cancelled job whose last step is finishing)
+        """
+        with self._cond:
+            if key in self._jobs:
+                return False
+            job = _Job(key, steps)
+            self._jobs[key] = job
+            self._ensure_started()
+            self._push(job, time.time() + max(float(delay or 0.0), 0.0))
+            return True
+
+    def unregister(self, key: Hashable) -> bool:
+        """
+        Cancel a job. An in-flight step finishes first; the generator is then closed on a worker
+        (so its `finally` cleanup runs there, never on the caller's thread).
+        """
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is None or job.cancelled:
+                return False
+            job.cancelled = True
+            if not job.running:
+                job.running = True
+                self._in_flight += 1
+                self._executor.submit(self._close, job)
+            return True
+
+    def is_scheduled(self, key: Hashable) -> bool:
+        with self._cond:
+            job = self._jobs.get(key)
+            return job is not None and not job.cancelled
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(1 for job in self._jobs.values() if not job.cancelled)
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    # Only hand out as many steps as there are workers; the rest wait in the heap
+                    # (and show up as overdue) instead of piling up in the executor queue.
+                    if self._in_flight >= self.max_workers:
+                        self._cond.wait()
+                        continue
+                    if self._heap and self._heap[0][0] <= now:
+                        due, seq, key = heapq.heappop(self._heap)
+                        job = self._jobs.get(key)
+                        # Entries of cancelled jobs or superseded pushes are skipped
+                        if job is None or job.cancelled or job.running or job.seq != seq:
+                            continue
+                        job.running = True
+                        self._in_flight += 1
+                        break
+                    self._cond.wait(timeout=(self._heap[0][0] - now) if self._heap else None)
+            try:
+                self._executor.submit(self._run_step, job, due)
+            except RuntimeError as e:
+                # Executor shut down (interpreter exit)
+                logger.info(f"Strategy scheduler stopped: {e}")
+                return
+
+    def _run_step(self, job: _Job, due: float) -> None:
+        started = time.time()
+        delay: Optional[float] = None
+        try:
+            delay = next(job.steps)
+        except StopIteration:
+            delay = None
+        except Exception as e:
+            # The generator is finished after raising; drop the job.
+            logger.error(f"Strategy {job.key} step raised: {e}")
+            logger.error(traceback.format_exc())
+            with self._cond:
+                self._total_errors += 1
+            delay = None
+        finished = time.time()
+
+        with self._cond:
+            job.record(max(started - due, 0.0), finished - started)
+            self._total_steps += 1
+            if delay is None:
+                self._finish(job)
+                return
+            # A job cancelled during this step keeps `running` set until _close releases it
+            if not job.cancelled:
+                job.running = False
+                self._in_flight -= 1
+                self._cond.notify()
+                try:
+                    wait = max(float(delay or 0.0), 0.0)
+                except (TypeError, ValueError):
+                    wait = 0.0
+                self._push(job, finished + wait)
+                return
+        self._close(job)
+
+    def _close(self, job: _Job) -> None:
+        try:
+            job.steps.close()
+        except Exception as e:
+            logger.warning(f"Strategy {job.key} close raised: {e}")
+        with self._cond:
+            self._finish(job)
+
+    def _finish(self, job: _Job) -> None:
+        # Caller holds self._cond
+        self._in_flight -= 1
+        self._cond.notify()
+        job.running = False
+        if self._jobs.get(job.key) is job:
+            del self._jobs[job.key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.time()
+            jobs = {str(key): job.to_dict(now) for key, job in self._jobs.items()}
+            overdue = sum(1 for due, seq, key in self._heap
+                          if due <= now and key in self._jobs and self._jobs[key].seq == seq)
+            lags = [job.last_lag for job in self._jobs.values() if job.ticks]
+            return {
+                'workers': self.max_workers,
+                'scheduled': sum(1 for job in self._jobs.values() if not job.cancelled),
+                'in_flight': self._in_flight,
+                'overdue': overdue,
+                'total_steps': self._total_steps,
+                'total_errors': self._total_errors,
+                'max_last_lag_ms': round(max(lags) * 1000, 1) if lags else 0.0,
+                'strategies': jobs,
+            }
+
+
+_scheduler: Optional[StrategyScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_strategy_scheduler() -> StrategyScheduler:
+    """Process-wide strategy scheduler (lazily created)."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = StrategyScheduler()
+    return _scheduler
@@ -0,0 +1,212 @@
+"""
+In-process registry of strategy run status.
+
+Strategy loops check `is_running()` on every tick. Instead of one
+`SELECT status FROM qd_strategies_trading` per strategy per tick, the registry keeps a
+snapshot of the running strategy ids, refreshed with a single batched query at most every
+STRATEGY_STATUS_REFRESH_SEC seconds, so DB load does not grow with the number of strategies.
+
+Status changes made through this process (`StrategyService.update_strategy_status`,
+`TradingExecutor.stop_strategy`) are published with NOTIFY on the `qd_strategy_status`
+channel inside the writing transaction and applied to the local snapshot once it commits. When STRATEGY_STATUS_LISTEN is
+enabled a background thread LISTENs on that channel, so changes made by other processes
+arrive without waiting for the next refresh; the snapshot is then only re-read every
+STRATEGY_STATUS_RESYNC_SEC seconds as a safety net (e.g. for rows edited by hand).
+"""
+import json
+import os
+import select
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from app.utils.db import get_db_connection, get_db_listen_connection
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+STATUS_CHANNEL = 'qd_strategy_status'
+
+
+class StrategyStatusRegistry:
+    """Snapshot of running strategy ids with batched refresh and LISTEN/NOTIFY updates."""
+
+    def __init__(self):
+        self.refresh_sec = max(0.1, float(os.getenv('STRATEGY_STATUS_REFRESH_SEC', '2')))
+        self.resync_sec = max(self.refresh_sec, float(os.getenv('STRATEGY_STATUS_RESYNC_SEC', '60')))
+        self.listen_enabled = os.getenv('STRATEGY_STATUS_LISTEN', 'true').strip().lower() in ('1', 'true', 'yes')
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._running: Set[int] = set()
+        self._loaded = False
+        self._refreshed_at = 0.0
+        # Ids already checked once; the first check of a new id forces a refresh so a strategy
+        # that was just set to running by another writer is never seen as stopped.
+        self._seen: Set[int] = set()
+        self._listener: Optional[threading.Thread] = None
+        self._listening = False
+        self._stats = {'lookups': 0, 'refreshes': 0, 'refresh_errors': 0, 'notifications': 0, 'published': 0}
+
+    # ---------------------------------------------------------------- lookups
+
+    def is_running(self, strategy_id: int) -> bool:
+        strategy_id = int(strategy_id)
+        with self._lock:
+            self._stats['lookups'] += 1
+            first_check = strategy_id not in self._seen
+            self._seen.add(strategy_id)
+            max_age = self.resync_sec if self._listening else self.refresh_sec
+            stale = (not self._loaded) or first_check or (time.time() - self._refreshed_at) >= max_age
+        if stale:
+            self.refresh(wait=first_check or not self._loaded)
+        with self._lock:
+            return strategy_id in self._running
+
+    def refresh(self, wait: bool = True) -> bool:
+        """
+        Reload the running-id snapshot with one query.
+
+        Args:
+            wait: If another thread is already refreshing, wait for it (True) or keep using the
+                  current snapshot (False).
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return False
+        try:
+            started = time.time()
+            try:
+                with get_db_connection() as db:
+                    cursor = db.cursor()
+                    cursor.execute("SELECT id FROM qd_strategies_trading WHERE status = 'running'")
+                    rows = cursor.fetchall() or []
+                    cursor.close()
+            except Exception as e:
+                # Keep the previous snapshot; retry on the next lookup after refresh_sec.
+                logger.warning(f"Strategy status refresh failed: {e}")
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+                    self._refreshed_at = started
+                return False
+            with self._lock:
+                self._running = {int(row['id']) for row in rows}
+                self._loaded = True
+                self._refreshed_at = started
+                self._stats['refreshes'] += 1
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    # ---------------------------------------------------------------- updates
+
+    def set_status(self, strategy_id: int, status: Optional[str]) -> None:
+        """Apply a status change to the local snapshot (None = strategy deleted)."""
+        strategy_id = int(strategy_id)
+        with self._lock:
+            if status == 'running':
+                self._running.add(strategy_id)
+            else:
+                self._running.discard(strategy_id)
+
+    def publish(self, cursor: Any, strategy_id: int, status: Optional[str]) -> None:
+        """
+        NOTIFY other processes of a status change.
+
+        `cursor` should belong to the transaction that changed the row, so the notification is
+        delivered only if that transaction commits. The NOTIFY runs inside a savepoint: a failure
+        is rolled back to it and logged without aborting the caller's transaction. The local
+        snapshot is not touched; call `set_status` after the commit succeeds.
+        """
+        try:
+            cursor.execute("SAVEPOINT qd_strategy_status_notify")
+        except Exception as e:
+            logger.warning(f"Strategy status notify skipped for {strategy_id}: {e}")
+            return
+        try:
+            payload = json.dumps({'id': int(strategy_id), 'status': status})
+            cursor.execute("SELECT pg_notify(?, ?)", (STATUS_CHANNEL, payload))
+            cursor.execute("RELEASE SAVEPOINT qd_strategy_status_notify")
+            with self._lock:
+                self._stats['published'] += 1
+        except Exception as e:
+            logger.warning(f"Strategy status notify failed for {strategy_id}: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT qd_strategy_status_notify")
+
+    def _apply_notification(self, payload: str) -> None:
+        try:
+            data = json.loads(payload or '{}')
+            self.set_status(int(data['id']), data.get('status'))
+            with self._lock:
+                self._stats['notifications'] += 1
+        except Exception as e:
+            logger.warning(f"Ignoring malformed strategy status notification {payload!r}: {e}")
+
+    # ---------------------------------------------------------------- listener
+
+    def start_listener(self) -> bool:
+        """Start the LISTEN thread (no-op if disabled or already running)."""
+        if not self.listen_enabled:
+            return False
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return True
+            self._listener = threading.Thread(target=self._listen_loop, name='strategy-status-listener', daemon=True)
+            self._listener.start()
+            return True
+
+    def _listen_loop(self) -> None:
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = get_db_listen_connection()
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {STATUS_CHANNEL}")
+                with self._lock:
+                    self._listening = True
+                # Changes made while disconnected were missed; resync once.
+                self.refresh(wait=True)
+                backoff = 1.0
+                logger.info(f"Listening for strategy status changes on '{STATUS_CHANNEL}'")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._apply_notification(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.warning(f"Strategy status listener disconnected: {e}; polling every {self.refresh_sec}s until reconnected")
+            finally:
+                with self._lock:
+                    self._listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'running': len(self._running),
+                'listening': self._listening,
+                'snapshot_age_sec': round(time.time() - self._refreshed_at, 1) if self._loaded else None,
+                'refresh_sec': self.refresh_sec,
+            })
+            return stats
+
+
+_registry: Optional[StrategyStatusRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_strategy_status_registry() -> StrategyStatusRegistry:
+    """Process-wide strategy status registry (lazily created)."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = StrategyStatusRegistry()
+    return _registry
@@ -19,25 +19,35 @@ import ccxt
 
 from app.utils.logger import get_logger
 from app.utils.db import get_db_connection
-from app.data_sources import DataSourceFactory
 from app.services.kline import KlineService
+from app.services.live_indicator import CandleWindow, IncrementalIndicator
+from app.services.strategy_scheduler import get_strategy_scheduler
+from app.services.strategy_status import get_strategy_status_registry
+from app.services.market_data_hub import get_market_data_hub
+from app.services.pending_order_worker import PENDING_ORDERS_CHANNEL
+from app.utils.safe_exec import build_sandbox_globals, get_compiled_code_cache
 
 logger = get_logger(__name__)
 
+# Modules live indicator scripts may import
+EXECUTOR_ALLOWED_MODULES = ('numpy', 'pandas', 'math', 'json', 'time')
+
 
 class TradingExecutor:
     """实时交易执行器 (Signal Provider Mode)"""
     
     def __init__(self):
         # 不再使用全局连接，改为每次使用时从连接池获取
-        self.running_strategies = {}  # {strategy_id: thread}
+        self.running_strategies = {}  # {strategy_id: started_at}
+        # 策略循环由共享调度器驱动（定时堆 + 固定大小线程池），不再每个策略一个线程
+        self.scheduler = get_strategy_scheduler()
+        # 每个 tick 的运行状态检查走内存快照（批量刷新 + LISTEN/NOTIFY），不再逐策略查库
+        self.status_registry = get_strategy_status_registry()
+        self.status_registry.start_listener()
         self.lock = threading.Lock()
-        # Local-only lightweight in-memory price cache (symbol -> (price, expiry_ts)).
-        # This replaces the old Redis-based PriceCache for local deployments.
-        self._price_cache = {}
-        self._price_cache_lock = threading.Lock()
-        # Default to 10s to match the unified tick cadence.
-        self._price_cache_ttl_sec = int(os.getenv("PRICE_CACHE_TTL_SEC", "10"))
+        # Shared market-data hub: prices/candles are fetched once per symbol per tick (TTL =
+        # PRICE_CACHE_TTL_SEC) for all strategies, using batch ticker endpoints where available.
+        self.market_data = get_market_data_hub()
 
         # In-memory signal de-dup cache to prevent repeated orders on the same candle signal.
         # Keyed by (strategy_id, symbol, signal_type, signal_timestamp).
@@ -45,8 +55,8 @@ class TradingExecutor:
         self._signal_dedup_lock = threading.Lock()
         self.kline_service = KlineService()   # K线服务（带缓存）
         
-        # 单实例线程上限，避免无限制创建线程导致 can't start new thread/OOM
-        self.max_threads = int(os.getenv('STRATEGY_MAX_THREADS', '64'))
+        # 单实例运行策略上限（线程数由 STRATEGY_SCHEDULER_WORKERS 固定，与策略数量无关）
+        self.max_strategies = int(os.getenv('STRATEGY_MAX_RUNNING', os.getenv('STRATEGY_MAX_THREADS', '2000')))
         
         # 确保数据库字段存在
         self._ensure_db_columns()
@@ -403,15 +413,15 @@ class TradingExecutor:
         """
         try:
             with self.lock:
-                # 清理已退出的线程，防止计数膨胀
-                stale_ids = [sid for sid, th in self.running_strategies.items() if not th.is_alive()]
+                # 清理已退出的策略循环，防止计数膨胀
+                stale_ids = [sid for sid in self.running_strategies if not self.scheduler.is_scheduled(sid)]
                 for sid in stale_ids:
                     del self.running_strategies[sid]
 
-                if len(self.running_strategies) >= self.max_threads:
+                if len(self.running_strategies) >= self.max_strategies:
                     logger.error(
-                        f"Thread limit reached ({self.max_threads}); refuse to start strategy {strategy_id}. "
-                        f"Reduce running strategies or increase STRATEGY_MAX_THREADS."
+                        f"Strategy limit reached ({self.max_strategies}); refuse to start strategy {strategy_id}. "
+                        f"Reduce running strategies or increase STRATEGY_MAX_RUNNING."
                     )
                     self._log_resource_status(prefix="start_denied: ")
                     return False
@@ -420,19 +430,11 @@ class TradingExecutor:
                     logger.warning(f"Strategy {strategy_id} is already running")
                     return False
                 
-                # 创建并启动线程
-                thread = threading.Thread(
-                    target=self._run_strategy_loop,
-                    args=(strategy_id,),
-                    daemon=True
-                )
-                try:
-                    thread.start()
-                except Exception as e:
-                    # 捕获 can't start new thread 等异常，记录资源状态
-                    self._log_resource_status(prefix="启动异常")
-                    raise e
-                self.running_strategies[strategy_id] = thread
+                # 交给调度器：循环生成器每次 next() 执行一步，并返回距下一步的秒数
+                if not self.scheduler.register(strategy_id, self._run_strategy_loop(strategy_id)):
+                    logger.warning(f"Strategy {strategy_id} is still stopping; try again shortly")
+                    return False
+                self.running_strategies[strategy_id] = time.time()
                 
                 logger.info(f"Strategy {strategy_id} started")
                 self._console_print(f"[strategy:{strategy_id}] started")
@@ -466,11 +468,14 @@ class TradingExecutor:
                         "UPDATE qd_strategies_trading SET status = 'stopped' WHERE id = %s",
                         (strategy_id,)
                     )
+                    self.status_registry.publish(cursor, strategy_id, 'stopped')
                     db.commit()
                     cursor.close()
+                self.status_registry.set_status(strategy_id, 'stopped')
                 
-                # 从运行列表中移除（线程会在下次循环检查状态时退出）
+                # 从运行列表与调度器中移除（正在执行的 tick 会先跑完）
                 del self.running_strategies[strategy_id]
+                self.scheduler.unregister(strategy_id)
                 
                 logger.info(f"Strategy {strategy_id} stopped")
                 self._console_print(f"[strategy:{strategy_id}] stopped (requested)")
@@ -483,7 +488,9 @@ class TradingExecutor:
     
     def _run_strategy_loop(self, strategy_id: int):
         """
-        策略运行循环
+        策略运行循环（生成器，由 StrategyScheduler 驱动）
+
+        每次 next() 执行到下一个等待点，yield 距下一步的秒数；生成器结束即策略退出。
         
         Args:
             strategy_id: 策略ID
@@ -559,6 +566,7 @@ class TradingExecutor:
             # 这决定了使用哪个数据源来获取价格和K线数据
             market_category = (strategy.get('market_category') or 'Crypto').strip()
             logger.info(f"Strategy {strategy_id} market_category: {market_category}")
+            self.market_data.subscribe(strategy_id, market_category, symbol, timeframe)
 
             # 初始化交易所连接（信号模式下无需真实连接）
             exchange = None
@@ -622,11 +630,12 @@ class TradingExecutor:
                 return
             logger.info(rf'Strategy {strategy_id} history kline number: {len(klines)}')
             
-            # 转换为DataFrame
-            df = self._klines_to_dataframe(klines)
-            if len(df) == 0:
+            # Rolling candle window: ticks update it in place, refreshes merge only the newest candles
+            window = CandleWindow.from_klines(klines, capacity=max(history_limit, len(klines)))
+            if len(window) == 0:
                 logger.error(f"Strategy {strategy_id} K-lines are empty after normalization")
                 return
+            df = window.to_dataframe()
 
             # ============================================
             # 启动时：完全依赖本地数据库的持仓状态（虚拟持仓）
@@ -636,43 +645,37 @@ class TradingExecutor:
 
             # 获取当前持仓最高价（从本地数据库读取）
             current_pos_list = self._get_current_positions(strategy_id, symbol)
-            initial_highest = 0.0
-            initial_position = 0  # 0=无持仓, 1=多头, -1=空头
-            initial_avg_entry_price = 0.0
-            initial_position_count = 0
-            initial_last_add_price = 0.0
-            
-            if current_pos_list:
-                pos = current_pos_list[0]  # 取第一个持仓（单向持仓模式）
-                initial_highest = float(pos.get('highest_price', 0) or 0)
-                pos_side = pos.get('side', 'long')
-                initial_position = 1 if pos_side == 'long' else -1
-                initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                initial_position_count = 1  # 简化处理，假设是单笔持仓
-                initial_last_add_price = initial_avg_entry_price
+            pos_state = self._indicator_position_state(current_pos_list)
 
             # 关键诊断日志：确认指标是否拿到了持仓状态
             logger.info(
                 f"策略 {strategy_id} 指标注入持仓状态: count={len(current_pos_list)}, "
-                f"position={initial_position}, entry_price={initial_avg_entry_price}, highest={initial_highest}"
+                f"position={pos_state['initial_position']}, entry_price={pos_state['initial_avg_entry_price']}, "
+                f"highest={pos_state['initial_highest_price']}"
             )
 
             # 执行指标代码，获取信号和触发价格
-            indicator_result = self._execute_indicator_with_prices(
-                indicator_code, df, trading_config, 
-                initial_highest_price=initial_highest,
-                initial_position=initial_position,
-                initial_avg_entry_price=initial_avg_entry_price,
-                initial_position_count=initial_position_count,
-                initial_last_add_price=initial_last_add_price
-            )
+            indicator_result = self._execute_indicator_with_prices(indicator_code, df, trading_config, **pos_state)
             if indicator_result is None:
                 logger.error(f"Strategy {strategy_id} indicator execution failed")
                 return
+
+            from app.data_sources.base import TIMEFRAME_SECONDS
+            timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
+
+            # Opt-in incremental mode: the script defines on_bar(state, bar, position)
+            incremental = IncrementalIndicator.from_env(indicator_result.get('exec_env'), timeframe_seconds)
+            if incremental is not None:
+                indicator_result = self._run_incremental_indicator(
+                    incremental, window, trading_config, pos_state, time.time()
+                )
+                if indicator_result is None:
+                    logger.error(f"Strategy {strategy_id} incremental indicator warm-up failed")
+                    return
+                logger.info(f"Strategy {strategy_id} uses incremental indicator evaluation (on_bar)")
             
             # 提取信号和触发价格
             pending_signals = indicator_result.get('pending_signals', [])  # 待触发的信号列表
-            last_kline_time = indicator_result.get('last_kline_time', 0)  # 最后一根K线的时间
             
             logger.info(f"Strategy {strategy_id} initialized; pending_signals={len(pending_signals)}")
             if pending_signals:
@@ -695,9 +698,9 @@ class TradingExecutor:
             last_kline_update_time = time.time()
             
             # 计算K线周期（秒）
-            from app.data_sources.base import TIMEFRAME_SECONDS
-            timeframe_seconds = TIMEFRAME_SECONDS.get(timeframe, 3600)
             kline_update_interval = timeframe_seconds  # 每个K线周期更新一次
+            # Candles fetched per refresh (merged into the window; a gap triggers a full reload)
+            refresh_limit = max(2, int(os.getenv('STRATEGY_KLINE_REFRESH_LIMIT', '5')))
             
             while True:
                 try:
@@ -712,7 +715,7 @@ class TradingExecutor:
                     if last_tick_time > 0:
                         sleep_sec = (last_tick_time + tick_interval_sec) - current_time
                         if sleep_sec > 0:
-                            time.sleep(min(sleep_sec, 1.0))
+                            yield sleep_sec
                             continue
                     last_tick_time = current_time
 
@@ -733,84 +736,72 @@ class TradingExecutor:
                     # 2. 检查是否需要更新K线（每个K线周期更新一次，从API拉取）
                     # ============================================
                     if current_time - last_kline_update_time >= kline_update_interval:
-                        klines = self._fetch_latest_kline(symbol, timeframe, limit=history_limit, market_category=market_category)
-                        if klines and len(klines) >= 2:
-                            df = self._klines_to_dataframe(klines)
-                            if len(df) > 0:
-                                current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
-
+                        klines = self._fetch_latest_kline(symbol, timeframe, limit=refresh_limit, market_category=market_category)
+                        reload_full = False
+                        if klines and not window.merge_klines(klines, timeframe_seconds):
+                            # Gap since the last refresh (e.g. data source outage): reload the whole window
+                            klines = self._fetch_latest_kline(symbol, timeframe, limit=history_limit, market_category=market_category)
+                            if klines and len(klines) >= 2:
+                                window = CandleWindow.from_klines(klines, capacity=max(history_limit, len(klines)))
+                                # on_bar state must be rebuilt from the reloaded history
+                                incremental = None
+                                reload_full = True
+                            else:
+                                klines = None
+                        if klines and len(window) > 0:
+                            current_pos_list = self._get_current_positions(strategy_id, symbol)
+                            pos_state = self._indicator_position_state(current_pos_list)
+
+                            if incremental is not None:
+                                indicator_result = self._run_incremental_indicator(
+                                    incremental, window, trading_config, pos_state, current_time
+                                )
+                            else:
+                                df = window.to_dataframe()
                                 indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
+                                    indicator_code, df, trading_config, **pos_state
                                 )
-                                if indicator_result:
-                                    pending_signals = indicator_result.get('pending_signals', [])
-                                    last_kline_time = indicator_result.get('last_kline_time', 0)
-                                    new_hp = indicator_result.get('new_highest_price', 0)
-
-                                    last_kline_update_time = current_time
-
-                                    # 更新 highest_price（使用最新 close 作为 current_price 的近似）
-                                    if new_hp > 0 and current_pos_list:
-                                        current_close = float(df['close'].iloc[-1])
-                                        for p in current_pos_list:
-                                            self._update_position(
-                                                strategy_id, p['symbol'], p['side'],
-                                                float(p['size']), float(p['entry_price']),
-                                                current_close,
-                                                highest_price=new_hp
-                                            )
+                                if indicator_result and reload_full:
+                                    incremental = IncrementalIndicator.from_env(indicator_result.get('exec_env'), timeframe_seconds)
+                                    if incremental is not None:
+                                        indicator_result = self._run_incremental_indicator(
+                                            incremental, window, trading_config, pos_state, current_time
+                                        )
+                            if indicator_result:
+                                pending_signals = indicator_result.get('pending_signals', [])
+                                new_hp = indicator_result.get('new_highest_price', 0)
+
+                                last_kline_update_time = current_time
+
+                                # 更新 highest_price（使用最新 close 作为 current_price 的近似）
+                                if new_hp > 0 and current_pos_list:
+                                    current_close = float(window.bar(-1)['close'])
+                                    for p in current_pos_list:
+                                        self._update_position(
+                                            strategy_id, p['symbol'], p['side'],
+                                            float(p['size']), float(p['entry_price']),
+                                            current_close,
+                                            highest_price=new_hp
+                                        )
                     else:
                         # ============================================
                         # 3. 非K线更新tick：用当前价更新最后一根K线并重算指标（统一tick节奏）
                         # ============================================
-                        if 'df' in locals() and df is not None and len(df) > 0:
+                        if len(window) > 0:
                             try:
-                                realtime_df = df.copy()
-                                realtime_df = self._update_dataframe_with_current_price(realtime_df, current_price, timeframe)
+                                window.apply_price(current_price, timeframe_seconds, current_time)
 
                                 current_pos_list = self._get_current_positions(strategy_id, symbol)
-                                initial_highest = 0.0
-                                initial_position = 0
-                                initial_avg_entry_price = 0.0
-                                initial_position_count = 0
-                                initial_last_add_price = 0.0
-
-                                if current_pos_list:
-                                    pos = current_pos_list[0]
-                                    initial_highest = float(pos.get('highest_price', 0) or 0)
-                                    pos_side = pos.get('side', 'long')
-                                    initial_position = 1 if pos_side == 'long' else -1
-                                    initial_avg_entry_price = float(pos.get('entry_price', 0) or 0)
-                                    initial_position_count = 1
-                                    initial_last_add_price = initial_avg_entry_price
+                                pos_state = self._indicator_position_state(current_pos_list)
 
-                                indicator_result = self._execute_indicator_with_prices(
-                                    indicator_code, realtime_df, trading_config,
-                                    initial_highest_price=initial_highest,
-                                    initial_position=initial_position,
-                                    initial_avg_entry_price=initial_avg_entry_price,
-                                    initial_position_count=initial_position_count,
-                                    initial_last_add_price=initial_last_add_price
-                                )
+                                if incremental is not None:
+                                    indicator_result = self._run_incremental_indicator(
+                                        incremental, window, trading_config, pos_state, current_time
+                                    )
+                                else:
+                                    indicator_result = self._execute_indicator_with_prices(
+                                        indicator_code, window.to_dataframe(), trading_config, **pos_state
+                                    )
                                 if indicator_result:
                                     pending_signals = indicator_result.get('pending_signals', [])
                                     new_hp = indicator_result.get('new_highest_price', 0)
@@ -1017,7 +1008,7 @@ class TradingExecutor:
                     logger.error(f"Strategy {strategy_id} loop error: {str(e)}")
                     logger.error(traceback.format_exc())
                     self._console_print(f"[strategy:{strategy_id}] loop error: {e}")
-                    time.sleep(5)
+                    yield 5
                     
         except Exception as e:
             logger.error(f"Strategy {strategy_id} crashed: {str(e)}")
@@ -1025,6 +1016,7 @@ class TradingExecutor:
             self._console_print(f"[strategy:{strategy_id}] fatal error: {e}")
         finally:
             # 清理
+            self.market_data.unsubscribe(strategy_id)
             with self.lock:
                 if strategy_id in self.running_strategies:
                     del self.running_strategies[strategy_id]
@@ -1087,18 +1079,10 @@ class TradingExecutor:
             return None
     
     def _is_strategy_running(self, strategy_id: int) -> bool:
-        """检查策略是否在运行"""
+        """检查策略是否在运行（内存快照，见 StrategyStatusRegistry）"""
         try:
-            with get_db_connection() as db:
-                cursor = db.cursor()
-                cursor.execute(
-                    "SELECT status FROM qd_strategies_trading WHERE id = %s",
-                    (strategy_id,)
-                )
-                result = cursor.fetchone()
-                cursor.close()
-                return result and result.get('status') == 'running'
-        except:
+            return self.status_registry.is_running(strategy_id)
+        except Exception:
             return False
     
     def _init_exchange(
@@ -1121,14 +1105,8 @@ class TradingExecutor:
             market_category: 市场类型 (Crypto, USStock, Forex, Futures, AShare, HShare)
         """
         try:
-            # 使用 KlineService 获取K线数据（自动处理缓存）
-            return self.kline_service.get_kline(
-                market=market_category,
-                symbol=symbol,
-                timeframe=timeframe,
-                limit=limit,
-                before_time=int(time.time())
-            )
+            # 经由共享行情中心获取（同一K线周期内多个策略共用一次请求）
+            return self.market_data.get_klines(market_category, symbol, timeframe, limit)
         except Exception as e:
             logger.error(f"Failed to fetch K-lines for {market_category}:{symbol}: {str(e)}")
             return []
@@ -1142,36 +1120,12 @@ class TradingExecutor:
             market_type: 交易类型 (swap/spot)
             market_category: 市场类型 (Crypto, USStock, Forex, Futures, AShare, HShare)
         """
-        # Local in-memory cache first
-        cache_key = f"{market_category}:{(symbol or '').strip().upper()}"
-        if cache_key and self._price_cache_ttl_sec > 0:
-            now = time.time()
-            try:
-                with self._price_cache_lock:
-                    item = self._price_cache.get(cache_key)
-                    if item:
-                        price, expiry = item
-                        if expiry > now:
-                            return float(price)
-                        # expired
-                        del self._price_cache[cache_key]
-            except Exception:
-                pass
-            
         try:
-            # 根据 market_category 选择正确的数据源
+            # 根据 market_category 选择正确的数据源（经由共享行情中心，按 symbol 去重/批量获取）
             # 支持: Crypto, USStock, Forex, Futures, AShare, HShare
-            ticker = DataSourceFactory.get_ticker(market_category, symbol)
-            if ticker:
-                price = float(ticker.get('last') or ticker.get('close') or 0)
-                if price > 0:
-                    if cache_key and self._price_cache_ttl_sec > 0:
-                        try:
-                            with self._price_cache_lock:
-                                self._price_cache[cache_key] = (float(price), time.time() + self._price_cache_ttl_sec)
-                        except Exception:
-                            pass
-                    return price
+            price = self.market_data.get_price(market_category, symbol)
+            if price is not None and price > 0:
+                return price
         except Exception as e:
             logger.warning(f"Failed to fetch price for {market_category}:{symbol}: {e}")
             
@@ -1424,94 +1378,54 @@ class TradingExecutor:
         except Exception:
             return None
     
-    def _klines_to_dataframe(self, klines: List[Dict[str, Any]]) -> pd.DataFrame:
-        """将K线数据转换为DataFrame"""
-        if not klines:
-            # 返回空的 DataFrame，包含正确的列
-            return pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume'])
-        
-        # 创建 DataFrame
-        df = pd.DataFrame(klines)
-        
-        # Convert time column.
-        # IMPORTANT: use UTC tz-aware index to avoid timezone skew when computing candle boundaries.
-        if 'time' in df.columns:
-            df['time'] = pd.to_datetime(df['time'], unit='s', utc=True)
-            df = df.set_index('time')
-        elif 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s', utc=True)
-            df = df.set_index('timestamp')
-        
-        # 确保只包含需要的列
-        required_columns = ['open', 'high', 'low', 'close', 'volume']
-        available_columns = [col for col in required_columns if col in df.columns]
-        if not available_columns:
-            logger.warning("K-lines are missing required columns")
-            return pd.DataFrame(columns=required_columns)
-        
-        df = df[available_columns]
-        
-        # 强制转换所有数值列为 float64 类型
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            if col in df.columns:
-                # 先转换为数值类型，然后强制转换为 float64
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
-        
-        # 删除包含 NaN 的行
-        df = df.dropna()
-        
-        return df
-
-    def _update_dataframe_with_current_price(self, df: pd.DataFrame, current_price: float, timeframe: str) -> pd.DataFrame:
+    def _indicator_position_state(self, current_pos_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """持仓状态 -> 指标脚本的 initial_* 注入参数（单向持仓模式，取第一个持仓）"""
+        state = {
+            'initial_highest_price': 0.0,
+            'initial_position': 0,  # 0=无持仓, 1=多头, -1=空头
+            'initial_avg_entry_price': 0.0,
+            'initial_position_count': 0,
+            'initial_last_add_price': 0.0,
+        }
+        if current_pos_list:
+            pos = current_pos_list[0]
+            state['initial_highest_price'] = float(pos.get('highest_price', 0) or 0)
+            state['initial_position'] = 1 if pos.get('side', 'long') == 'long' else -1
+            state['initial_avg_entry_price'] = float(pos.get('entry_price', 0) or 0)
+            state['initial_position_count'] = 1  # 简化处理，假设是单笔持仓
+            state['initial_last_add_price'] = state['initial_avg_entry_price']
+        return state
+
+    def _run_incremental_indicator(
+        self,
+        incremental: IncrementalIndicator,
+        window: CandleWindow,
+        trading_config: Dict[str, Any],
+        pos_state: Dict[str, Any],
+        now_ts: float
+    ) -> Optional[Dict[str, Any]]:
         """
-        使用当前价格更新DataFrame的最后一根K线（用于实时计算）
+        增量模式：只对新收盘/正在形成的K线调用 on_bar，返回与 _execute_indicator_with_prices 相同的结构
         """
-        if df is None or len(df) == 0:
-            return df
-            
         try:
-            # 获取最后一根K线的时间
-            last_time = df.index[-1]
-            
-            # 计算当前时间对应的K线起始时间
-            from app.data_sources.base import TIMEFRAME_SECONDS
-            timeframe_key = timeframe
-            if timeframe_key not in TIMEFRAME_SECONDS:
-                timeframe_key = str(timeframe_key).upper()
-            if timeframe_key not in TIMEFRAME_SECONDS:
-                timeframe_key = str(timeframe_key).lower()
-            tf_seconds = TIMEFRAME_SECONDS.get(timeframe_key, 60)
-            
-            # Use epoch seconds directly to avoid naive datetime timezone conversion issues.
-            last_ts = float(last_time.timestamp())
-            now_ts = float(time.time())
-            
-            # 计算当前价格所属的 K 线开始时间
-            current_period_start = int(now_ts // tf_seconds) * tf_seconds
-            
-            # 检查最后一根K线是否就是当前周期的
-            if abs(last_ts - current_period_start) < 2:
-                # 更新最后一根
-                df.iloc[-1, df.columns.get_loc('close')] = current_price
-                df.iloc[-1, df.columns.get_loc('high')] = max(df.iloc[-1]['high'], current_price)
-                df.iloc[-1, df.columns.get_loc('low')] = min(df.iloc[-1]['low'], current_price)
-            elif current_period_start > last_ts:
-                # 追加新行
-                new_row = pd.DataFrame({
-                    'open': [current_price],
-                    'high': [current_price],
-                    'low': [current_price],
-                    'close': [current_price],
-                    'volume': [0.0]
-                }, index=[pd.to_datetime(current_period_start, unit='s', utc=True)])
-                
-                df = pd.concat([df, new_row])
-            
-            return df
-            
+            position = {
+                'side': pos_state['initial_position'],
+                'entry_price': pos_state['initial_avg_entry_price'],
+                'highest_price': pos_state['initial_highest_price'],
+                'count': pos_state['initial_position_count'],
+                'last_add_price': pos_state['initial_last_add_price'],
+            }
+            incremental.update(window, position, now_ts)
+            last_kline_time = int(window.last_time)
+            return {
+                'pending_signals': self._extract_pending_signals(incremental.signal_frame(), trading_config, last_kline_time),
+                'last_kline_time': last_kline_time,
+                'new_highest_price': incremental.highest_price,
+            }
         except Exception as e:
-            logger.error(f"Failed to update realtime candle: {str(e)}")
-            return df
+            logger.error(f"Incremental indicator (on_bar) failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            return None
     
     def _execute_indicator_with_prices(
         self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any], 
@@ -1544,209 +1458,13 @@ class TradingExecutor:
             last_kline_time = int(df.index[-1].timestamp()) if hasattr(df.index[-1], 'timestamp') else int(time.time())
             
             # 提取待触发的信号
-            pending_signals = []
-            
-            # Supported indicator signal formats:
-            # - Preferred (simple): df['buy'], df['sell'] as boolean
-            # - Internal (4-way): df['open_long'], df['close_long'], df['open_short'], df['close_short'] as boolean
-            if all(col in executed_df.columns for col in ['buy', 'sell']) and not all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
-                # Normalize buy/sell into 4-way columns for execution.
-                td = trading_config.get('trade_direction', trading_config.get('tradeDirection', 'both'))
-                td = str(td or 'both').lower()
-                if td not in ['long', 'short', 'both']:
-                    td = 'both'
-
-                buy = executed_df['buy'].fillna(False).astype(bool)
-                sell = executed_df['sell'].fillna(False).astype(bool)
-
-                executed_df = executed_df.copy()
-                if td == 'long':
-                    executed_df['open_long'] = buy
-                    executed_df['close_long'] = sell
-                    executed_df['open_short'] = False
-                    executed_df['close_short'] = False
-                elif td == 'short':
-                    executed_df['open_long'] = False
-                    executed_df['close_long'] = False
-                    executed_df['open_short'] = sell
-                    executed_df['close_short'] = buy
-                else:
-                    executed_df['open_long'] = buy
-                    executed_df['close_short'] = buy
-                    executed_df['open_short'] = sell
-                    executed_df['close_long'] = sell
-
-            # Check for 4-way columns after normalization
-            if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
-                # 优化点3: 防“信号闪烁” (Repainting)
-                signal_mode = trading_config.get('signal_mode', 'confirmed') # 'confirmed' or 'aggressive'
-                exit_signal_mode = trading_config.get('exit_signal_mode', 'aggressive') # 'confirmed' or 'aggressive'
-                
-                entry_check_set = set()
-                exit_check_set = set()
-                
-                if len(executed_df) > 1:
-                    # 始终检查上一根已完成K线
-                    entry_check_set.add(len(executed_df) - 2)
-                    exit_check_set.add(len(executed_df) - 2)
-                
-                if signal_mode == 'aggressive' and len(executed_df) > 0:
-                    entry_check_set.add(len(executed_df) - 1)
-                
-                if exit_signal_mode == 'aggressive' and len(executed_df) > 0:
-                    exit_check_set.add(len(executed_df) - 1)
-                
-                # 统一遍历索引（保持确定性排序）
-                check_indices = sorted(entry_check_set.union(exit_check_set), reverse=True)
-                
-                for idx in check_indices:
-                    # 获取该K线的收盘价（作为默认触发价）
-                    close_price = float(executed_df['close'].iloc[idx])
-                    # 该信号的时间戳
-                    signal_timestamp = int(executed_df.index[idx].timestamp()) if hasattr(executed_df.index[idx], 'timestamp') else last_kline_time
-                    
-                    # 开多信号（仅在 entry_check_set 中检查）
-                    if idx in entry_check_set and executed_df['open_long'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.08
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-                        
-                        if not any(s['type'] == 'open_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'open_long',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 平多信号
-                    if idx in exit_check_set and executed_df['close_long'].iloc[idx]:
-                        trigger_price = close_price
-                        if not any(s['type'] == 'close_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'close_long',
-                                'trigger_price': trigger_price,
-                                'position_size': 0,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 开空信号
-                    if idx in entry_check_set and executed_df['open_short'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.08
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-                        
-                        if not any(s['type'] == 'open_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'open_short',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                    
-                    # 平空信号
-                    if idx in exit_check_set and executed_df['close_short'].iloc[idx]:
-                        trigger_price = close_price
-                        if not any(s['type'] == 'close_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'close_short',
-                                'trigger_price': trigger_price,
-                                'position_size': 0,
-                                'timestamp': signal_timestamp
-                            })
-                            
-                    # 加多信号
-                    if idx in entry_check_set and 'add_long' in executed_df.columns and executed_df['add_long'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.06
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-
-                        if not any(s['type'] == 'add_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'add_long',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-                            
-                    # 加空信号
-                    if idx in entry_check_set and 'add_short' in executed_df.columns and executed_df['add_short'].iloc[idx]:
-                        trigger_price = close_price
-                        position_size = 0.06
-                        if 'position_size' in executed_df.columns:
-                            pos_size = executed_df['position_size'].iloc[idx]
-                            if pos_size > 0:
-                                position_size = float(pos_size)
-
-                        if not any(s['type'] == 'add_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'add_short',
-                                'trigger_price': trigger_price,
-                                'position_size': position_size,
-                                'timestamp': signal_timestamp
-                            })
-
-                    # Reduce / scale-out signals (optional)
-                    # These are used by position management rules (trend/adverse reduce) and should be treated as exits.
-                    if idx in exit_check_set and 'reduce_long' in executed_df.columns and executed_df['reduce_long'].iloc[idx]:
-                        trigger_price = close_price
-                        reduce_pct = 0.1
-                        if 'reduce_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        elif 'position_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        if reduce_pct <= 0:
-                            reduce_pct = 0.1
-                        if not any(s['type'] == 'reduce_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'reduce_long',
-                                'trigger_price': trigger_price,
-                                'position_size': reduce_pct,
-                                'timestamp': signal_timestamp
-                            })
-
-                    if idx in exit_check_set and 'reduce_short' in executed_df.columns and executed_df['reduce_short'].iloc[idx]:
-                        trigger_price = close_price
-                        reduce_pct = 0.1
-                        if 'reduce_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        elif 'position_size' in executed_df.columns:
-                            try:
-                                reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
-                            except Exception:
-                                reduce_pct = 0.1
-                        if reduce_pct <= 0:
-                            reduce_pct = 0.1
-                        if not any(s['type'] == 'reduce_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
-                            pending_signals.append({
-                                'type': 'reduce_short',
-                                'trigger_price': trigger_price,
-                                'position_size': reduce_pct,
-                                'timestamp': signal_timestamp
-                            })
+            pending_signals = self._extract_pending_signals(executed_df, trading_config, last_kline_time)
             
             return {
                 'pending_signals': pending_signals,
                 'last_kline_time': last_kline_time,
-                'new_highest_price': new_highest_price
+                'new_highest_price': new_highest_price,
+                'exec_env': exec_env
             }
             
         except Exception as e:
@@ -1754,6 +1472,213 @@ class TradingExecutor:
             logger.error(traceback.format_exc())
             return None
     
+    def _extract_pending_signals(
+        self, executed_df: pd.DataFrame, trading_config: Dict[str, Any], last_kline_time: int
+    ) -> List[Dict[str, Any]]:
+        """
+        从执行后的DataFrame提取待触发的信号（只看最后两根K线）
+        """
+        pending_signals = []
+        
+        # Supported indicator signal formats:
+        # - Preferred (simple): df['buy'], df['sell'] as boolean
+        # - Internal (4-way): df['open_long'], df['close_long'], df['open_short'], df['close_short'] as boolean
+        if all(col in executed_df.columns for col in ['buy', 'sell']) and not all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
+            # Normalize buy/sell into 4-way columns for execution.
+            td = trading_config.get('trade_direction', trading_config.get('tradeDirection', 'both'))
+            td = str(td or 'both').lower()
+            if td not in ['long', 'short', 'both']:
+                td = 'both'
+
+            buy = executed_df['buy'].fillna(False).astype(bool)
+            sell = executed_df['sell'].fillna(False).astype(bool)
+
+            executed_df = executed_df.copy()
+            if td == 'long':
+                executed_df['open_long'] = buy
+                executed_df['close_long'] = sell
+                executed_df['open_short'] = False
+                executed_df['close_short'] = False
+            elif td == 'short':
+                executed_df['open_long'] = False
+                executed_df['close_long'] = False
+                executed_df['open_short'] = sell
+                executed_df['close_short'] = buy
+            else:
+                executed_df['open_long'] = buy
+                executed_df['close_short'] = buy
+                executed_df['open_short'] = sell
+                executed_df['close_long'] = sell
+
+        # Check for 4-way columns after normalization
+        if all(col in executed_df.columns for col in ['open_long', 'close_long', 'open_short', 'close_short']):
+            # 优化点3: 防“信号闪烁” (Repainting)
+            signal_mode = trading_config.get('signal_mode', 'confirmed') # 'confirmed' or 'aggressive'
+            exit_signal_mode = trading_config.get('exit_signal_mode', 'aggressive') # 'confirmed' or 'aggressive'
+            
+            entry_check_set = set()
+            exit_check_set = set()
+            
+            if len(executed_df) > 1:
+                # 始终检查上一根已完成K线
+                entry_check_set.add(len(executed_df) - 2)
+                exit_check_set.add(len(executed_df) - 2)
+            
+            if signal_mode == 'aggressive' and len(executed_df) > 0:
+                entry_check_set.add(len(executed_df) - 1)
+            
+            if exit_signal_mode == 'aggressive' and len(executed_df) > 0:
+                exit_check_set.add(len(executed_df) - 1)
+            
+            # 统一遍历索引（保持确定性排序）
+            check_indices = sorted(entry_check_set.union(exit_check_set), reverse=True)
+            
+            for idx in check_indices:
+                # 获取该K线的收盘价（作为默认触发价）
+                close_price = float(executed_df['close'].iloc[idx])
+                # 该信号的时间戳
+                signal_timestamp = int(executed_df.index[idx].timestamp()) if hasattr(executed_df.index[idx], 'timestamp') else last_kline_time
+                
+                # 开多信号（仅在 entry_check_set 中检查）
+                if idx in entry_check_set and executed_df['open_long'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.08
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+                    
+                    if not any(s['type'] == 'open_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'open_long',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 平多信号
+                if idx in exit_check_set and executed_df['close_long'].iloc[idx]:
+                    trigger_price = close_price
+                    if not any(s['type'] == 'close_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'close_long',
+                            'trigger_price': trigger_price,
+                            'position_size': 0,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 开空信号
+                if idx in entry_check_set and executed_df['open_short'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.08
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+                    
+                    if not any(s['type'] == 'open_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'open_short',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                
+                # 平空信号
+                if idx in exit_check_set and executed_df['close_short'].iloc[idx]:
+                    trigger_price = close_price
+                    if not any(s['type'] == 'close_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'close_short',
+                            'trigger_price': trigger_price,
+                            'position_size': 0,
+                            'timestamp': signal_timestamp
+                        })
+                        
+                # 加多信号
+                if idx in entry_check_set and 'add_long' in executed_df.columns and executed_df['add_long'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.06
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+
+                    if not any(s['type'] == 'add_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'add_long',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+                        
+                # 加空信号
+                if idx in entry_check_set and 'add_short' in executed_df.columns and executed_df['add_short'].iloc[idx]:
+                    trigger_price = close_price
+                    position_size = 0.06
+                    if 'position_size' in executed_df.columns:
+                        pos_size = executed_df['position_size'].iloc[idx]
+                        if pos_size > 0:
+                            position_size = float(pos_size)
+
+                    if not any(s['type'] == 'add_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'add_short',
+                            'trigger_price': trigger_price,
+                            'position_size': position_size,
+                            'timestamp': signal_timestamp
+                        })
+
+                # Reduce / scale-out signals (optional)
+                # These are used by position management rules (trend/adverse reduce) and should be treated as exits.
+                if idx in exit_check_set and 'reduce_long' in executed_df.columns and executed_df['reduce_long'].iloc[idx]:
+                    trigger_price = close_price
+                    reduce_pct = 0.1
+                    if 'reduce_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    elif 'position_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    if reduce_pct <= 0:
+                        reduce_pct = 0.1
+                    if not any(s['type'] == 'reduce_long' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'reduce_long',
+                            'trigger_price': trigger_price,
+                            'position_size': reduce_pct,
+                            'timestamp': signal_timestamp
+                        })
+
+                if idx in exit_check_set and 'reduce_short' in executed_df.columns and executed_df['reduce_short'].iloc[idx]:
+                    trigger_price = close_price
+                    reduce_pct = 0.1
+                    if 'reduce_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['reduce_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    elif 'position_size' in executed_df.columns:
+                        try:
+                            reduce_pct = float(executed_df['position_size'].iloc[idx] or 0)
+                        except Exception:
+                            reduce_pct = 0.1
+                    if reduce_pct <= 0:
+                        reduce_pct = 0.1
+                    if not any(s['type'] == 'reduce_short' and s.get('timestamp') == signal_timestamp for s in pending_signals):
+                        pending_signals.append({
+                            'type': 'reduce_short',
+                            'trigger_price': trigger_price,
+                            'position_size': reduce_pct,
+                            'timestamp': signal_timestamp
+                        })
+        
+        return pending_signals
+    
     def _execute_indicator_df(
         self, indicator_code: str, df: pd.DataFrame, trading_config: Dict[str, Any], 
         initial_highest_price: float = 0.0,
@@ -1813,29 +1738,10 @@ class TradingExecutor:
                 'initial_last_add_price': float(initial_last_add_price)
             }
             
-            import builtins
-            def safe_import(name, *args, **kwargs):
-                allowed_modules = ['numpy', 'pandas', 'math', 'json', 'time']
-                if name in allowed_modules or name.split('.')[0] in allowed_modules:
-                    return builtins.__import__(name, *args, **kwargs)
-                raise ImportError(f"不允许导入模块: {name}")
-            
-            safe_builtins = {k: getattr(builtins, k) for k in dir(builtins) 
-                           if not k.startswith('_') and k not in [
-                               'eval', 'exec', 'compile', 'open', 'input',
-                               'help', 'exit', 'quit', '__import__',
-                               'copyright', 'credits', 'license'
-                           ]}
-            safe_builtins['__import__'] = safe_import
-            
-            exec_env = local_vars.copy()
-            exec_env['__builtins__'] = safe_builtins
-            
-            pre_import_code = "import numpy as np\nimport pandas as pd\n"
-            exec(pre_import_code, exec_env)
-            
-            # 这里的 safe_exec_code 假设已存在
-            exec(indicator_code, exec_env)
+            # Compiled once per script content; restricted builtins are prebuilt and copied per call
+            code_obj = get_compiled_code_cache().get(indicator_code, validate=False)
+            exec_env = build_sandbox_globals(local_vars, allowed_modules=EXECUTOR_ALLOWED_MODULES)
+            exec(code_obj, exec_env)
             
             executed_df = exec_env.get('df', df)
 
@@ -2547,6 +2453,9 @@ class TradingExecutor:
                     ),
                 )
                 pending_id = cur.lastrowid
+                if pending_id is not None:
+                    # Wake PendingOrderWorker(s); delivered on commit.
+                    cur.execute("SELECT pg_notify(%s, %s)", (PENDING_ORDERS_CHANNEL, str(pending_id)))
                 db.commit()
                 cur.close()
             return int(pending_id) if pending_id is not None else None
@@ -2,10 +2,19 @@
 Cache utilities.
 Local-first behavior: use in-memory cache by default.
 Redis is only used when explicitly enabled via environment variables.
+
+`CacheManager.get_or_load()` adds request coalescing on top of the plain TTL cache: concurrent
+misses of one key share a single loader call, and an expired value is still served for
+`stale_ttl` seconds while one background refresh replaces it.
 """
+import itertools
+import os
+import sys
 import time
 import threading
-from typing import Optional, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any, Callable, Dict, Tuple, Union
 import json
 
 from app.utils.logger import get_logger
@@ -14,36 +23,137 @@ from app.config import CacheConfig
 logger = get_logger(__name__)
 
 
+def _estimate_size(value: Any, _depth: int = 0) -> int:
+    """Rough in-memory size of a value in bytes (containers are sampled, not walked fully)."""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        n = len(value)
+        if n:
+            sample = list(itertools.islice(value.items(), 8))
+            per_item = sum(_estimate_size(k, _depth + 1) + _estimate_size(v, _depth + 1) for k, v in sample) / len(sample)
+            size += int(per_item * n)
+    elif isinstance(value, (list, tuple, set)):
+        n = len(value)
+        if n:
+            sample = list(itertools.islice(value, 8))
+            size += int(sum(_estimate_size(v, _depth + 1) for v in sample) / len(sample) * n)
+    return size
+
+
 class MemoryCache:
-    """内存缓存（Redis 不可用时的备选方案）"""
-    
-    def __init__(self):
-        self._cache = {}
+    """
+    内存缓存（Redis 不可用时的备选方案）
+
+    - LRU：超过条目数 / 内存预算（估算值）时淘汰最久未使用的条目
+    - 过期条目在写入时顺带定期清理（最多每 sweep_interval_sec 秒一次）
+    - 值按原对象保存，不做 JSON 序列化；取出的对象与缓存共享，调用方只读不改
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        sweep_interval_sec: Optional[float] = None,
+    ):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('CACHE_MEMORY_MAX_MB', '256')) * 1024 * 1024)
+        if max_entries is None:
+            max_entries = int(os.getenv('CACHE_MEMORY_MAX_ENTRIES', '20000'))
+        if sweep_interval_sec is None:
+            sweep_interval_sec = float(os.getenv('CACHE_SWEEP_INTERVAL_SEC', '60'))
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_entries = max(1, int(max_entries))
+        self.sweep_interval_sec = float(sweep_interval_sec)
+        # key -> (value, expiry, size); order = LRU (oldest first)
+        self._cache: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
         self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self._stats = {'evicted_lru': 0, 'expired': 0, 'rejected_too_large': 0}
     
-    def get(self, key: str) -> Optional[str]:
+    def get(self, key: str) -> Optional[Any]:
         with self._lock:
-            if key in self._cache:
-                data, expiry = self._cache[key]
-                if expiry > time.time():
-                    return data
-                else:
-                    del self._cache[key]
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            if item[1] > time.time():
+                self._cache.move_to_end(key)
+                return item[0]
+            self._remove(key)
+            self._stats['expired'] += 1
             return None
     
-    def setex(self, key: str, ttl: int, value: str):
+    def setex(self, key: str, ttl: int, value: Any):
+        size = _estimate_size(key) + _estimate_size(value)
         with self._lock:
-            expiry = time.time() + ttl
-            self._cache[key] = (value, expiry)
+            if key in self._cache:
+                self._remove(key)
+            if self.max_bytes and size > self.max_bytes:
+                # A single value larger than the whole budget is not cached
+                self._stats['rejected_too_large'] += 1
+                return
+            now = time.time()
+            self._cache[key] = (value, now + ttl, size)
+            self._bytes += size
+            if now - self._last_sweep >= self.sweep_interval_sec:
+                self._sweep(now)
+            while len(self._cache) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                oldest = next(iter(self._cache))
+                self._remove(oldest)
+                self._stats['evicted_lru'] += 1
     
     def delete(self, key: str):
         with self._lock:
             if key in self._cache:
-                del self._cache[key]
+                self._remove(key)
     
     def clear(self):
         with self._lock:
             self._cache.clear()
+            self._bytes = 0
+
+    def sweep(self) -> int:
+        """清理全部过期条目，返回清理数量"""
+        with self._lock:
+            return self._sweep(time.time())
+
+    def _remove(self, key: str):
+        # Caller holds self._lock
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+
+    def _sweep(self, now: float) -> int:
+        # Caller holds self._lock
+        expired = [k for k, (_, expiry, _) in self._cache.items() if expiry <= now]
+        for k in expired:
+            self._remove(k)
+        self._stats['expired'] += len(expired)
+        self._last_sweep = now
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'entries': len(self._cache),
+                'estimated_bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            })
+            return stats
+
+
+class _Flight:
+    """One in-flight load of a key; followers wait on it instead of calling the loader."""
+
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
 
 
 class CacheManager:
@@ -67,6 +177,12 @@ class CacheManager:
         self._initialized = True
         self._client = None
         self._use_redis = False
+        # get_or_load: in-flight loads, keys being refreshed in the background, counters
+        self._flights: Dict[str, _Flight] = {}
+        self._refreshing = set()
+        self._flight_lock = threading.Lock()
+        self._refresh_executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'coalesced': 0, 'loads': 0, 'load_errors': 0, 'refreshes': 0}
 
         # Local-first: do NOT touch Redis unless explicitly enabled.
         if not CacheConfig.ENABLED:
@@ -101,6 +217,9 @@ class CacheManager:
         """获取缓存"""
         try:
             data = self._client.get(key)
+            if not self._use_redis:
+                # 进程内缓存直接保存对象，无需反序列化
+                return data
             if data:
                 return json.loads(data)
             return None
@@ -111,7 +230,10 @@ class CacheManager:
     def set(self, key: str, value: Any, ttl: int = 300):
         """设置缓存"""
         try:
-            self._client.setex(key, ttl, json.dumps(value))
+            if self._use_redis:
+                self._client.setex(key, ttl, json.dumps(value))
+            else:
+                self._client.setex(key, ttl, value)
         except Exception as e:
             logger.error(f"Cache write failed: {e}")
     
@@ -122,6 +244,136 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Cache delete failed: {e}")
     
+    # ------------------------------------------------------------------ get_or_load
+
+    def _count(self, name: str, n: int = 1):
+        with self._flight_lock:
+            self._stats[name] += n
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: Union[int, Callable[[Any], int]] = 300,
+        stale_ttl: int = 0,
+        force_refresh: bool = False,
+    ) -> Any:
+        """
+        读取缓存，未命中时调用 loader 加载并写入缓存（同一 key 的并发请求只加载一次）。
+
+        Args:
+            key: 缓存键（只通过 get_or_load 访问，值带新鲜度信息存储）
+            loader: 无参加载函数
+            ttl: 新鲜期（秒），或根据加载结果返回 TTL 的函数；<= 0 表示不缓存该结果
+            stale_ttl: 过期后仍可返回旧值的时长（秒），期间后台刷新一次
+            force_refresh: 跳过缓存直接加载
+
+        Falsy results (None, empty list/dict) are returned but not cached.
+        """
+        if not force_refresh:
+            entry = self.get(key)
+            if isinstance(entry, dict) and 'f' in entry:
+                if time.time() < float(entry['f']):
+                    self._count('hits')
+                    return entry.get('v')
+                # Stale but within stale_ttl: serve it and refresh in the background
+                self._count('stale')
+                self._refresh_async(key, loader, ttl, stale_ttl)
+                return entry.get('v')
+            self._count('misses')
+        return self._load(key, loader, ttl, stale_ttl)
+
+    def peek(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """
+        读取 get_or_load 写入的缓存项，不触发加载或后台刷新（供批量加载使用）。
+
+        Returns:
+            (value, is_fresh)，未命中时返回 None
+        """
+        entry = self.get(key)
+        if isinstance(entry, dict) and 'f' in entry:
+            fresh = time.time() < float(entry['f'])
+            self._count('hits' if fresh else 'stale')
+            return entry.get('v'), fresh
+        self._count('misses')
+        return None
+
+    def put(self, key: str, value: Any, ttl: Union[int, Callable[[Any], int]] = 300, stale_ttl: int = 0):
+        """按 get_or_load 的格式写入一个已加载的值（falsy 或 ttl <= 0 时不写入）"""
+        if not value:
+            return
+        fresh = int(ttl(value) if callable(ttl) else ttl)
+        if fresh > 0:
+            stale = max(0, int(stale_ttl or 0))
+            self.set(key, {'v': value, 'f': time.time() + fresh}, fresh + stale)
+
+    def _load(self, key: str, loader: Callable[[], Any], ttl, stale_ttl: int) -> Any:
+        with self._flight_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            self._count('loads')
+            value = loader()
+            flight.value = value
+            self.put(key, value, ttl, stale_ttl)
+            return value
+        except Exception as e:
+            self._count('load_errors')
+            flight.error = e
+            raise
+        finally:
+            with self._flight_lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _refresh_async(self, key: str, loader: Callable[[], Any], ttl, stale_ttl: int):
+        with self._flight_lock:
+            if key in self._refreshing or key in self._flights:
+                return
+            self._refreshing.add(key)
+            if self._refresh_executor is None:
+                workers = max(1, int(os.getenv('CACHE_REFRESH_WORKERS', '4')))
+                self._refresh_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-refresh')
+            executor = self._refresh_executor
+            self._stats['refreshes'] += 1
+
+        def _run():
+            try:
+                self._load(key, loader, ttl, stale_ttl)
+            except Exception as e:
+                # Keep serving the stale value; the next stale read retries.
+                logger.debug(f"Background cache refresh failed for {key}: {e}")
+            finally:
+                with self._flight_lock:
+                    self._refreshing.discard(key)
+
+        try:
+            executor.submit(_run)
+        except RuntimeError:
+            # Interpreter shutting down
+            with self._flight_lock:
+                self._refreshing.discard(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._flight_lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._flights)
+            stats['refreshing'] = len(self._refreshing)
+        stats['backend'] = 'redis' if self._use_redis else 'memory'
+        if isinstance(self._client, MemoryCache):
+            stats['memory'] = self._client.get_stats()
+        return stats
+
     @property
     def is_redis(self) -> bool:
         return self._use_redis
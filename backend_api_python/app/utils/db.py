@@ -20,6 +20,7 @@ Configuration:
 from app.utils.db_postgres import (
     get_pg_connection as get_db_connection,
     get_pg_connection_sync as get_db_connection_sync,
+    get_pg_listen_connection as get_db_listen_connection,
     is_postgres_available,
     close_pool as close_db,
 )
@@ -57,6 +58,7 @@ def close_db_connection():
 __all__ = [
     'get_db_connection',
     'get_db_connection_sync',
+    'get_db_listen_connection',
     'close_db_connection',
     'init_database',
     'close_db',
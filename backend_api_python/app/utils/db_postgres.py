@@ -253,6 +253,30 @@ def get_pg_connection_sync() -> PostgresConnection:
     return PostgresConnection(conn)
 
 
+def get_pg_listen_connection():
+    """
+    Open a dedicated autocommit psycopg2 connection (not from the pool) for LISTEN/NOTIFY.
+
+    The caller owns the connection: wait on it with select(), call poll(), read conn.notifies,
+    and close it when done.
+    """
+    if not HAS_PSYCOPG2:
+        raise RuntimeError("psycopg2 is not installed. Cannot use PostgreSQL.")
+    params = _parse_database_url(_get_database_url())
+    if not params:
+        raise RuntimeError("DATABASE_URL environment variable is not set or invalid.")
+    conn = psycopg2.connect(
+        host=params.get('host', 'localhost'),
+        port=params.get('port', 5432),
+        user=params.get('user', 'quantdinger'),
+        password=params.get('password', ''),
+        dbname=params.get('dbname', 'quantdinger'),
+        connect_timeout=10,
+    )
+    conn.autocommit = True
+    return conn
+
+
 def execute_sql(sql: str, params: tuple = None) -> List[Dict[str, Any]]:
     """
     Execute SQL and return results (convenience function)
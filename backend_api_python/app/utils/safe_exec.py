@@ -2,14 +2,21 @@
 安全的代码执行工具
 提供超时、资源限制和沙箱环境
 """
+import builtins
+import hashlib
 import signal
 import sys
 import os
 import threading
 import traceback
-from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from types import CodeType
+from typing import Dict, Any, Optional, Tuple, Union
 from contextlib import contextmanager
 
+import numpy as np
+import pandas as pd
+
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -70,7 +77,7 @@ def timeout_context(seconds: int):
 
 
 def safe_exec_code(
-    code: str,
+    code: Union[str, CodeType],
     exec_globals: Dict[str, Any],
     exec_locals: Optional[Dict[str, Any]] = None,
     timeout: int = 30,
@@ -80,7 +87,7 @@ def safe_exec_code(
     安全执行Python代码
     
     Args:
-        code: 要执行的Python代码
+        code: 要执行的Python代码（源码或 compile 后的 code object）
         exec_globals: 全局变量字典
         exec_locals: 局部变量字典（如果为None，则使用exec_globals）
         timeout: 超时时间（秒），默认30秒
@@ -310,3 +317,155 @@ def validate_code_safety(code: str) -> Tuple[bool, Optional[str]]:
         logger.warning(f"AST parse failed; skipping safety checks: {str(e)}")
     
     return True, None
+
+
+# ---------------------------------------------------------------------------
+# Compiled indicator code cache
+# ---------------------------------------------------------------------------
+
+# Builtins removed from the indicator sandbox
+SANDBOX_BLOCKED_BUILTINS = frozenset([
+    'eval', 'exec', 'compile', 'open', 'input',
+    'help', 'exit', 'quit',
+    'copyright', 'credits', 'license'
+])
+
+# Modules indicator code may import
+INDICATOR_ALLOWED_MODULES = ('numpy', 'pandas', 'math', 'json', 'datetime', 'time')
+
+_sandbox_builtins: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+_sandbox_lock = threading.Lock()
+
+
+def _make_safe_import(allowed_modules: Tuple[str, ...]):
+    def safe_import(name, *args, **kwargs):
+        """Only allow importing numpy, pandas, math, json etc."""
+        if name in allowed_modules or name.split('.')[0] in allowed_modules:
+            return builtins.__import__(name, *args, **kwargs)
+        raise ImportError(f"Import not allowed: {name}")
+    return safe_import
+
+
+def build_sandbox_globals(
+    local_vars: Dict[str, Any],
+    allowed_modules: Tuple[str, ...] = INDICATOR_ALLOWED_MODULES
+) -> Dict[str, Any]:
+    """
+    Execution globals for indicator code: local_vars + np/pd + restricted builtins.
+
+    The restricted builtins dict is built once per allowed-modules set and copied per call,
+    so scripts cannot leak changes into each other.
+    """
+    template = _sandbox_builtins.get(allowed_modules)
+    if template is None:
+        with _sandbox_lock:
+            template = {k: getattr(builtins, k) for k in dir(builtins)
+                        if not k.startswith('_') and k not in SANDBOX_BLOCKED_BUILTINS}
+            template['__import__'] = _make_safe_import(allowed_modules)
+            _sandbox_builtins[allowed_modules] = template
+
+    exec_env = dict(local_vars)
+    # Same as running "import numpy as np; import pandas as pd" in the sandbox
+    exec_env['np'] = np
+    exec_env['pd'] = pd
+    exec_env['__builtins__'] = dict(template)
+    return exec_env
+
+
+class _CompiledCode:
+    __slots__ = ('code_obj', 'safety')
+
+    def __init__(self, code_obj: CodeType):
+        self.code_obj = code_obj
+        self.safety: Optional[Tuple[bool, Optional[str]]] = None
+
+
+class CompiledCodeCache:
+    """
+    Bounded LRU of compiled indicator code, keyed by the SHA-256 of the source.
+
+    Entries also remember the validate_code_safety result, so a strategy ticking every candle
+    or a sweep running hundreds of combinations validates and compiles its script once.
+
+    Config (env):
+        INDICATOR_CODE_CACHE_SIZE: Max cached scripts (default 256)
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max(1, int(max_size or os.getenv('INDICATOR_CODE_CACHE_SIZE', '256')))
+        self._entries: 'OrderedDict[str, _CompiledCode]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry(self, code: str) -> _CompiledCode:
+        key = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Compile outside the lock; a SyntaxError propagates and is not cached
+        entry = _CompiledCode(compile(code, '<string>', 'exec'))
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get(self, code: str, validate: bool = True) -> CodeType:
+        """
+        Compiled code object for `code`.
+
+        Raises:
+            ValueError: validate=True and the code fails validate_code_safety
+            SyntaxError: validate=False and the code does not compile
+        """
+        if validate:
+            try:
+                entry = self._entry(code)
+            except SyntaxError as e:
+                raise ValueError(f"Code contains unsafe operations: 代码语法错误: {str(e)}")
+            if entry.safety is None:
+                entry.safety = validate_code_safety(code)
+            is_safe, error_msg = entry.safety
+            if not is_safe:
+                raise ValueError(f"Code contains unsafe operations: {error_msg}")
+            return entry.code_obj
+        return self._entry(code).code_obj
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_code_cache: Optional[CompiledCodeCache] = None
+_code_cache_lock = threading.Lock()
+
+
+def get_compiled_code_cache() -> CompiledCodeCache:
+    """Process-wide compiled indicator code cache (shared by backtests and live strategies)."""
+    global _code_cache
+    if _code_cache is None:
+        with _code_cache_lock:
+            if _code_cache is None:
+                _code_cache = CompiledCodeCache()
+    return _code_cache
@@ -392,7 +392,10 @@ CREATE TABLE IF NOT EXISTS qd_backtest_runs (
     status VARCHAR(20) DEFAULT 'success',
     error_message TEXT DEFAULT '',
     result_json TEXT DEFAULT '',
-    created_at TIMESTAMP DEFAULT NOW()
+    progress TEXT DEFAULT '',              -- Job progress JSON (phase, bars_processed, bars_total)
+    job_kind VARCHAR(20) DEFAULT 'backtest', -- backtest / sweep / portfolio
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
 );
 
 CREATE INDEX IF NOT EXISTS idx_backtest_runs_user_id ON qd_backtest_runs(user_id);
@@ -767,6 +770,38 @@ BEGIN
     END IF;
 END $$;
 
+-- =============================================================================
+-- 22. Migration: Backtest job queue columns
+-- =============================================================================
+-- qd_backtest_runs rows double as async backtest jobs (status queued/running/success/failed).
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'qd_backtest_runs' AND column_name = 'progress'
+    ) THEN
+        ALTER TABLE qd_backtest_runs ADD COLUMN progress TEXT DEFAULT '';
+        RAISE NOTICE 'Added progress column to qd_backtest_runs';
+    END IF;
+    
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'qd_backtest_runs' AND column_name = 'updated_at'
+    ) THEN
+        ALTER TABLE qd_backtest_runs ADD COLUMN updated_at TIMESTAMP DEFAULT NOW();
+        RAISE NOTICE 'Added updated_at column to qd_backtest_runs';
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'qd_backtest_runs' AND column_name = 'job_kind'
+    ) THEN
+        ALTER TABLE qd_backtest_runs ADD COLUMN job_kind VARCHAR(20) DEFAULT 'backtest';
+        RAISE NOTICE 'Added job_kind column to qd_backtest_runs';
+    END IF;
+END $$;
+
 -- =============================================================================
 -- Completion Notice
 -- =============================================================================
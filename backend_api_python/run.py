@@ -76,7 +76,10 @@ from app.config.settings import Config
 
 # Create app instance (for gunicorn use)
 # gunicorn -c gunicorn_config.py "run:app"
-app = create_app()
+# Process-pool children (backtest jobs, spawn start method) re-import this file as `__mp_main__`;
+# they must not create the app, which would start strategy threads and background workers.
+if __name__ != '__mp_main__':
+    app = create_app()
 
 
 def main():
@@ -0,0 +1,207 @@
+"""
+Parity check: array backtest engine vs reference loop.
+
+Goal:
+- Generate deterministic synthetic OHLCV candles and random 4-way / buy-sell signals
+- Run `BacktestService._simulate_trading` with engine='loop' and engine='array'
+  over a grid of strategy configs (SL/TP/trailing/scale-in/scale-out, timing, direction, leverage)
+- Same for the multi-timeframe loop (`_simulate_trading_mtf`, 1H signals on 1m execution candles)
+- Verify trades, equity curve, total commission and metrics are identical
+
+Usage:
+  python backend_api_python/scripts/backtest_engine_parity.py
+  python backend_api_python/scripts/backtest_engine_parity.py --bars 50000 --seeds 3 --bench
+
+Notes:
+- No network / database access. Exits with status 1 on the first mismatch.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def _ensure_backend_on_syspath() -> None:
+    backend_root = Path(__file__).resolve().parents[1]
+    p = str(backend_root)
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+
+_ensure_backend_on_syspath()
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.services.backtest import BacktestService  # noqa: E402
+from app.services import backtest_engine  # noqa: E402
+
+
+def _make_candles(n: int, seed: int, freq: str = '1min') -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rets = rng.normal(0, 0.004, n)
+    close = 100.0 * np.exp(np.cumsum(rets))
+    open_ = np.concatenate([[100.0], close[:-1]]) * (1 + rng.normal(0, 0.001, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+    index = pd.date_range('2024-01-01', periods=n, freq=freq)
+    return pd.DataFrame({
+        'open': open_, 'high': high, 'low': low, 'close': close,
+        'volume': rng.uniform(1, 100, n),
+    }, index=index)
+
+
+def _make_signals(df: pd.DataFrame, seed: int, four_way: bool, density: float = 0.03) -> Dict[str, pd.Series]:
+    rng = np.random.default_rng(seed + 1000)
+    n = len(df)
+
+    def _sig() -> pd.Series:
+        return pd.Series(rng.random(n) < density, index=df.index)
+
+    if four_way:
+        return {
+            'open_long': _sig(), 'close_long': _sig(),
+            'open_short': _sig(), 'close_short': _sig(),
+        }
+    return {'buy': _sig(), 'sell': _sig()}
+
+
+def _config_grid() -> List[Dict[str, Any]]:
+    risks = [
+        {},
+        {'stopLossPct': 0.05, 'takeProfitPct': 0.08},
+        {'stopLossPct': 0.03, 'trailing': {'enabled': True, 'pct': 0.02, 'activationPct': 0.04}},
+        {'stopLossPct': 0.9, 'takeProfitPct': 0.05, 'trailing': {'enabled': True, 'pct': 0.03}},
+    ]
+    scales = [
+        {},
+        {'trendAdd': {'enabled': True, 'stepPct': 0.02, 'sizePct': 0.2, 'maxTimes': 3},
+         'trendReduce': {'enabled': True, 'stepPct': 0.04, 'sizePct': 0.3, 'maxTimes': 2}},
+        {'dcaAdd': {'enabled': True, 'stepPct': 0.03, 'sizePct': 0.25, 'maxTimes': 0},
+         'adverseReduce': {'enabled': True, 'stepPct': 0.05, 'sizePct': 0.5, 'maxTimes': 1}},
+    ]
+    timings = ['next_bar_open', 'bar_close']
+    entry_pcts = [1.0, 40]
+
+    grid = []
+    for risk, scale, timing, entry_pct in itertools.product(risks, scales, timings, entry_pcts):
+        grid.append({
+            'execution': {'signalTiming': timing},
+            'risk': risk,
+            'scale': scale,
+            'position': {'entryPct': entry_pct},
+        })
+    return grid
+
+
+def _mtf_config_grid() -> List[Dict[str, Any]]:
+    risks = [
+        {},
+        {'stopLossPct': 0.05, 'takeProfitPct': 0.08},
+        {'stopLossPct': 0.03, 'trailing': {'enabled': True, 'pct': 0.02, 'activationPct': 0.04}},
+        {'stopLossPct': 0.9, 'takeProfitPct': 0.05, 'trailing': {'enabled': True, 'pct': 0.03}},
+    ]
+    return [{'risk': risk, 'position': {'entryPct': entry_pct}} for risk in risks for entry_pct in (None, 40)]
+
+
+def _check_mtf(svc: BacktestService, bars: int, seeds: int) -> int:
+    checked = 0
+    for seed in range(seeds):
+        df_exec = _make_candles(bars, seed)
+        df_signal = df_exec.resample('1h').agg(
+            {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+        ).dropna()
+        for four_way in (True, False):
+            signals = _make_signals(df_signal, seed, four_way, density=0.15)
+            for cfg in _mtf_config_grid():
+                for direction, leverage in (('long', 1), ('short', 3), ('both', 10)):
+                    run_args = (df_signal, df_exec, 10000.0, 0.001, 0.0005, leverage, direction, cfg, '1H', '1m')
+                    ref = svc._simulate_trading_mtf(run_args[0], run_args[1], dict(signals), *run_args[2:], engine='loop')
+                    arr = svc._simulate_trading_mtf(run_args[0], run_args[1], dict(signals), *run_args[2:], engine='array')
+                    for name, x, y in (('trades', ref[1], arr[1]), ('equity', ref[0], arr[0])):
+                        msg = _diff(x, y)
+                        if msg:
+                            print(f"MTF MISMATCH seed={seed} four_way={four_way} dir={direction} lev={leverage} cfg={cfg}")
+                            print(f"  {name}: {msg}")
+                            raise SystemExit(1)
+                    if not np.isclose(ref[2], arr[2], rtol=0, atol=1e-9):
+                        print(f"MTF MISMATCH commission {ref[2]} != {arr[2]} cfg={cfg}")
+                        raise SystemExit(1)
+                    checked += 1
+    return checked
+
+
+def _diff(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> str:
+    if len(a) != len(b):
+        return f"length {len(a)} != {len(b)}"
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return f"first difference at #{i}: {x} != {y}"
+    return ''
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bars', type=int, default=3000)
+    parser.add_argument('--seeds', type=int, default=2)
+    parser.add_argument('--bench', action='store_true', help='Also time both engines on the largest run')
+    args = parser.parse_args()
+
+    svc = BacktestService()
+    checked = 0
+    for seed in range(args.seeds):
+        df = _make_candles(args.bars, seed)
+        for four_way in (True, False):
+            signals = _make_signals(df, seed, four_way)
+            for cfg in _config_grid():
+                for direction, leverage in (('long', 1), ('short', 3), ('both', 10)):
+                    run_args = (df, dict(signals), 10000.0, 0.001, 0.0005, leverage, direction, cfg)
+                    ref = svc._simulate_trading(*run_args, engine='loop')
+                    arr = svc._simulate_trading(*run_args, engine='array')
+                    for name, x, y in (('trades', ref[1], arr[1]), ('equity', ref[0], arr[0])):
+                        msg = _diff(x, y)
+                        if msg:
+                            print(f"MISMATCH seed={seed} four_way={four_way} dir={direction} lev={leverage} cfg={cfg}")
+                            print(f"  {name}: {msg}")
+                            raise SystemExit(1)
+                    if not np.isclose(ref[2], arr[2], rtol=0, atol=1e-9):
+                        print(f"MISMATCH commission {ref[2]} != {arr[2]} cfg={cfg}")
+                        raise SystemExit(1)
+                    metric_args = (10000.0, '1m', df.index[0], df.index[-1])
+                    ref_metrics = svc._calculate_metrics(ref[0], ref[1], *metric_args, ref[2])
+                    arr_metrics = svc._calculate_metrics(arr[0], arr[1], *metric_args, arr[2])
+                    if ref_metrics != arr_metrics:
+                        print(f"MISMATCH metrics {ref_metrics} != {arr_metrics} cfg={cfg}")
+                        raise SystemExit(1)
+                    checked += 1
+
+    print(f"OK: {checked} runs identical (numba={'on' if backtest_engine.HAS_NUMBA else 'off'})")
+
+    checked = _check_mtf(svc, args.bars, args.seeds)
+    print(f"OK: {checked} MTF runs identical")
+
+    if args.bench:
+        df = _make_candles(args.bars, 0)
+        signals = _make_signals(df, 0, True)
+        cfg = _config_grid()[-1]
+        for engine in ('loop', 'array', 'array'):
+            t0 = time.perf_counter()
+            svc._simulate_trading(df, dict(signals), 10000.0, 0.001, 0.0, 5, 'both', cfg, engine=engine)
+            print(f"{engine:>6}: {time.perf_counter() - t0:.3f}s ({args.bars} bars)")
+
+        df_signal = df.resample('1h').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}).dropna()
+        signals = _make_signals(df_signal, 0, False, density=0.15)
+        cfg = _mtf_config_grid()[-1]
+        for engine in ('loop', 'array', 'array'):
+            t0 = time.perf_counter()
+            svc._simulate_trading_mtf(df_signal, df, dict(signals), 10000.0, 0.001, 0.0, 5, 'both', cfg, '1H', '1m', engine=engine)
+            print(f"MTF {engine:>6}: {time.perf_counter() - t0:.3f}s ({args.bars} exec bars)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Local stand-in for a Binance-compatible public WebSocket stream (for CRYPTO_STREAM_* testing).
+
+Speaks the subset used by app.data_sources.crypto_stream:
+- client sends {"method": "SUBSCRIBE"|"UNSUBSCRIBE", "params": ["btcusdt@ticker", "btcusdt@kline_1m"], "id": n}
+- server replies {"result": null, "id": n} and pushes `24hrTicker` / `kline` events for every
+  subscribed stream every --interval seconds (random-walk prices)
+
+Usage:
+  # Serve forever, then run the backend with
+  #   CRYPTO_STREAM_ENABLED=true CRYPTO_STREAM_URL=ws://127.0.0.1:8765
+  python backend_api_python/scripts/crypto_stream_standin.py --port 8765
+
+  # Self-check: stream client against the stand-in, including disconnect -> REST fallback -> reconnect
+  python backend_api_python/scripts/crypto_stream_standin.py --check
+
+Notes:
+- Requires the `websockets` package. No network access beyond localhost.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Set
+
+
+def _ensure_backend_on_syspath() -> None:
+    backend_root = Path(__file__).resolve().parents[1]
+    p = str(backend_root)
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+
+_ensure_backend_on_syspath()
+
+import websockets  # noqa: E402
+
+INTERVAL_SECONDS = {'1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, '4h': 14400, '1d': 86400, '1w': 604800}
+
+
+class StandinServer:
+    def __init__(self, host: str, port: int, interval: float):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.prices: Dict[str, float] = {}
+        self.connections = 0
+
+    def _price(self, sym: str) -> float:
+        price = self.prices.get(sym, 100.0 + random.random() * 10)
+        price *= 1 + random.gauss(0, 0.001)
+        self.prices[sym] = price
+        return price
+
+    def _events(self, streams: Set[str]):
+        now = time.time()
+        for name in sorted(streams):
+            sym, _, kind = name.partition('@')
+            price = self._price(sym)
+            if kind == 'ticker':
+                yield {
+                    'e': '24hrTicker', 'E': int(now * 1000), 's': sym.upper(),
+                    'c': f"{price:.4f}", 'o': f"{price * 0.99:.4f}", 'h': f"{price * 1.01:.4f}",
+                    'l': f"{price * 0.98:.4f}", 'b': f"{price * 0.9999:.4f}", 'a': f"{price * 1.0001:.4f}",
+                    'p': f"{price * 0.01:.4f}", 'P': '1.00', 'v': '1000', 'q': f"{price * 1000:.2f}",
+                }
+            elif kind.startswith('kline_'):
+                interval = kind[len('kline_'):]
+                tf = INTERVAL_SECONDS.get(interval, 60)
+                open_time = int(now // tf) * tf
+                yield {
+                    'e': 'kline', 'E': int(now * 1000), 's': sym.upper(),
+                    'k': {
+                        't': open_time * 1000, 'T': (open_time + tf) * 1000 - 1, 's': sym.upper(), 'i': interval,
+                        'o': f"{price:.4f}", 'h': f"{price * 1.001:.4f}", 'l': f"{price * 0.999:.4f}",
+                        'c': f"{price:.4f}", 'v': '10', 'x': False,
+                    },
+                }
+
+    async def handler(self, ws, *args) -> None:
+        self.connections += 1
+        streams: Set[str] = set()
+
+        async def pusher():
+            while True:
+                for event in self._events(streams):
+                    await ws.send(json.dumps(event))
+                await asyncio.sleep(self.interval)
+
+        task = asyncio.ensure_future(pusher())
+        try:
+            async for message in ws:
+                req = json.loads(message)
+                params = req.get('params') or []
+                if req.get('method') == 'SUBSCRIBE':
+                    streams.update(params)
+                elif req.get('method') == 'UNSUBSCRIBE':
+                    streams.difference_update(params)
+                await ws.send(json.dumps({'result': None, 'id': req.get('id')}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            task.cancel()
+
+    async def serve_forever(self) -> None:
+        async with websockets.serve(self.handler, self.host, self.port):
+            print(f"stand-in stream listening on ws://{self.host}:{self.port}", flush=True)
+            await asyncio.Future()
+
+
+class _ServerThread:
+    """Runs the stand-in in a background event loop so it can be stopped/restarted."""
+
+    def __init__(self, server: StandinServer):
+        self.server = server
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.ws_server = None
+
+    def start(self) -> None:
+        async def _start():
+            return await websockets.serve(self.server.handler, self.server.host, self.server.port)
+        self.ws_server = asyncio.run_coroutine_threadsafe(_start(), self.loop).result(10)
+
+    def stop(self) -> None:
+        async def _stop():
+            self.ws_server.close()
+            await self.ws_server.wait_closed()
+        asyncio.run_coroutine_threadsafe(_stop(), self.loop).result(10)
+
+
+def _wait(predicate, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run_check(port: int) -> int:
+    from app.data_sources.crypto_stream import CryptoStream
+
+    server = StandinServer('127.0.0.1', port, interval=0.1)
+    runner = _ServerThread(server)
+    runner.start()
+
+    stream = CryptoStream(f"ws://127.0.0.1:{port}", max_age_sec=2.0, candle_buffer=10)
+    stream.subscribe('BTC/USDT', '1m')
+    stream.subscribe('ETHUSDT', '1m')
+
+    def check(label: str, ok: bool) -> None:
+        print(f"[{'ok' if ok else 'FAIL'}] {label}", flush=True)
+        if not ok:
+            raise SystemExit(1)
+
+    check("ticker streamed", _wait(lambda: stream.get_ticker('BTC/USDT') is not None, 10))
+    check("second symbol streamed", _wait(lambda: stream.get_ticker('ETH/USDT') is not None, 10))
+    check("forming candle streamed", _wait(lambda: stream.get_klines('BTC/USDT', '1m', 1) is not None, 10))
+
+    now = int(time.time() // 60) * 60
+    stream.seed_klines('BTC/USDT', '1m', [
+        {'time': now - 60 * i, 'open': 1, 'high': 1, 'low': 1, 'close': 1, 'volume': 1} for i in range(1, 5)
+    ])
+    klines = stream.get_klines('BTC/USDT', '1m', 5)
+    check("REST seed + streamed forming candle serve a 5-candle tail", bool(klines) and klines[-1]['time'] == now)
+
+    stream.unsubscribe('ETHUSDT', '1m')
+    check("unsubscribed symbol falls back to REST", stream.get_ticker('ETH/USDT') is None)
+
+    t0 = time.perf_counter()
+    for _ in range(10000):
+        stream.get_ticker('BTC/USDT')
+    print(f"get_ticker: {(time.perf_counter() - t0) / 10000 * 1e6:.1f} us/call", flush=True)
+
+    runner.stop()
+    check("disconnect -> None (REST fallback)", _wait(lambda: stream.get_ticker('BTC/USDT') is None, 10))
+    check("disconnect -> candles dropped", stream.get_klines('BTC/USDT', '1m', 1) is None)
+
+    runner.start()
+    check("reconnect and re-subscribe", _wait(lambda: stream.get_ticker('BTC/USDT') is not None, 15))
+    check("unsubscribed symbol stays off after reconnect", stream.get_ticker('ETH/USDT') is None)
+    print(stream.get_stats(), flush=True)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between pushed events')
+    parser.add_argument('--check', action='store_true', help='run the client self-check against an in-process stand-in')
+    args = parser.parse_args()
+    if args.check:
+        return run_check(args.port)
+    asyncio.run(StandinServer(args.host, args.port, args.interval).serve_forever())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())